@@ -0,0 +1,239 @@
+"""
+Bulk event write path that bypasses the ORM unit of work.
+
+Strategies:
+- "copy": PostgreSQL COPY FROM STDIN, rows rendered to CSV as the server reads
+- "core": SQLAlchemy Core multi-row INSERT, executed in fixed-size chunks
+- "orm":  one ORM object per event (the legacy path, kept for benchmarking)
+
+"auto" picks COPY when the connection is PostgreSQL (psycopg2 or asyncpg) and
+falls back to Core everywhere else (e.g. SQLite in local runs and tests).
+insert_events() serves sync sessions; insert_events_async() serves the
+AsyncSession used by request handlers.
+"""
+
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Union
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import metrics, models, schemas
+
+BULK_INSERT_STRATEGY = os.getenv("WEBTICS_BULK_INSERT_STRATEGY", "auto")
+CORE_CHUNK_SIZE = int(os.getenv("WEBTICS_BULK_INSERT_CHUNK_SIZE", "1000"))
+
+STRATEGIES = ("auto", "copy", "core", "orm")
+COPY_DRIVERS = ("psycopg2", "asyncpg")
+
+# Column order used for COPY and for row dicts
+EVENT_COLUMNS = (
+    "play_session_id",
+    "event_type",
+    "event_subtype",
+    "x",
+    "y",
+    "z",
+    "magnitude",
+    "data",
+    "timestamp",
+)
+
+
+def event_rows(
+    play_session_id: int,
+    events: Iterable[Union[schemas.EventCreate, schemas.EventCreateDict]],
+    timestamp: Optional[datetime] = None
+) -> Iterator[dict]:
+    """Turn parsed events (models or validated dicts) into insert rows lazily."""
+    timestamp = timestamp or datetime.utcnow()
+    for event in events:
+        fields = event if isinstance(event, dict) else event.__dict__
+        yield {
+            "play_session_id": play_session_id,
+            "event_type": fields["event_type"],
+            "event_subtype": fields.get("event_subtype", 0),
+            "x": fields.get("x"),
+            "y": fields.get("y"),
+            "z": fields.get("z"),
+            "magnitude": fields.get("magnitude"),
+            "data": fields.get("data"),
+            "timestamp": timestamp,
+        }
+
+
+def supports_copy(db: Union[Session, AsyncSession]) -> bool:
+    """True when the session is bound to PostgreSQL via psycopg2 or asyncpg."""
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver in COPY_DRIVERS
+
+
+def resolve_strategy(db: Union[Session, AsyncSession], strategy: Optional[str] = None) -> str:
+    """Pick a concrete strategy, falling back from COPY when unsupported."""
+    strategy = strategy or BULK_INSERT_STRATEGY
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown bulk insert strategy: {strategy}")
+    if strategy in ("auto", "copy"):
+        return "copy" if supports_copy(db) else "core"
+    return strategy
+
+
+def insert_events(db: Session, rows: Iterable[dict], strategy: Optional[str] = None) -> int:
+    """
+    Insert event rows using the configured bulk strategy.
+
+    Rows are consumed lazily, so generators from event_rows() are never
+    materialized in full. The caller owns the transaction (commit/rollback).
+
+    Returns:
+        int: Number of events written
+    """
+    strategy = resolve_strategy(db, strategy)
+    if strategy == "copy":
+        return _copy_insert(db, rows)
+    if strategy == "core":
+        return _core_insert(db, rows)
+    return _orm_insert(db, rows)
+
+
+def _core_insert(db: Session, rows: Iterable[dict]) -> int:
+    rows = iter(rows)
+    written = 0
+    while True:
+        chunk: List[dict] = list(islice(rows, CORE_CHUNK_SIZE))
+        if not chunk:
+            return written
+        db.execute(insert(models.Event), chunk)
+        written += len(chunk)
+
+
+def _orm_insert(db: Session, rows: Iterable[dict]) -> int:
+    db_events = [models.Event(**row) for row in rows]
+    db.add_all(db_events)
+    db.flush()
+    return len(db_events)
+
+
+def _copy_value(column: str, value):
+    if column == "data":
+        # Match the JSON column's default of storing None as JSON null
+        return json.dumps(value)
+    if value is None:
+        return None
+    if column == "timestamp":
+        return value.isoformat()
+    return value
+
+
+class _CopyStream:
+    """File-like object that renders rows to CSV as COPY reads them."""
+
+    def __init__(self, rows: Iterable[dict]):
+        self._rows = iter(rows)
+        self.count = 0
+
+    def read(self, size: int = 65536) -> str:
+        if size is None or size < 0:
+            size = 65536
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        while buf.tell() < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            writer.writerow([_copy_value(c, row.get(c)) for c in EVENT_COLUMNS])
+            self.count += 1
+        return buf.getvalue()
+
+
+def _is_integrity_violation(error: Exception) -> bool:
+    """A psycopg2 or asyncpg error in SQLSTATE class 23 (integrity constraint violation)."""
+    code = getattr(error, "pgcode", None) or getattr(error, "sqlstate", None)
+    return isinstance(code, str) and code.startswith("23")
+
+
+def _copy_insert(db: Session, rows: Iterable[dict]) -> int:
+    stream = _CopyStream(rows)
+    statement = f"COPY {models.Event.__tablename__} ({', '.join(EVENT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, stream)
+    except Exception as e:
+        # The driver-level COPY bypasses SQLAlchemy's exception wrapping;
+        # callers handle a deleted play session as IntegrityError either way
+        if _is_integrity_violation(e):
+            raise IntegrityError(statement, None, e) from e
+        raise
+    finally:
+        cursor.close()
+    return stream.count
+
+
+async def insert_events_async(
+    db: AsyncSession,
+    rows: Iterable[dict],
+    strategy: Optional[str] = None
+) -> int:
+    """
+    Async counterpart of insert_events() for request handlers.
+
+    COPY uses asyncpg's binary copy_records_to_table; Core runs the same
+    chunked INSERT. The caller owns the transaction (commit/rollback).
+
+    Returns:
+        int: Number of events written
+    """
+    strategy = resolve_strategy(db, strategy)
+    if strategy == "copy":
+        return await _copy_insert_async(db, rows)
+    if strategy == "core":
+        return await _core_insert_async(db, rows)
+    return await db.run_sync(_orm_insert, rows)
+
+
+async def _core_insert_async(db: AsyncSession, rows: Iterable[dict]) -> int:
+    rows = iter(rows)
+    written = 0
+    while True:
+        chunk: List[dict] = list(islice(rows, CORE_CHUNK_SIZE))
+        if not chunk:
+            return written
+        await db.execute(insert(models.Event), chunk)
+        written += len(chunk)
+
+
+async def _copy_insert_async(db: AsyncSession, rows: Iterable[dict]) -> int:
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    driver = raw.driver_connection
+    if not driver.is_in_transaction():
+        # SQLAlchemy's asyncpg adapter opens its transaction lazily on the
+        # first statement; without one the COPY would commit on its own
+        await conn.exec_driver_sql("SELECT 1")
+
+    # Binary COPY takes native values; only the JSON column needs encoding
+    records = (
+        tuple(json.dumps(row.get(c)) if c == "data" else row.get(c) for c in EVENT_COLUMNS)
+        for row in rows
+    )
+    started = time.perf_counter()
+    try:
+        status = await driver.copy_records_to_table(
+            models.Event.__tablename__, records=records, columns=EVENT_COLUMNS
+        )
+    except Exception as e:
+        if _is_integrity_violation(e):
+            raise IntegrityError(f"COPY {models.Event.__tablename__}", None, e) from e
+        raise
+    # The driver-level COPY is invisible to cursor events
+    metrics.add_db_time(time.perf_counter() - started)
+    # Status is the server's command tag, e.g. "COPY 500"
+    return int(status.split()[-1])
@@ -97,6 +97,26 @@ def verify_withdrawal_code(withdrawal_code: str, salt: str, expected_hash: str)
     return hmac.compare_digest(computed_hash, expected_hash)
 
 
+def withdrawal_lookup_digest(withdrawal_code: str) -> str:
+    """
+    Deterministic keyed digest of a withdrawal code for indexed lookup.
+
+    Unlike hash_withdrawal_code() it has no per-record salt, so a submitted
+    code maps straight to one row via an index instead of being checked
+    against every consent. It is keyed (HMAC with SECRET_KEY under a
+    separate label), so the column alone cannot be used to test guesses.
+    The salted hash is still verified after lookup.
+
+    Args:
+        withdrawal_code: The plaintext withdrawal code
+
+    Returns:
+        str: 64-character hex digest
+    """
+    key = f"{SECRET_KEY}:withdrawal-lookup".encode('utf-8')
+    return hmac.new(key, withdrawal_code.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
 def hash_ip_address(ip_address: str) -> str:
     """
     Hash an IP address for privacy-preserving abuse detection.
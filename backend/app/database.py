@@ -1,23 +1,82 @@
 """Database connection and session management."""
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
+from .db_pool import engine_options, instrument
+from .metrics import instrument_engine
+
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql://webtics:webtics@db:5432/webtics"
 )
 
-engine = create_engine(DATABASE_URL)
+# DATABASE_URL may name either driver; the other engine is derived from it.
+# Request handlers use the async engine, while table creation, the
+# write-behind flusher thread and command line tools use the sync one.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+SYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg2",
+    "sqlite": "sqlite",
+}
+
+
+def async_database_url(url: str) -> URL:
+    """Async driver URL for a database URL (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    if url.get_dialect().is_async:
+        return url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def sync_database_url(url: str) -> URL:
+    """Sync driver URL for a database URL (psycopg2 / pysqlite)."""
+    url = make_url(url)
+    if not url.get_dialect().is_async:
+        return url
+    return url.set(drivername=SYNC_DRIVERS[url.get_backend_name()])
+
+
+_sync_url = sync_database_url(DATABASE_URL)
+_sync_options = engine_options(_sync_url)
+engine = create_engine(_sync_url, **_sync_options)
+instrument(engine, "sync", _sync_options.get("max_overflow"))
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+_async_url = async_database_url(DATABASE_URL)
+_async_options = engine_options(_async_url)
+async_engine = create_async_engine(_async_url, **_async_options)
+instrument(async_engine.sync_engine, "async", _async_options.get("max_overflow"))
+instrument_engine(async_engine.sync_engine)
+# Objects stay usable after commit so handlers can return them without
+# another round trip to reload expired attributes
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
 def get_db():
-    """Dependency for getting database sessions."""
+    """Dependency for getting sync database sessions (tools and background threads)."""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting async database sessions in request handlers."""
+    async with AsyncSessionLocal() as db:
+        yield db
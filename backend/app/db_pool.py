@@ -0,0 +1,266 @@
+"""
+Connection pool configuration and instrumentation.
+
+Pool sizing comes from WEBTICS_DB_POOL_* variables and applies to both the
+sync and async engines. Each engine's pool reports how long checkouts wait,
+how many connections are checked out and how much overflow is in use, so
+burst latency can be attributed to the pool or to PostgreSQL and workers
+sized against max_connections.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+POOL_SIZE = int(os.getenv("WEBTICS_DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("WEBTICS_DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("WEBTICS_DB_POOL_TIMEOUT", "30"))
+# Seconds before a connection is replaced; -1 keeps connections indefinitely
+POOL_RECYCLE = int(os.getenv("WEBTICS_DB_POOL_RECYCLE", "-1"))
+# Test connections with a round trip on checkout (survives DB restarts)
+POOL_PRE_PING = os.getenv("WEBTICS_DB_POOL_PRE_PING", "false").lower() == "true"
+
+# Recent checkout waits kept for percentiles
+WAIT_SAMPLES = 2048
+# Weight of each checkout in the recent wait average, and how quickly that
+# average decays while no checkouts happen (admission control)
+RECENT_WAIT_WEIGHT = 0.2
+RECENT_WAIT_DECAY_SEC = 5.0
+
+
+class PoolStats:
+    """Thread-safe checkout and connection counters for one pool."""
+
+    def __init__(self, name: str, max_overflow: Optional[int] = None):
+        self.name = name
+        # As configured for the engine; None when SQLAlchemy picked the pool
+        self.max_overflow = max_overflow
+        self._lock = threading.Lock()
+        self._waits: deque = deque(maxlen=WAIT_SAMPLES)
+
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total_sec = 0.0
+        self.wait_max_sec = 0.0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        self._recent_wait = 0.0
+        self._recent_at = time.monotonic()
+
+    def _decayed_wait(self, now: float) -> float:
+        return self._recent_wait * math.exp(-(now - self._recent_at) / RECENT_WAIT_DECAY_SEC)
+
+    def recent_wait_sec(self) -> float:
+        """Moving average of checkout waits, decaying towards 0 while idle."""
+        with self._lock:
+            return self._decayed_wait(time.monotonic())
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            recent = self._decayed_wait(now)
+            self._recent_wait = recent + RECENT_WAIT_WEIGHT * (seconds - recent)
+            self._recent_at = now
+            self._waits.append(seconds)
+            self.wait_total_sec += seconds
+            self.wait_max_sec = max(self.wait_max_sec, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def record_checkin(self) -> None:
+        with self._lock:
+            self.checkins += 1
+
+    def record_invalidation(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def record_checkout(self, checked_out: int, overflow: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self.peak_overflow = max(self.peak_overflow, overflow)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            waited = len(waits)
+            total = self.wait_total_sec
+            count = self.checkouts + self.timeouts
+            counters = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "peak_checked_out": self.peak_checked_out,
+                "peak_overflow": self.peak_overflow,
+            }
+            wait_max = self.wait_max_sec
+
+        def pct(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(waited - 1, int(p * waited))] * 1000, 3)
+
+        return {
+            **counters,
+            "wait_ms": {
+                "mean": round(total / count * 1000, 3) if count else 0.0,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "p99": pct(0.99),
+                "max": round(wait_max * 1000, 3),
+                "recent": round(self.recent_wait_sec() * 1000, 3),
+                "samples": waited,
+            },
+        }
+
+
+class _TimedCheckout:
+    """
+    Pool mixin that times connect() and counts timeouts.
+
+    connect() covers the whole checkout: waiting for a free connection,
+    opening one when the pool grows into overflow, and pre-ping.
+    """
+
+    stats: PoolStats
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # Engine.dispose() swaps in a fresh pool; keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: URL) -> Dict[str, Any]:
+    """create_engine()/create_async_engine() pool arguments for a URL."""
+    if url.get_backend_name() == "sqlite":
+        # SQLite engines use SQLAlchemy's file/memory specific pools
+        return {}
+    return {
+        "poolclass": TimedAsyncAdaptedQueuePool if url.get_dialect().is_async else TimedQueuePool,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+
+_pool_stats: Dict[str, PoolStats] = {}
+_engines: Dict[str, Engine] = {}
+
+
+def instrument(engine: Engine, name: str, max_overflow: Optional[int] = None) -> PoolStats:
+    """
+    Attach PoolStats to an engine's pool via pool events.
+
+    max_overflow is the value the engine was created with (engine_options());
+    pools don't expose it publicly, so it is recorded for pool_state().
+    """
+    stats = PoolStats(name, max_overflow)
+    engine.pool.stats = stats
+    _pool_stats[name] = stats
+    _engines[name] = engine
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        stats.record_connect()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            stats.record_checkout(pool.checkedout(), max(pool.overflow(), 0))
+        else:
+            stats.record_checkout(0, 0)
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        stats.record_checkin()
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.record_invalidation()
+
+    return stats
+
+
+def get_pool_stats(name: str) -> Optional[PoolStats]:
+    """PoolStats of the engine instrumented under name ("sync", "async")."""
+    return _pool_stats.get(name)
+
+
+def pool_state(engine: Engine) -> Dict[str, Any]:
+    """Current occupancy of an engine's pool."""
+    pool = engine.pool
+    state: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        pool_stats: Optional[PoolStats] = getattr(pool, "stats", None)
+        state.update({
+            "size": pool.size(),
+            "max_overflow": pool_stats.max_overflow if pool_stats else None,
+            "timeout_sec": pool.timeout(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    return state
+
+
+def stats() -> Dict[str, Any]:
+    """Pool state and counters for every instrumented engine."""
+    engines = {
+        name: {**pool_state(_engines[name]), **pool_stats.stats()}
+        for name, pool_stats in _pool_stats.items()
+    }
+    return {
+        "config": {
+            "pool_size": POOL_SIZE,
+            "max_overflow": MAX_OVERFLOW,
+            "timeout_sec": POOL_TIMEOUT,
+            "recycle_sec": POOL_RECYCLE,
+            "pre_ping": POOL_PRE_PING,
+        },
+        # Upper bound this worker can hold open; multiply by the number of
+        # workers and compare with PostgreSQL max_connections
+        "max_connections_per_worker": sum(
+            state.get("size", 0) + max(state.get("max_overflow") or 0, 0)
+            for state in engines.values()
+        ),
+        "engines": engines,
+    }
@@ -0,0 +1,209 @@
+"""
+Streaming participant data export (GDPR Article 15).
+
+All of a participant's sessions, play sessions and events are read with a
+single ordered outer-join query on a server-side cursor (yield_per) and
+written out as they arrive, so memory stays bounded whatever the amount of
+data. Two formats:
+
+- json: the nested document the export has always returned; the totals are
+  written after the sessions array, once they are known
+- ndjson: one record per line, tagged with "type" (participant, session,
+  play_session, event, summary)
+
+The body can be gzip-compressed incrementally as it streams.
+"""
+
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, models_research
+from .database import AsyncSessionLocal
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+EXPORT_FORMATS = ("json", "ndjson")
+# Rows fetched per round trip from the server-side cursor
+EXPORT_YIELD_PER = int(os.getenv("WEBTICS_EXPORT_YIELD_PER", "1000"))
+# Output is flushed to the client in chunks of about this many bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode("utf-8")
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _export_query(participant_id: str):
+    """Sessions, play sessions and events of a participant in nesting order."""
+    return (
+        select(
+            models.MetricSession.id.label("session_id"),
+            models.MetricSession.unique_id,
+            models.MetricSession.build_number,
+            models.MetricSession.created_at,
+            models.MetricSession.closed_at,
+            models.PlaySession.id.label("play_session_id"),
+            models.PlaySession.started_at,
+            models.PlaySession.ended_at,
+            models.Event.id.label("event_id"),
+            models.Event.event_type,
+            models.Event.event_subtype,
+            models.Event.x,
+            models.Event.y,
+            models.Event.z,
+            models.Event.magnitude,
+            models.Event.data,
+            models.Event.timestamp,
+        )
+        .outerjoin(models.PlaySession, models.PlaySession.metric_session_id == models.MetricSession.id)
+        # Joined on play session only: an export bounded by started_at would
+        # miss events stamped before it
+        .outerjoin(models.Event, models.Event.play_session_id == models.PlaySession.id)
+        .where(models.MetricSession.unique_id == participant_id)
+        .order_by(models.MetricSession.id, models.PlaySession.id, models.Event.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+
+
+def _session_record(row) -> dict:
+    return {
+        "id": row.session_id,
+        "unique_id": row.unique_id,
+        "build_number": row.build_number,
+        "created_at": _iso(row.created_at),
+        "closed_at": _iso(row.closed_at),
+    }
+
+
+def _play_session_record(row) -> dict:
+    return {
+        "id": row.play_session_id,
+        "started_at": _iso(row.started_at),
+        "ended_at": _iso(row.ended_at),
+    }
+
+
+def _event_record(row) -> dict:
+    return {
+        "id": row.event_id,
+        "event_type": row.event_type,
+        "event_subtype": row.event_subtype,
+        "x": row.x,
+        "y": row.y,
+        "z": row.z,
+        "magnitude": row.magnitude,
+        "data": row.data,
+        "timestamp": _iso(row.timestamp),
+    }
+
+
+def _open(record: dict, key: str) -> bytes:
+    """Serialized record with a trailing list member left open: {..., "key": ["""
+    return _dumps(record)[:-1] + b', "' + key.encode() + b'": ['
+
+
+async def stream_participant_export(
+    consent: models_research.ResearchConsent,
+    fmt: str = "json",
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+) -> AsyncIterator[bytes]:
+    """
+    Yield the export document in chunks.
+
+    Opens its own session: the request's session is closed before a
+    streaming response body is sent.
+    """
+    participant = {
+        "participant_id": consent.participant_id,
+        "study_id": consent.study_id,
+        "consented_at": _iso(consent.consented_at),
+        "privacy_level": consent.privacy_level,
+    }
+    ndjson = fmt == "ndjson"
+    buffer = bytearray()
+    total_sessions = 0
+    total_events = 0
+    session_id = play_session_id = None
+
+    if ndjson:
+        buffer += _dumps({"type": "participant", **participant}) + b"\n"
+    else:
+        buffer += _open(participant, "sessions")
+
+    async with session_factory() as db:
+        result = await db.stream(_export_query(consent.participant_id))
+
+        async for row in result:
+            if row.session_id != session_id:
+                if ndjson:
+                    buffer += _dumps({"type": "session", **_session_record(row)}) + b"\n"
+                else:
+                    if session_id is not None:
+                        # Close the previous session (and its open play session)
+                        buffer += b"]}]}," if play_session_id is not None else b"]},"
+                    buffer += _open(_session_record(row), "play_sessions")
+                session_id = row.session_id
+                play_session_id = None
+                total_sessions += 1
+
+            if row.play_session_id is not None and row.play_session_id != play_session_id:
+                if ndjson:
+                    buffer += _dumps({
+                        "type": "play_session", "session_id": session_id, **_play_session_record(row)
+                    }) + b"\n"
+                else:
+                    if play_session_id is not None:
+                        buffer += b"]},"
+                    buffer += _open(_play_session_record(row), "events")
+                play_session_id = row.play_session_id
+                first_event = True
+
+            if row.event_id is not None:
+                if ndjson:
+                    buffer += _dumps({
+                        "type": "event", "play_session_id": play_session_id, **_event_record(row)
+                    }) + b"\n"
+                else:
+                    if not first_event:
+                        buffer += b","
+                    buffer += _dumps(_event_record(row))
+                    first_event = False
+                total_events += 1
+
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+
+    totals = {"total_sessions": total_sessions, "total_events": total_events}
+    if ndjson:
+        buffer += _dumps({"type": "summary", **totals}) + b"\n"
+    else:
+        if session_id is not None:
+            buffer += b"]}]}" if play_session_id is not None else b"]}"
+        buffer += b"], " + _dumps(totals)[1:]
+    yield bytes(buffer)
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Gzip-compress a byte stream incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,392 @@
+"""
+Spatial heatmaps: a tile pyramid of event counts.
+
+Event coordinates (WEBTICS_HEATMAP_AXES, x and y by default) lie within
+VALIDATION_RULES["coordinates"]; that square is mapped onto a 2^15 unit
+world, cut at zoom z into 2^z x 2^z tiles of TILE_SIZE x TILE_SIZE cells.
+Zoom 0 is one tile of 512-unit cells; every level halves the cell size, down
+to WEBTICS_HEATMAP_MAX_ZOOM (16-unit cells at the default 5). Tile (0, 0) and
+cell 0 are at the minimum x and y; cells are row-major (cell = y * 64 + x).
+
+heatmap_cells holds a count per (study, zoom, tile, event type, build, cell),
+only for non-empty cells. Ingest bins each batch at every zoom level with
+NumPy and upserts the increments in the rollup transaction (app.rollups), so
+a tile is read as at most 4096 rows from one index range however many events
+fell in it. Like the study rollups, rows are split over WEBTICS_ROLLUP_SHARDS
+shards so one study's concurrent ingest does not queue on the zoom 0 cells.
+Deleting events (withdrawal, retention) subtracts them again.
+
+Sessions without a consent are counted under study "" and sessions without
+a build number under build "".
+
+Tiles are cached per worker. A commit that changes a tile bumps its version
+in this worker, which invalidates it at once; changes made by other workers
+show after WEBTICS_HEATMAP_CACHE_TTL seconds.
+
+Heatmaps are opt-in: set WEBTICS_HEATMAPS_ENABLED=true, then backfill events
+logged before that with `python -m app.rollups rebuild`.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import Select, column, delete, event, func, select, table, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, models_research
+from .database import async_engine, engine
+from .middleware.data_validation import VALIDATION_RULES
+from .session_cache import TTLCache
+
+HEATMAPS_ENABLED = os.getenv("WEBTICS_HEATMAPS_ENABLED", "false").lower() == "true"
+HEATMAP_AXES = tuple(axis.strip() for axis in os.getenv("WEBTICS_HEATMAP_AXES", "x,y").split(","))
+HEATMAP_MAX_ZOOM = min(int(os.getenv("WEBTICS_HEATMAP_MAX_ZOOM", "5")), 9)
+HEATMAP_CACHE_SIZE = int(os.getenv("WEBTICS_HEATMAP_CACHE_SIZE", "2000"))
+HEATMAP_CACHE_TTL_SEC = float(os.getenv("WEBTICS_HEATMAP_CACHE_TTL", "10"))
+# Same spread as the study rollups
+HEATMAP_SHARDS = int(os.getenv("WEBTICS_ROLLUP_SHARDS", "8"))
+
+TILE_BITS = 6
+TILE_SIZE = 1 << TILE_BITS
+WORLD_BITS = 15
+WORLD_SIZE = 1 << WORLD_BITS
+ORIGIN = VALIDATION_RULES["coordinates"]["min"]
+# Rows per upsert statement (asyncpg allows 32767 parameters)
+UPSERT_CHUNK = 1000
+
+if len(HEATMAP_AXES) != 2 or not set(HEATMAP_AXES) <= {"x", "y", "z"}:
+    raise ValueError(f"WEBTICS_HEATMAP_AXES must name two of x, y, z, not {HEATMAP_AXES}")
+
+Cell = models.HeatmapCell
+Consent = models_research.ResearchConsent
+
+# Columns rollups.forget_heatmap_points() needs from deleted events
+POINT_COLUMNS = (
+    models.Event.play_session_id,
+    models.Event.event_type,
+    getattr(models.Event, HEATMAP_AXES[0]),
+    getattr(models.Event, HEATMAP_AXES[1]),
+)
+
+TileKey = Tuple[str, int, int, int]
+
+tile_cache = TTLCache(HEATMAP_CACHE_SIZE, HEATMAP_CACHE_TTL_SEC)
+_tile_versions: Dict[TileKey, int] = {}
+_versions_lock = threading.Lock()
+_TOUCHED = "webtics_heatmap_tiles"
+_COMMITTED = "webtics_heatmap_tiles_committed"
+
+
+def cell_size(zoom: int) -> int:
+    return 1 << (WORLD_BITS - TILE_BITS - zoom)
+
+
+def cell_coordinates(values: np.ndarray, zoom: int) -> np.ndarray:
+    """Global cell index along one axis at a zoom level."""
+    offset = np.clip(np.asarray(values, dtype=np.int64) - ORIGIN, 0, WORLD_SIZE - 1)
+    return offset >> (WORLD_BITS - TILE_BITS - zoom)
+
+
+def tally(
+    play_session_ids: np.ndarray,
+    event_types: np.ndarray,
+    first: np.ndarray,
+    second: np.ndarray,
+    labels: Dict[int, Tuple[str, str]],
+    weights: Optional[np.ndarray] = None,
+) -> List[dict]:
+    """
+    Cell counts of points at every zoom level.
+
+    `labels` maps each play session to its (study_id, build); `weights`, if
+    given, is how many events each point stands for. Rows come back in
+    primary key order so concurrent upserts lock rows in the same order.
+    """
+    if not len(play_session_ids):
+        return []
+    unique_ids, inverse = np.unique(play_session_ids, return_inverse=True)
+    groups = [(*labels[ps], ps % HEATMAP_SHARDS) for ps in unique_ids.tolist()]
+    distinct = sorted(set(groups))
+    index = {group: i for i, group in enumerate(distinct)}
+    group = np.array([index[g] for g in groups], dtype=np.int64)[inverse]
+    event_types = np.asarray(event_types, dtype=np.int64)
+
+    levels = []
+    for zoom in range(HEATMAP_MAX_ZOOM + 1):
+        cx, cy = cell_coordinates(first, zoom), cell_coordinates(second, zoom)
+        levels.append(np.stack([
+            group,
+            np.full(group.size, zoom),
+            cx >> TILE_BITS,
+            cy >> TILE_BITS,
+            event_types,
+            ((cy & (TILE_SIZE - 1)) << TILE_BITS) | (cx & (TILE_SIZE - 1)),
+        ], axis=1))
+    if weights is None:
+        keys, counts = np.unique(np.concatenate(levels), axis=0, return_counts=True)
+    else:
+        keys, inverse = np.unique(np.concatenate(levels), axis=0, return_inverse=True)
+        counts = np.bincount(
+            inverse.ravel(), weights=np.tile(np.asarray(weights, dtype=np.int64), len(levels))
+        ).astype(np.int64)
+
+    rows = []
+    for (g, zoom, tile_x, tile_y, event_type, cell), count in zip(keys.tolist(), counts.tolist()):
+        study_id, build, shard = distinct[g]
+        rows.append({
+            "study_id": study_id, "zoom": zoom, "tile_x": tile_x, "tile_y": tile_y,
+            "event_type": event_type, "build": build, "cell": cell, "shard": shard, "count": count,
+        })
+    rows.sort(key=lambda r: (r["study_id"], r["zoom"], r["tile_x"], r["tile_y"], r["event_type"], r["build"], r["cell"], r["shard"]))
+    return rows
+
+
+def tally_points(
+    points: Sequence[Tuple[int, ...]],
+    labels: Dict[int, Tuple[str, str]],
+    weighted: bool = False,
+) -> List[dict]:
+    """
+    tally() for (play_session_id, event_type, first axis, second axis) tuples.
+
+    With weighted, each tuple carries a fifth item: the number of events at
+    that point (from a GROUP BY).
+    """
+    points = [p for p in points if p[2] is not None and p[3] is not None]
+    if not points:
+        return []
+    columns = np.array(points, dtype=np.int64).T
+    return tally(columns[0], columns[1], columns[2], columns[3], labels, columns[4] if weighted else None)
+
+
+# Writes
+
+def _upsert(dialect_name: str, rows: List[dict]):
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(Cell).values(rows)
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(Cell).values(rows)
+    else:
+        raise NotImplementedError(f"Heatmaps are not supported on {dialect_name}")
+    return stmt.on_conflict_do_update(
+        index_elements=[c.name for c in Cell.__table__.primary_key],
+        set_={"count": Cell.__table__.c.count + stmt.excluded.count}
+    )
+
+
+def _write_statements(dialect_name: str, rows: List[dict], subtract: bool = False) -> list:
+    if subtract:
+        rows = [{**row, "count": -row["count"]} for row in rows]
+    statements = [_upsert(dialect_name, rows[i:i + UPSERT_CHUNK]) for i in range(0, len(rows), UPSERT_CHUNK)]
+    if subtract:
+        statements.append(delete(Cell).where(
+            tuple_(Cell.study_id, Cell.zoom, Cell.tile_x, Cell.tile_y).in_(sorted(_tiles(rows))),
+            Cell.count <= 0
+        ))
+    return statements
+
+
+def _tiles(rows: Iterable[dict]) -> Set[TileKey]:
+    return {(r["study_id"], r["zoom"], r["tile_x"], r["tile_y"]) for r in rows}
+
+
+# Tiles written in the open transaction are invalidated once it has committed.
+# The commit event fires just before the database commits, so the versions
+# are bumped when the connection goes back to the pool instead; a reader
+# can then never cache the pre-commit counts under the new version.
+
+def _mark_touched(connection: Connection, rows: List[dict]) -> None:
+    connection.info.setdefault(_TOUCHED, set()).update(_tiles(rows))
+
+
+def _on_commit(connection: Connection) -> None:
+    touched = connection.info.pop(_TOUCHED, None)
+    if touched:
+        connection.info.setdefault(_COMMITTED, set()).update(touched)
+
+
+def _on_rollback(connection: Connection) -> None:
+    connection.info.pop(_TOUCHED, None)
+
+
+def _on_checkin(dbapi_connection, connection_record) -> None:
+    committed = connection_record.info.pop(_COMMITTED, None) if connection_record is not None else None
+    if committed:
+        with _versions_lock:
+            for tile in committed:
+                _tile_versions[tile] = _tile_versions.get(tile, 0) + 1
+
+
+def instrument_engine(bind: Engine) -> None:
+    """Invalidate cached tiles after commits on this engine."""
+    event.listen(bind, "commit", _on_commit)
+    event.listen(bind, "rollback", _on_rollback)
+    event.listen(bind, "checkin", _on_checkin)
+
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+
+async def _write_async(db: AsyncSession, rows: List[dict], subtract: bool) -> None:
+    if not rows:
+        return
+    for statement in _write_statements(db.bind.dialect.name, rows, subtract):
+        await db.execute(statement)
+    _mark_touched((await db.connection()).sync_connection, rows)
+
+
+def _write(db, rows: List[dict], subtract: bool) -> None:
+    """For a sync Session or Connection."""
+    if not rows:
+        return
+    connection = db if isinstance(db, Connection) else db.connection()
+    for statement in _write_statements(connection.dialect.name, rows, subtract):
+        connection.execute(statement)
+    _mark_touched(connection, rows)
+
+
+async def apply_async(db: AsyncSession, points, labels: Dict[int, Tuple[str, str]]) -> None:
+    """Add newly ingested points to the pyramid in the caller's transaction."""
+    if HEATMAPS_ENABLED and points:
+        await _write_async(db, tally_points(points, labels), subtract=False)
+
+
+def apply(db, points, labels: Dict[int, Tuple[str, str]]) -> None:
+    """Sync counterpart of apply_async() for the write-behind flusher."""
+    if HEATMAPS_ENABLED and points:
+        _write(db, tally_points(points, labels), subtract=False)
+
+
+async def forget_async(db: AsyncSession, points, labels: Dict[int, Tuple[str, str]]) -> None:
+    """Subtract deleted events (rows of POINT_COLUMNS) in the deleting transaction."""
+    if HEATMAPS_ENABLED and points:
+        await _write_async(db, tally_points(points, labels), subtract=True)
+
+
+def forget(db, points, labels: Dict[int, Tuple[str, str]], weighted: bool = False) -> None:
+    """Sync counterpart of forget_async() for the retention sweeper (see tally_points for weighted)."""
+    if HEATMAPS_ENABLED and points:
+        _write(db, tally_points(points, labels, weighted), subtract=True)
+
+
+def partition_points_query(partition_name: str) -> Select:
+    """Events of an events partition grouped by point, as weighted POINT_COLUMNS rows."""
+    events = table(partition_name, *(column(c.name) for c in POINT_COLUMNS))
+    columns = [events.c[c.name] for c in POINT_COLUMNS]
+    return (
+        select(*columns, func.count())
+        .where(columns[2].isnot(None), columns[3].isnot(None))
+        .group_by(*columns)
+    )
+
+
+def rebuild_chunk(conn: Connection, first_id: int, last_id: int) -> int:
+    """Add the events of a range of play sessions to the pyramid."""
+    first_axis, second_axis = POINT_COLUMNS[2:]
+    rows = conn.execute(
+        select(*POINT_COLUMNS, Consent.study_id, models.MetricSession.build_number)
+        .join(models.PlaySession, models.PlaySession.id == models.Event.play_session_id)
+        .join(models.MetricSession, models.MetricSession.id == models.PlaySession.metric_session_id)
+        .outerjoin(Consent, Consent.participant_id == models.MetricSession.unique_id)
+        .where(
+            models.Event.play_session_id.between(first_id, last_id),
+            first_axis.isnot(None),
+            second_axis.isnot(None)
+        )
+    ).all()
+    if not rows:
+        return 0
+    labels = {row[0]: (row.study_id or "", row.build_number or "") for row in rows}
+    cells = tally_points([tuple(row[:4]) for row in rows], labels)
+    _write(conn, cells, subtract=False)
+    return len(cells)
+
+
+def clear_cache() -> None:
+    tile_cache.clear()
+    with _versions_lock:
+        _tile_versions.clear()
+
+
+# Reads
+
+def tile_query(
+    study_id: str,
+    zoom: int,
+    tile_x: int,
+    tile_y: int,
+    event_type: Optional[int] = None,
+    build: Optional[str] = None,
+) -> Select:
+    where = [Cell.study_id == study_id, Cell.zoom == zoom, Cell.tile_x == tile_x, Cell.tile_y == tile_y]
+    if event_type is not None:
+        where.append(Cell.event_type == event_type)
+    if build is not None:
+        where.append(Cell.build == build)
+    return select(Cell.cell, func.sum(Cell.count).label("count")).where(*where).group_by(Cell.cell)
+
+
+async def read_tile(
+    db: AsyncSession,
+    study_id: str,
+    zoom: int,
+    tile_x: int,
+    tile_y: int,
+    event_type: Optional[int] = None,
+    build: Optional[str] = None,
+) -> np.ndarray:
+    """A tile's cell counts as TILE_SIZE * TILE_SIZE row-major uint32, cached."""
+    tile = (study_id, zoom, tile_x, tile_y)
+    version = _tile_versions.get(tile, 0)
+    key = (tile, event_type, build)
+    cached = tile_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    rows = (await db.execute(tile_query(study_id, zoom, tile_x, tile_y, event_type, build))).all()
+    counts = np.zeros(TILE_SIZE * TILE_SIZE, dtype=np.uint32)
+    if rows:
+        cells, values = np.array([tuple(row) for row in rows], dtype=np.int64).T
+        counts[cells] = np.clip(values, 0, np.iinfo(np.uint32).max)
+    tile_cache.set(key, (version, counts))
+    return counts
+
+
+def layers_query(study_id: str) -> Select:
+    """Event count per (event type, build) of a study, from its zoom 0 tile."""
+    return (
+        select(Cell.event_type, Cell.build, func.sum(Cell.count).label("count"))
+        .where(Cell.study_id == study_id, Cell.zoom == 0)
+        .group_by(Cell.event_type, Cell.build)
+        .order_by(Cell.event_type, Cell.build)
+    )
+
+
+def describe_tile(zoom: int, tile_x: int, tile_y: int) -> Dict[str, Any]:
+    """World bounds of a tile, in event coordinates."""
+    size = cell_size(zoom)
+    x0 = ORIGIN + tile_x * TILE_SIZE * size
+    y0 = ORIGIN + tile_y * TILE_SIZE * size
+    return {
+        "zoom": zoom,
+        "tile_x": tile_x,
+        "tile_y": tile_y,
+        "tile_size": TILE_SIZE,
+        "cell_size": size,
+        "bounds": [x0, y0, x0 + TILE_SIZE * size, y0 + TILE_SIZE * size],
+    }
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": HEATMAPS_ENABLED,
+        "axes": list(HEATMAP_AXES),
+        "max_zoom": HEATMAP_MAX_ZOOM,
+        "tile_cache": tile_cache.stats(),
+        "tracked_tiles": len(_tile_versions),
+    }
@@ -0,0 +1,243 @@
+"""
+Write-behind ingestion queue for telemetry events.
+
+When enabled, validated events are buffered in-process and the request
+returns immediately. A background flusher merges queued events from every
+play session into bulk inserts, triggered by batch size or elapsed time.
+Events reach live subscribers once the flush that wrote them has committed.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, rollups, schemas, session_cache
+from .bulk_insert import insert_events
+from .database import SessionLocal
+from .live_hub import LiveHub, live_hub
+
+logger = logging.getLogger("webtics.ingest")
+
+# Opt-in configuration (defaults keep the synchronous write path)
+WRITE_BEHIND_ENABLED = os.getenv("WEBTICS_WRITE_BEHIND", "false").lower() == "true"
+QUEUE_MAX_SIZE = int(os.getenv("WEBTICS_WRITE_BEHIND_MAX_QUEUE", "10000"))
+FLUSH_BATCH_SIZE = int(os.getenv("WEBTICS_WRITE_BEHIND_BATCH_SIZE", "500"))
+FLUSH_INTERVAL_SEC = float(os.getenv("WEBTICS_WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+
+
+class QueueFullError(Exception):
+    """Raised when the write-behind queue cannot accept more events."""
+    pass
+
+
+class WriteBehindQueue:
+    """Bounded in-process event buffer with a background bulk flusher."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_size: int = QUEUE_MAX_SIZE,
+        batch_size: int = FLUSH_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SEC,
+        hub: LiveHub = live_hub,
+    ):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.hub = hub
+
+        # (event row, metric session id for live subscribers)
+        self._pending: Deque[Tuple[dict, Optional[int]]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Counters for tuning batch size and flush interval
+        self.events_enqueued = 0
+        self.events_rejected = 0
+        self.events_flushed = 0
+        self.events_failed = 0
+        self.flush_count = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def start(self) -> None:
+        """Start the background flusher on the running event loop."""
+        if self.is_running:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Write-behind queue started (max_size={self.max_size}, "
+            f"batch_size={self.batch_size}, flush_interval={self.flush_interval}s)"
+        )
+
+    async def stop(self) -> None:
+        """Flush everything still queued and stop the flusher."""
+        if not self.is_running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        logger.info(f"Write-behind queue stopped ({self.events_flushed} events flushed)")
+
+    def enqueue(self, play_session_id: int, event: schemas.EventCreate, metric_session_id: Optional[int] = None) -> None:
+        """Queue a validated event for the next bulk flush."""
+        if self._stopping or len(self._pending) >= self.max_size:
+            self.events_rejected += 1
+            raise QueueFullError("Event queue is full")
+
+        self._pending.append(({
+            "play_session_id": play_session_id,
+            "event_type": event.event_type,
+            "event_subtype": event.event_subtype,
+            "x": event.x,
+            "y": event.y,
+            "z": event.z,
+            "magnitude": event.magnitude,
+            "data": event.data,
+            # Stamp on receipt, not on flush
+            "timestamp": datetime.utcnow(),
+        }, metric_session_id))
+        self.events_enqueued += 1
+
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while self._pending:
+                batch = [
+                    self._pending.popleft()
+                    for _ in range(min(self.batch_size, len(self._pending)))
+                ]
+                await self._flush(batch)
+
+            if self._stopping:
+                return
+
+    async def _flush(self, pending: List[Tuple[dict, Optional[int]]]) -> None:
+        started = time.perf_counter()
+        batch = [row for row, _ in pending]
+        try:
+            written = await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            self.events_failed += len(batch)
+            logger.error(f"Write-behind flush of {len(batch)} events failed: {e}", exc_info=True)
+            return
+        if len(written) < len(batch):
+            self.events_failed += len(batch) - len(written)
+            logger.warning(f"Write-behind flush dropped {len(batch) - len(written)} events of deleted play sessions")
+        batch = written
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flush_count += 1
+        self.events_flushed += len(batch)
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        logger.debug(f"Flushed {len(batch)} events in {elapsed_ms:.1f}ms")
+
+        if self.hub.subscriber_count:
+            self._publish(batch, {row["play_session_id"]: metric_session_id for row, metric_session_id in pending})
+
+    def _publish(self, written: List[dict], metric_sessions: Dict[int, Optional[int]]) -> None:
+        """Push committed rows to the live subscribers of their sessions."""
+        by_play_session: Dict[int, List[dict]] = {}
+        for row in written:
+            by_play_session.setdefault(row["play_session_id"], []).append(row)
+        for play_session_id, rows in by_play_session.items():
+            metric_session_id = metric_sessions[play_session_id]
+            if self.hub.has_subscribers(play_session_id, metric_session_id):
+                self.hub.publish(play_session_id, metric_session_id, rows)
+
+    def _write_batch(self, batch: List[dict]) -> List[dict]:
+        """Write a batch in one transaction; returns the rows written."""
+        db = self.session_factory()
+        try:
+            try:
+                self._insert(db, batch)
+            except IntegrityError:
+                # Events queued for play sessions deleted since (possibly by
+                # another worker, past this worker's cached existence check)
+                db.rollback()
+                batch = self._existing_play_sessions_only(db, batch)
+                if batch:
+                    self._insert(db, batch)
+            return batch
+        finally:
+            db.close()
+
+    @staticmethod
+    def _insert(db: Session, batch: List[dict]) -> None:
+        accumulator = rollups.RollupAccumulator()
+        insert_events(db, accumulator.observe(batch) if rollups.accumulating() else batch)
+        rollups.apply(db, accumulator)
+        db.commit()
+
+    @staticmethod
+    def _existing_play_sessions_only(db: Session, batch: List[dict]) -> List[dict]:
+        queued = {row["play_session_id"] for row in batch}
+        existing = set(db.scalars(select(models.PlaySession.id).where(models.PlaySession.id.in_(queued))))
+        for play_session_id in queued - existing:
+            session_cache.forget_play_session(play_session_id)
+        return [row for row in batch if row["play_session_id"] in existing]
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, throughput counters and flush latency/batch size."""
+        return {
+            "enabled": self.is_running,
+            "depth": self.depth,
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_sec": self.flush_interval,
+            "events_enqueued": self.events_enqueued,
+            "events_rejected": self.events_rejected,
+            "events_flushed": self.events_flushed,
+            "events_failed": self.events_failed,
+            "flush_count": self.flush_count,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": (
+                self.events_flushed / self.flush_count if self.flush_count else 0.0
+            ),
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": (
+                round(self.total_flush_ms / self.flush_count, 3) if self.flush_count else 0.0
+            ),
+        }
+
+
+# Shared queue used by the API (started in the app lifespan when enabled)
+event_queue = WriteBehindQueue()
@@ -0,0 +1,239 @@
+"""
+Background participant data deletion (withdrawal jobs).
+
+A withdrawal creates a DeletionJob row and runs the deletion as a task on
+the worker's event loop. The deletion is set-based, with a fixed number of
+statements however much data the participant has, and it runs in one
+transaction together with the consent update and the WithdrawalAudit row, so
+either everything is deleted and audited or nothing changes.
+
+The request waits up to WEBTICS_WITHDRAWAL_SYNC_WAIT seconds for the job and
+answers directly if it finishes; otherwise the participant gets the job id
+and polls its status, which any worker can answer from the table.
+
+Two withdrawals of one consent can race past the active job check and both
+start a job. The second to get the consent finds it already withdrawn and
+completes with the counts of the job that deleted the data.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set
+from uuid import uuid4
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import heatmaps, metrics, models, models_research, rollups, session_cache, study_stats
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger("webtics.jobs")
+
+# Seconds a withdrawal request waits for its job before returning 202
+WITHDRAWAL_SYNC_WAIT_SEC = float(os.getenv("WEBTICS_WITHDRAWAL_SYNC_WAIT", "10"))
+# Seconds shutdown waits for running jobs to commit
+JOB_DRAIN_TIMEOUT_SEC = 30.0
+
+ACTIVE_STATUSES = ("pending", "running")
+
+_tasks: Dict[str, asyncio.Task] = {}
+# Strong references so running tasks are not garbage collected
+_running: Set[asyncio.Task] = set()
+
+
+def new_job_id() -> str:
+    return uuid4().hex
+
+
+def submit(job_id: str, coro) -> asyncio.Task:
+    """Run a job coroutine on the current event loop."""
+    task = asyncio.create_task(coro)
+    _tasks[job_id] = task
+    _running.add(task)
+
+    def done(task: asyncio.Task) -> None:
+        _running.discard(task)
+        _tasks.pop(job_id, None)
+
+    task.add_done_callback(done)
+    return task
+
+
+def task_for(job_id: str) -> Optional[asyncio.Task]:
+    """The running task for a job started by this worker, if any."""
+    return _tasks.get(job_id)
+
+
+async def drain(timeout: float = JOB_DRAIN_TIMEOUT_SEC) -> None:
+    """Wait for running jobs at shutdown so their transactions commit."""
+    if _running:
+        await asyncio.wait(set(_running), timeout=timeout)
+
+
+async def delete_participant_data(db: AsyncSession, participant_id: str) -> Dict[str, list]:
+    """
+    Delete a participant's events, play sessions and metric sessions.
+
+    Runs inside the caller's transaction. Returns the deleted ids so the
+    caller can evict them from the session cache.
+    """
+    metric_session_ids = (await db.scalars(
+        select(models.MetricSession.id).where(models.MetricSession.unique_id == participant_id)
+    )).all()
+    if not metric_session_ids:
+        return {"events": 0, "metric_session_ids": [], "play_session_ids": []}
+
+    play_session_ids = (await db.scalars(
+        select(models.PlaySession.id).where(
+            models.PlaySession.metric_session_id.in_(metric_session_ids)
+        )
+    )).all()
+
+    events_deleted = 0
+    if play_session_ids:
+        # No timestamp bound: erasure has to reach events from skewed client
+        # clocks and legacy rows migrated into the DEFAULT partition too
+        delete_events = (
+            delete(models.Event)
+            .where(models.Event.play_session_id.in_(play_session_ids))
+            .execution_options(synchronize_session=False)
+        )
+        if heatmaps.HEATMAPS_ENABLED:
+            deleted = (await db.execute(delete_events.returning(*heatmaps.POINT_COLUMNS))).all()
+            events_deleted = len(deleted)
+            await rollups.forget_heatmap_points_async(db, deleted)
+        else:
+            events_deleted = (await db.execute(delete_events)).rowcount
+
+        await rollups.forget_play_sessions_async(db, play_session_ids)
+        await db.execute(
+            delete(models.PlaySession).where(models.PlaySession.id.in_(play_session_ids))
+            .execution_options(synchronize_session=False)
+        )
+    await db.execute(
+        delete(models.MetricSession).where(models.MetricSession.id.in_(metric_session_ids))
+        .execution_options(synchronize_session=False)
+    )
+    return {
+        "events": events_deleted,
+        "metric_session_ids": metric_session_ids,
+        "play_session_ids": play_session_ids,
+    }
+
+
+async def run_withdrawal(
+    job_id: str,
+    request_ip_hash: Optional[str],
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+) -> None:
+    """Delete a withdrawn participant's data and audit it atomically."""
+    started = time.perf_counter()
+    async with session_factory() as db:
+        job = await db.get(models_research.DeletionJob, job_id)
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        await db.commit()
+
+        consent_query = select(models_research.ResearchConsent).where(
+            models_research.ResearchConsent.id == job.consent_id
+        )
+        if db.bind.dialect.name == "postgresql":
+            # A concurrent withdrawal of the same consent waits for this one
+            consent_query = consent_query.with_for_update()
+
+        try:
+            consent = await db.scalar(consent_query)
+            if not consent.is_active:
+                await _complete_as_duplicate(db, job)
+                metrics.withdrawal_job_duration.observe(time.perf_counter() - started, ("completed",))
+                logger.info(f"Withdrawal job {job_id}: consent {consent.id} was already withdrawn")
+                return
+
+            deleted = await delete_participant_data(db, consent.participant_id)
+            study_id = consent.study_id
+            now = datetime.utcnow()
+
+            consent.is_active = False
+            consent.withdrawn_at = now
+            consent.data_deleted_at = now
+
+            db.add(models_research.WithdrawalAudit(
+                consent_id=consent.id,
+                withdrawal_code_hash=consent.withdrawal_code_hash,
+                participant_id=consent.participant_id,
+                events_deleted=deleted["events"],
+                sessions_deleted=len(deleted["metric_session_ids"]),
+                success=True,
+                request_ip_hash=request_ip_hash,
+                requested_at=job.requested_at,
+                completed_at=now
+            ))
+
+            job.status = "completed"
+            job.events_deleted = deleted["events"]
+            job.sessions_deleted = len(deleted["metric_session_ids"])
+            job.completed_at = now
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Withdrawal job {job_id} failed: {e}", exc_info=True)
+            job = await db.get(models_research.DeletionJob, job_id)
+            consent = await db.get(models_research.ResearchConsent, job.consent_id)
+            now = datetime.utcnow()
+            job.status = "failed"
+            job.error_message = str(e)[:500]
+            job.completed_at = now
+            db.add(models_research.WithdrawalAudit(
+                consent_id=consent.id,
+                withdrawal_code_hash=consent.withdrawal_code_hash,
+                participant_id=consent.participant_id,
+                success=False,
+                error_message=str(e)[:500],
+                request_ip_hash=request_ip_hash,
+                requested_at=job.requested_at,
+                completed_at=now
+            ))
+            await db.commit()
+            metrics.withdrawal_job_duration.observe(time.perf_counter() - started, ("failed",))
+            return
+
+    metrics.withdrawal_job_duration.observe(time.perf_counter() - started, ("completed",))
+    # The study's active/withdrawn counts changed
+    study_stats.forget(study_id)
+    # Deleted sessions must no longer pass the ingest existence check
+    for play_session_id in deleted["play_session_ids"]:
+        session_cache.forget_play_session(play_session_id)
+    for session_id in deleted["metric_session_ids"]:
+        session_cache.forget_metric_session(session_id)
+    logger.info(
+        f"Withdrawal job {job_id}: {job.sessions_deleted} sessions, "
+        f"{job.events_deleted} events deleted"
+    )
+
+
+async def _complete_as_duplicate(db: AsyncSession, job: models_research.DeletionJob) -> None:
+    """Complete a job whose consent a concurrent job has already withdrawn."""
+    done = await db.scalar(
+        select(models_research.DeletionJob).where(
+            models_research.DeletionJob.consent_id == job.consent_id,
+            models_research.DeletionJob.status == "completed"
+        ).order_by(models_research.DeletionJob.completed_at.desc()).limit(1)
+    )
+    job.status = "completed"
+    job.events_deleted = done.events_deleted if done is not None else 0
+    job.sessions_deleted = done.sessions_deleted if done is not None else 0
+    job.completed_at = done.completed_at if done is not None else datetime.utcnow()
+    await db.commit()
+
+
+async def active_job_for(db: AsyncSession, consent_id: int) -> Optional[models_research.DeletionJob]:
+    """A pending or running deletion job for a consent, if one exists."""
+    return await db.scalar(
+        select(models_research.DeletionJob).where(
+            models_research.DeletionJob.consent_id == consent_id,
+            models_research.DeletionJob.status.in_(ACTIVE_STATUSES)
+        ).order_by(models_research.DeletionJob.requested_at.desc()).limit(1)
+    )
@@ -0,0 +1,254 @@
+"""
+Live event fan-out for dashboard streams (Server-Sent Events).
+
+The ingest endpoints publish newly accepted events to an in-process hub,
+which hands each batch to every subscriber of its metric session or play
+session. A batch is serialized once however many subscribers there are, and
+publishing never waits on a subscriber: each one has a bounded buffer, and a
+subscriber that falls more than WEBTICS_LIVE_BUFFER_EVENTS behind is dropped
+(its stream ends with an "overflow" event, and the client reloads and
+reconnects) rather than slowing ingest or growing memory.
+
+Events are published once committed; with the write-behind queue, by its
+flusher after each batch. Bulk-inserted events are pushed as the rows
+written, without ids; clients that need ids reload through
+GET /api/v1/sessions/{id}/events. The hub is per
+worker: with several workers a stream only carries events ingested by the
+worker it is connected to.
+
+Streams stay open until the client leaves, so uvicorn's graceful shutdown
+would wait on them forever; run it with --timeout-graceful-shutdown (the
+Dockerfile does) and browsers reconnect to the next worker.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Dict, Iterable, Optional, Set, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+logger = logging.getLogger("webtics.live")
+
+LIVE_BUFFER_EVENTS = int(os.getenv("WEBTICS_LIVE_BUFFER_EVENTS", "1000"))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("WEBTICS_LIVE_MAX_SUBSCRIBERS", "5000"))
+# Seconds between keepalive comments on an idle stream
+LIVE_KEEPALIVE_SEC = float(os.getenv("WEBTICS_LIVE_KEEPALIVE", "15"))
+
+Topic = Tuple[str, int]
+
+
+class TooManySubscribersError(Exception):
+    """Raised when the hub is at WEBTICS_LIVE_MAX_SUBSCRIBERS."""
+    pass
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default).encode("utf-8")
+
+
+def _wake_threadsafe(loop: asyncio.AbstractEventLoop, ready: asyncio.Event) -> None:
+    """Set an asyncio.Event owned by `loop` from any thread or loop."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        ready.set()
+    elif not loop.is_closed():
+        loop.call_soon_threadsafe(ready.set)
+
+
+class Subscription:
+    """One stream's bounded buffer of serialized event batches."""
+
+    def __init__(self, topic: Topic, max_events: int):
+        self.topic = topic
+        self.max_events = max_events
+        self.dropped = False
+        self.events_delivered = 0
+
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._buffer: Deque[Tuple[bytes, int]] = deque()
+        self._buffered_events = 0
+        self._lock = threading.Lock()
+
+    @property
+    def buffered_events(self) -> int:
+        return self._buffered_events
+
+    def offer(self, payload: bytes, count: int) -> bool:
+        """Buffer a batch without blocking; False if this drops the subscriber."""
+        with self._lock:
+            if self.dropped:
+                return False
+            if self._buffered_events + count > self.max_events:
+                self.dropped = True
+                self._buffer.clear()
+                self._buffered_events = 0
+            else:
+                self._buffer.append((payload, count))
+                self._buffered_events += count
+        _wake_threadsafe(self._loop, self._ready)
+        return not self.dropped
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Next serialized batch, or None on timeout.
+
+        Raises OverflowError once the subscriber has been dropped.
+        """
+        while True:
+            with self._lock:
+                if self.dropped:
+                    raise OverflowError("Subscriber fell too far behind")
+                if self._buffer:
+                    payload, count = self._buffer.popleft()
+                    self._buffered_events -= count
+                    self.events_delivered += count
+                    return payload
+                self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+
+class LiveHub:
+    """Subscribers per metric session and play session."""
+
+    def __init__(self, max_subscribers: int = LIVE_MAX_SUBSCRIBERS, buffer_events: int = LIVE_BUFFER_EVENTS):
+        self.max_subscribers = max_subscribers
+        self.buffer_events = buffer_events
+        self._topics: Dict[Topic, Set[Subscription]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+        self.batches_published = 0
+        self.events_published = 0
+        self.subscribers_dropped = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._count
+
+    def subscribe(self, metric_session_id: Optional[int] = None, play_session_id: Optional[int] = None) -> Subscription:
+        """Subscribe to a metric session or a play session on the running loop."""
+        if (metric_session_id is None) == (play_session_id is None):
+            raise ValueError("Subscribe to exactly one of a metric session or a play session")
+        topic = ("session", metric_session_id) if metric_session_id is not None else ("play_session", play_session_id)
+        subscription = Subscription(topic, self.buffer_events)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribersError(f"{self._count} live subscribers already connected")
+            self._topics.setdefault(topic, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+            self._count -= 1
+
+    def has_subscribers(self, play_session_id: int, metric_session_id: int) -> bool:
+        """Cheap check so ingest only materializes rows when someone listens."""
+        topics = self._topics
+        return bool(topics) and (
+            ("play_session", play_session_id) in topics or ("session", metric_session_id) in topics
+        )
+
+    def publish(self, play_session_id: int, metric_session_id: int, rows: Iterable[dict]) -> int:
+        """
+        Hand newly ingested event rows to their subscribers.
+
+        Returns the number of subscribers the batch was delivered to.
+        """
+        with self._lock:
+            subscribers = [
+                *self._topics.get(("play_session", play_session_id), ()),
+                *self._topics.get(("session", metric_session_id), ()),
+            ]
+        if not subscribers:
+            return 0
+        events = [{"id": row.get("id"), **row} for row in rows]
+        if not events:
+            return 0
+        payload = _dumps(events)
+
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.dropped:
+                # Already told to resync; its stream unsubscribes shortly
+                continue
+            if subscription.offer(payload, len(events)):
+                delivered += 1
+            else:
+                self.subscribers_dropped += 1
+                logger.info(f"Dropped slow live subscriber on {subscription.topic[0]} {subscription.topic[1]}")
+        self.batches_published += 1
+        self.events_published += len(events)
+        return delivered
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "subscribers": self._count,
+            "topics": len(self._topics),
+            "max_subscribers": self.max_subscribers,
+            "buffer_events": self.buffer_events,
+            "batches_published": self.batches_published,
+            "events_published": self.events_published,
+            "subscribers_dropped": self.subscribers_dropped,
+        }
+
+
+async def sse_stream(
+    hub: "LiveHub",
+    subscription: Subscription,
+    keepalive: float = LIVE_KEEPALIVE_SEC,
+) -> AsyncIterator[bytes]:
+    """
+    Server-Sent Events for a subscription.
+
+    Each ingested batch is one "events" message whose data is a JSON array.
+    Idle streams get a comment every `keepalive` seconds so proxies keep the
+    connection open. A dropped subscriber gets an "overflow" message and the
+    stream ends.
+    """
+    try:
+        yield b"retry: 3000\n: connected\n\n"
+        while True:
+            try:
+                payload = await subscription.get(timeout=keepalive)
+            except OverflowError:
+                yield b"event: overflow\ndata: {}\n\n"
+                return
+            if payload is None:
+                yield b": keepalive\n\n"
+            else:
+                yield b"event: events\ndata: " + payload + b"\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+
+live_hub = LiveHub()
@@ -1,18 +1,36 @@
 """FastAPI main application for WebTics telemetry backend."""
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError as PydanticValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+from typing import Iterable, List, Optional
 from datetime import datetime
+from contextlib import asynccontextmanager
 import os
 import logging
 
-from . import models, schemas, models_research
-from .database import engine, get_db
-from .routers import research
-from .middleware.data_validation import validation_middleware
-from .middleware.security import SecurityHeadersMiddleware, https_redirect_middleware
+from . import models, schemas, models_research, bulk_insert, wire_format, session_cache, partitions, retention, migrations, jobs, pagination, rollups, rate_limit, metrics, db_pool
+from .database import engine, async_engine, get_async_db
+from .routers import research, internal, analytics, heatmaps
+from .ingest_queue import event_queue, QueueFullError, WRITE_BEHIND_ENABLED
+from .live_hub import live_hub, sse_stream, TooManySubscribersError
+from .middleware.data_validation import (
+    ValidationMiddleware,
+    validate_event_batch,
+    decode_json,
+    parse_event,
+    parse_event_batch,
+    parse_session,
+    ValidationError,
+    event_rule_registry
+)
+from .ndjson import iter_ndjson_lines, NDJSON_MEDIA_TYPES
+from .middleware.security import SecurityHeadersMiddleware, HTTPSRedirectMiddleware
+from .middleware.admission import AdmissionControlMiddleware, admission_controller
 
 # Configure logging
 logging.basicConfig(
@@ -21,23 +39,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Streaming NDJSON ingestion limits
+NDJSON_CHUNK_SIZE = int(os.getenv("WEBTICS_NDJSON_CHUNK_SIZE", "1000"))
+NDJSON_MAX_LINE_BYTES = int(os.getenv("WEBTICS_NDJSON_MAX_LINE_BYTES", "16384"))
+NDJSON_MAX_REPORTED_ERRORS = 100
+# Largest page of events returned by one read
+MAX_EVENTS_PAGE = int(os.getenv("WEBTICS_MAX_EVENTS_PAGE", "1000"))
+
+# The partitioned events table has to exist before create_all() would
+# create a plain one
+if partitions.PARTITIONING_ENABLED:
+    if partitions.partition_manager.supported:
+        partitions.partition_manager.ensure()
+    else:
+        logger.warning("WEBTICS_EVENT_PARTITIONING requires PostgreSQL; ignoring")
+
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 models_research.Base.metadata.create_all(bind=engine)
+# Columns and indexes added since the tables were created
+migrations.upgrade(engine)
+research.legacy_consents_remaining = migrations.legacy_consents(engine) > 0
+if research.legacy_consents_remaining and not research.WITHDRAWAL_LEGACY_SCAN:
+    logger.warning(
+        "Active consents without a withdrawal lookup digest cannot withdraw "
+        "while WEBTICS_WITHDRAWAL_LEGACY_SCAN=false"
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background services."""
+    if WRITE_BEHIND_ENABLED:
+        await event_queue.start()
+    if partitions.PARTITIONING_ENABLED and partitions.partition_manager.supported:
+        await partitions.partition_manager.start()
+    if retention.RETENTION_ENABLED:
+        await retention.retention_sweeper.start()
+    await rate_limit.invalid_attempts.start()
+    await event_rule_registry.start()
+    yield
+    await event_rule_registry.stop()
+    await rate_limit.invalid_attempts.stop()
+    await retention.retention_sweeper.stop()
+    await partitions.partition_manager.stop()
+    # Let running withdrawal deletions commit
+    await jobs.drain()
+    # Flush any queued events before the worker exits
+    await event_queue.stop()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="WebTics Telemetry API",
     description="Lightweight game telemetry and metrics system with research ethics compliance",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Include research ethics router
 app.include_router(research.router)
+app.include_router(internal.router)
+app.include_router(analytics.router)
+app.include_router(heatmaps.router)
 
 # Security middleware
 app.add_middleware(SecurityHeadersMiddleware)
-app.middleware("http")(https_redirect_middleware)
-app.middleware("http")(validation_middleware)
+app.add_middleware(HTTPSRedirectMiddleware)
+app.add_middleware(ValidationMiddleware)
+# Inside CORS, so browser builds can read Retry-After on refusals
+app.add_middleware(AdmissionControlMiddleware)
 
 # CORS middleware - use environment variable for allowed origins
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "*").split(",")
@@ -49,8 +120,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination headers the dashboard reads, and Retry-After for client backoff
+    expose_headers=["X-Next-Cursor", "Link", "ETag", "X-Heatmap-Total", "X-Heatmap-Max", "Retry-After"],
 )
 
+if metrics.METRICS_ENABLED:
+    # Outermost, so refusals by the other middleware are measured too
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    # Current state of this worker, read from the existing stats at scrape time
+    def _pool_checked_out():
+        return {
+            (name,): db_pool.pool_state(pool_engine).get("checked_out", 0)
+            for name, pool_engine in (("sync", engine), ("async", async_engine.sync_engine))
+        }
+
+    metrics.registry.gauge_function(
+        "webtics_db_pool_checked_out", "Connections checked out of each pool.", _pool_checked_out, ("pool",)
+    )
+    metrics.registry.gauge_function(
+        "webtics_ingest_queue_depth", "Events waiting in the write-behind queue.", lambda: event_queue.depth
+    )
+    metrics.registry.gauge_function(
+        "webtics_admission_in_flight", "Ingest requests being handled.", lambda: admission_controller.in_flight
+    )
+    metrics.registry.counter_function(
+        "webtics_admission_refused_total", "Ingest requests refused by admission control.",
+        lambda: {(reason,): count for reason, count in admission_controller.refused.items()}, ("reason",)
+    )
+    metrics.registry.gauge_function(
+        "webtics_live_subscribers", "Live event stream subscribers.", lambda: live_hub.stats()["subscribers"]
+    )
+    metrics.registry.counter_function(
+        "webtics_code_attempt_global_alerts_total",
+        "Windows in which failed withdrawal-code attempts over all clients exceeded the global limit.",
+        lambda: rate_limit.code_attempt_limiter.global_alerts
+    )
+
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -72,6 +178,61 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+async def require_play_session(db: AsyncSession, play_session_id: int) -> session_cache.PlaySessionInfo:
+    """Check the parent play session exists (and is open, if configured)."""
+    info = await session_cache.lookup_play_session(db, play_session_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Play session not found")
+    if info.closed and session_cache.REJECT_CLOSED_PLAY_SESSIONS:
+        raise HTTPException(status_code=409, detail="Play session is closed")
+    return info
+
+
+@asynccontextmanager
+async def play_session_write(db: AsyncSession, play_session_id: int):
+    """
+    Answer 404 when an event write fails because its play session is gone.
+
+    The existence check is cached per worker, so a withdrawal or retention
+    sweep in another worker may have deleted the play session since; the
+    insert then violates the events foreign key.
+    """
+    try:
+        yield
+    except IntegrityError:
+        await db.rollback()
+        session_cache.forget_play_session(play_session_id)
+        if await session_cache.lookup_play_session(db, play_session_id) is None:
+            raise HTTPException(status_code=404, detail="Play session not found")
+        raise
+
+
+async def write_events(
+    db: AsyncSession,
+    play_session_id: int,
+    info: session_cache.PlaySessionInfo,
+    rows: Iterable[dict]
+) -> int:
+    """
+    Bulk insert event rows with their rollups in one transaction and commit.
+
+    Committed events are then pushed to live subscribers, if there are any.
+    """
+    published = None
+    if live_hub.has_subscribers(play_session_id, info.metric_session_id):
+        rows = published = list(rows)
+    accumulator = rollups.RollupAccumulator()
+    if rollups.accumulating():
+        rows = accumulator.observe(rows)
+    async with play_session_write(db, play_session_id):
+        events_logged = await bulk_insert.insert_events_async(db, rows)
+        await rollups.apply_async(db, accumulator)
+        await db.commit()
+    if published is not None:
+        live_hub.publish(play_session_id, info.metric_session_id, published)
+    return events_logged
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -82,16 +243,40 @@ async def root():
     }
 
 
-@app.post("/api/v1/sessions", response_model=schemas.MetricSessionResponse)
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics of this worker, in the text exposition format (see app/metrics.py)."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def json_body(schema: dict) -> dict:
+    """OpenAPI request body for endpoints that parse JSON in a dependency."""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": schema}}
+        }
+    }
+
+
+@app.post(
+    "/api/v1/sessions",
+    response_model=schemas.MetricSessionResponse,
+    openapi_extra=json_body(schemas.MetricSessionCreate.model_json_schema())
+)
 async def create_session(
-    session_data: schemas.MetricSessionCreate,
-    db: Session = Depends(get_db)
+    session_data: schemas.MetricSessionCreate = Depends(parse_session),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new metric session."""
     # Check if session already exists
-    existing = db.query(models.MetricSession).filter(
-        models.MetricSession.unique_id == session_data.unique_id
-    ).first()
+    existing = await db.scalar(
+        select(models.MetricSession.id).where(
+            models.MetricSession.unique_id == session_data.unique_id
+        )
+    )
 
     if existing:
         raise HTTPException(status_code=400, detail="Session already exists")
@@ -101,36 +286,33 @@ async def create_session(
         build_number=session_data.build_number
     )
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    await db.commit()
+    session_cache.remember_metric_session(db_session.id)
     return db_session
 
 
 @app.post("/api/v1/sessions/{session_id}/close")
-async def close_session(session_id: int, db: Session = Depends(get_db)):
+async def close_session(session_id: int, db: AsyncSession = Depends(get_async_db)):
     """Close a metric session."""
-    session = db.query(models.MetricSession).filter(
-        models.MetricSession.id == session_id
-    ).first()
+    session = await db.get(models.MetricSession, session_id)
 
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
     session.closed_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    session_cache.remember_metric_session(session_id, closed=True)
     return {"status": "closed", "session_id": session_id}
 
 
 @app.post("/api/v1/play-sessions", response_model=schemas.PlaySessionResponse)
 async def create_play_session(
     play_session_data: schemas.PlaySessionCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new play session within a metric session."""
-    # Verify metric session exists
-    metric_session = db.query(models.MetricSession).filter(
-        models.MetricSession.id == play_session_data.metric_session_id
-    ).first()
+    # Verify metric session exists (cached)
+    metric_session = await session_cache.lookup_metric_session(db, play_session_data.metric_session_id)
 
     if not metric_session:
         raise HTTPException(status_code=404, detail="Metric session not found")
@@ -139,40 +321,69 @@ async def create_play_session(
         metric_session_id=play_session_data.metric_session_id
     )
     db.add(db_play_session)
-    db.commit()
-    db.refresh(db_play_session)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Deleted by another worker since its cached existence check
+        await db.rollback()
+        session_cache.forget_metric_session(play_session_data.metric_session_id)
+        if await session_cache.lookup_metric_session(db, play_session_data.metric_session_id) is None:
+            raise HTTPException(status_code=404, detail="Metric session not found")
+        raise
+    session_cache.remember_play_session(db_play_session.id, db_play_session.metric_session_id)
     return db_play_session
 
 
 @app.post("/api/v1/play-sessions/{play_session_id}/close")
-async def close_play_session(play_session_id: int, db: Session = Depends(get_db)):
+async def close_play_session(play_session_id: int, db: AsyncSession = Depends(get_async_db)):
     """Close a play session."""
-    play_session = db.query(models.PlaySession).filter(
-        models.PlaySession.id == play_session_id
-    ).first()
+    play_session = await db.get(models.PlaySession, play_session_id)
 
     if not play_session:
         raise HTTPException(status_code=404, detail="Play session not found")
 
     play_session.ended_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    session_cache.remember_play_session(
+        play_session_id, play_session.metric_session_id, closed=True
+    )
     return {"status": "closed", "play_session_id": play_session_id}
 
 
-@app.post("/api/v1/events", response_model=schemas.EventResponse)
+@app.post(
+    "/api/v1/events",
+    response_model=schemas.EventResponse,
+    responses={202: {"description": "Event queued for write-behind flush"}},
+    openapi_extra=json_body(schemas.EventCreate.model_json_schema())
+)
 async def log_event(
-    event: schemas.EventCreate,
     play_session_id: int,
-    db: Session = Depends(get_db)
+    event: schemas.EventCreate = Depends(parse_event),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Log a single telemetry event."""
-    # Verify play session exists
-    play_session = db.query(models.PlaySession).filter(
-        models.PlaySession.id == play_session_id
-    ).first()
-
-    if not play_session:
-        raise HTTPException(status_code=404, detail="Play session not found")
+    """
+    Log a single telemetry event.
+
+    With WEBTICS_WRITE_BEHIND enabled the event is queued and flushed in bulk
+    by a background task; the request returns 202 without waiting for the write.
+    """
+    # Verify play session exists (cached)
+    info = await require_play_session(db, play_session_id)
+
+    if event_queue.is_running:
+        try:
+            event_queue.enqueue(play_session_id, event, info.metric_session_id)
+        except QueueFullError:
+            raise HTTPException(
+                status_code=503,
+                detail="Event queue is full. Please retry later.",
+                headers={"Retry-After": "1"}
+            )
+        metrics.record_ingest("json", 1)
+        return JSONResponse(
+            status_code=202,
+            content={"status": "queued", "play_session_id": play_session_id}
+        )
 
     db_event = models.Event(
         play_session_id=play_session_id,
@@ -185,65 +396,257 @@ async def log_event(
         data=event.data
     )
     db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
+    async with play_session_write(db, play_session_id):
+        if rollups.accumulating():
+            await db.flush()
+            accumulator = rollups.RollupAccumulator()
+            accumulator.add({column: getattr(db_event, column) for column in bulk_insert.EVENT_COLUMNS})
+            await rollups.apply_async(db, accumulator)
+        await db.commit()
+    metrics.record_ingest("json", 1)
+    if live_hub.has_subscribers(play_session_id, info.metric_session_id):
+        live_hub.publish(play_session_id, info.metric_session_id, [
+            {column: getattr(db_event, column) for column in ("id", *bulk_insert.EVENT_COLUMNS)}
+        ])
     return db_event
 
 
-@app.post("/api/v1/events/batch")
+@app.post(
+    "/api/v1/events/batch",
+    openapi_extra=json_body({"type": "array", "items": schemas.EventCreate.model_json_schema()})
+)
 async def log_events_batch(
-    events: List[schemas.EventCreate],
     play_session_id: int,
-    db: Session = Depends(get_db)
+    events: List[schemas.EventCreateDict] = Depends(parse_event_batch),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Log multiple telemetry events in a batch."""
-    # Verify play session exists
-    play_session = db.query(models.PlaySession).filter(
-        models.PlaySession.id == play_session_id
-    ).first()
+    # Verify play session exists (cached)
+    info = await require_play_session(db, play_session_id)
 
-    if not play_session:
-        raise HTTPException(status_code=404, detail="Play session not found")
+    # Stream rows straight into COPY/Core insert, skipping the ORM
+    events_logged = await write_events(
+        db, play_session_id, info, bulk_insert.event_rows(play_session_id, events)
+    )
+    metrics.record_ingest("batch", events_logged)
+
+    return {"status": "success", "events_logged": events_logged}
+
+
+@app.post("/api/v1/events/ndjson")
+async def log_events_ndjson(
+    request: Request,
+    play_session_id: int,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Log events streamed as NDJSON (one JSON event per line).
+
+    The body is read incrementally and each line is validated as it arrives.
+    Valid events are written in fixed-size chunks, so memory stays flat
+    regardless of upload size. Invalid lines are reported individually and
+    do not reject the rest of the upload.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_MEDIA_TYPES:
+        raise HTTPException(status_code=415, detail="Content-Type must be application/x-ndjson")
+
+    # Verify play session exists (cached)
+    info = await require_play_session(db, play_session_id)
+
+    events_logged = 0
+    lines_rejected = 0
+    errors = []
+    chunk: List[schemas.EventCreate] = []
+
+    async for line_no, line in iter_ndjson_lines(request.stream(), NDJSON_MAX_LINE_BYTES):
+        try:
+            if line is None:
+                raise ValidationError(f"Line exceeds {NDJSON_MAX_LINE_BYTES} bytes")
+            payload = decode_json(line)
+            if not isinstance(payload, dict):
+                raise ValidationError("Each line must be a JSON object")
+            event = schemas.EventCreate.model_validate(payload)
+            validate_event_batch([payload], [event.__dict__], label=None)
+        except PydanticValidationError as e:
+            lines_rejected += 1
+            metrics.validation_failures.inc(("schema",))
+            if len(errors) < NDJSON_MAX_REPORTED_ERRORS:
+                first = e.errors()[0]
+                field = ".".join(str(part) for part in first["loc"])
+                errors.append({"line": line_no, "error": f"{field}: {first['msg']}"})
+            continue
+        except ValidationError as e:
+            lines_rejected += 1
+            metrics.record_validation_errors(e.errors)
+            if len(errors) < NDJSON_MAX_REPORTED_ERRORS:
+                errors.append({"line": line_no, "error": str(e), "fields": e.errors})
+            continue
+        except ValueError as e:
+            lines_rejected += 1
+            metrics.validation_failures.inc(("json",))
+            if len(errors) < NDJSON_MAX_REPORTED_ERRORS:
+                errors.append({"line": line_no, "error": str(e)})
+            continue
+
+        chunk.append(event)
+
+        if len(chunk) >= NDJSON_CHUNK_SIZE:
+            events_logged += await write_events(
+                db, play_session_id, info, bulk_insert.event_rows(play_session_id, chunk)
+            )
+            chunk.clear()
+
+    if chunk:
+        events_logged += await write_events(
+            db, play_session_id, info, bulk_insert.event_rows(play_session_id, chunk)
+        )
+
+    metrics.record_ingest("ndjson", events_logged)
+    if lines_rejected:
+        logger.warning(
+            f"NDJSON upload for play session {play_session_id}: "
+            f"{lines_rejected} lines rejected, {events_logged} events logged"
+        )
 
-    db_events = [
-        models.Event(
-            play_session_id=play_session_id,
-            event_type=event.event_type,
-            event_subtype=event.event_subtype,
-            x=event.x,
-            y=event.y,
-            z=event.z,
-            magnitude=event.magnitude,
-            data=event.data
+    return {
+        "status": "partial" if lines_rejected else "success",
+        "events_logged": events_logged,
+        "lines_rejected": lines_rejected,
+        "errors": errors,
+        "errors_truncated": lines_rejected > len(errors)
+    }
+
+
+@app.post("/api/v1/events/binary")
+async def log_events_binary(
+    request: Request,
+    play_session_id: int,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Log a batch of events encoded in the compact binary wire format.
+
+    See app/wire_format.py for the format. Records are decoded with a single
+    NumPy structured view and validated column-wise; the whole batch is
+    rejected if any record is invalid.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != wire_format.MEDIA_TYPE:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Type must be {wire_format.MEDIA_TYPE}"
         )
-        for event in events
-    ]
 
-    db.add_all(db_events)
-    db.commit()
+    # Verify play session exists (cached)
+    info = await require_play_session(db, play_session_id)
+
+    body = await request.body()
+    try:
+        records, data = wire_format.decode_events(body)
+        wire_format.validate_records(records, data)
+        event_data = wire_format.decode_data(records, data)
+    except ValidationError as e:
+        logger.warning(f"Binary event batch rejected: {e}")
+        metrics.record_validation_errors(e.errors)
+        raise HTTPException(status_code=400, detail=e.errors)
+
+    events_logged = await write_events(
+        db, play_session_id, info, wire_format.record_rows(play_session_id, records, event_data)
+    )
+    metrics.record_ingest("binary", events_logged)
 
-    return {"status": "success", "events_logged": len(db_events)}
+    return {"status": "success", "events_logged": events_logged}
 
 
 @app.get("/api/v1/sessions/{session_id}/events", response_model=List[schemas.EventResponse])
 async def get_session_events(
     session_id: int,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_EVENTS_PAGE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    since_id: Optional[int] = None,
+    since_timestamp: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Retrieve events for a specific metric session."""
-    # Get all play sessions for this metric session
-    play_sessions = db.query(models.PlaySession).filter(
-        models.PlaySession.metric_session_id == session_id
-    ).all()
+    """
+    Retrieve events for a specific metric session, newest first.
+
+    Pages are keyset-paginated on (timestamp, id): when a page is full, the
+    X-Next-Cursor header (and a Link rel="next" header) gives the cursor for
+    the following page, so any page costs the same as the first. Optional
+    since (inclusive) and until (exclusive) bound the event timestamps.
+
+    Pollers pass since_id or since_timestamp (exclusive) to get only newer
+    events, and If-None-Match with the last ETag: when the session has not
+    changed the answer is 304 without reading any events.
+    """
+    before = None
+    if cursor is not None:
+        try:
+            before = pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    dialect_name = db.bind.dialect.name
+    version = (await db.execute(pagination.session_version_query(session_id, dialect_name))).one()
+    etag = pagination.events_etag(version, request.query_params.multi_items())
+    if pagination.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+    events = (await db.scalars(pagination.session_events_query(
+        session_id, limit, dialect_name,
+        before=before, since=since, until=until,
+        since_id=since_id, since_timestamp=since_timestamp
+    ))).all()
+
+    if len(events) == limit:
+        last = events[-1]
+        next_cursor = pagination.encode_cursor(last.timestamp, last.id)
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+    return events
+
 
-    if not play_sessions:
-        return []
+def live_stream_response(**topic) -> StreamingResponse:
+    """Subscribe to the live hub and stream the subscription as SSE."""
+    try:
+        subscription = live_hub.subscribe(**topic)
+    except TooManySubscribersError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return StreamingResponse(
+        sse_stream(live_hub, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs when the client disconnects before the stream starts
+        background=BackgroundTask(live_hub.unsubscribe, subscription)
+    )
 
-    play_session_ids = [ps.id for ps in play_sessions]
 
-    events = db.query(models.Event).filter(
-        models.Event.play_session_id.in_(play_session_ids)
-    ).order_by(models.Event.timestamp.desc()).limit(limit).all()
+@app.get("/api/v1/sessions/{session_id}/events/stream")
+async def stream_session_events(session_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events stream of events as they are ingested for a session.
 
-    return events
+    Each "events" message carries a JSON array of the events from one ingest
+    request. A client that falls too far behind gets an "overflow" message
+    and should reload the events and reconnect. See app/live_hub.py.
+    """
+    if await session_cache.lookup_metric_session(db, session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return live_stream_response(metric_session_id=session_id)
+
+
+@app.get("/api/v1/play-sessions/{play_session_id}/events/stream")
+async def stream_play_session_events(play_session_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Server-Sent Events stream of a play session's events; see stream_session_events."""
+    if await session_cache.lookup_play_session(db, play_session_id) is None:
+        raise HTTPException(status_code=404, detail="Play session not found")
+    return live_stream_response(play_session_id=play_session_id)
@@ -0,0 +1,415 @@
+"""
+Prometheus metrics for the backend, served at /metrics.
+
+Recorded on this worker (each worker keeps its own registry, so scrape
+every worker or run one per scrape target):
+
+- webtics_http_request_duration_seconds{method,route,status}: latency
+  histogram per route template (/api/v1/sessions/{session_id}/events, not
+  the concrete path); its _count is the request count
+- webtics_http_request_db_seconds{method,route} and
+  webtics_http_request_db_queries_total{method,route}: database time and
+  statements per request, from cursor events (plus COPY, which bypasses them)
+- webtics_events_ingested_total{format} and webtics_ingest_batch_events
+  {format}: events accepted and events per request (json, batch, ndjson,
+  binary); rate() gives events per second
+- webtics_validation_failures_total{rule}: rejected fields by rule
+- webtics_withdrawal_lookup_seconds{path} and
+  webtics_withdrawal_job_seconds{status}: withdrawal-code lookups (indexed
+  or legacy scan) and deletion jobs
+
+Scrape-time gauges come from the existing stats objects (pool, write-behind
+queue, admission). Recording is a dict lookup and a bisect under an
+uncontended lock; benchmarks/bench_metrics.py measures the overhead.
+WEBTICS_METRICS_ENABLED=false removes the middleware and the endpoint.
+"""
+
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+METRICS_ENABLED = os.getenv("WEBTICS_METRICS_ENABLED", "true").lower() == "true"
+
+# Starlette appends "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Seconds; request latency and database time per request
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Events per ingest request
+BATCH_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+# Withdrawal deletions take far longer than requests
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Route label for requests no route matched (404s), so paths never become labels
+UNMATCHED_ROUTE = "unmatched"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    """A metric family: one series per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Drop all series (tests)."""
+
+
+class Counter(Metric):
+    """Monotonic count per label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_label_text(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram per label values."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last is +Inf), sum]; counts are not
+        # cumulative until rendered
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def sum(self, labels: Labels = ()) -> float:
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        names = self.labelnames + ("le",)
+        lines = []
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_label_text(names, labels + (_format_value(bound),))} {cumulative}"
+                )
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class CallbackMetric(Metric):
+    """Gauge or counter read at scrape time: a number or {labels: number}."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], object],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        return [
+            f"{self.name}{_label_text(self.labelnames, labels)} {_format_value(sample)}"
+            for labels, sample in values
+        ]
+
+
+class Registry:
+    """Named metric families rendered together in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_function(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], object],
+        labelnames: Sequence[str] = (),
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, labelnames))
+
+    def counter_function(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], object],
+        labelnames: Sequence[str] = (),
+    ) -> CallbackMetric:
+        """A counter kept elsewhere (an existing stats object)."""
+        return self.register(CallbackMetric(name, documentation, callback, labelnames, kind="counter"))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception:
+                # A failing stats callback must not break the whole scrape
+                continue
+            lines += metric.header()
+            lines += samples
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "webtics_http_request_duration_seconds",
+    "HTTP request latency by route template and status.",
+    ("method", "route", "status"),
+)
+request_db_time = registry.histogram(
+    "webtics_http_request_db_seconds",
+    "Database time spent by each HTTP request.",
+    ("method", "route"),
+)
+request_db_queries = registry.counter(
+    "webtics_http_request_db_queries_total",
+    "Database statements executed by HTTP requests.",
+    ("method", "route"),
+)
+events_ingested = registry.counter(
+    "webtics_events_ingested_total",
+    "Events accepted by the ingest endpoints.",
+    ("format",),
+)
+ingest_batch_events = registry.histogram(
+    "webtics_ingest_batch_events",
+    "Events per ingest request.",
+    ("format",),
+    buckets=BATCH_BUCKETS,
+)
+validation_failures = registry.counter(
+    "webtics_validation_failures_total",
+    "Rejected event fields by validation rule.",
+    ("rule",),
+)
+withdrawal_lookup_duration = registry.histogram(
+    "webtics_withdrawal_lookup_seconds",
+    "Withdrawal-code lookups, by indexed digest or legacy consent scan.",
+    ("path",),
+)
+withdrawal_job_duration = registry.histogram(
+    "webtics_withdrawal_job_seconds",
+    "Participant data deletion jobs by outcome.",
+    ("status",),
+    buckets=JOB_BUCKETS,
+)
+
+
+def record_ingest(format: str, count: int) -> None:
+    """Count events accepted by one ingest request."""
+    events_ingested.inc((format,), count)
+    ingest_batch_events.observe(count, (format,))
+
+
+def record_validation_errors(errors: Iterable[dict]) -> None:
+    """Count structured validation errors by their rule ("type")."""
+    for error in errors:
+        rule = error.get("type", "value_error")
+        if rule == "value_error" and error.get("loc"):
+            # Generic checks (timestamp, data size) are named by their field
+            rule = error["loc"][-1]
+        validation_failures.inc((str(rule),))
+
+
+# Database time of the request being handled: [seconds, statements], or
+# None outside requests (background tasks record nothing)
+_db_timer: ContextVar[Optional[list]] = ContextVar("webtics_db_timer", default=None)
+
+_QUERY_STARTED = "webtics_query_started"
+
+
+def add_db_time(seconds: float, statements: int = 1) -> None:
+    """Charge database work that bypasses cursor events (COPY) to the request."""
+    timer = _db_timer.get()
+    if timer is not None:
+        timer[0] += seconds
+        timer[1] += statements
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time each statement an engine runs for the current request."""
+    if not METRICS_ENABLED:
+        # Any cursor listener moves SQLAlchemy off its fastest execute path
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _db_timer.get() is not None:
+            conn.info[_QUERY_STARTED] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop(_QUERY_STARTED, None)
+        if started is not None:
+            add_db_time(time.perf_counter() - started)
+
+
+def _route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Requests answered before routing (admission refusals, 405s) still
+    # belong to a route
+    app = scope.get("app")
+    for candidate in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = candidate.matches(scope)
+        if match != Match.NONE:
+            return getattr(candidate, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Record latency, status and database time per route template."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        timer = [0.0, 0]
+        token = _db_timer.set(timer)
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _db_timer.reset(token)
+            method = scope["method"]
+            route = _route_template(scope)
+            request_duration.observe(elapsed, (method, route, str(status)))
+            if timer[1]:
+                request_db_time.observe(timer[0], (method, route))
+                request_db_queries.inc((method, route), timer[1])
+
+
+def render() -> str:
+    return registry.render()
@@ -3,6 +3,6 @@ WebTics middleware package.
 Security and validation middleware for the FastAPI application.
 """
 
-from .data_validation import validation_middleware
+from .data_validation import ValidationMiddleware
 
-__all__ = ["validation_middleware"]
+__all__ = ["ValidationMiddleware"]
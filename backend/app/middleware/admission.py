@@ -0,0 +1,189 @@
+"""
+Admission control for the event ingest endpoints.
+
+When PostgreSQL slows down, ingest requests would otherwise pile up inside
+the worker until nginx gives up on them (proxy_read_timeout), while games
+keep retrying on top. POST /api/v1/events* requests are instead admitted
+only while this worker is healthy, and refused straight away otherwise:
+
+- 429 when WEBTICS_ADMISSION_MAX_IN_FLIGHT ingest requests are already
+  being handled
+- 503 when the recent average wait for a pooled database connection is
+  over WEBTICS_ADMISSION_MAX_POOL_WAIT_MS
+- 503 when the write-behind queue is more than
+  WEBTICS_ADMISSION_MAX_QUEUE_FILL full
+
+Refusals carry Retry-After, computed from how long the backlog should take
+to clear (request latency, pool wait, queue drain rate) and capped at
+WEBTICS_ADMISSION_MAX_RETRY_AFTER seconds. The SDKs back off exponentially
+and never retry sooner than that. Reads and live streams are not
+admission-controlled. State is at /api/v1/internal/admission.
+"""
+
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .. import db_pool
+from ..ingest_queue import WriteBehindQueue, event_queue
+
+logger = logging.getLogger("webtics.admission")
+
+ADMISSION_ENABLED = os.getenv("WEBTICS_ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("WEBTICS_ADMISSION_MAX_IN_FLIGHT", "100"))
+ADMISSION_MAX_POOL_WAIT_SEC = float(os.getenv("WEBTICS_ADMISSION_MAX_POOL_WAIT_MS", "1000")) / 1000
+ADMISSION_MAX_QUEUE_FILL = float(os.getenv("WEBTICS_ADMISSION_MAX_QUEUE_FILL", "0.9"))
+ADMISSION_MAX_RETRY_AFTER = int(os.getenv("WEBTICS_ADMISSION_MAX_RETRY_AFTER", "30"))
+
+INGEST_PATH_PREFIX = "/api/v1/events"
+# Weight of each request in the ingest latency average
+LATENCY_WEIGHT = 0.1
+
+# (status code, Retry-After seconds, reason)
+Refusal = Tuple[int, int, str]
+
+
+class AdmissionController:
+    """Decides whether this worker takes another ingest request."""
+
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_pool_wait: float = ADMISSION_MAX_POOL_WAIT_SEC,
+        max_queue_fill: float = ADMISSION_MAX_QUEUE_FILL,
+        max_retry_after: int = ADMISSION_MAX_RETRY_AFTER,
+        pool_wait: Optional[Callable[[], float]] = None,
+        queue: Optional[WriteBehindQueue] = event_queue,
+        enabled: bool = ADMISSION_ENABLED,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_pool_wait = max_pool_wait
+        self.max_queue_fill = max_queue_fill
+        self.max_retry_after = max_retry_after
+        self._pool_wait = pool_wait or _async_pool_wait
+        self.queue = queue
+        self.enabled = enabled
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.latency_sec = 0.0
+        self.admitted = 0
+        self.refused: Dict[str, int] = {"in_flight": 0, "pool_wait": 0, "queue": 0}
+        self.last_refusal: Optional[Dict[str, Any]] = None
+
+    def _retry_after(self, seconds: float) -> int:
+        return max(1, min(self.max_retry_after, math.ceil(seconds)))
+
+    def _queue_fill(self) -> float:
+        if self.queue is None or not self.queue.is_running or not self.queue.max_size:
+            return 0.0
+        return self.queue.depth / self.queue.max_size
+
+    def _queue_drain_sec(self) -> float:
+        """Time for the flusher to write what is queued, at its recent speed."""
+        queue = self.queue
+        if not queue.events_flushed or not queue.total_flush_ms:
+            return queue.flush_interval
+        rate = queue.events_flushed / (queue.total_flush_ms / 1000)
+        return queue.depth / rate + queue.flush_interval
+
+    def check(self) -> Optional[Refusal]:
+        """None to admit, else why and for how long the request is refused."""
+        if not self.enabled:
+            return None
+        if self.in_flight >= self.max_in_flight:
+            # The requests ahead of this one should finish within a latency
+            return 429, self._retry_after(self.latency_sec * self.in_flight / max(self.max_in_flight, 1)), "in_flight"
+        pool_wait = self._pool_wait()
+        if pool_wait > self.max_pool_wait:
+            return 503, self._retry_after(pool_wait), "pool_wait"
+        if self._queue_fill() > self.max_queue_fill:
+            return 503, self._retry_after(self._queue_drain_sec()), "queue"
+        return None
+
+    def admit(self) -> Optional[Refusal]:
+        """Check and, if admitted, count the request as in flight."""
+        refusal = self.check()
+        if refusal is None:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.admitted += 1
+            return None
+        status, retry_after, reason = refusal
+        self.refused[reason] += 1
+        self.last_refusal = {"reason": reason, "status": status, "retry_after": retry_after, "at": time.time()}
+        return refusal
+
+    def release(self, elapsed: float) -> None:
+        self.in_flight -= 1
+        self.latency_sec += LATENCY_WEIGHT * (elapsed - self.latency_sec)
+
+    def state(self) -> Dict[str, Any]:
+        refusal = self.check()
+        return {
+            "enabled": self.enabled,
+            "admitting": refusal is None,
+            "reason": refusal[2] if refusal else None,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "latency_ms": round(self.latency_sec * 1000, 3),
+            "pool_wait_ms": round(self._pool_wait() * 1000, 3),
+            "queue_fill": round(self._queue_fill(), 4),
+            "limits": {
+                "max_in_flight": self.max_in_flight,
+                "max_pool_wait_ms": self.max_pool_wait * 1000,
+                "max_queue_fill": self.max_queue_fill,
+                "max_retry_after_sec": self.max_retry_after,
+            },
+            "admitted": self.admitted,
+            "refused": dict(self.refused),
+            "last_refusal": self.last_refusal,
+        }
+
+
+def _async_pool_wait() -> float:
+    stats = db_pool.get_pool_stats("async")
+    return stats.recent_wait_sec() if stats is not None else 0.0
+
+
+admission_controller = AdmissionController()
+
+
+class AdmissionControlMiddleware:
+    """Refuse ingest requests early while the worker is overloaded."""
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(INGEST_PATH_PREFIX)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        refusal = self.controller.admit()
+        if refusal is not None:
+            status, retry_after, reason = refusal
+            logger.debug(f"Refused {scope['path']} ({reason}), Retry-After {retry_after}s")
+            response = JSONResponse(
+                status_code=status,
+                content={"detail": "Server is busy. Please retry later.", "reason": reason},
+                headers={"Retry-After": str(retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - started)
@@ -5,13 +5,32 @@ Prevents data corruption and injection attacks.
 """
 
 from fastapi import Request, HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from pydantic import TypeAdapter, ValidationError as PydanticValidationError
 from datetime import datetime, timezone
+from typing import Any, List, Optional
+import numpy as np
+import os
 import re
 import logging
 import json
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+from .. import metrics, schemas
+from .event_rules import EventRuleRegistry
+
 logger = logging.getLogger("webtics.validation")
 
+# Reject oversized bodies from the Content-Length header, before reading them
+# (matches the nginx client_max_body_size)
+MAX_BODY_BYTES = int(os.getenv("WEBTICS_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+
 # Validation rules based on domain knowledge
 VALIDATION_RULES = {
     "reaction_time_ms": {"min": 0, "max": 10000, "description": "Human reaction time 0-10 seconds"},
@@ -27,13 +46,32 @@ SAFE_STRING_PATTERN = re.compile(r'^[a-zA-Z0-9_\-\.]+$')
 UUID_PATTERN = re.compile(r'^[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}$', re.I)
 
 
+# Cap on structured errors returned for one request
+MAX_REPORTED_ERRORS = 100
+
+
 class ValidationError(Exception):
     """Custom exception for validation failures."""
-    pass
 
+    def __init__(self, message: str = "", errors: Optional[List[dict]] = None, field: Optional[str] = None):
+        super().__init__(message)
+        # The offending event field, when there is a single one
+        self.field = field
+        # Structured per-field errors, shaped like FastAPI's 422 details
+        self.errors = errors or [{
+            "loc": ["body", field] if field else ["body"], "msg": message, "type": "value_error"
+        }]
 
-def validate_numeric_range(value: float, field_name: str) -> None:
-    """Validate numeric value is within acceptable range."""
+
+# Per-event-type rules (magnitude ranges etc.), loaded from config files
+event_rule_registry = EventRuleRegistry(
+    VALIDATION_RULES,
+    max_event_type=VALIDATION_RULES["event_type"]["max"]
+)
+
+
+def validate_numeric_range(value: float, field_name: str, field: Optional[str] = None) -> None:
+    """Validate numeric value is within acceptable range (field defaults to the rule name)."""
     if field_name not in VALIDATION_RULES:
         return  # No rule defined, skip validation
 
@@ -41,19 +79,21 @@ def validate_numeric_range(value: float, field_name: str) -> None:
     if not (rule["min"] <= value <= rule["max"]):
         raise ValidationError(
             f"{field_name} value {value} outside valid range "
-            f"[{rule['min']}, {rule['max']}]. {rule['description']}"
+            f"[{rule['min']}, {rule['max']}]. {rule['description']}",
+            field=field or field_name
         )
 
 
 def validate_string_safe(value: str, field_name: str, max_length: int = 255) -> None:
     """Validate string is safe (alphanumeric + basic punctuation only)."""
     if len(value) > max_length:
-        raise ValidationError(f"{field_name} exceeds max length {max_length}")
+        raise ValidationError(f"{field_name} exceeds max length {max_length}", field=field_name)
 
     if not SAFE_STRING_PATTERN.match(value):
         raise ValidationError(
             f"{field_name} contains invalid characters. "
-            f"Only alphanumeric, underscore, hyphen, dot allowed."
+            f"Only alphanumeric, underscore, hyphen, dot allowed.",
+            field=field_name
         )
 
 
@@ -62,7 +102,7 @@ def validate_timestamp(timestamp_str: str) -> datetime:
     try:
         dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
     except ValueError as e:
-        raise ValidationError(f"Invalid timestamp format: {e}")
+        raise ValidationError(f"Invalid timestamp format: {e}", field="timestamp")
 
     # Check timestamp is not in future (allow 5 min clock skew)
     now = datetime.now(timezone.utc)
@@ -70,7 +110,8 @@ def validate_timestamp(timestamp_str: str) -> datetime:
 
     if dt.timestamp() > max_future:
         raise ValidationError(
-            f"Timestamp {timestamp_str} is in the future (server time: {now.isoformat()})"
+            f"Timestamp {timestamp_str} is in the future (server time: {now.isoformat()})",
+            field="timestamp"
         )
 
     return dt
@@ -83,7 +124,7 @@ def validate_event_data(event_data: dict) -> None:
     required = ["event_type"]
     for field in required:
         if field not in event_data:
-            raise ValidationError(f"Missing required field: {field}")
+            raise ValidationError(f"Missing required field: {field}", field=field)
 
     # Validate event types
     validate_numeric_range(event_data["event_type"], "event_type")
@@ -93,17 +134,16 @@ def validate_event_data(event_data: dict) -> None:
     # Validate coordinates
     for coord in ["x", "y", "z"]:
         if coord in event_data and event_data[coord] is not None:
-            validate_numeric_range(event_data[coord], "coordinates")
-
-    # Validate magnitude (used for reaction times, scores, etc.)
-    if "magnitude" in event_data and event_data["magnitude"] is not None:
-        mag = event_data["magnitude"]
-        # Infer validation rule based on event type
-        event_type = event_data["event_type"]
-        if event_type in [102, 103]:  # CORRECT_RESPONSE, INCORRECT_RESPONSE
-            validate_numeric_range(mag, "reaction_time_ms")
-        elif event_type in [104, 105]:  # TASK_SCORE
-            validate_numeric_range(mag, "accuracy_percent")
+            validate_numeric_range(event_data[coord], "coordinates", coord)
+
+    # Validate magnitude and other per-event-type rules (reaction times, scores, etc.)
+    columns = {
+        field: np.array([event_data.get(field)], dtype=np.float64)
+        for field in ("event_type", "event_subtype", "x", "y", "z", "magnitude")
+    }
+    errors = event_rule_registry.compiled.validate_columns(columns, indexed=False)
+    if errors:
+        raise ValidationError(errors[0]["msg"], errors, field=errors[0]["loc"][-1])
 
     # Validate timestamp if present
     if "timestamp" in event_data and event_data["timestamp"]:
@@ -112,11 +152,11 @@ def validate_event_data(event_data: dict) -> None:
     # Validate additional data JSON (if present)
     if "data" in event_data and event_data["data"]:
         if not isinstance(event_data["data"], dict):
-            raise ValidationError("'data' field must be a JSON object")
+            raise ValidationError("'data' field must be a JSON object", field="data")
         # Check JSON size
         json_str = json.dumps(event_data["data"])
         if len(json_str) > 10000:  # 10KB limit
-            raise ValidationError("'data' JSON exceeds 10KB limit")
+            raise ValidationError("'data' JSON exceeds 10KB limit", field="data")
 
 
 def validate_session_data(session_data: dict) -> None:
@@ -127,43 +167,229 @@ def validate_session_data(session_data: dict) -> None:
     if "build_number" in session_data and session_data["build_number"]:
         # Build number can have dots for versioning like "1.0.2"
         if len(session_data["build_number"]) > 50:
-            raise ValidationError("build_number exceeds max length 50")
-
-
-async def validation_middleware(request: Request, call_next):
-    """FastAPI middleware to validate all incoming requests."""
-
-    # Only validate POST requests with JSON body
-    if request.method == "POST":
-        # Validate event creation
-        if request.url.path.startswith("/api/v1/events"):
-            try:
-                body = await request.json()
-                validate_event_data(body)
-            except ValidationError as e:
-                logger.warning(f"Event validation failed: {e}")
-                raise HTTPException(status_code=400, detail=str(e))
-            except json.JSONDecodeError as e:
-                logger.warning(f"Invalid JSON in event: {e}")
-                raise HTTPException(status_code=400, detail="Invalid JSON format")
-            except Exception as e:
-                logger.error(f"Unexpected validation error: {e}", exc_info=True)
-                raise HTTPException(status_code=400, detail="Invalid request data")
-
-        # Validate session creation
-        elif request.url.path.startswith("/api/v1/sessions"):
-            try:
-                body = await request.json()
-                validate_session_data(body)
-            except ValidationError as e:
-                logger.warning(f"Session validation failed: {e}")
-                raise HTTPException(status_code=400, detail=str(e))
-            except json.JSONDecodeError as e:
-                logger.warning(f"Invalid JSON in session: {e}")
-                raise HTTPException(status_code=400, detail="Invalid JSON format")
-            except Exception as e:
-                logger.error(f"Unexpected validation error: {e}", exc_info=True)
-                raise HTTPException(status_code=400, detail="Invalid request data")
-
-    response = await call_next(request)
-    return response
+            raise ValidationError("build_number exceeds max length 50", field="build_number")
+
+
+def decode_json(body: bytes) -> Any:
+    """Decode a request body once, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _dumps_size(value: Any) -> int:
+    if orjson is not None:
+        return len(orjson.dumps(value))
+    return len(json.dumps(value))
+
+
+def _column(events: List[dict], field: str) -> np.ndarray:
+    """Build a float column from validated events (None becomes NaN)."""
+    return np.array([e.get(field) for e in events], dtype=np.float64)
+
+
+def _input_value(value: float):
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def validate_event_columns(columns: dict, label: Optional[str] = "Event") -> None:
+    """
+    Validate whole columns with vectorized checks.
+
+    Global ranges from VALIDATION_RULES apply to every event; per-event-type
+    rules come from the compiled event rule registry.
+
+    Args:
+        columns: float64 arrays keyed by event field (NaN = missing value)
+        label: Prefix for the offending row index in error messages,
+            or None for single events
+
+    Raises:
+        ValidationError: With structured errors for every offending field
+            (up to MAX_REPORTED_ERRORS); the message names the first one
+    """
+    errors: List[dict] = []
+    indexed = label is not None
+
+    def report(bad: np.ndarray, values: np.ndarray, name: str, rule_name: str, msg):
+        for index in np.flatnonzero(bad)[:MAX_REPORTED_ERRORS - len(errors)].tolist():
+            errors.append({
+                "loc": ["body", index, name] if indexed else ["body", name],
+                "msg": msg(values[index]),
+                "type": rule_name,
+                "input": _input_value(values[index]),
+            })
+
+    def check(values: np.ndarray, field_name: str, name: str):
+        rule = VALIDATION_RULES[field_name]
+        # NaN (missing) compares False on both sides, so it never fails
+        bad = (values < rule["min"]) | (values > rule["max"])
+        report(bad, values, name, field_name, lambda value: (
+            f"{name} value {value:g} outside valid range "
+            f"[{rule['min']}, {rule['max']}]. {rule['description']}"
+        ))
+
+    check(columns["event_type"], "event_type", "event_type")
+    check(columns["event_subtype"], "event_subtype", "event_subtype")
+    for coord in ("x", "y", "z"):
+        check(columns[coord], "coordinates", coord)
+
+    magnitude = columns["magnitude"]
+    report(np.isinf(magnitude), magnitude, "magnitude", "finite",
+           lambda value: "magnitude must be a finite number")
+
+    errors += event_rule_registry.compiled.validate_columns(
+        columns, indexed=indexed, limit=MAX_REPORTED_ERRORS - len(errors)
+    )
+
+    if errors:
+        first = errors[0]
+        prefix = f"{label} {first['loc'][1]}: " if indexed else ""
+        raise ValidationError(prefix + first["msg"], errors, field=first["loc"][-1])
+
+
+def validate_event_batch(
+    items: List[dict],
+    events: List[dict],
+    label: Optional[str] = "Event"
+) -> None:
+    """
+    Validate type-checked events column by column.
+
+    Range rules run as vectorized column checks; timestamp and data size
+    checks only touch the events that carry those fields.
+
+    Args:
+        items: The decoded request objects (for fields outside the schema)
+        events: The same events after type validation, as dicts
+        label: Prefix for the offending event index in error messages
+    """
+    if not events:
+        return
+    columns = {
+        field: _column(events, field)
+        for field in ("event_type", "event_subtype", "x", "y", "z", "magnitude")
+    }
+    validate_event_columns(columns, label)
+
+    for index, (item, event) in enumerate(zip(items, events)):
+        timestamp = item.get("timestamp")
+        data = event.get("data")
+        if not (timestamp or data):
+            continue
+        try:
+            if timestamp:
+                if not isinstance(timestamp, str):
+                    raise ValidationError("Invalid timestamp format: expected ISO 8601 string", field="timestamp")
+                validate_timestamp(timestamp)
+            if data and _dumps_size(data) > 10000:  # 10KB limit
+                raise ValidationError("'data' JSON exceeds 10KB limit", field="data")
+        except ValidationError as e:
+            raise ValidationError(
+                f"{label} {index}: {e}" if label else str(e),
+                [{
+                    "loc": ["body", index, e.field] if label else ["body", e.field],
+                    "msg": str(e),
+                    "type": "value_error",
+                }],
+                field=e.field
+            )
+
+
+_event_batch_adapter = TypeAdapter(List[schemas.EventCreateDict])
+
+
+async def _read_json(request: Request) -> Any:
+    try:
+        return decode_json(await request.body())
+    except ValueError as e:
+        logger.warning(f"Invalid JSON on {request.url.path}: {e}")
+        metrics.validation_failures.inc(("json",))
+        raise HTTPException(status_code=400, detail="Invalid JSON format")
+
+
+async def parse_event(request: Request) -> schemas.EventCreate:
+    """
+    Dependency: decode, type-check and validate a single event body once.
+
+    Replaces body parsing in middleware plus FastAPI's own parse.
+    """
+    payload = await _read_json(request)
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Event must be a JSON object")
+    try:
+        event = schemas.EventCreate.model_validate(payload)
+        validate_event_batch([payload], [event.__dict__], label=None)
+    except PydanticValidationError as e:
+        metrics.validation_failures.inc(("schema",))
+        raise RequestValidationError(e.errors())
+    except ValidationError as e:
+        logger.warning(f"Event validation failed: {e}")
+        metrics.record_validation_errors(e.errors)
+        raise HTTPException(status_code=400, detail=e.errors)
+    return event
+
+
+async def parse_event_batch(request: Request) -> List[schemas.EventCreateDict]:
+    """
+    Dependency: decode a JSON array of events once and validate it as columns.
+
+    Events are handed to the endpoint as validated dicts rather than models.
+    """
+    payload = await _read_json(request)
+    if not isinstance(payload, list) or not all(isinstance(item, dict) for item in payload):
+        raise HTTPException(status_code=400, detail="Batch must be a JSON array of event objects")
+    try:
+        events = _event_batch_adapter.validate_python(payload)
+        validate_event_batch(payload, events)
+    except PydanticValidationError as e:
+        metrics.validation_failures.inc(("schema",))
+        raise RequestValidationError(e.errors())
+    except ValidationError as e:
+        logger.warning(f"Event batch validation failed: {e}")
+        metrics.record_validation_errors(e.errors)
+        raise HTTPException(status_code=400, detail=e.errors)
+    return events
+
+
+async def parse_session(request: Request) -> schemas.MetricSessionCreate:
+    """Dependency: decode and validate a metric session body once."""
+    payload = await _read_json(request)
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Session must be a JSON object")
+    try:
+        session = schemas.MetricSessionCreate.model_validate(payload)
+        validate_session_data(payload)
+    except PydanticValidationError as e:
+        raise RequestValidationError(e.errors())
+    except ValidationError as e:
+        logger.warning(f"Session validation failed: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return session
+
+
+class ValidationMiddleware:
+    """
+    ASGI middleware for cheap, header-only request checks.
+
+    Body validation happens once in the parse_* dependencies, so the
+    middleware never reads or decodes the body itself.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            request = Request(scope)
+            content_length = request.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > MAX_BODY_BYTES:
+                logger.warning(f"Rejected {content_length}-byte body on {request.url.path}")
+                response = JSONResponse(
+                    status_code=413,
+                    content={"detail": f"Request body exceeds {MAX_BODY_BYTES} bytes"}
+                )
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
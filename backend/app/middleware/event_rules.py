@@ -0,0 +1,377 @@
+"""
+Per-event-type validation rules, compiled from JSON config files.
+
+Rules are data, not code: the bundled app/event_rules.json plus one optional
+file per study in WEBTICS_EVENT_RULES_DIR, e.g.
+
+    {
+      "study_id": "ADHD_2026_001",
+      "event_types": {
+        "200": {
+          "name": "ATTENTION_TASK",
+          "fields": {
+            "magnitude": {"rule": "reaction_time_ms", "required": true},
+            "event_subtype": {"min": 0, "max": 3, "description": "Attention subtask"}
+          }
+        }
+      }
+    }
+
+A field rule either names an entry of VALIDATION_RULES ("rule") or gives its
+own min/max/description. Each rule set is compiled into lookup arrays indexed
+by event_type, so a whole batch is checked with one vectorized comparison per
+field however many types are registered.
+
+Rules are global: ingest validates a batch before knowing its study. So an
+event type may only be defined once across all files (or identically in
+several); a reload that finds conflicting definitions is rejected and the
+previous rules stay in place. Files are re-read on demand (the internal
+reload endpoint) or when a background task, polling every
+WEBTICS_EVENT_RULES_RELOAD_SEC, sees them change.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("webtics.validation")
+
+EVENT_RULES_PATH = os.getenv(
+    "WEBTICS_EVENT_RULES_PATH",
+    str(Path(__file__).resolve().parent.parent / "event_rules.json")
+)
+EVENT_RULES_DIR = os.getenv("WEBTICS_EVENT_RULES_DIR", "")
+EVENT_RULES_RELOAD_SEC = float(os.getenv("WEBTICS_EVENT_RULES_RELOAD_SEC", "5"))
+
+# Fields a rule can constrain
+RULE_FIELDS = ("event_subtype", "x", "y", "z", "magnitude")
+
+
+class RuleConfigError(Exception):
+    """Raised when a rules file is malformed."""
+    pass
+
+
+@dataclass(frozen=True)
+class FieldRule:
+    """Compiled constraint on one event field."""
+    field: str
+    min: float
+    max: float
+    required: bool
+    rule: str
+    description: str
+
+
+@dataclass(frozen=True)
+class EventTypeRules:
+    """All field rules for one event type."""
+    event_type: int
+    name: Optional[str]
+    study_id: Optional[str]
+    source: str
+    fields: Tuple[FieldRule, ...]
+
+
+def _input_value(value: float):
+    if np.isnan(value):
+        return None
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class CompiledRules:
+    """Immutable snapshot of all event type rules, swapped on reload."""
+
+    def __init__(self, types: Dict[int, EventTypeRules], max_event_type: int):
+        size = max_event_type + 1
+        self.types = types
+        self.max_event_type = max_event_type
+        self._rules: List[FieldRule] = []
+        self._lo = {f: np.full(size, -np.inf) for f in RULE_FIELDS}
+        self._hi = {f: np.full(size, np.inf) for f in RULE_FIELDS}
+        self._required = {f: np.zeros(size, dtype=bool) for f in RULE_FIELDS}
+        self._rule_index = {f: np.full(size, -1, dtype=np.int32) for f in RULE_FIELDS}
+
+        for event_type, type_rules in types.items():
+            for rule in type_rules.fields:
+                self._lo[rule.field][event_type] = rule.min
+                self._hi[rule.field][event_type] = rule.max
+                self._required[rule.field][event_type] = rule.required
+                self._rule_index[rule.field][event_type] = len(self._rules)
+                self._rules.append(rule)
+
+        # Only fields that some type constrains need checking at all
+        self.active_fields = [
+            f for f in RULE_FIELDS if (self._rule_index[f] >= 0).any()
+        ]
+
+    def validate_columns(
+        self,
+        columns: Dict[str, np.ndarray],
+        indexed: bool = True,
+        limit: int = 100
+    ) -> List[dict]:
+        """
+        Check float columns (NaN = missing) against each row's event type.
+
+        Returns:
+            Structured errors: {"loc", "msg", "type", "input"}, at most limit
+        """
+        errors: List[dict] = []
+        event_type = columns["event_type"]
+        known = (event_type >= 0) & (event_type <= self.max_event_type)
+        types = np.where(known, event_type, 0).astype(np.intp)
+
+        for field in self.active_fields:
+            values = columns[field]
+            out_of_range = (values < self._lo[field][types]) | (values > self._hi[field][types])
+            missing = self._required[field][types] & np.isnan(values)
+            bad = known & (out_of_range | missing)
+            if not bad.any():
+                continue
+            for index in np.flatnonzero(bad)[:limit - len(errors)].tolist():
+                rule = self._rules[self._rule_index[field][types[index]]]
+                value = values[index]
+                if np.isnan(value):
+                    msg = f"{field} is required for event type {types[index]}"
+                else:
+                    msg = (
+                        f"{field} value {value:g} outside valid range "
+                        f"[{rule.min:g}, {rule.max:g}]. {rule.description}"
+                    )
+                errors.append({
+                    "loc": ["body", index, field] if indexed else ["body", field],
+                    "msg": msg,
+                    "type": rule.rule,
+                    "input": _input_value(value),
+                })
+            if len(errors) >= limit:
+                break
+        return errors
+
+
+def _expect_object(value, where: str) -> dict:
+    if not isinstance(value, dict):
+        raise RuleConfigError(f"{where}: expected an object, got {type(value).__name__}")
+    return value
+
+
+def _bound(value, where: str) -> float:
+    # bool is an int subclass, but "min": true is a mistake, not 1
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleConfigError(f"{where}: expected a number, got {type(value).__name__}")
+    return value
+
+
+def _compile_field(field: str, spec: dict, named_rules: Dict[str, dict], where: str) -> FieldRule:
+    if field not in RULE_FIELDS:
+        raise RuleConfigError(f"{where}: unknown field '{field}'")
+    spec = _expect_object(spec, f"{where} field {field}")
+    if "rule" in spec:
+        if not isinstance(spec["rule"], str) or spec["rule"] not in named_rules:
+            raise RuleConfigError(f"{where}: unknown rule '{spec['rule']}'")
+        base = named_rules[spec["rule"]]
+        rule_name = spec["rule"]
+    else:
+        base = {}
+        rule_name = f"{field}_range"
+    lo = _bound(spec.get("min", base.get("min", -np.inf)), f"{where} field {field} min")
+    hi = _bound(spec.get("max", base.get("max", np.inf)), f"{where} field {field} max")
+    if lo > hi:
+        raise RuleConfigError(f"{where}: min {lo} is greater than max {hi}")
+    required = spec.get("required", False)
+    if not isinstance(required, bool):
+        raise RuleConfigError(
+            f"{where} field {field} required: expected true or false, got {type(required).__name__}"
+        )
+    return FieldRule(
+        field=field,
+        min=float(lo),
+        max=float(hi),
+        required=required,
+        rule=rule_name,
+        description=spec.get("description", base.get("description", "")),
+    )
+
+
+def compile_rules_file(
+    path: Path,
+    named_rules: Dict[str, dict],
+    max_event_type: int
+) -> Dict[int, EventTypeRules]:
+    """Parse and compile one rules file."""
+    try:
+        config = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise RuleConfigError(f"{path}: {e}")
+
+    config = _expect_object(config, path.name)
+    study_id = config.get("study_id")
+    types: Dict[int, EventTypeRules] = {}
+    event_types = _expect_object(config.get("event_types", {}), f"{path.name} event_types")
+    for key, type_spec in event_types.items():
+        where = f"{path.name} event type {key}"
+        type_spec = _expect_object(type_spec, where)
+        try:
+            event_type = int(key)
+        except ValueError:
+            raise RuleConfigError(f"{where}: event type must be an integer")
+        if not 0 <= event_type <= max_event_type:
+            raise RuleConfigError(f"{where}: outside [0, {max_event_type}]")
+        fields = tuple(
+            _compile_field(field, spec, named_rules, where)
+            for field, spec in _expect_object(type_spec.get("fields", {}), f"{where} fields").items()
+        )
+        types[event_type] = EventTypeRules(
+            event_type=event_type,
+            name=type_spec.get("name"),
+            study_id=study_id,
+            source=path.name,
+            fields=fields,
+        )
+    return types
+
+
+class EventRuleRegistry:
+    """Loads, compiles and hot-reloads event type rules."""
+
+    def __init__(
+        self,
+        named_rules: Dict[str, dict],
+        max_event_type: int,
+        path: str = EVENT_RULES_PATH,
+        rules_dir: str = EVENT_RULES_DIR,
+        reload_interval: float = EVENT_RULES_RELOAD_SEC,
+    ):
+        self.named_rules = named_rules
+        self.max_event_type = max_event_type
+        self.path = Path(path)
+        self.rules_dir = Path(rules_dir) if rules_dir else None
+        self.reload_interval = reload_interval
+
+        self._lock = threading.Lock()
+        self._compiled = CompiledRules({}, max_event_type)
+        self._signature: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+        self.loaded_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.reload()
+
+    def _files(self) -> List[Path]:
+        files = [self.path] if self.path.exists() else []
+        if self.rules_dir and self.rules_dir.is_dir():
+            files += sorted(self.rules_dir.glob("*.json"))
+        return files
+
+    def _file_signature(self) -> tuple:
+        signature = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    @property
+    def compiled(self) -> CompiledRules:
+        """Current rules; reads no files, so it is cheap on the request path."""
+        return self._compiled
+
+    def check_for_changes(self) -> bool:
+        """Reload if any rule file changed since the last load; True if it did."""
+        if self._file_signature() == self._signature:
+            return False
+        self.reload()
+        return True
+
+    async def start(self) -> None:
+        """Poll the rule files for changes in the background."""
+        if self._task is None and self.reload_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await asyncio.to_thread(self.check_for_changes)
+            except Exception as e:
+                logger.warning(f"Event rule change check failed: {e}")
+
+    def reload(self) -> dict:
+        """
+        Re-read and recompile all rule files.
+
+        A broken file, or two files defining one event type differently,
+        leaves the previous rules in place.
+        """
+        with self._lock:
+            signature = self._file_signature()
+            types: Dict[int, EventTypeRules] = {}
+            try:
+                for path in self._files():
+                    for event_type, rules in compile_rules_file(
+                        path, self.named_rules, self.max_event_type
+                    ).items():
+                        defined = types.get(event_type)
+                        if defined is None:
+                            types[event_type] = rules
+                        elif (defined.name, defined.fields) != (rules.name, rules.fields):
+                            raise RuleConfigError(
+                                f"Event type {event_type} in {rules.source} conflicts with "
+                                f"its definition in {defined.source}"
+                            )
+            except RuleConfigError as e:
+                self.last_error = str(e)
+                self._signature = signature
+                logger.error(f"Event rules not reloaded: {e}")
+                return self.describe()
+
+            self._compiled = CompiledRules(types, self.max_event_type)
+            self._signature = signature
+            self.loaded_at = datetime.utcnow()
+            self.last_error = None
+            logger.info(f"Loaded validation rules for {len(types)} event types")
+            return self.describe()
+
+    def describe(self) -> dict:
+        """Registered types and reload status (for the internal API)."""
+        return {
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "last_error": self.last_error,
+            "files": [str(p) for p in self._files()],
+            "event_types": {
+                str(event_type): {
+                    "name": rules.name,
+                    "study_id": rules.study_id,
+                    "source": rules.source,
+                    "fields": {
+                        r.field: {
+                            "min": None if np.isinf(r.min) else r.min,
+                            "max": None if np.isinf(r.max) else r.max,
+                            "required": r.required,
+                            "rule": r.rule,
+                        }
+                        for r in rules.fields
+                    },
+                }
+                for event_type, rules in sorted(self._compiled.types.items())
+            },
+        }
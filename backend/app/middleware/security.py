@@ -3,50 +3,73 @@ Security middleware for WebTics.
 Implements security headers and HTTPS enforcement.
 """
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
 from starlette.responses import RedirectResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import os
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    """Add security headers to all responses."""
+class SecurityHeadersMiddleware:
+    """
+    Add security headers to all responses.
 
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
+    Plain ASGI rather than BaseHTTPMiddleware: headers are added to the
+    response start message, and streamed bodies (live event streams,
+    exports) pass through without being re-buffered chunk by chunk.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
         # Only add HSTS if using HTTPS (or in production)
-        if request.url.scheme == "https" or os.getenv("ENVIRONMENT") == "production":
-            # HSTS: Force HTTPS for 1 year
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        hsts = scope.get("scheme") == "https" or os.getenv("ENVIRONMENT") == "production"
 
-        # Prevent clickjacking
-        response.headers["X-Frame-Options"] = "DENY"
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if hsts:
+                    # HSTS: Force HTTPS for 1 year
+                    headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
 
-        # XSS protection
-        response.headers["X-Content-Type-Options"] = "nosniff"
+                # Prevent clickjacking
+                headers["X-Frame-Options"] = "DENY"
 
-        # Referrer policy
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+                # XSS protection
+                headers["X-Content-Type-Options"] = "nosniff"
 
-        # Content Security Policy (basic - adjust for your needs)
-        response.headers["Content-Security-Policy"] = "default-src 'self'"
+                # Referrer policy
+                headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
 
-        # Permissions Policy (formerly Feature-Policy)
-        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+                # Content Security Policy (basic - adjust for your needs)
+                headers["Content-Security-Policy"] = "default-src 'self'"
 
-        return response
+                # Permissions Policy (formerly Feature-Policy)
+                headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+            await send(message)
 
+        await self.app(scope, receive, send_with_headers)
 
-async def https_redirect_middleware(request: Request, call_next):
+
+class HTTPSRedirectMiddleware:
     """Redirect HTTP to HTTPS in production."""
 
-    # Only enforce HTTPS redirect in production
-    if os.getenv("ENVIRONMENT") == "production":
-        if request.url.scheme != "https":
-            # Redirect to HTTPS
-            https_url = str(request.url).replace("http://", "https://", 1)
-            return RedirectResponse(url=https_url, status_code=301)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Only enforce HTTPS redirect in production
+        if scope["type"] == "http" and os.getenv("ENVIRONMENT") == "production":
+            request = Request(scope)
+            if request.url.scheme != "https":
+                # Redirect to HTTPS
+                https_url = str(request.url).replace("http://", "https://", 1)
+                await RedirectResponse(url=https_url, status_code=301)(scope, receive, send)
+                return
 
-    response = await call_next(request)
-    return response
+        await self.app(scope, receive, send)
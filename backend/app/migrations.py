@@ -0,0 +1,113 @@
+"""
+Additive schema migrations applied at startup.
+
+create_all() only creates missing tables, so columns and indexes added to
+existing models never reach databases created by an earlier release. After
+create_all(), upgrade() compares every existing table with its model and
+adds what is missing:
+
+- nullable columns (or columns with a server default), via ALTER TABLE
+- indexes declared on the model, via CREATE INDEX
+
+Nothing is dropped or altered. Changes that cannot be applied additively
+(e.g. a new NOT NULL column without a server default) are logged and left
+for a manual migration.
+
+CREATE INDEX blocks writes to the table while it builds. On large
+PostgreSQL tables, build new indexes beforehand with CREATE INDEX
+CONCURRENTLY under the model's index name; upgrade() then skips them.
+
+Consents created before withdrawal_lookup existed cannot be backfilled: the
+digest is keyed on the plaintext withdrawal code, which is never stored. A
+legacy consent gains its digest on its first successful lookup; the scan
+that finds it runs while any remain (unless WEBTICS_WITHDRAWAL_LEGACY_SCAN
+is false). Check how many are left with
+
+    python -m app.migrations legacy-consents
+"""
+
+import argparse
+import json
+import logging
+from typing import List
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+from . import models, models_research  # noqa: F401  (register tables on Base)
+from .database import Base, engine
+
+logger = logging.getLogger("webtics.migrations")
+
+
+def _add_column_sql(engine: Engine, table, column) -> str:
+    column_type = column.type.compile(dialect=engine.dialect)
+    sql = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+    if column.server_default is not None:
+        sql += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        sql += " NOT NULL"
+    return sql
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """Add missing columns and indexes to existing tables; returns what was applied."""
+    applied = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    logger.warning(
+                        f"Cannot add NOT NULL column {table.name}.{column.name} "
+                        "without a server default; migrate it manually"
+                    )
+                    continue
+                conn.execute(text(_add_column_sql(engine, table, column)))
+                applied.append(f"column {table.name}.{column.name}")
+
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in indexes:
+                    continue
+                conn.execute(CreateIndex(index))
+                applied.append(f"index {index.name}")
+
+    for change in applied:
+        logger.info(f"Schema upgrade: added {change}")
+    return applied
+
+
+def legacy_consents(engine: Engine = engine) -> int:
+    """Active consents without a withdrawal lookup digest."""
+    consent = models_research.ResearchConsent
+    with engine.connect() as conn:
+        return conn.scalar(
+            select(func.count()).select_from(consent).where(
+                consent.withdrawal_lookup.is_(None), consent.is_active == True
+            )
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Additive schema migrations")
+    parser.add_argument("command", choices=["upgrade", "legacy-consents"])
+    args = parser.parse_args()
+    if args.command == "upgrade":
+        print(json.dumps({"applied": upgrade(engine)}, indent=2))
+    else:
+        print(json.dumps({"legacy_consents": legacy_consents(engine)}, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    main()
@@ -1,5 +1,5 @@
 """SQLAlchemy database models."""
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -24,7 +24,7 @@ class PlaySession(Base):
     __tablename__ = "play_sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    metric_session_id = Column(Integer, ForeignKey("metric_sessions.id"), nullable=False)
+    metric_session_id = Column(Integer, ForeignKey("metric_sessions.id"), nullable=False, index=True)
     started_at = Column(DateTime, default=datetime.utcnow)
     ended_at = Column(DateTime, nullable=True)
 
@@ -54,3 +54,103 @@ class Event(Base):
 
     # Relationships
     play_session = relationship("PlaySession", back_populates="events")
+
+    __table_args__ = (
+        # Per play session reads in (timestamp, id) order and keyset pages
+        Index("ix_events_play_session_timestamp_id", "play_session_id", "timestamp", "id"),
+        # Highest id per play session (the ETag version in app.pagination)
+        Index("ix_events_play_session_id_id", "play_session_id", "id"),
+    )
+
+
+class PlaySessionEventRollup(Base):
+    """
+    Event counts and magnitude moments per play session, event type and hour.
+
+    Maintained by app.rollups in the ingest transaction. study_id is copied
+    from the participant's consent so study rollups can be recomputed from
+    these rows alone.
+    """
+    __tablename__ = "play_session_event_rollups"
+
+    play_session_id = Column(Integer, ForeignKey("play_sessions.id"), primary_key=True)
+    event_type = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    study_id = Column(String(100), nullable=True)
+
+    event_count = Column(Integer, nullable=False, default=0)
+    # Moments over events with a magnitude
+    magnitude_count = Column(Integer, nullable=False, default=0)
+    magnitude_sum = Column(Float, nullable=False, default=0.0)
+    magnitude_sum_sq = Column(Float, nullable=False, default=0.0)
+    magnitude_min = Column(Float, nullable=True)
+    magnitude_max = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_play_session_event_rollups_study_bucket", "study_id", "bucket_start"),
+    )
+
+
+class StudyEventRollup(Base):
+    """
+    Event counts and magnitude moments per study, event type and hour.
+
+    Each key is split over a few shards (by play session) so concurrent
+    ingest transactions of one study do not all queue on the same row;
+    queries sum the shards.
+    """
+    __tablename__ = "study_event_rollups"
+
+    study_id = Column(String(100), primary_key=True)
+    event_type = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+
+    event_count = Column(Integer, nullable=False, default=0)
+    magnitude_count = Column(Integer, nullable=False, default=0)
+    magnitude_sum = Column(Float, nullable=False, default=0.0)
+    magnitude_sum_sq = Column(Float, nullable=False, default=0.0)
+    magnitude_min = Column(Float, nullable=True)
+    magnitude_max = Column(Float, nullable=True)
+
+
+class PlaySessionSketch(Base):
+    """
+    Mergeable magnitude distribution per play session and event type.
+
+    A log-bucketed histogram (see app.sketches) maintained in the ingest
+    transaction for WEBTICS_SKETCH_EVENT_TYPES, so study percentiles are
+    merged from these rows instead of sorting every event.
+    """
+    __tablename__ = "play_session_sketches"
+
+    play_session_id = Column(Integer, ForeignKey("play_sessions.id"), primary_key=True)
+    event_type = Column(Integer, primary_key=True)
+
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    minimum = Column(Float, nullable=True)
+    maximum = Column(Float, nullable=True)
+    # Bucket keys (int32) followed by their counts (int64), little endian
+    bins = Column(LargeBinary, nullable=False)
+
+
+class HeatmapCell(Base):
+    """
+    Event count in one cell of the heatmap tile pyramid (see app.heatmaps).
+
+    The key leads with (study, zoom, tile) so a tile is one index range;
+    shards spread concurrent increments like StudyEventRollup.
+    """
+    __tablename__ = "heatmap_cells"
+
+    study_id = Column(String(100), primary_key=True)
+    zoom = Column(Integer, primary_key=True)
+    tile_x = Column(Integer, primary_key=True)
+    tile_y = Column(Integer, primary_key=True)
+    event_type = Column(Integer, primary_key=True)
+    build = Column(String(100), primary_key=True)
+    cell = Column(Integer, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+
+    count = Column(Integer, nullable=False, default=0)
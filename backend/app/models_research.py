@@ -1,5 +1,5 @@
 """Research ethics and consent management models."""
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -16,6 +16,9 @@ class ResearchConsent(Base):
     # Cryptographic withdrawal system
     withdrawal_code_hash = Column(String(64), nullable=False, unique=True, index=True)
     withdrawal_salt = Column(String(32), nullable=False)
+    # Keyed digest for indexed lookup (crypto_utils.withdrawal_lookup_digest).
+    # Null for consents created before it existed until their code is used.
+    withdrawal_lookup = Column(String(64), nullable=True, unique=True, index=True)
 
     # Privacy level: 'anonymous', 'pseudonymous', 'identifiable'
     privacy_level = Column(String(20), nullable=False, default='pseudonymous')
@@ -40,6 +43,15 @@ class ResearchConsent(Base):
     # Relationships
     withdrawals = relationship("WithdrawalAudit", back_populates="consent")
 
+    __table_args__ = (
+        # Grouped per study counts (app.study_stats); id is included so
+        # PostgreSQL answers them from the index alone
+        Index(
+            "ix_research_consents_study_active", "study_id", "is_active",
+            postgresql_include=["id"]
+        ),
+    )
+
 
 class WithdrawalAudit(Base):
     """Audit log for withdrawal requests (IRB compliance)."""
@@ -67,6 +79,10 @@ class WithdrawalAudit(Base):
     # IP address for abuse detection (hashed)
     request_ip_hash = Column(String(64), nullable=True)
 
+    # Invalid attempts aggregated into this row (app.rate_limit); null for
+    # a single attempt. requested_at/completed_at span the first and last.
+    attempt_count = Column(Integer, nullable=True)
+
     # Relationships
     consent = relationship("ResearchConsent", back_populates="withdrawals")
 
@@ -101,3 +117,36 @@ class StudyMetadata(Base):
     # Contact
     contact_email = Column(String(100), nullable=True)
     withdrawal_url = Column(String(200), nullable=True)
+
+
+class RateLimitWindow(Base):
+    """Attempts per key and fixed window, shared by workers (app.rate_limit)."""
+    __tablename__ = "rate_limit_windows"
+
+    # e.g. "code:<hashed ip>"; never a raw IP address
+    key = Column(String(100), primary_key=True)
+    # Window start in seconds since the epoch
+    window_start = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class DeletionJob(Base):
+    """Background deletion of a withdrawn participant's data."""
+    __tablename__ = "deletion_jobs"
+
+    # Random id handed to the participant to poll the job status
+    id = Column(String(32), primary_key=True)
+    consent_id = Column(Integer, ForeignKey("research_consents.id"), nullable=False, index=True)
+
+    # 'pending', 'running', 'completed', 'failed'
+    status = Column(String(20), nullable=False, default='pending')
+
+    # Rows removed (set when the deletion commits)
+    events_deleted = Column(Integer, default=0)
+    sessions_deleted = Column(Integer, default=0)
+    error_message = Column(Text, nullable=True)
+
+    # Timestamps
+    requested_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,56 @@
+"""
+Incremental NDJSON (newline-delimited JSON) reader.
+
+Splits a streamed request body into lines without ever buffering more than
+one line, so upload size does not affect memory use.
+"""
+
+from typing import AsyncIterator, Optional, Tuple
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson")
+
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_bytes: int
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Yield (line_number, line) pairs from a byte stream.
+
+    Blank lines are skipped but still counted. Lines longer than
+    max_line_bytes are discarded as they stream in and yielded as None so the
+    caller can report them.
+    """
+    buffer = bytearray()
+    overflow = False
+    line_no = 0
+
+    async for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            piece = chunk[start:] if newline < 0 else chunk[start:newline]
+
+            if not overflow:
+                if len(buffer) + len(piece) > max_line_bytes:
+                    overflow = True
+                    buffer.clear()
+                else:
+                    buffer += piece
+
+            if newline < 0:
+                break
+
+            line_no += 1
+            if overflow:
+                yield line_no, None
+            elif buffer.strip():
+                yield line_no, bytes(buffer)
+            buffer.clear()
+            overflow = False
+            start = newline + 1
+
+    # Final line without a trailing newline
+    if overflow or buffer.strip():
+        line_no += 1
+        yield line_no, None if overflow else bytes(buffer)
@@ -0,0 +1,188 @@
+"""
+Keyset pagination for event reads.
+
+Pages are ordered newest first on (timestamp, id). A cursor encodes the
+position of the last event on a page, and the next page continues strictly
+after it with a row comparison the (play_session_id, timestamp, id) index
+can seek to. Page 1000 costs the same as page 1, and events inserted while
+paging do not shift later pages.
+
+Polling clients ask for only what is new (since_id / since_timestamp) and
+revalidate with an ETag built from the session's newest event timestamp and
+highest event id. Each is one backward probe per play session, on the
+(play_session_id, timestamp, id) and (play_session_id, id) indexes, so a
+304 costs the same however many events a session has and never touches
+the rows of the page.
+"""
+
+import base64
+import binascii
+import hashlib
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import Select, func, literal, select, true, tuple_
+from sqlalchemy.orm import aliased
+
+from . import models, partitions
+
+Cursor = Tuple[datetime, int]
+
+# Stands in for a missing play session start in the partition bound
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(timestamp: datetime, event_id: int) -> str:
+    raw = f"{timestamp.isoformat()},{event_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Parse a cursor from encode_cursor(); raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, event_id = raw.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(event_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def session_events_query(
+    session_id: int,
+    limit: int,
+    dialect_name: str,
+    before: Optional[Cursor] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    since_id: Optional[int] = None,
+    since_timestamp: Optional[datetime] = None,
+) -> Select:
+    """
+    One page of a metric session's events, newest first.
+
+    On PostgreSQL each play session contributes its own newest `limit` rows
+    through a LATERAL subquery (an index seek each), and only those are
+    merged. A plain join lets the planner walk the global timestamp index
+    instead, which is fast for busy sessions and slow for quiet ones.
+
+    since_id and since_timestamp (both exclusive) restrict the page to
+    events newer than the ones a client already has.
+    """
+    order = (models.Event.timestamp.desc(), models.Event.id.desc())
+    conditions = []
+    if before is not None:
+        conditions.append(tuple_(models.Event.timestamp, models.Event.id) < tuple_(*before))
+    if since is not None:
+        conditions.append(models.Event.timestamp >= since)
+    if until is not None:
+        conditions.append(models.Event.timestamp < until)
+    if since_timestamp is not None:
+        conditions.append(models.Event.timestamp > since_timestamp)
+    if since_id is not None:
+        conditions.append(models.Event.id > since_id)
+
+    if dialect_name == "postgresql":
+        # Events never predate their play session; the bound lets a
+        # partitioned events table prune partitions per play session
+        earliest = func.coalesce(models.PlaySession.started_at, literal(_EPOCH)) - partitions.EVENT_CLOCK_SKEW
+        if since_id is not None:
+            # Ids alone give the index nothing to seek on; newer events are
+            # at most the clock skew older than the event the client has
+            known = aliased(models.Event)
+            known_timestamp = select(known.timestamp).where(known.id == since_id).scalar_subquery()
+            conditions.append(
+                models.Event.timestamp >= func.coalesce(known_timestamp, literal(_EPOCH)) - partitions.EVENT_CLOCK_SKEW
+            )
+        per_play_session = (
+            select(models.Event)
+            .where(
+                models.Event.play_session_id == models.PlaySession.id,
+                models.Event.timestamp >= earliest,
+                *conditions
+            )
+            .order_by(*order)
+            .limit(limit)
+            .lateral()
+        )
+        event = aliased(models.Event, per_play_session)
+        return (
+            select(event)
+            .select_from(models.PlaySession)
+            .join(per_play_session, true())
+            .where(models.PlaySession.metric_session_id == session_id)
+            .order_by(event.timestamp.desc(), event.id.desc())
+            .limit(limit)
+        )
+
+    return (
+        select(models.Event)
+        .join(models.PlaySession, models.Event.play_session_id == models.PlaySession.id)
+        .where(models.PlaySession.metric_session_id == session_id, *conditions)
+        .order_by(*order)
+        .limit(limit)
+    )
+
+
+def session_version_query(session_id: int, dialect_name: str) -> Select:
+    """
+    Number of play sessions, the newest event timestamp and the highest
+    event id of a session.
+
+    Events are append-only and only ever deleted with their whole play
+    session, so these change whenever any page of the session could. The
+    highest id is taken on its own: timestamps are stamped before commit,
+    so an event can commit after one with a newer timestamp.
+    """
+    if dialect_name == "postgresql":
+        earliest = func.coalesce(models.PlaySession.started_at, literal(_EPOCH)) - partitions.EVENT_CLOCK_SKEW
+        in_play_session = (
+            models.Event.play_session_id == models.PlaySession.id,
+            models.Event.timestamp >= earliest,
+        )
+        newest = (
+            select(models.Event.timestamp)
+            .where(*in_play_session)
+            .order_by(models.Event.timestamp.desc(), models.Event.id.desc())
+            .limit(1)
+            .lateral()
+        )
+        # Served from the end of (play_session_id, id); the timestamp bound
+        # only prunes partitions
+        highest = (
+            select(func.max(models.Event.id).label("id"))
+            .where(*in_play_session)
+            .lateral()
+        )
+        return (
+            select(func.count(models.PlaySession.id), func.max(newest.c.timestamp), func.max(highest.c.id))
+            .select_from(models.PlaySession)
+            .outerjoin(newest, true())
+            .outerjoin(highest, true())
+            .where(models.PlaySession.metric_session_id == session_id)
+        )
+
+    return (
+        select(
+            func.count(func.distinct(models.PlaySession.id)),
+            func.max(models.Event.timestamp),
+            func.max(models.Event.id),
+        )
+        .select_from(models.PlaySession)
+        .outerjoin(models.Event, models.Event.play_session_id == models.PlaySession.id)
+        .where(models.PlaySession.metric_session_id == session_id)
+    )
+
+
+def events_etag(version: Iterable, params: Iterable[Tuple[str, str]]) -> str:
+    """Weak ETag for a page: the session version plus the query parameters."""
+    digest = hashlib.sha1(repr((tuple(version), sorted(params))).encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value covers an ETag."""
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    # Weak comparison: W/"x" and "x" match
+    return "*" in tags or etag in tags or etag[2:] in tags
@@ -0,0 +1,491 @@
+"""
+Time-range partitioning of the events table (PostgreSQL only).
+
+With WEBTICS_EVENT_PARTITIONING enabled, `events` is created as a table
+partitioned by RANGE (timestamp), one partition per day, week or month
+(WEBTICS_EVENT_PARTITION_INTERVAL). Queries bounded on timestamp only scan
+the matching partitions, and old data can be detached or dropped as a whole
+partition instead of deleted row by row.
+
+The manager creates partitions WEBTICS_EVENT_PARTITION_PREMAKE intervals
+ahead, both at startup and periodically from the app lifespan, and detaches
+partitions older than WEBTICS_EVENT_PARTITION_DETACH_AFTER intervals when
+that is set. A DEFAULT partition catches rows outside every range so
+inserts never fail; its rows are moved out when their partition is created.
+
+Existing plain tables are converted with:
+
+    python -m app.partitions migrate
+
+which renames the table to events_legacy, creates the partitioned table and
+copies rows in one transaction (ingest blocks until it commits, so run it in
+a maintenance window). Other commands: status, maintain, detach, attach.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, Table, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from . import models
+from .database import engine
+
+logger = logging.getLogger("webtics.partitions")
+
+PARTITIONING_ENABLED = os.getenv("WEBTICS_EVENT_PARTITIONING", "false").lower() == "true"
+PARTITION_INTERVAL = os.getenv("WEBTICS_EVENT_PARTITION_INTERVAL", "month")
+# Partitions created ahead of the current one
+PARTITION_PREMAKE = int(os.getenv("WEBTICS_EVENT_PARTITION_PREMAKE", "3"))
+# Detach partitions this many intervals old (0 keeps everything attached)
+PARTITION_DETACH_AFTER = int(os.getenv("WEBTICS_EVENT_PARTITION_DETACH_AFTER", "0"))
+PARTITION_MAINTAIN_INTERVAL_SEC = float(os.getenv("WEBTICS_EVENT_PARTITION_MAINTAIN_INTERVAL", "3600"))
+
+INTERVALS = ("day", "week", "month")
+
+PARENT = models.Event.__tablename__
+DEFAULT_PARTITION = f"{PARENT}_default"
+LEGACY_TABLE = f"{PARENT}_legacy"
+# Serializes partition DDL across workers (pg_advisory_xact_lock key)
+ADVISORY_LOCK_KEY = 0x57455056
+
+# Events are stamped by the server on receipt, so none predate their play
+# session; the margin covers clock skew between workers
+EVENT_CLOCK_SKEW = timedelta(minutes=5)
+
+_BOUNDS_COMMENT = re.compile(r"FROM (\S+) TO (\S+)")
+_BOUNDS_EXPR = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def interval_start(ts: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    """Start of the partition interval containing ts."""
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "day":
+        return day
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown partition interval: {interval}")
+
+
+def next_start(start: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    """Start of the interval after the one beginning at start."""
+    if interval == "day":
+        return start + timedelta(days=1)
+    if interval == "week":
+        return start + timedelta(weeks=1)
+    if interval == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f"Unknown partition interval: {interval}")
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARENT}_p{start:%Y%m%d}"
+
+
+def earliest_event_time(started_at: Optional[datetime]) -> Optional[datetime]:
+    """
+    Lower timestamp bound for events of a play session started at started_at.
+
+    Adding it to event queries lets PostgreSQL prune partitions older than
+    the session instead of probing every one.
+    """
+    return started_at - EVENT_CLOCK_SKEW if started_at else None
+
+
+def _literal(ts: datetime) -> str:
+    return f"'{ts.isoformat(sep=' ')}'"
+
+
+def partitioned_events_table() -> Table:
+    """Copy of the events table keyed on (id, timestamp) and partitioned by timestamp."""
+    metadata = MetaData()
+    # Referenced tables must be present for the foreign key to compile
+    for table in (models.MetricSession.__table__, models.PlaySession.__table__):
+        table.to_metadata(metadata)
+    events = models.Event.__table__.to_metadata(metadata)
+
+    # PostgreSQL requires the partition key in every unique constraint
+    events.c.timestamp.primary_key = True
+    events.c.timestamp.nullable = False
+    events.append_constraint(PrimaryKeyConstraint(events.c.id, events.c.timestamp))
+    events.c.id.autoincrement = True
+    events.dialect_options["postgresql"]["partition_by"] = "RANGE (timestamp)"
+    return events
+
+
+@dataclass
+class Partition:
+    name: str
+    start: Optional[datetime]
+    end: Optional[datetime]
+    attached: bool = True
+
+    @property
+    def is_default(self) -> bool:
+        return self.start is None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "from": self.start.isoformat() if self.start else None,
+            "to": self.end.isoformat() if self.end else None,
+            "attached": self.attached,
+        }
+
+
+class PartitionManager:
+    """Creates, detaches and attaches monthly (or daily/weekly) event partitions."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        interval: str = PARTITION_INTERVAL,
+        premake: int = PARTITION_PREMAKE,
+        detach_after: int = PARTITION_DETACH_AFTER,
+        maintain_interval: float = PARTITION_MAINTAIN_INTERVAL_SEC,
+    ):
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown partition interval: {interval}")
+        self.engine = engine
+        self.interval = interval
+        self.premake = premake
+        self.detach_after = detach_after
+        self.maintain_interval = maintain_interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def supported(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    # Catalog queries
+
+    def _relkind(self, conn: Connection, name: str) -> Optional[str]:
+        return conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": name}
+        ).scalar()
+
+    def is_partitioned(self, conn: Connection) -> bool:
+        return self._relkind(conn, PARENT) == "p"
+
+    def partitions(self, conn: Connection) -> List[Partition]:
+        """Attached partitions ordered by range, DEFAULT last."""
+        rows = conn.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:parent)"
+        ), {"parent": PARENT}).all()
+
+        partitions = []
+        for name, bound in rows:
+            match = _BOUNDS_EXPR.search(bound or "")
+            if match:
+                start, end = (datetime.fromisoformat(v) for v in match.groups())
+                partitions.append(Partition(name, start, end))
+            else:
+                partitions.append(Partition(name, None, None))
+        return sorted(partitions, key=lambda p: (p.is_default, p.start or datetime.min))
+
+    def detached_partitions(self, conn: Connection) -> List[Partition]:
+        """Tables detached by this manager (their bounds are kept in a comment)."""
+        rows = conn.execute(text(
+            "SELECT c.relname, obj_description(c.oid, 'pg_class') FROM pg_class c "
+            "WHERE c.relkind = 'r' AND NOT c.relispartition AND c.relname LIKE :pattern"
+        ), {"pattern": f"{PARENT}\\_p%"}).all()
+
+        partitions = []
+        for name, comment in rows:
+            match = _BOUNDS_COMMENT.search(comment or "")
+            if match:
+                start, end = (datetime.fromisoformat(v) for v in match.groups())
+                partitions.append(Partition(name, start, end, attached=False))
+        return sorted(partitions, key=lambda p: p.start)
+
+    # DDL
+
+    def _lock(self, conn: Connection) -> None:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+    def _create_parent(self, conn: Connection) -> None:
+        # The parent references play_sessions, which may not exist yet
+        models.Base.metadata.create_all(
+            conn, tables=[models.MetricSession.__table__, models.PlaySession.__table__]
+        )
+        events = partitioned_events_table()
+        conn.execute(CreateTable(events))
+        for index in events.indexes:
+            conn.execute(CreateIndex(index))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+        logger.info(f"Created partitioned {PARENT} table ({self.interval} partitions)")
+
+    def create_partition(self, conn: Connection, start: datetime) -> bool:
+        """Create the partition beginning at start; False if it already exists."""
+        name = partition_name(start)
+        if self._relkind(conn, name) is not None:
+            return False
+        end = next_start(start, self.interval)
+        bounds = f"FOR VALUES FROM ({_literal(start)}) TO ({_literal(end)})"
+
+        stray = conn.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+            "WHERE timestamp >= :start AND timestamp < :end)"
+        ), {"start": start, "end": end}).scalar()
+
+        if stray:
+            # Rows for this range landed in DEFAULT; PostgreSQL refuses to
+            # create the partition until they are moved into it
+            conn.execute(text(
+                f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            moved = conn.execute(text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                "WHERE timestamp >= :start AND timestamp < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), {"start": start, "end": end}).rowcount
+            conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} {bounds}"))
+            logger.info(f"Created partition {name} with {moved} rows moved from {DEFAULT_PARTITION}")
+        else:
+            conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} {bounds}"))
+            logger.info(f"Created partition {name}")
+        return True
+
+    def detach(self, conn: Connection, partition: Partition) -> None:
+        """
+        Detach a partition, keeping it as a standalone table.
+
+        A CHECK constraint matching the bounds lets attach() skip the
+        validation scan, and the bounds are recorded in the table comment.
+        """
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {partition.name}"))
+        conn.execute(text(
+            f"ALTER TABLE {partition.name} ADD CONSTRAINT {partition.name}_bounds "
+            f"CHECK (timestamp >= {_literal(partition.start)} AND timestamp < {_literal(partition.end)})"
+        ))
+        conn.execute(text(
+            f"COMMENT ON TABLE {partition.name} IS "
+            f"'FROM {partition.start.isoformat()} TO {partition.end.isoformat()}'"
+        ))
+        logger.info(f"Detached partition {partition.name}")
+        partition.attached = False
+
+    def attach(self, conn: Connection, name: str) -> Partition:
+        """Re-attach a partition previously detached by this manager."""
+        partition = next((p for p in self.detached_partitions(conn) if p.name == name), None)
+        if partition is None:
+            raise ValueError(f"{name} is not a detached {PARENT} partition")
+        conn.execute(text(
+            f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ({_literal(partition.start)}) TO ({_literal(partition.end)})"
+        ))
+        conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS {name}_bounds"))
+        conn.execute(text(f"COMMENT ON TABLE {name} IS NULL"))
+        logger.info(f"Attached partition {name}")
+        partition.attached = True
+        return partition
+
+    # Operations
+
+    def _premake(self, conn: Connection, now: datetime) -> List[str]:
+        created = []
+        start = interval_start(now, self.interval)
+        for _ in range(self.premake + 1):
+            if self.create_partition(conn, start):
+                created.append(partition_name(start))
+            start = next_start(start, self.interval)
+        return created
+
+    def ensure(self, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+        """
+        Create the partitioned table if missing and partitions ahead of now.
+
+        Called at startup before create_all(), which then leaves events alone.
+        """
+        now = now or datetime.utcnow()
+        with self.engine.begin() as conn:
+            self._lock(conn)
+            kind = self._relkind(conn, PARENT)
+            if kind is None:
+                self._create_parent(conn)
+            elif kind != "p":
+                logger.warning(
+                    f"{PARENT} is not partitioned; run `python -m app.partitions migrate` to convert it"
+                )
+                return {"created": []}
+            return {"created": self._premake(conn, now)}
+
+    def maintain(self, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+        """Create upcoming partitions and detach expired ones."""
+        now = now or datetime.utcnow()
+        detached = []
+        with self.engine.begin() as conn:
+            self._lock(conn)
+            if not self.is_partitioned(conn):
+                return {"created": [], "detached": []}
+            created = self._premake(conn, now)
+
+            if self.detach_after > 0:
+                cutoff = interval_start(now, self.interval)
+                for _ in range(self.detach_after):
+                    cutoff = interval_start(cutoff - timedelta(days=1), self.interval)
+                for partition in self.partitions(conn):
+                    if not partition.is_default and partition.end <= cutoff:
+                        self.detach(conn, partition)
+                        detached.append(partition.name)
+        return {"created": created, "detached": detached}
+
+    def migrate(self, drop_legacy: bool = False, now: Optional[datetime] = None) -> dict:
+        """Convert a plain events table into the partitioned layout, copying all rows."""
+        now = now or datetime.utcnow()
+        with self.engine.begin() as conn:
+            self._lock(conn)
+            kind = self._relkind(conn, PARENT)
+            if kind == "p":
+                return {"status": "already_partitioned"}
+            if kind is None:
+                self._create_parent(conn)
+                return {"status": "created", "created": self._premake(conn, now)}
+            if self._relkind(conn, LEGACY_TABLE) is not None:
+                raise RuntimeError(f"{LEGACY_TABLE} already exists; drop or rename it first")
+
+            # Free the names the new table needs: the table, its indexes
+            # (including the primary key) and its id sequence
+            sequence = conn.execute(
+                text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": PARENT}
+            ).scalar()
+            indexes = conn.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+                {"table": PARENT}
+            ).scalars().all()
+            conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {LEGACY_TABLE}"))
+            for index in indexes:
+                conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_legacy"'))
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {LEGACY_TABLE}_id_seq"))
+
+            self._create_parent(conn)
+
+            oldest = conn.execute(text(f"SELECT min(timestamp) FROM {LEGACY_TABLE}")).scalar()
+            start = interval_start(min(oldest or now, now), self.interval)
+            current = interval_start(now, self.interval)
+            created = []
+            while start < current:
+                if self.create_partition(conn, start):
+                    created.append(partition_name(start))
+                start = next_start(start, self.interval)
+            created += self._premake(conn, now)
+
+            names = [c.name for c in models.Event.__table__.columns]
+            columns = ", ".join(names)
+            # The partition key is NOT NULL; undated legacy rows go to DEFAULT
+            select_columns = ", ".join(
+                "COALESCE(timestamp, TIMESTAMP 'epoch')" if name == "timestamp" else name
+                for name in names
+            )
+            copied = conn.execute(text(
+                f"INSERT INTO {PARENT} ({columns}) SELECT {select_columns} FROM {LEGACY_TABLE}"
+            )).rowcount
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{PARENT}', 'id'), "
+                f"GREATEST((SELECT max(id) FROM {PARENT}), 1))"
+            ))
+            if drop_legacy:
+                conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+
+        logger.info(f"Migrated {copied} events into partitioned {PARENT}")
+        return {
+            "status": "migrated",
+            "rows_copied": copied,
+            "created": created,
+            "legacy_table": None if drop_legacy else LEGACY_TABLE,
+        }
+
+    def status(self) -> dict:
+        with self.engine.connect() as conn:
+            if not self.is_partitioned(conn):
+                return {"partitioned": False}
+            return {
+                "partitioned": True,
+                "interval": self.interval,
+                "partitions": [p.to_dict() for p in self.partitions(conn)],
+                "detached": [p.to_dict() for p in self.detached_partitions(conn)],
+            }
+
+    # Background maintenance
+
+    async def start(self) -> None:
+        """Run maintain() periodically on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.maintain_interval)
+            try:
+                await asyncio.to_thread(self.maintain)
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {e}", exc_info=True)
+
+
+partition_manager = PartitionManager(engine)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage events table partitions (PostgreSQL)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="List attached and detached partitions")
+    sub.add_parser("maintain", help="Create upcoming partitions and detach expired ones")
+    migrate = sub.add_parser("migrate", help="Convert a plain events table to partitions")
+    migrate.add_argument("--drop-legacy", action="store_true", help="Drop events_legacy after copying")
+    detach = sub.add_parser("detach", help="Detach a partition, keeping its table")
+    detach.add_argument("name")
+    attach = sub.add_parser("attach", help="Re-attach a detached partition")
+    attach.add_argument("name")
+    args = parser.parse_args()
+
+    manager = partition_manager
+    if not manager.supported:
+        parser.error("Partitioning requires PostgreSQL")
+
+    if args.command == "status":
+        result = manager.status()
+    elif args.command == "maintain":
+        result = manager.maintain()
+    elif args.command == "migrate":
+        result = manager.migrate(drop_legacy=args.drop_legacy)
+    elif args.command == "detach":
+        with engine.begin() as conn:
+            manager._lock(conn)
+            partition = next((p for p in manager.partitions(conn) if p.name == args.name), None)
+            if partition is None or partition.is_default:
+                parser.error(f"{args.name} is not an attached range partition")
+            manager.detach(conn, partition)
+        result = partition.to_dict()
+    else:
+        with engine.begin() as conn:
+            manager._lock(conn)
+            result = manager.attach(conn, args.name).to_dict()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    main()
@@ -0,0 +1,377 @@
+"""
+Rate limiting of withdrawal-code attempts.
+
+/research/withdraw and /research/participant/data accept a withdrawal code
+from anyone, and every attempt costs a lookup (plus an HMAC per legacy
+consent while any remain, see routers.research). Both endpoints charge
+one attempt to the caller's hashed IP (crypto_utils.hash_ip_address)
+before doing any work:
+
+- WEBTICS_CODE_ATTEMPT_LIMIT attempts per WEBTICS_CODE_ATTEMPT_WINDOW
+  seconds per IP; callers over it get 429 with Retry-After
+
+Codes that fail (resolve to no consent) are also counted over all IPs.
+More than WEBTICS_CODE_ATTEMPT_GLOBAL_LIMIT per window, e.g. guessing spread
+across many addresses, raises an alert (a warning and the global_alerts
+counter) but refuses nobody: a shared bucket that refused attempts would
+let one attacker lock every participant out of withdrawing.
+
+If the backend itself fails, attempts are let through rather than locking
+participants out.
+
+Backends (WEBTICS_RATE_LIMIT_BACKEND):
+
+- memory: token buckets in this worker. With N workers an IP gets up to
+  N times the limit.
+- database: fixed-window counters in rate_limit_windows, shared by all
+  workers at the cost of one upsert per attempt.
+
+Other shared stores plug in by subclassing RateLimitBackend.
+
+Failed attempts are not audited one withdrawal_audit row and commit at a
+time, which a flood would turn into write load. InvalidAttemptLog counts
+them per hashed IP and reason and writes one row per
+WEBTICS_INVALID_ATTEMPT_FLUSH seconds with attempt_count set; counts not
+yet written are lost if the worker is killed.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from . import models_research
+from .database import AsyncSessionLocal, async_engine
+
+logger = logging.getLogger("webtics.rate_limit")
+
+RATE_LIMIT_ENABLED = os.getenv("WEBTICS_RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("WEBTICS_RATE_LIMIT_BACKEND", "memory")
+CODE_ATTEMPT_LIMIT = int(os.getenv("WEBTICS_CODE_ATTEMPT_LIMIT", "10"))
+CODE_ATTEMPT_WINDOW_SEC = float(os.getenv("WEBTICS_CODE_ATTEMPT_WINDOW", "60"))
+# Failed attempts per window over all IPs before alerting, 0 disables
+CODE_ATTEMPT_GLOBAL_LIMIT = int(os.getenv("WEBTICS_CODE_ATTEMPT_GLOBAL_LIMIT", "600"))
+INVALID_ATTEMPT_FLUSH_SEC = float(os.getenv("WEBTICS_INVALID_ATTEMPT_FLUSH", "60"))
+
+# Buckets kept by the memory backend; least recently used go first
+MEMORY_MAX_KEYS = 100000
+# (IP, reason) pairs held between flushes; attempts beyond are pooled
+# into one row without an IP
+MAX_PENDING_ATTEMPTS = 10000
+
+GLOBAL_FAILURES_KEY = "code-failures:*"
+
+Window = models_research.RateLimitWindow.__table__
+
+
+class RateLimitBackend:
+    """Counts attempts per key; subclass to share limits through another store."""
+
+    name = "base"
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        """Count one attempt; 0 if allowed, else seconds until one would be."""
+        raise NotImplementedError
+
+    async def prune(self) -> None:
+        """Drop state that no longer affects any limit."""
+
+    def reset(self) -> None:
+        """Forget all counts (tests, operator reset)."""
+
+
+class MemoryBackend(RateLimitBackend):
+    """Token bucket per key: up to limit attempts, refilled at limit per window."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> (tokens, updated_at, full_at)
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        return self.take(key, limit, window)
+
+    def take(self, key: str, limit: int, window: float) -> float:
+        rate = limit / window
+        now = self._clock()
+        with self._lock:
+            entry = self._buckets.get(key)
+            tokens = float(limit) if entry is None else min(float(limit), entry[0] + (now - entry[1]) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (limit - tokens) / rate)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    async def prune(self) -> None:
+        now = self._clock()
+        with self._lock:
+            for key in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                del self._buckets[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class DatabaseBackend(RateLimitBackend):
+    """Fixed-window counters in rate_limit_windows, shared by all workers."""
+
+    name = "database"
+
+    def __init__(self, engine: AsyncEngine = async_engine, clock: Callable[[], float] = time.time):
+        self.engine = engine
+        self._clock = clock
+        self._longest_window = 0.0
+
+    def _increment(self, key: str, window_start: int):
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            stmt = postgresql.insert(Window)
+        elif dialect == "sqlite":
+            stmt = sqlite.insert(Window)
+        else:
+            raise NotImplementedError(f"Database rate limiting is not supported on {dialect}")
+        return stmt.values(key=key, window_start=window_start, count=1).on_conflict_do_update(
+            index_elements=[Window.c.key, Window.c.window_start],
+            set_={"count": Window.c.count + 1}
+        ).returning(Window.c.count)
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        self._longest_window = max(self._longest_window, window)
+        now = self._clock()
+        window_start = int(now // window * window)
+        async with self.engine.begin() as conn:
+            count = (await conn.execute(self._increment(key, window_start))).scalar_one()
+        if count <= limit:
+            return 0.0
+        return window_start + window - now
+
+    async def prune(self) -> None:
+        if self._longest_window:
+            cutoff = int(self._clock() - self._longest_window)
+            async with self.engine.begin() as conn:
+                await conn.execute(delete(Window).where(Window.c.window_start < cutoff))
+
+    def reset(self) -> None:
+        pass
+
+
+BACKENDS = {"memory": MemoryBackend, "database": DatabaseBackend}
+
+
+class CodeAttemptLimiter:
+    """Per-IP limit on withdrawal-code attempts, and an alert on failures over all IPs."""
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        limit: int = CODE_ATTEMPT_LIMIT,
+        window: float = CODE_ATTEMPT_WINDOW_SEC,
+        global_limit: int = CODE_ATTEMPT_GLOBAL_LIMIT,
+        enabled: bool = RATE_LIMIT_ENABLED,
+    ):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+        self.global_limit = global_limit
+        self.enabled = enabled
+
+        self.allowed = 0
+        self.rejected = 0
+        self.failures = 0
+        self.global_alerts = 0
+        self.backend_errors = 0
+        self._over_global = False
+
+    async def check(self, ip_hash: str) -> int:
+        """Charge one attempt to ip_hash; 0 if allowed, else whole seconds to wait."""
+        if not self.enabled:
+            return 0
+        try:
+            wait = await self.backend.hit(f"code:{ip_hash}", self.limit, self.window)
+            if wait:
+                self.rejected += 1
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Rate limit backend failed, allowing attempt: {e}")
+            return 0
+        if not wait:
+            self.allowed += 1
+            return 0
+        return max(1, math.ceil(wait))
+
+    async def record_failure(self) -> None:
+        """Count a code that resolved to no consent; alert when failures over all IPs exceed the global limit."""
+        self.failures += 1
+        if not self.enabled or self.global_limit <= 0:
+            return
+        try:
+            over = bool(await self.backend.hit(GLOBAL_FAILURES_KEY, self.global_limit, self.window))
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Rate limit backend failed, failure not counted: {e}")
+            return
+        if over and not self._over_global:
+            self.global_alerts += 1
+            logger.warning(
+                f"More than {self.global_limit} failed withdrawal-code attempts in "
+                f"{self.window:g}s over all clients; possible distributed guessing"
+            )
+        self._over_global = over
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend.name,
+            "limit": self.limit,
+            "global_limit": self.global_limit,
+            "window_sec": self.window,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "global_alerts": self.global_alerts,
+            "backend_errors": self.backend_errors,
+        }
+
+
+class InvalidAttemptLog:
+    """Failed code attempts, written to withdrawal_audit as one row per IP and reason."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        interval: float = INVALID_ATTEMPT_FLUSH_SEC,
+        max_pending: int = MAX_PENDING_ATTEMPTS,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_pending = max_pending
+        # (ip_hash, reason) -> [count, first_at, last_at]
+        self._pending: Dict[Tuple[Optional[str], str], List[Any]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.attempts_recorded = 0
+        self.rows_written = 0
+
+    def record(self, ip_hash: Optional[str], reason: str) -> None:
+        now = datetime.utcnow()
+        with self._lock:
+            self.attempts_recorded += 1
+            key = (ip_hash, reason)
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                key = (None, reason)
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [1, now, now]
+            else:
+                entry[0] += 1
+                entry[2] = now
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(entry[0] for entry in self._pending.values())
+
+    async def flush(self) -> int:
+        """Write the aggregated rows; returns how many were written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [
+            {
+                "withdrawal_code_hash": "invalid",
+                "success": False,
+                "error_message": reason,
+                "request_ip_hash": ip_hash,
+                "requested_at": first_at,
+                "completed_at": last_at,
+                "attempt_count": count,
+            }
+            for (ip_hash, reason), (count, first_at, last_at) in pending.items()
+        ]
+        try:
+            async with self.session_factory() as db:
+                await db.execute(insert(models_research.WithdrawalAudit), rows)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Could not write invalid attempt audit: {e}", exc_info=True)
+            # Keep the counts for the next flush
+            with self._lock:
+                for key, (count, first_at, last_at) in pending.items():
+                    entry = self._pending.setdefault(key, [0, first_at, last_at])
+                    entry[0] += count
+                    entry[1] = min(entry[1], first_at)
+                    entry[2] = max(entry[2], last_at)
+            return 0
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flush_interval_sec": self.interval,
+            "attempts_recorded": self.attempts_recorded,
+            "attempts_pending": self.pending(),
+            "rows_written": self.rows_written,
+        }
+
+    # Background service
+
+    async def start(self) -> None:
+        """Flush (and prune the limiter backend) periodically."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+            try:
+                await code_attempt_limiter.backend.prune()
+            except Exception as e:
+                logger.warning(f"Rate limit backend prune failed: {e}")
+
+
+if RATE_LIMIT_BACKEND not in BACKENDS:
+    raise ValueError(
+        f"WEBTICS_RATE_LIMIT_BACKEND must be one of {', '.join(BACKENDS)}, not {RATE_LIMIT_BACKEND!r}"
+    )
+
+code_attempt_limiter = CodeAttemptLimiter(BACKENDS[RATE_LIMIT_BACKEND]())
+invalid_attempts = InvalidAttemptLog()
+
+
+def stats() -> Dict[str, Any]:
+    return {"limiter": code_attempt_limiter.stats(), "invalid_attempts": invalid_attempts.stats()}
@@ -0,0 +1,375 @@
+"""
+Data retention sweeper driven by StudyMetadata.data_retention_days.
+
+A metric session expires once its study's retention period has passed since
+its last activity: the session closing (or being created, if it never
+closed), any of its play sessions starting or ending, or an event logged to
+a play session that is still open. Studies are linked
+to sessions through the participant's consent record; sessions without one,
+or in studies without a retention period, are never purged.
+
+Expired sessions are purged with their play sessions and events in small
+chunks, each in its own short transaction with a pause in between, so ingest
+never waits long on row locks. When events are partitioned (app.partitions),
+partitions holding only expired events are dropped whole first (their heatmap
+points are subtracted in the same transaction).
+
+Runs periodically from the app lifespan with WEBTICS_RETENTION_ENABLED, or
+once from the command line:
+
+    python -m app.retention [--dry-run]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, column, delete, exists, func, or_, select, table, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import aliased
+
+from . import heatmaps, models, models_research, partitions, rollups, session_cache
+from .database import engine
+
+logger = logging.getLogger("webtics.retention")
+
+RETENTION_ENABLED = os.getenv("WEBTICS_RETENTION_ENABLED", "false").lower() == "true"
+RETENTION_INTERVAL_SEC = float(os.getenv("WEBTICS_RETENTION_INTERVAL", "3600"))
+# Metric sessions purged per chunk
+RETENTION_SESSION_BATCH = int(os.getenv("WEBTICS_RETENTION_SESSION_BATCH", "100"))
+# Events deleted per transaction (bounds how long row locks are held)
+RETENTION_EVENT_BATCH = int(os.getenv("WEBTICS_RETENTION_EVENT_BATCH", "5000"))
+# Pause between transactions so ingest gets the tables back
+RETENTION_THROTTLE_SEC = float(os.getenv("WEBTICS_RETENTION_THROTTLE", "0.05"))
+
+# Only one worker sweeps at a time (pg_try_advisory_lock key)
+ADVISORY_LOCK_KEY = 0x57455052
+# Give up on dropping a partition rather than queue ingest behind it
+PARTITION_LOCK_TIMEOUT = "5s"
+
+Consent = models_research.ResearchConsent
+Study = models_research.StudyMetadata
+
+
+def study_cutoffs(conn: Connection, now: datetime) -> Dict[str, datetime]:
+    """Per study, the last-activity time before which sessions are expired."""
+    rows = conn.execute(
+        select(Study.study_id, Study.data_retention_days).where(
+            Study.data_retention_days.isnot(None),
+            Study.data_retention_days > 0
+        )
+    ).all()
+    return {study_id: now - timedelta(days=days) for study_id, days in rows}
+
+
+def _active_since(cutoff: datetime):
+    """Whether a metric session has play sessions or open-session events at or after cutoff."""
+    play_session = aliased(models.PlaySession)
+    recent_play_session = (
+        exists()
+        .where(
+            play_session.metric_session_id == models.MetricSession.id,
+            func.coalesce(play_session.ended_at, play_session.started_at) >= cutoff
+        )
+        .correlate(models.MetricSession)
+    )
+    # A play session that never ended may still be logging events
+    recent_event = (
+        exists()
+        .where(
+            play_session.metric_session_id == models.MetricSession.id,
+            play_session.ended_at.is_(None),
+            models.Event.play_session_id == play_session.id,
+            models.Event.timestamp >= cutoff
+        )
+        .correlate(models.MetricSession)
+    )
+    return or_(recent_play_session, recent_event)
+
+
+def expired_sessions(cutoffs: Dict[str, datetime]):
+    """SELECT of (id, unique_id) for metric sessions past their study's cutoff."""
+    last_activity = func.coalesce(models.MetricSession.closed_at, models.MetricSession.created_at)
+    return (
+        select(models.MetricSession.id, models.MetricSession.unique_id)
+        .join(Consent, Consent.participant_id == models.MetricSession.unique_id)
+        .where(or_(*(
+            and_(Consent.study_id == study_id, last_activity < cutoff, ~_active_since(cutoff))
+            for study_id, cutoff in cutoffs.items()
+        )))
+        .order_by(models.MetricSession.id)
+    )
+
+
+class RetentionSweeper:
+    """Purges expired study data in throttled chunks."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        session_batch: int = RETENTION_SESSION_BATCH,
+        event_batch: int = RETENTION_EVENT_BATCH,
+        throttle: float = RETENTION_THROTTLE_SEC,
+        interval: float = RETENTION_INTERVAL_SEC,
+    ):
+        self.engine = engine
+        self.session_batch = session_batch
+        self.event_batch = event_batch
+        self.throttle = throttle
+        self.interval = interval
+        self.partition_manager = partitions.PartitionManager(engine)
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters across runs
+        self.runs = 0
+        self.total_events = 0
+        self.total_play_sessions = 0
+        self.total_sessions = 0
+        self.total_partitions = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    # Partitions
+
+    def _droppable_partitions(self, conn: Connection, cutoffs: Dict[str, datetime]) -> List[partitions.Partition]:
+        if not self.partition_manager.supported or not self.partition_manager.is_partitioned(conn):
+            return []
+        # A partition newer than the shortest retention period cannot be
+        # all expired; skip scanning those
+        newest = max(cutoffs.values())
+        candidates = [
+            p for p in self.partition_manager.partitions(conn) + self.partition_manager.detached_partitions(conn)
+            if not p.is_default and p.end <= newest
+        ]
+
+        expired_play_sessions = select(models.PlaySession.id).where(
+            models.PlaySession.metric_session_id.in_(
+                expired_sessions(cutoffs).with_only_columns(models.MetricSession.id).order_by(None)
+            )
+        )
+        droppable = []
+        for partition in candidates:
+            events = table(partition.name, column("play_session_id"))
+            live = conn.execute(select(exists().where(
+                events.c.play_session_id.not_in(expired_play_sessions)
+            ))).scalar()
+            if not live:
+                droppable.append(partition)
+        return droppable
+
+    def _drop_partition(self, partition: partitions.Partition) -> bool:
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+                if partition.attached:
+                    conn.execute(text(
+                        f"ALTER TABLE {partitions.PARENT} DETACH PARTITION {partition.name}"
+                    ))
+                if heatmaps.HEATMAPS_ENABLED:
+                    # Subtract the partition's points in the dropping transaction,
+                    # grouped so a large partition is a few rows per position
+                    points = conn.execute(heatmaps.partition_points_query(partition.name)).all()
+                    rollups.forget_heatmap_points(conn, points, weighted=True)
+                conn.execute(text(f"DROP TABLE {partition.name}"))
+        except Exception as e:
+            logger.warning(f"Could not drop partition {partition.name}: {e}")
+            return False
+        logger.info(f"Dropped expired partition {partition.name}")
+        return True
+
+    # Chunked deletes
+
+    def _delete_events(self, play_session_ids: List[int]) -> int:
+        deleted = 0
+        while True:
+            with self.engine.begin() as conn:
+                batch = select(models.Event.id).where(
+                    models.Event.play_session_id.in_(play_session_ids)
+                ).limit(self.event_batch)
+                delete_events = delete(models.Event).where(models.Event.id.in_(batch))
+                if heatmaps.HEATMAPS_ENABLED:
+                    # Subtracted chunk by chunk, so an interrupted purge stays consistent
+                    points = conn.execute(delete_events.returning(*heatmaps.POINT_COLUMNS)).all()
+                    count = len(points)
+                    rollups.forget_heatmap_points(conn, points)
+                else:
+                    count = conn.execute(delete_events).rowcount
+            deleted += count
+            if count < self.event_batch:
+                return deleted
+            time.sleep(self.throttle)
+
+    def _purge_chunk(self, sessions: List[Any], now: datetime) -> Dict[str, int]:
+        session_ids = [s.id for s in sessions]
+        with self.engine.connect() as conn:
+            play_session_ids = conn.execute(
+                select(models.PlaySession.id).where(
+                    models.PlaySession.metric_session_id.in_(session_ids)
+                )
+            ).scalars().all()
+
+        events = self._delete_events(play_session_ids) if play_session_ids else 0
+
+        with self.engine.begin() as conn:
+            rollups.forget_play_sessions(conn, play_session_ids)
+            play_sessions = conn.execute(
+                delete(models.PlaySession).where(
+                    models.PlaySession.metric_session_id.in_(session_ids)
+                )
+            ).rowcount
+            metric_sessions = conn.execute(
+                delete(models.MetricSession).where(models.MetricSession.id.in_(session_ids))
+            ).rowcount
+            conn.execute(
+                update(Consent).where(
+                    Consent.participant_id.in_([s.unique_id for s in sessions]),
+                    Consent.data_deleted_at.is_(None)
+                ).values(data_deleted_at=now)
+            )
+
+        for play_session_id in play_session_ids:
+            session_cache.forget_play_session(play_session_id)
+        for session_id in session_ids:
+            session_cache.forget_metric_session(session_id)
+        return {"events": events, "play_sessions": play_sessions, "sessions": metric_sessions}
+
+    # Runs
+
+    def _try_lock(self, conn: Connection) -> bool:
+        if conn.dialect.name != "postgresql":
+            return True
+        return conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+        ).scalar()
+
+    def sweep(self, now: Optional[datetime] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """Purge everything expired as of now; returns rows purged."""
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        result: Dict[str, Any] = {
+            "started_at": now.isoformat(),
+            "dry_run": dry_run,
+            "partitions_dropped": [],
+            "events_deleted": 0,
+            "play_sessions_deleted": 0,
+            "sessions_deleted": 0,
+        }
+
+        # The lock connection stays open for the whole run
+        with self.engine.connect() as lock_conn:
+            if not self._try_lock(lock_conn):
+                result["skipped"] = "another worker is sweeping"
+                return result
+            try:
+                with self.engine.connect() as conn:
+                    cutoffs = study_cutoffs(conn, now)
+                    if not cutoffs:
+                        return self._finish(result, started)
+                    droppable = self._droppable_partitions(conn, cutoffs)
+                    if dry_run:
+                        result["partitions_dropped"] = [p.name for p in droppable]
+                        result["sessions_deleted"] = conn.execute(
+                            select(func.count()).select_from(expired_sessions(cutoffs).subquery())
+                        ).scalar()
+                        return self._finish(result, started)
+
+                for partition in droppable:
+                    if self._drop_partition(partition):
+                        result["partitions_dropped"].append(partition.name)
+                        time.sleep(self.throttle)
+
+                while True:
+                    with self.engine.connect() as conn:
+                        sessions = conn.execute(
+                            expired_sessions(cutoffs).limit(self.session_batch)
+                        ).all()
+                    if not sessions:
+                        break
+                    counts = self._purge_chunk(sessions, now)
+                    result["events_deleted"] += counts["events"]
+                    result["play_sessions_deleted"] += counts["play_sessions"]
+                    result["sessions_deleted"] += counts["sessions"]
+                    time.sleep(self.throttle)
+            finally:
+                if lock_conn.dialect.name == "postgresql":
+                    lock_conn.execute(
+                        text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY}
+                    )
+                    lock_conn.commit()
+
+        self.total_events += result["events_deleted"]
+        self.total_play_sessions += result["play_sessions_deleted"]
+        self.total_sessions += result["sessions_deleted"]
+        self.total_partitions += len(result["partitions_dropped"])
+        return self._finish(result, started)
+
+    def _finish(self, result: Dict[str, Any], started: float) -> Dict[str, Any]:
+        result["duration_sec"] = round(time.perf_counter() - started, 3)
+        if not result["dry_run"]:
+            self.runs += 1
+            self.last_run = result
+        if result["sessions_deleted"] or result["partitions_dropped"]:
+            logger.info(
+                f"Retention sweep: {result['sessions_deleted']} sessions, "
+                f"{result['play_sessions_deleted']} play sessions, "
+                f"{result['events_deleted']} events, "
+                f"{len(result['partitions_dropped'])} partitions purged"
+                + (" (dry run)" if result["dry_run"] else "")
+            )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": RETENTION_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "interval_sec": self.interval,
+            "runs": self.runs,
+            "events_deleted": self.total_events,
+            "play_sessions_deleted": self.total_play_sessions,
+            "sessions_deleted": self.total_sessions,
+            "partitions_dropped": self.total_partitions,
+            "last_run": self.last_run,
+        }
+
+    # Background service
+
+    async def start(self) -> None:
+        """Run sweep() periodically on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+
+retention_sweeper = RetentionSweeper(engine)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Purge study data past its retention period")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be purged")
+    args = parser.parse_args()
+    print(json.dumps(retention_sweeper.sweep(dry_run=args.dry_run), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    main()
@@ -0,0 +1,612 @@
+"""
+Incrementally maintained event rollups.
+
+Two tables hold, per event type and hour, the event count and the count,
+sum, sum of squares, min and max of magnitude:
+
+- play_session_event_rollups: per play session
+- study_event_rollups: per study (through the participant's consent),
+  split over WEBTICS_ROLLUP_SHARDS rows per key so one study's concurrent
+  ingest transactions do not queue on a single row
+
+The ingest path tallies rows as they stream into the bulk insert and
+upserts both tables in the same transaction, so the rollups always match
+the committed events. Summary statistics (counts, mean, standard deviation,
+min, max of magnitude) are then read from the rollups in O(buckets) instead
+of scanning events.
+
+The same transaction merges reaction-time magnitudes into the per play
+session distribution sketches of app.sketches, and event coordinates into
+the heatmap tile pyramid of app.heatmaps. Each has its own switch
+(WEBTICS_ROLLUPS_ENABLED, WEBTICS_SKETCH_EVENT_TYPES, WEBTICS_HEATMAPS_ENABLED);
+rows are tallied whenever any of them is on.
+
+When play sessions are deleted (withdrawal, retention), their rollup rows
+and sketches go with them, their events are subtracted from the heatmaps,
+and the study rows they fed are recomputed from the remaining play session
+rows.
+
+Databases that had events before rollups existed, or after changing the
+bucket, need a one-off rebuild (pause ingest while it runs):
+
+    python -m app.rollups rebuild
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, delete, distinct, func, insert, literal, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import heatmaps, models, models_research, sketches
+from .database import engine
+from .session_cache import SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SEC, TTLCache
+
+logger = logging.getLogger("webtics.rollups")
+
+ROLLUPS_ENABLED = os.getenv("WEBTICS_ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_SHARDS = int(os.getenv("WEBTICS_ROLLUP_SHARDS", "8"))
+ROLLUP_BUCKET = timedelta(hours=1)
+# Play sessions aggregated per transaction by rebuild()
+REBUILD_CHUNK = 1000
+
+PlaySessionRollup = models.PlaySessionEventRollup
+StudyRollup = models.StudyEventRollup
+Consent = models_research.ResearchConsent
+
+STAT_COLUMNS = (
+    "event_count",
+    "magnitude_count",
+    "magnitude_sum",
+    "magnitude_sum_sq",
+    "magnitude_min",
+    "magnitude_max",
+)
+
+
+class PlaySessionLabels(NamedTuple):
+    """What aggregates are keyed by besides the play session itself."""
+    study_id: str  # "" for sessions without a consent
+    build: str  # "" for sessions without a build number
+
+
+# play_session_id -> PlaySessionLabels
+study_cache = TTLCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SEC)
+
+RollupKey = Tuple[int, int, datetime]
+
+_FIRST_AXIS, _SECOND_AXIS = heatmaps.HEATMAP_AXES
+
+
+def accumulating() -> bool:
+    """Whether ingest should tally rows for any of rollups, sketches or heatmaps."""
+    return ROLLUPS_ENABLED or bool(sketches.SKETCH_EVENT_TYPES) or heatmaps.HEATMAPS_ENABLED
+
+
+def bucket_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class _Stats:
+    __slots__ = STAT_COLUMNS
+
+    def __init__(self):
+        self.event_count = 0
+        self.magnitude_count = 0
+        self.magnitude_sum = 0.0
+        self.magnitude_sum_sq = 0.0
+        self.magnitude_min = None
+        self.magnitude_max = None
+
+    def add(self, magnitude: Optional[float]) -> None:
+        self.event_count += 1
+        if magnitude is None:
+            return
+        self.magnitude_count += 1
+        self.magnitude_sum += magnitude
+        self.magnitude_sum_sq += magnitude * magnitude
+        if self.magnitude_min is None or magnitude < self.magnitude_min:
+            self.magnitude_min = magnitude
+        if self.magnitude_max is None or magnitude > self.magnitude_max:
+            self.magnitude_max = magnitude
+
+    def values(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in STAT_COLUMNS}
+
+
+class RollupAccumulator:
+    """Tallies event rows per (play session, event type, hour)."""
+
+    def __init__(self):
+        self._stats: Dict[RollupKey, _Stats] = {}
+        # (play session, event type) -> magnitudes for the distribution sketches
+        self.samples: Dict[Tuple[int, int], List[float]] = defaultdict(list)
+        # (play session, event type, first axis, second axis) for the heatmaps
+        self.points: List[Tuple[int, int, int, int]] = []
+        self._last_timestamp = None
+        self._last_bucket = None
+
+    def __bool__(self) -> bool:
+        return bool(self._stats or self.samples or self.points)
+
+    def add(self, row: dict) -> None:
+        play_session_id, event_type, magnitude = row["play_session_id"], row["event_type"], row.get("magnitude")
+        if ROLLUPS_ENABLED:
+            timestamp = row["timestamp"]
+            # Rows of one request share a timestamp
+            if timestamp != self._last_timestamp:
+                self._last_timestamp = timestamp
+                self._last_bucket = bucket_start(timestamp)
+            key = (play_session_id, event_type, self._last_bucket)
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _Stats()
+            stats.add(magnitude)
+        if magnitude is not None and event_type in sketches.SKETCH_EVENT_TYPES:
+            self.samples[(play_session_id, event_type)].append(magnitude)
+        if heatmaps.HEATMAPS_ENABLED:
+            first, second = row.get(_FIRST_AXIS), row.get(_SECOND_AXIS)
+            if first is not None and second is not None:
+                self.points.append((play_session_id, event_type, first, second))
+
+    def observe(self, rows: Iterable[dict]) -> Iterator[dict]:
+        """Pass rows through (to the bulk insert) while tallying them."""
+        for row in rows:
+            self.add(row)
+            yield row
+
+    def play_session_ids(self) -> List[int]:
+        """Play sessions whose labels the rollups or heatmaps need."""
+        play_session_ids = {key[0] for key in self._stats}
+        play_session_ids.update(point[0] for point in self.points)
+        return sorted(play_session_ids)
+
+    def items(self) -> List[Tuple[RollupKey, _Stats]]:
+        # Sorted so concurrent transactions lock rows in the same order
+        return sorted(self._stats.items(), key=lambda item: item[0])
+
+
+# Study and build lookup
+
+def _labels_query(play_session_ids: Sequence[int]) -> Select:
+    return (
+        select(models.PlaySession.id, Consent.study_id, models.MetricSession.build_number)
+        .join(models.MetricSession, models.MetricSession.id == models.PlaySession.metric_session_id)
+        .outerjoin(Consent, Consent.participant_id == models.MetricSession.unique_id)
+        .where(models.PlaySession.id.in_(play_session_ids))
+    )
+
+
+def _cached_labels(play_session_ids: Iterable[int]) -> Tuple[Dict[int, PlaySessionLabels], List[int]]:
+    labels, missing = {}, []
+    for play_session_id in play_session_ids:
+        cached = study_cache.get(play_session_id)
+        if cached is None:
+            missing.append(play_session_id)
+        else:
+            labels[play_session_id] = cached
+    return labels, missing
+
+
+def _remember_labels(labels: Dict[int, PlaySessionLabels], rows) -> None:
+    for play_session_id, study_id, build in rows:
+        labels[play_session_id] = PlaySessionLabels(study_id or "", build or "")
+        study_cache.set(play_session_id, labels[play_session_id])
+
+
+async def _labels_async(db: AsyncSession, play_session_ids: Iterable[int]) -> Dict[int, PlaySessionLabels]:
+    labels, missing = _cached_labels(play_session_ids)
+    if missing:
+        _remember_labels(labels, (await db.execute(_labels_query(missing))).all())
+    return labels
+
+
+def _labels(db, play_session_ids: Iterable[int]) -> Dict[int, PlaySessionLabels]:
+    """For a sync Session or Connection."""
+    labels, missing = _cached_labels(play_session_ids)
+    if missing:
+        _remember_labels(labels, db.execute(_labels_query(missing)).all())
+    return labels
+
+
+# Upserts
+
+def _upsert(dialect_name: str, table, key_columns: Sequence[str], rows: List[dict]):
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(table).values(rows)
+        least, greatest = func.least, func.greatest
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(table).values(rows)
+        # Two-argument min()/max() are scalar functions in SQLite
+        least, greatest = func.min, func.max
+    else:
+        raise NotImplementedError(f"Rollups are not supported on {dialect_name}")
+    current, new = table.c, stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={
+            "event_count": current.event_count + new.event_count,
+            "magnitude_count": current.magnitude_count + new.magnitude_count,
+            "magnitude_sum": current.magnitude_sum + new.magnitude_sum,
+            "magnitude_sum_sq": current.magnitude_sum_sq + new.magnitude_sum_sq,
+            # Either side may be NULL (no magnitudes yet)
+            "magnitude_min": least(
+                func.coalesce(current.magnitude_min, new.magnitude_min),
+                func.coalesce(new.magnitude_min, current.magnitude_min)
+            ),
+            "magnitude_max": greatest(
+                func.coalesce(current.magnitude_max, new.magnitude_max),
+                func.coalesce(new.magnitude_max, current.magnitude_max)
+            ),
+        }
+    )
+
+
+def _upsert_statements(dialect_name: str, accumulator: RollupAccumulator, labels: Dict[int, PlaySessionLabels]) -> list:
+    play_session_rows = []
+    study_stats: Dict[Tuple[str, int, datetime, int], _Stats] = {}
+    for (play_session_id, event_type, bucket), stats in accumulator.items():
+        study_id = labels[play_session_id].study_id or None
+        play_session_rows.append({
+            "play_session_id": play_session_id,
+            "event_type": event_type,
+            "bucket_start": bucket,
+            "study_id": study_id,
+            **stats.values(),
+        })
+        if study_id is None:
+            continue
+        key = (study_id, event_type, bucket, play_session_id % ROLLUP_SHARDS)
+        existing = study_stats.get(key)
+        study_stats[key] = stats if existing is None else _merge(existing, stats)
+
+    statements = [_upsert(
+        dialect_name, PlaySessionRollup.__table__,
+        ("play_session_id", "event_type", "bucket_start"), play_session_rows
+    )]
+    if study_stats:
+        study_rows = [
+            {"study_id": s, "event_type": t, "bucket_start": b, "shard": shard, **stats.values()}
+            for (s, t, b, shard), stats in sorted(study_stats.items(), key=lambda item: item[0])
+        ]
+        statements.append(_upsert(
+            dialect_name, StudyRollup.__table__,
+            ("study_id", "event_type", "bucket_start", "shard"), study_rows
+        ))
+    return statements
+
+
+def _merge(a: _Stats, b: _Stats) -> _Stats:
+    merged = _Stats()
+    merged.event_count = a.event_count + b.event_count
+    merged.magnitude_count = a.magnitude_count + b.magnitude_count
+    merged.magnitude_sum = a.magnitude_sum + b.magnitude_sum
+    merged.magnitude_sum_sq = a.magnitude_sum_sq + b.magnitude_sum_sq
+    minimums = [m for m in (a.magnitude_min, b.magnitude_min) if m is not None]
+    maximums = [m for m in (a.magnitude_max, b.magnitude_max) if m is not None]
+    merged.magnitude_min = min(minimums) if minimums else None
+    merged.magnitude_max = max(maximums) if maximums else None
+    return merged
+
+
+async def apply_async(db: AsyncSession, accumulator: RollupAccumulator) -> None:
+    """Upsert tallied rows into the enabled aggregates in the caller's transaction."""
+    if not accumulator:
+        return
+    labels = await _labels_async(db, accumulator.play_session_ids())
+    if accumulator.items():
+        for statement in _upsert_statements(db.bind.dialect.name, accumulator, labels):
+            await db.execute(statement)
+    await sketches.apply_async(db, accumulator.samples)
+    await heatmaps.apply_async(db, accumulator.points, labels)
+
+
+def apply(db: Session, accumulator: RollupAccumulator) -> None:
+    """Sync counterpart of apply_async() for the write-behind flusher."""
+    if not accumulator:
+        return
+    labels = _labels(db, accumulator.play_session_ids())
+    if accumulator.items():
+        for statement in _upsert_statements(db.get_bind().dialect.name, accumulator, labels):
+            db.execute(statement)
+    sketches.apply(db, accumulator.samples)
+    heatmaps.apply(db, accumulator.points, labels)
+
+
+# Deletion
+
+def _touched_query(play_session_ids: Sequence[int]) -> Select:
+    return select(distinct(PlaySessionRollup.study_id), PlaySessionRollup.bucket_start).where(
+        PlaySessionRollup.play_session_id.in_(play_session_ids),
+        PlaySessionRollup.study_id.isnot(None)
+    )
+
+
+def _study_rows_from_play_sessions(where) -> Select:
+    """Study rollup rows aggregated from play session rollups."""
+    # Inline the modulus: asyncpg sends bound parameters server side, and
+    # PostgreSQL does not treat "% $1" and "% $2" as the same GROUP BY expression
+    shard = PlaySessionRollup.play_session_id % literal_column(str(int(ROLLUP_SHARDS)))
+    return (
+        select(
+            PlaySessionRollup.study_id,
+            PlaySessionRollup.event_type,
+            PlaySessionRollup.bucket_start,
+            shard.label("shard"),
+            func.sum(PlaySessionRollup.event_count),
+            func.sum(PlaySessionRollup.magnitude_count),
+            func.sum(PlaySessionRollup.magnitude_sum),
+            func.sum(PlaySessionRollup.magnitude_sum_sq),
+            func.min(PlaySessionRollup.magnitude_min),
+            func.max(PlaySessionRollup.magnitude_max),
+        )
+        .where(PlaySessionRollup.study_id.isnot(None), *where)
+        .group_by(
+            PlaySessionRollup.study_id,
+            PlaySessionRollup.event_type,
+            PlaySessionRollup.bucket_start,
+            shard,
+        )
+    )
+
+
+def _insert_study_rows(where):
+    return insert(StudyRollup).from_select(
+        ["study_id", "event_type", "bucket_start", "shard", *STAT_COLUMNS],
+        _study_rows_from_play_sessions(where)
+    )
+
+
+def _forget_statements(play_session_ids: Sequence[int], touched) -> list:
+    statements = [
+        delete(PlaySessionRollup).where(PlaySessionRollup.play_session_id.in_(play_session_ids)),
+        sketches.delete_statement(play_session_ids),
+    ]
+    buckets_by_study: Dict[str, List[datetime]] = defaultdict(list)
+    for study_id, bucket in touched:
+        buckets_by_study[study_id].append(bucket)
+    for study_id, buckets in sorted(buckets_by_study.items()):
+        statements.append(delete(StudyRollup).where(
+            StudyRollup.study_id == study_id, StudyRollup.bucket_start.in_(buckets)
+        ))
+        statements.append(_insert_study_rows([
+            PlaySessionRollup.study_id == study_id, PlaySessionRollup.bucket_start.in_(buckets)
+        ]))
+    return statements
+
+
+async def forget_play_sessions_async(db: AsyncSession, play_session_ids: Sequence[int]) -> None:
+    """
+    Drop the rollups of play sessions about to be deleted.
+
+    Run in the deleting transaction, before the play sessions themselves;
+    the study rows they contributed to are recomputed without them.
+    """
+    if not play_session_ids:
+        return
+    touched = (await db.execute(_touched_query(play_session_ids))).all()
+    for statement in _forget_statements(play_session_ids, touched):
+        await db.execute(statement)
+    for play_session_id in play_session_ids:
+        study_cache.invalidate(play_session_id)
+
+
+def forget_play_sessions(conn: Connection, play_session_ids: Sequence[int]) -> None:
+    """Sync counterpart of forget_play_sessions_async() for the retention sweeper."""
+    if not play_session_ids:
+        return
+    touched = conn.execute(_touched_query(play_session_ids)).all()
+    for statement in _forget_statements(play_session_ids, touched):
+        conn.execute(statement)
+    for play_session_id in play_session_ids:
+        study_cache.invalidate(play_session_id)
+
+
+async def forget_heatmap_points_async(db: AsyncSession, deleted) -> None:
+    """
+    Subtract deleted events from the heatmaps, in the deleting transaction.
+
+    `deleted` are the heatmaps.POINT_COLUMNS rows returned by the events
+    DELETE; run it before the play sessions themselves are deleted. It is
+    here rather than in heatmaps because it needs the play session labels.
+    """
+    if deleted:
+        labels = await _labels_async(db, {row[0] for row in deleted})
+        await heatmaps.forget_async(db, deleted, labels)
+
+
+def forget_heatmap_points(conn: Connection, deleted, weighted: bool = False) -> None:
+    """Sync counterpart of forget_heatmap_points_async() for the retention sweeper (see heatmaps.tally_points)."""
+    if deleted:
+        heatmaps.forget(conn, deleted, _labels(conn, {row[0] for row in deleted}), weighted)
+
+
+# Rebuild
+
+def _bucket_expression(dialect_name: str):
+    if dialect_name == "postgresql":
+        return func.date_trunc("hour", models.Event.timestamp)
+    # Same text format SQLAlchemy stores DateTime values in on SQLite
+    return func.strftime("%Y-%m-%d %H:00:00.000000", models.Event.timestamp)
+
+
+def _play_session_rows_from_events(dialect_name: str, first_id: int, last_id: int) -> Select:
+    bucket = _bucket_expression(dialect_name)
+    magnitude = models.Event.magnitude
+    return (
+        select(
+            models.Event.play_session_id,
+            models.Event.event_type,
+            bucket,
+            Consent.study_id,
+            func.count(),
+            func.count(magnitude),
+            func.coalesce(func.sum(magnitude), literal(0.0)),
+            func.coalesce(func.sum(magnitude * magnitude), literal(0.0)),
+            func.min(magnitude),
+            func.max(magnitude),
+        )
+        .join(models.PlaySession, models.PlaySession.id == models.Event.play_session_id)
+        .join(models.MetricSession, models.MetricSession.id == models.PlaySession.metric_session_id)
+        .outerjoin(Consent, Consent.participant_id == models.MetricSession.unique_id)
+        .where(
+            models.Event.play_session_id.between(first_id, last_id),
+            models.Event.timestamp.isnot(None)
+        )
+        .group_by(models.Event.play_session_id, models.Event.event_type, bucket, Consent.study_id)
+    )
+
+
+def rebuild(engine: Engine = engine, chunk: int = REBUILD_CHUNK) -> Dict[str, Any]:
+    """Recompute both rollup tables, the sketches and the heatmaps from the events table."""
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(delete(StudyRollup))
+        conn.execute(delete(PlaySessionRollup))
+        conn.execute(delete(sketches.Sketch))
+        conn.execute(delete(heatmaps.Cell))
+        low, high = conn.execute(
+            select(func.min(models.PlaySession.id), func.max(models.PlaySession.id))
+        ).one()
+
+    if low is not None:
+        for first_id in range(low, high + 1, chunk):
+            with engine.begin() as conn:
+                conn.execute(insert(PlaySessionRollup).from_select(
+                    ["play_session_id", "event_type", "bucket_start", "study_id", *STAT_COLUMNS],
+                    _play_session_rows_from_events(conn.dialect.name, first_id, first_id + chunk - 1)
+                ))
+                sketches.rebuild_chunk(conn, first_id, first_id + chunk - 1)
+                if heatmaps.HEATMAPS_ENABLED:
+                    heatmaps.rebuild_chunk(conn, first_id, first_id + chunk - 1)
+
+    with engine.begin() as conn:
+        conn.execute(_insert_study_rows([]))
+        counts = {
+            "play_session_rows": conn.execute(select(func.count()).select_from(PlaySessionRollup)).scalar(),
+            "study_rows": conn.execute(select(func.count()).select_from(StudyRollup)).scalar(),
+            "sketches": conn.execute(select(func.count()).select_from(sketches.Sketch)).scalar(),
+            "heatmap_cells": conn.execute(select(func.count()).select_from(heatmaps.Cell)).scalar(),
+        }
+    study_cache.clear()
+    heatmaps.clear_cache()
+    counts["duration_sec"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Rebuilt rollups: {counts}")
+    return counts
+
+
+# Queries
+
+def _sum_columns(table) -> tuple:
+    return (
+        func.sum(table.event_count).label("event_count"),
+        func.sum(table.magnitude_count).label("magnitude_count"),
+        func.sum(table.magnitude_sum).label("magnitude_sum"),
+        func.sum(table.magnitude_sum_sq).label("magnitude_sum_sq"),
+        func.min(table.magnitude_min).label("magnitude_min"),
+        func.max(table.magnitude_max).label("magnitude_max"),
+    )
+
+
+def describe(row) -> Dict[str, Any]:
+    """Summary statistics from summed rollup columns."""
+    n = row.magnitude_count or 0
+    mean = stddev = None
+    if n:
+        mean = row.magnitude_sum / n
+        if n > 1:
+            # Sample variance from the moments; clamp rounding noise
+            variance = max(0.0, (row.magnitude_sum_sq - row.magnitude_sum * mean) / (n - 1))
+            stddev = variance ** 0.5
+    return {
+        "count": row.event_count or 0,
+        "magnitude": {
+            "count": n,
+            "mean": mean,
+            "stddev": stddev,
+            "min": row.magnitude_min,
+            "max": row.magnitude_max,
+        },
+    }
+
+
+def _time_filters(table, event_type: Optional[int], start: Optional[datetime], end: Optional[datetime]) -> list:
+    where = []
+    if event_type is not None:
+        where.append(table.event_type == event_type)
+    if start is not None:
+        where.append(table.bucket_start >= bucket_start(start))
+    if end is not None:
+        where.append(table.bucket_start < end)
+    return where
+
+
+def play_session_summary_query(
+    play_session_ids: Optional[Sequence[int]] = None,
+    metric_session_id: Optional[int] = None,
+    event_type: Optional[int] = None,
+) -> Select:
+    """Per event type totals over some play sessions (or a metric session's)."""
+    where = _time_filters(PlaySessionRollup, event_type, None, None)
+    if play_session_ids is not None:
+        where.append(PlaySessionRollup.play_session_id.in_(play_session_ids))
+    if metric_session_id is not None:
+        where.append(PlaySessionRollup.play_session_id.in_(
+            select(models.PlaySession.id).where(models.PlaySession.metric_session_id == metric_session_id)
+        ))
+    return (
+        select(PlaySessionRollup.event_type, *_sum_columns(PlaySessionRollup))
+        .where(*where)
+        .group_by(PlaySessionRollup.event_type)
+        .order_by(PlaySessionRollup.event_type)
+    )
+
+
+def study_summary_query(
+    study_id: str,
+    event_type: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    by_bucket: bool = False,
+) -> Select:
+    """Per event type (and optionally per hour) totals for a study, shards summed."""
+    group = [StudyRollup.event_type]
+    if by_bucket:
+        group.append(StudyRollup.bucket_start)
+    return (
+        select(*group, *_sum_columns(StudyRollup))
+        .where(StudyRollup.study_id == study_id, *_time_filters(StudyRollup, event_type, start, end))
+        .group_by(*group)
+        .order_by(*group)
+    )
+
+
+def merge_rows(rows: Iterable) -> Any:
+    """Combine summed rollup rows (e.g. hours into a day)."""
+    total = _Stats()
+    total.event_count = 0
+    for row in rows:
+        total = _merge(total, row)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain event rollup tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--chunk", type=int, default=REBUILD_CHUNK, help="Play sessions per transaction")
+    args = parser.parse_args()
+    print(json.dumps(rebuild(chunk=args.chunk), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    main()
@@ -0,0 +1,159 @@
+"""
+Aggregate event statistics served from the rollup tables (app/rollups.py)
+and the distribution sketches (app/sketches.py).
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import rollups, schemas, sketches
+from ..database import get_async_db
+
+router = APIRouter(prefix="/api/v1/analytics", tags=["analytics"])
+
+
+def summary_response(rows) -> dict:
+    return {"event_types": [{"event_type": row.event_type, **rollups.describe(row)} for row in rows]}
+
+
+@router.get("/play-sessions/{play_session_id}/summary", response_model=schemas.RollupSummaryResponse)
+async def get_play_session_summary(
+    play_session_id: int,
+    event_type: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Event counts and magnitude statistics per event type for a play session."""
+    rows = (await db.execute(rollups.play_session_summary_query(
+        play_session_ids=[play_session_id], event_type=event_type
+    ))).all()
+    return summary_response(rows)
+
+
+@router.get("/sessions/{session_id}/summary", response_model=schemas.RollupSummaryResponse)
+async def get_session_summary(
+    session_id: int,
+    event_type: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Event counts and magnitude statistics per event type over a metric session's play sessions."""
+    rows = (await db.execute(rollups.play_session_summary_query(
+        metric_session_id=session_id, event_type=event_type
+    ))).all()
+    return summary_response(rows)
+
+
+@router.get("/studies/{study_id}/summary", response_model=schemas.RollupSummaryResponse)
+async def get_study_summary(
+    study_id: str,
+    event_type: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Event counts and magnitude statistics per event type for a study.
+
+    start and end select whole hourly buckets: the bucket containing start
+    is included, buckets starting at or after end are not.
+    """
+    rows = (await db.execute(rollups.study_summary_query(study_id, event_type, start, end))).all()
+    return summary_response(rows)
+
+
+@router.get("/studies/{study_id}/timeseries", response_model=schemas.RollupTimeseriesResponse)
+async def get_study_timeseries(
+    study_id: str,
+    event_type: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: Literal["hour", "day"] = "hour",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Per event type statistics for a study by hour or by day."""
+    rows = (await db.execute(rollups.study_summary_query(
+        study_id, event_type, start, end, by_bucket=True
+    ))).all()
+
+    if interval == "day":
+        days = defaultdict(list)
+        for row in rows:
+            days[(row.bucket_start.replace(hour=0), row.event_type)].append(row)
+        merged = [
+            (day, event_type, rollups.merge_rows(day_rows))
+            for (day, event_type), day_rows in sorted(days.items())
+        ]
+    else:
+        merged = [(row.bucket_start, row.event_type, row) for row in rows]
+
+    return {
+        "interval": interval,
+        "buckets": [
+            {"bucket_start": bucket, "event_type": event_type, **rollups.describe(stats)}
+            for bucket, event_type, stats in sorted(merged, key=lambda item: (item[0], item[1]))
+        ],
+    }
+
+
+def distribution_response(event_type: int, groups, quantiles: List[float], bins: int) -> dict:
+    return {
+        "event_type": event_type,
+        "relative_accuracy": sketches.RELATIVE_ACCURACY,
+        "groups": [
+            {**labels, **sketches.describe(sketch, quantiles, bins)}
+            for labels, sketch in groups if sketch.count
+        ],
+    }
+
+
+def check_quantiles(q: Optional[List[float]]) -> List[float]:
+    if not q:
+        return list(sketches.DEFAULT_QUANTILES)
+    if any(not 0 <= value <= 1 for value in q):
+        raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+    return q
+
+
+@router.get("/play-sessions/{play_session_id}/distribution", response_model=schemas.DistributionResponse)
+async def get_play_session_distribution(
+    play_session_id: int,
+    event_type: int = 102,
+    q: Optional[List[float]] = Query(None, description="Quantiles, e.g. q=0.5&q=0.99"),
+    bins: int = Query(20, ge=0, le=200, description="Histogram bins (0 for none)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Approximate magnitude percentiles and histogram for a play session."""
+    quantiles = check_quantiles(q)
+    rows = (await db.execute(sketches.play_session_sketches_query([play_session_id], event_type))).all()
+    return distribution_response(event_type, sketches.merge_groups(rows), quantiles, bins)
+
+
+@router.get("/studies/{study_id}/distribution", response_model=schemas.DistributionResponse)
+async def get_study_distribution(
+    study_id: str,
+    event_type: int = 102,
+    condition: Optional[str] = None,
+    age_range: Optional[str] = None,
+    build: Optional[str] = None,
+    group_by: Optional[List[Literal["condition", "age_range", "build"]]] = Query(None),
+    q: Optional[List[float]] = Query(None, description="Quantiles, e.g. q=0.5&q=0.99"),
+    bins: int = Query(20, ge=0, le=200, description="Histogram bins (0 for none)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Approximate magnitude percentiles and histogram for a study.
+
+    Merges the per play session sketches of the study's participants,
+    optionally filtered by consent condition and age range and by game
+    build, into one distribution per group_by combination. Percentiles are
+    within relative_accuracy of the exact values. Defaults to reaction
+    times (event type 102, CORRECT_RESPONSE).
+    """
+    quantiles = check_quantiles(q)
+    group_by = list(dict.fromkeys(group_by or []))
+    rows = (await db.execute(sketches.study_sketches_query(
+        study_id, event_type, condition=condition, age_range=age_range, build=build, group_by=group_by
+    ))).all()
+    return distribution_response(event_type, sketches.merge_groups(rows, group_by), quantiles, bins)
@@ -0,0 +1,71 @@
+"""Spatial heatmap tiles served from the tile pyramid (app/heatmaps.py)."""
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import heatmaps, schemas
+from ..database import get_async_db
+
+
+def require_enabled():
+    """Heatmaps are opt-in (WEBTICS_HEATMAPS_ENABLED); without them there are no tiles to serve."""
+    if not heatmaps.HEATMAPS_ENABLED:
+        raise HTTPException(status_code=404, detail="Heatmaps are not enabled")
+
+
+router = APIRouter(prefix="/api/v1/heatmaps", tags=["heatmaps"], dependencies=[Depends(require_enabled)])
+
+TILE_CACHE_CONTROL = f"private, max-age={int(heatmaps.HEATMAP_CACHE_TTL_SEC)}"
+
+
+@router.get("", response_model=schemas.HeatmapInfoResponse)
+async def get_heatmap_info(study_id: str = "", db: AsyncSession = Depends(get_async_db)):
+    """
+    Tile geometry and the (event type, build) layers of a study's heatmap.
+
+    study_id "" (the default) covers sessions without a research consent.
+    """
+    rows = (await db.execute(heatmaps.layers_query(study_id))).all()
+    return {
+        "study_id": study_id,
+        "axes": list(heatmaps.HEATMAP_AXES),
+        "origin": [heatmaps.ORIGIN, heatmaps.ORIGIN],
+        "world_size": heatmaps.WORLD_SIZE,
+        "tile_size": heatmaps.TILE_SIZE,
+        "max_zoom": heatmaps.HEATMAP_MAX_ZOOM,
+        "layers": [{"event_type": r.event_type, "build": r.build, "count": r.count} for r in rows if r.count > 0],
+    }
+
+
+@router.get("/tiles/{zoom}/{tile_x}/{tile_y}", response_model=schemas.HeatmapTileResponse)
+async def get_heatmap_tile(
+    response: Response,
+    zoom: int = Path(..., ge=0, le=heatmaps.HEATMAP_MAX_ZOOM),
+    tile_x: int = Path(..., ge=0),
+    tile_y: int = Path(..., ge=0),
+    study_id: str = "",
+    event_type: Optional[int] = None,
+    build: Optional[str] = None,
+    format: Literal["json", "binary"] = "json",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Event counts per cell of one tile (TILE_SIZE x TILE_SIZE, row-major).
+
+    Omitting event_type or build sums over all of them. format=binary
+    returns the counts as little-endian uint32 (16 KiB), with the total and
+    maximum in X-Heatmap-Total and X-Heatmap-Max.
+    """
+    if tile_x >= 1 << zoom or tile_y >= 1 << zoom:
+        raise HTTPException(status_code=404, detail="Tile outside the world at this zoom")
+
+    counts = await heatmaps.read_tile(db, study_id, zoom, tile_x, tile_y, event_type, build)
+    total, peak = int(counts.sum(dtype="int64")), int(counts.max())
+    headers = {"Cache-Control": TILE_CACHE_CONTROL}
+    if format == "binary":
+        headers.update({"X-Heatmap-Total": str(total), "X-Heatmap-Max": str(peak)})
+        return Response(content=counts.astype("<u4").tobytes(), media_type="application/octet-stream", headers=headers)
+
+    response.headers.update(headers)
+    return {**heatmaps.describe_tile(zoom, tile_x, tile_y), "total": total, "max": peak, "counts": counts.tolist()}
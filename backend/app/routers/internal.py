@@ -0,0 +1,130 @@
+"""
+Internal operational endpoints (queue, cache and pool health).
+
+Operators only: every endpoint requires WEBTICS_OPERATOR_TOKEN as a bearer
+token (Authorization: Bearer <token>). Without the variable the whole
+router answers 404.
+"""
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from .. import db_pool, heatmaps, partitions, rate_limit, retention, session_cache, study_stats
+from ..live_hub import live_hub
+from ..ingest_queue import event_queue
+from ..middleware.admission import admission_controller
+from ..middleware.data_validation import event_rule_registry
+
+OPERATOR_TOKEN = os.getenv("WEBTICS_OPERATOR_TOKEN", "")
+
+
+def require_operator(authorization: Optional[str] = Header(None)) -> None:
+    """Dependency: allow only requests carrying the operator token."""
+    if not OPERATOR_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), OPERATOR_TOKEN.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Operator token required",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+router = APIRouter(
+    prefix="/api/v1/internal",
+    tags=["internal"],
+    dependencies=[Depends(require_operator)]
+)
+
+
+@router.get("/ingest-queue")
+async def get_ingest_queue_stats():
+    """
+    Write-behind queue depth, flush latency and batch size.
+
+    Used to tune WEBTICS_WRITE_BEHIND_BATCH_SIZE and
+    WEBTICS_WRITE_BEHIND_FLUSH_INTERVAL.
+    """
+    return event_queue.stats()
+
+
+@router.get("/admission")
+async def get_admission_state():
+    """
+    Whether this worker is admitting ingest requests, and why not.
+
+    Shows in-flight requests, recent pool wait and write-behind queue fill
+    against their WEBTICS_ADMISSION_* limits, and refusals by reason.
+    """
+    return admission_controller.state()
+
+
+@router.get("/session-cache")
+async def get_session_cache_stats():
+    """Hit/miss counters for the play/metric session existence cache."""
+    return session_cache.stats()
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    """
+    Connection pool occupancy, checkout wait percentiles and overflow use.
+
+    High checkout waits with low database time mean the pool (or the number
+    of workers) is too small; see WEBTICS_DB_POOL_SIZE and
+    WEBTICS_DB_MAX_OVERFLOW.
+    """
+    return db_pool.stats()
+
+
+@router.get("/partitions")
+def get_partitions():
+    """Attached and detached events partitions (PostgreSQL only)."""
+    if not partitions.partition_manager.supported:
+        return {"partitioned": False}
+    return partitions.partition_manager.status()
+
+
+@router.get("/retention")
+async def get_retention_stats():
+    """Rows purged by the retention sweeper, in total and in its last run."""
+    return retention.retention_sweeper.stats()
+
+
+@router.get("/live")
+async def get_live_stats():
+    """Live stream subscribers on this worker and slow subscribers dropped."""
+    return live_hub.stats()
+
+
+@router.get("/heatmaps")
+async def get_heatmap_stats():
+    """Heatmap tile cache hit rate on this worker."""
+    return heatmaps.stats()
+
+
+@router.get("/study-stats")
+async def get_study_stats_cache():
+    """Hit/miss counters for the per-study stats cache on this worker."""
+    return study_stats.stats()
+
+
+@router.get("/rate-limit")
+async def get_rate_limit_stats():
+    """Withdrawal-code attempts allowed and refused, and invalid attempts awaiting audit."""
+    return rate_limit.stats()
+
+
+@router.get("/event-rules")
+async def get_event_rules():
+    """Compiled per-event-type validation rules and their source files."""
+    return event_rule_registry.describe()
+
+
+@router.post("/event-rules/reload")
+async def reload_event_rules():
+    """Re-read rule files now instead of waiting for the change poll (operator token required)."""
+    return event_rule_registry.reload()
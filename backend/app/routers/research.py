@@ -1,25 +1,142 @@
 """API endpoints for research ethics and consent management."""
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+import asyncio
+import os
+import time
 
-from .. import models_research, schemas_research, models
-from ..database import get_db
+from .. import export, jobs, metrics, models_research, rate_limit, schemas_research, study_stats
+from ..database import get_async_db
 from ..crypto_utils import (
     generate_consent_record,
     verify_withdrawal_code,
+    withdrawal_lookup_digest,
     hash_ip_address
 )
 
 router = APIRouter(prefix="/api/v1/research", tags=["research"])
 
+# Also check codes against consents created before withdrawal_lookup existed
+# (python -m app.migrations legacy-consents counts them). The scan runs only
+# while such consents remain; "false" forces it off, so an unknown code always
+# costs one indexed query.
+WITHDRAWAL_LEGACY_SCAN = os.getenv("WEBTICS_WITHDRAWAL_LEGACY_SCAN", "auto").lower() != "false"
+# Whether active consents without a digest may remain. Set at startup from
+# migrations.legacy_consents() and cleared once a scan finds none; new
+# consents always get a digest, so it never turns back on.
+legacy_consents_remaining = True
+# Most participants enrolled by one /consent/batch request
+CONSENT_BATCH_MAX = int(os.getenv("WEBTICS_CONSENT_BATCH_MAX", "500"))
+
+PRIVACY_LEVELS = ('anonymous', 'pseudonymous', 'identifiable')
+
+
+def check_privacy_level(privacy_level: str) -> None:
+    if privacy_level not in PRIVACY_LEVELS:
+        raise HTTPException(
+            status_code=400,
+            detail="privacy_level must be 'anonymous', 'pseudonymous', or 'identifiable'"
+        )
+
+
+async def limit_code_attempts(request: Request) -> str:
+    """
+    Charge one withdrawal-code attempt to the caller (see app.rate_limit).
+
+    Returns the hashed client IP; raises 429 with Retry-After when the
+    caller is over the limit.
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    ip_hash = hash_ip_address(client_ip)
+    retry_after = await rate_limit.code_attempt_limiter.check(ip_hash)
+    if retry_after:
+        rate_limit.invalid_attempts.record(ip_hash, "Rate limited")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts. Please wait before trying again.",
+            headers={"Retry-After": str(retry_after)}
+        )
+    return ip_hash
+
+
+async def record_invalid_code(ip_hash: str, reason: str) -> None:
+    """Audit a code that resolved to no consent (aggregated per IP) and count it towards the global alert."""
+    rate_limit.invalid_attempts.record(ip_hash, reason)
+    await rate_limit.code_attempt_limiter.record_failure()
+
+
+async def find_consent_by_code(
+    db: AsyncSession,
+    withdrawal_code: str
+) -> Optional[models_research.ResearchConsent]:
+    """
+    Resolve an active consent from its withdrawal code.
+
+    The keyed lookup digest finds the candidate row through its index, then
+    the salted hash is verified in constant time. While consents without a
+    digest (created before the column existed) remain, and unless
+    WITHDRAWAL_LEGACY_SCAN forces it off, they are scanned as before, and the
+    digest is stored for a match so the next lookup is indexed.
+    """
+    global legacy_consents_remaining
+
+    lookup = withdrawal_lookup_digest(withdrawal_code)
+    started = time.perf_counter()
+    consent = await db.scalar(
+        select(models_research.ResearchConsent).where(
+            models_research.ResearchConsent.withdrawal_lookup == lookup,
+            models_research.ResearchConsent.is_active == True
+        )
+    )
+    metrics.withdrawal_lookup_duration.observe(time.perf_counter() - started, ("indexed",))
+    if consent is not None:
+        if verify_withdrawal_code(withdrawal_code, consent.withdrawal_salt, consent.withdrawal_code_hash):
+            return consent
+        return None
+
+    if not (WITHDRAWAL_LEGACY_SCAN and legacy_consents_remaining):
+        return None
+
+    started = time.perf_counter()
+    try:
+        # Only the columns the check needs, not a full ORM row per consent
+        legacy_consents = (await db.execute(
+            select(
+                models_research.ResearchConsent.id,
+                models_research.ResearchConsent.withdrawal_salt,
+                models_research.ResearchConsent.withdrawal_code_hash
+            ).where(
+                models_research.ResearchConsent.withdrawal_lookup.is_(None),
+                models_research.ResearchConsent.is_active == True
+            )
+        )).all()
+        if not legacy_consents:
+            legacy_consents_remaining = False
+            return None
+        for consent_id, salt, code_hash in legacy_consents:
+            if verify_withdrawal_code(withdrawal_code, salt, code_hash):
+                await db.execute(
+                    update(models_research.ResearchConsent)
+                    .where(models_research.ResearchConsent.id == consent_id)
+                    .values(withdrawal_lookup=lookup)
+                )
+                await db.commit()
+                return await db.get(models_research.ResearchConsent, consent_id)
+        return None
+    finally:
+        metrics.withdrawal_lookup_duration.observe(time.perf_counter() - started, ("legacy_scan",))
+
 
 @router.post("/consent", response_model=schemas_research.ConsentResponse)
 async def create_consent(
     consent_data: schemas_research.ConsentCreate,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a research consent record with cryptographic withdrawal code.
@@ -33,12 +150,7 @@ async def create_consent(
     The withdrawal code enables GDPR Article 17 "Right to Erasure" without
     compromising participant anonymity.
     """
-    # Validate privacy level
-    if consent_data.privacy_level not in ['anonymous', 'pseudonymous', 'identifiable']:
-        raise HTTPException(
-            status_code=400,
-            detail="privacy_level must be 'anonymous', 'pseudonymous', or 'identifiable'"
-        )
+    check_privacy_level(consent_data.privacy_level)
 
     # Generate cryptographic components
     withdrawal_code, participant_id, salt, code_hash = generate_consent_record()
@@ -52,6 +164,7 @@ async def create_consent(
         participant_id=participant_id,
         withdrawal_code_hash=code_hash,
         withdrawal_salt=salt,
+        withdrawal_lookup=withdrawal_lookup_digest(withdrawal_code),
         privacy_level=consent_data.privacy_level,
         age_range=participant_info.get('age_range'),
         condition=participant_info.get('condition'),
@@ -61,8 +174,8 @@ async def create_consent(
     )
 
     db.add(db_consent)
-    db.commit()
-    db.refresh(db_consent)
+    await db.commit()
+    study_stats.forget(consent_data.study_id)
 
     # Return consent with withdrawal code
     # WARNING: This is the ONLY time the withdrawal code is ever visible
@@ -76,11 +189,88 @@ async def create_consent(
     )
 
 
-@router.post("/withdraw", response_model=schemas_research.WithdrawalResponse)
+@router.post("/consent/batch", response_model=schemas_research.ConsentBatchResponse)
+async def create_consent_batch(
+    batch: schemas_research.ConsentBatchCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Enrol a cohort (a class, a clinic list) under one consent form.
+
+    Creates one consent per entry in participants, exactly as POST /consent
+    would, but in a single INSERT ... RETURNING and one transaction: either
+    every participant is enrolled or none is. At most
+    WEBTICS_CONSENT_BATCH_MAX participants per request.
+
+    Withdrawal codes are returned in request order and, as with /consent,
+    this is the ONLY time they are visible. Hand each participant their
+    own code; the researcher must not keep the list.
+    """
+    check_privacy_level(batch.privacy_level)
+    if not batch.participants:
+        raise HTTPException(status_code=400, detail="participants must not be empty")
+    if len(batch.participants) > CONSENT_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {CONSENT_BATCH_MAX} participants per batch"
+        )
+
+    consented_at = datetime.utcnow()
+    codes = []
+    rows = []
+    for participant_info in batch.participants:
+        withdrawal_code, participant_id, salt, code_hash = generate_consent_record()
+        codes.append(withdrawal_code)
+        rows.append({
+            "study_id": batch.study_id,
+            "participant_id": participant_id,
+            "withdrawal_code_hash": code_hash,
+            "withdrawal_salt": salt,
+            "withdrawal_lookup": withdrawal_lookup_digest(withdrawal_code),
+            "privacy_level": batch.privacy_level,
+            "age_range": participant_info.get('age_range'),
+            "condition": participant_info.get('condition'),
+            "recruitment_site": participant_info.get('recruitment_site'),
+            "irb_protocol": batch.irb_protocol,
+            "consent_version": batch.consent_version,
+            "consented_at": consented_at,
+            "is_active": True,
+        })
+
+    Consent = models_research.ResearchConsent
+    result = await db.execute(
+        insert(Consent).returning(Consent.id, Consent.participant_id, sort_by_parameter_order=True),
+        rows
+    )
+    inserted = result.all()
+    await db.commit()
+    study_stats.forget(batch.study_id)
+
+    return schemas_research.ConsentBatchResponse(
+        study_id=batch.study_id,
+        privacy_level=batch.privacy_level,
+        consented_at=consented_at,
+        consents=[
+            schemas_research.ConsentBatchItem(
+                participant_id=row.participant_id,
+                withdrawal_code=code,
+                consent_id=row.id
+            )
+            for row, code in zip(inserted, codes)
+        ]
+    )
+
+
+@router.post(
+    "/withdraw",
+    response_model=schemas_research.WithdrawalResponse,
+    responses={202: {"model": schemas_research.WithdrawalJobResponse}}
+)
 async def withdraw_participation(
     withdrawal_request: schemas_research.WithdrawalRequest,
     request: Request,
-    db: Session = Depends(get_db)
+    ip_hash: str = Depends(limit_code_attempts),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Withdraw participation and permanently delete all associated data.
@@ -92,38 +282,20 @@ async def withdraw_participation(
     4. Logs the withdrawal for IRB compliance
     5. Returns success/failure WITHOUT revealing participant identity
 
+    Deletion runs as a background job in a single transaction with the
+    audit record. If it takes longer than WEBTICS_WITHDRAWAL_SYNC_WAIT
+    seconds, 202 is returned with a job id to poll at status_url.
+
+    Attempts are rate limited per hashed client IP (429 with Retry-After).
+
     Supports GDPR Article 17, NZ Privacy Act 2020, and research ethics requirements.
     """
-    # Get client IP for abuse detection (hashed)
-    client_ip = request.client.host if request.client else "unknown"
-    ip_hash = hash_ip_address(client_ip)
-
-    # Try to find matching consent by verifying hash
-    consents = db.query(models_research.ResearchConsent).filter(
-        models_research.ResearchConsent.is_active == True
-    ).all()
-
-    matching_consent = None
-    for consent in consents:
-        if verify_withdrawal_code(
-            withdrawal_request.withdrawal_code,
-            consent.withdrawal_salt,
-            consent.withdrawal_code_hash
-        ):
-            matching_consent = consent
-            break
+    # Find matching consent by its lookup digest and verify the hash
+    matching_consent = await find_consent_by_code(db, withdrawal_request.withdrawal_code)
 
     if not matching_consent:
-        # Invalid code - log the attempt for abuse detection
-        audit = models_research.WithdrawalAudit(
-            withdrawal_code_hash="invalid",
-            success=False,
-            error_message="Invalid withdrawal code",
-            request_ip_hash=ip_hash,
-            completed_at=datetime.utcnow()
-        )
-        db.add(audit)
-        db.commit()
+        # Invalid code - count the attempt for abuse detection
+        await record_invalid_code(ip_hash, "Invalid withdrawal code")
 
         # Don't reveal whether code exists or not (prevent enumeration)
         raise HTTPException(
@@ -131,79 +303,79 @@ async def withdraw_participation(
             detail="Invalid withdrawal code. Please check your code and try again."
         )
 
-    # Found valid consent - proceed with data deletion
-    participant_id = matching_consent.participant_id
-
-    # Count data to be deleted (for audit)
-    metric_sessions = db.query(models.MetricSession).join(
-        models_research.ResearchConsent,
-        models.MetricSession.unique_id == models_research.ResearchConsent.participant_id
-    ).filter(
-        models_research.ResearchConsent.id == matching_consent.id
-    ).all()
-
-    sessions_count = len(metric_sessions)
-    events_count = 0
-
-    # Delete all data (CASCADE DELETE)
-    for session in metric_sessions:
-        play_sessions = db.query(models.PlaySession).filter(
-            models.PlaySession.metric_session_id == session.id
-        ).all()
-
-        for play_session in play_sessions:
-            event_count = db.query(models.Event).filter(
-                models.Event.play_session_id == play_session.id
-            ).count()
-            events_count += event_count
-
-            # Delete events
-            db.query(models.Event).filter(
-                models.Event.play_session_id == play_session.id
-            ).delete()
-
-        # Delete play sessions
-        db.query(models.PlaySession).filter(
-            models.PlaySession.metric_session_id == session.id
-        ).delete()
-
-        # Delete metric session
-        db.delete(session)
-
-    # Mark consent as withdrawn
-    matching_consent.is_active = False
-    matching_consent.withdrawn_at = datetime.utcnow()
-    matching_consent.data_deleted_at = datetime.utcnow()
-
-    # Create audit record
-    audit = models_research.WithdrawalAudit(
-        consent_id=matching_consent.id,
-        withdrawal_code_hash=matching_consent.withdrawal_code_hash,
-        participant_id=participant_id,
-        events_deleted=events_count,
-        sessions_deleted=sessions_count,
-        success=True,
-        request_ip_hash=ip_hash,
-        completed_at=datetime.utcnow()
-    )
-    db.add(audit)
-
-    # Commit all changes
-    db.commit()
+    # Found valid consent - delete its data in a background job, reusing one
+    # already in progress if the participant retries
+    job = await jobs.active_job_for(db, matching_consent.id)
+    if job is None:
+        job = models_research.DeletionJob(id=jobs.new_job_id(), consent_id=matching_consent.id)
+        db.add(job)
+        await db.commit()
+        task = jobs.submit(job.id, jobs.run_withdrawal(job.id, ip_hash))
+    else:
+        task = jobs.task_for(job.id)
+
+    # Answer directly when the deletion finishes quickly
+    if task is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), jobs.WITHDRAWAL_SYNC_WAIT_SEC)
+        except asyncio.TimeoutError:
+            pass
+    await db.refresh(job)
+
+    if job.status == "failed":
+        raise HTTPException(
+            status_code=500,
+            detail="Withdrawal could not be completed. No data was deleted; please try again."
+        )
+    if job.status != "completed":
+        return JSONResponse(
+            status_code=202,
+            content=jsonable_encoder(withdrawal_job_response(job, request))
+        )
 
     return schemas_research.WithdrawalResponse(
         success=True,
         message="Your participation has been withdrawn. All associated data has been permanently deleted.",
-        deleted_at=matching_consent.data_deleted_at,
-        sessions_deleted=sessions_count,
-        events_deleted=events_count
+        deleted_at=job.completed_at,
+        sessions_deleted=job.sessions_deleted,
+        events_deleted=job.events_deleted
     )
 
 
+def withdrawal_job_response(job: models_research.DeletionJob, request: Request) -> schemas_research.WithdrawalJobResponse:
+    return schemas_research.WithdrawalJobResponse(
+        job_id=job.id,
+        status=job.status,
+        status_url=str(request.url_for("get_withdrawal_job", job_id=job.id)),
+        requested_at=job.requested_at,
+        completed_at=job.completed_at,
+        sessions_deleted=job.sessions_deleted if job.status == "completed" else None,
+        events_deleted=job.events_deleted if job.status == "completed" else None
+    )
+
+
+@router.get("/withdraw/jobs/{job_id}", response_model=schemas_research.WithdrawalJobResponse)
+async def get_withdrawal_job(
+    job_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Status of a withdrawal deletion job.
+
+    Failed jobs deleted nothing; submitting the withdrawal code again
+    starts a new job.
+    """
+    job = await db.get(models_research.DeletionJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Withdrawal job not found")
+    return withdrawal_job_response(job, request)
+
+
 @router.get("/study/{study_id}/stats", response_model=schemas_research.StudyStatsResponse)
 async def get_study_stats(
     study_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     # TODO: Add researcher authentication
 ):
     """
@@ -220,52 +392,51 @@ async def get_study_stats(
     - Individual participant IDs
     - Withdrawal codes
     - Personal identifiable information
+
+    Counted in one query and cached per study (see app.study_stats).
     """
-    # Count consents
-    total_consented = db.query(models_research.ResearchConsent).filter(
-        models_research.ResearchConsent.study_id == study_id
-    ).count()
-
-    active_participants = db.query(models_research.ResearchConsent).filter(
-        models_research.ResearchConsent.study_id == study_id,
-        models_research.ResearchConsent.is_active == True
-    ).count()
-
-    withdrawn_participants = db.query(models_research.ResearchConsent).filter(
-        models_research.ResearchConsent.study_id == study_id,
-        models_research.ResearchConsent.is_active == False
-    ).count()
-
-    # Get study metadata (if exists)
-    study_meta = db.query(models_research.StudyMetadata).filter(
-        models_research.StudyMetadata.study_id == study_id
-    ).first()
-
-    # Get common privacy level and IRB protocol from first consent
-    first_consent = db.query(models_research.ResearchConsent).filter(
-        models_research.ResearchConsent.study_id == study_id
-    ).first()
-
-    if not first_consent and not study_meta:
+    stats = (await study_stats.get_stats(db, [study_id])).get(study_id)
+    if stats is None:
         raise HTTPException(status_code=404, detail="Study not found")
+    return stats
+
+
+@router.get("/studies/stats", response_model=schemas_research.StudyStatsBulkResponse)
+async def get_studies_stats(
+    study_id: Optional[List[str]] = Query(None, description="Repeat for each study"),
+    db: AsyncSession = Depends(get_async_db)
+    # TODO: Add researcher authentication
+):
+    """
+    Aggregate statistics for several studies in one call.
+
+    Same fields as /study/{study_id}/stats, in the requested order; studies
+    that do not exist are listed in not_found instead of failing the
+    request. At most WEBTICS_STUDY_STATS_MAX_BULK studies per request.
+    """
+    study_ids = list(dict.fromkeys(study_id or []))
+    if not study_ids:
+        raise HTTPException(status_code=400, detail="At least one study_id is required")
+    if len(study_ids) > study_stats.MAX_BULK_STUDIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {study_stats.MAX_BULK_STUDIES} studies per request"
+        )
 
-    return schemas_research.StudyStatsResponse(
-        study_id=study_id,
-        total_consented=total_consented,
-        active_participants=active_participants,
-        withdrawn_participants=withdrawn_participants,
-        privacy_level=first_consent.privacy_level if first_consent else "unknown",
-        irb_protocol=study_meta.irb_protocol if study_meta else (
-            first_consent.irb_protocol if first_consent else None
-        ),
-        data_retention_days=study_meta.data_retention_days if study_meta else 365
+    found = await study_stats.get_stats(db, study_ids)
+    return schemas_research.StudyStatsBulkResponse(
+        studies=[found[s] for s in study_ids if s in found],
+        not_found=[s for s in study_ids if s not in found]
     )
 
 
 @router.get("/participant/data")
 async def export_participant_data(
     withdrawal_code: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    format: str = "json",
+    ip_hash: str = Depends(limit_code_attempts),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Export all data for a participant (GDPR Article 15 - Right of Access).
@@ -275,87 +446,36 @@ async def export_participant_data(
     2. Retrieve all their data for review
     3. Without revealing identity to researcher
 
-    Returns JSON with all events, sessions, and metadata.
+    Returns JSON with all events, sessions, and metadata, streamed as it is
+    read (format=ndjson gives one record per line instead). The body is
+    gzip-compressed when the client sends Accept-Encoding: gzip.
+
+    Attempts are rate limited as for /withdraw.
     """
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format must be one of: {', '.join(export.EXPORT_FORMATS)}"
+        )
+
     # Find matching consent
-    consents = db.query(models_research.ResearchConsent).filter(
-        models_research.ResearchConsent.is_active == True
-    ).all()
-
-    matching_consent = None
-    for consent in consents:
-        if verify_withdrawal_code(
-            withdrawal_code,
-            consent.withdrawal_salt,
-            consent.withdrawal_code_hash
-        ):
-            matching_consent = consent
-            break
+    matching_consent = await find_consent_by_code(db, withdrawal_code)
 
     if not matching_consent:
+        await record_invalid_code(ip_hash, "Invalid withdrawal code (data export)")
         raise HTTPException(
             status_code=400,
             detail="Invalid withdrawal code"
         )
 
-    # Retrieve all data for this participant
-    metric_sessions = db.query(models.MetricSession).join(
-        models_research.ResearchConsent,
-        models.MetricSession.unique_id == models_research.ResearchConsent.participant_id
-    ).filter(
-        models_research.ResearchConsent.id == matching_consent.id
-    ).all()
-
-    sessions_data = []
-    total_events = 0
-
-    for session in metric_sessions:
-        play_sessions = db.query(models.PlaySession).filter(
-            models.PlaySession.metric_session_id == session.id
-        ).all()
-
-        play_sessions_data = []
-        for play_session in play_sessions:
-            events = db.query(models.Event).filter(
-                models.Event.play_session_id == play_session.id
-            ).all()
-
-            total_events += len(events)
-
-            events_data = [{
-                "id": e.id,
-                "event_type": e.event_type,
-                "event_subtype": e.event_subtype,
-                "x": e.x,
-                "y": e.y,
-                "z": e.z,
-                "magnitude": e.magnitude,
-                "data": e.data,
-                "timestamp": e.timestamp.isoformat()
-            } for e in events]
-
-            play_sessions_data.append({
-                "id": play_session.id,
-                "started_at": play_session.started_at.isoformat(),
-                "ended_at": play_session.ended_at.isoformat() if play_session.ended_at else None,
-                "events": events_data
-            })
-
-        sessions_data.append({
-            "id": session.id,
-            "unique_id": session.unique_id,
-            "build_number": session.build_number,
-            "created_at": session.created_at.isoformat(),
-            "closed_at": session.closed_at.isoformat() if session.closed_at else None,
-            "play_sessions": play_sessions_data
-        })
+    body = export.stream_participant_export(matching_consent, format)
+    headers = {"Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = export.gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
 
-    return {
-        "participant_id": matching_consent.participant_id,
-        "study_id": matching_consent.study_id,
-        "consented_at": matching_consent.consented_at.isoformat(),
-        "privacy_level": matching_consent.privacy_level,
-        "total_sessions": len(sessions_data),
-        "total_events": total_events,
-        "sessions": sessions_data
-    }
+    return StreamingResponse(
+        body,
+        media_type="application/x-ndjson" if format == "ndjson" else "application/json",
+        headers=headers
+    )
@@ -1,7 +1,8 @@
 """Pydantic schemas for request/response validation."""
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, Any
+from typing import Any, Dict, List, Optional
+from typing_extensions import TypedDict, NotRequired
 
 
 class EventCreate(BaseModel):
@@ -15,6 +16,22 @@ class EventCreate(BaseModel):
     data: Optional[dict[str, Any]] = Field(None, description="Additional event data")
 
 
+class EventCreateDict(TypedDict):
+    """
+    EventCreate as a plain dict, for validating large batches.
+
+    Validating into dicts is several times cheaper than building one model
+    per event. Missing keys take the EventCreate defaults.
+    """
+    event_type: int
+    event_subtype: NotRequired[int]
+    x: NotRequired[Optional[int]]
+    y: NotRequired[Optional[int]]
+    z: NotRequired[Optional[int]]
+    magnitude: NotRequired[Optional[float]]
+    data: NotRequired[Optional[dict[str, Any]]]
+
+
 class EventResponse(BaseModel):
     """Schema for event response."""
     id: int
@@ -63,3 +80,96 @@ class MetricSessionResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class MagnitudeStats(BaseModel):
+    """Summary statistics of event magnitudes."""
+    count: int
+    mean: Optional[float]
+    stddev: Optional[float]
+    min: Optional[float]
+    max: Optional[float]
+
+
+class EventTypeStats(BaseModel):
+    """Event count and magnitude statistics for one event type."""
+    event_type: int
+    count: int
+    magnitude: MagnitudeStats
+
+
+class RollupSummaryResponse(BaseModel):
+    """Per event type statistics served from the rollup tables."""
+    event_types: List[EventTypeStats]
+
+
+class RollupBucket(BaseModel):
+    """Statistics for one event type in one time bucket."""
+    bucket_start: datetime
+    event_type: int
+    count: int
+    magnitude: MagnitudeStats
+
+
+class RollupTimeseriesResponse(BaseModel):
+    """Per bucket statistics served from the rollup tables."""
+    interval: str
+    buckets: List[RollupBucket]
+
+
+class HistogramBin(BaseModel):
+    """Magnitudes in [lower, upper) (the last bin includes upper)."""
+    lower: float
+    upper: float
+    count: int
+
+
+class DistributionGroup(BaseModel):
+    """Approximate magnitude distribution of one group of play sessions."""
+    condition: Optional[str] = None
+    age_range: Optional[str] = None
+    build: Optional[str] = None
+    count: int
+    mean: Optional[float]
+    min: Optional[float]
+    max: Optional[float]
+    quantiles: Dict[str, Optional[float]]
+    histogram: List[HistogramBin]
+
+
+class DistributionResponse(BaseModel):
+    """Magnitude distributions merged from per play session sketches."""
+    event_type: int
+    relative_accuracy: float
+    groups: List[DistributionGroup]
+
+
+class HeatmapLayer(BaseModel):
+    """Events of one type and build in a study's heatmap."""
+    event_type: int
+    build: str
+    count: int
+
+
+class HeatmapInfoResponse(BaseModel):
+    """Geometry of the heatmap tile pyramid and the layers a study has."""
+    study_id: str
+    axes: List[str]
+    origin: List[int]
+    world_size: int
+    tile_size: int
+    max_zoom: int
+    layers: List[HeatmapLayer]
+
+
+class HeatmapTileResponse(BaseModel):
+    """Cell counts of one heatmap tile, row-major from the minimum corner."""
+    zoom: int
+    tile_x: int
+    tile_y: int
+    tile_size: int
+    cell_size: int
+    bounds: List[int]
+    total: int
+    max: int
+    counts: List[int]
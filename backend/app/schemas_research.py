@@ -1,7 +1,7 @@
 """Pydantic schemas for research ethics and consent management."""
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 
 class ConsentCreate(BaseModel):
@@ -37,6 +37,42 @@ class ConsentResponse(BaseModel):
         from_attributes = True
 
 
+class ConsentBatchCreate(BaseModel):
+    """Schema for enrolling a cohort under one consent form."""
+    study_id: str = Field(..., description="Research study identifier")
+    privacy_level: str = Field(
+        default="pseudonymous",
+        description="Privacy level: anonymous, pseudonymous, or identifiable"
+    )
+    participants: List[Dict[str, str]] = Field(
+        ...,
+        description="One entry per participant with minimal aggregate info "
+        "(age_range, condition, etc.); use {} when there is none"
+    )
+    irb_protocol: Optional[str] = Field(None, description="IRB protocol number")
+    consent_version: Optional[str] = Field(None, description="Consent form version")
+
+
+class ConsentBatchItem(BaseModel):
+    """One enrolled participant in a batch consent response."""
+    participant_id: str = Field(..., description="Pseudonymous participant ID")
+    withdrawal_code: str = Field(..., description="Unique withdrawal code (hand to this participant)")
+    consent_id: int
+
+
+class ConsentBatchResponse(BaseModel):
+    """Schema for batch consent creation response (same order as the request)."""
+    study_id: str
+    privacy_level: str
+    consented_at: datetime
+    consents: List[ConsentBatchItem]
+
+    important_notice: str = Field(
+        default="Give each participant their own withdrawal code. These codes are not "
+        "shown again and the researcher cannot retrieve them."
+    )
+
+
 class WithdrawalRequest(BaseModel):
     """Schema for withdrawal request."""
     withdrawal_code: str = Field(..., description="Participant's withdrawal code")
@@ -51,6 +87,17 @@ class WithdrawalResponse(BaseModel):
     events_deleted: Optional[int]
 
 
+class WithdrawalJobResponse(BaseModel):
+    """Schema for a background withdrawal deletion job."""
+    job_id: str
+    status: str
+    status_url: str
+    requested_at: datetime
+    completed_at: Optional[datetime]
+    sessions_deleted: Optional[int]
+    events_deleted: Optional[int]
+
+
 class StudyStatsResponse(BaseModel):
     """Schema for study statistics (researcher view)."""
     study_id: str
@@ -62,6 +109,12 @@ class StudyStatsResponse(BaseModel):
     data_retention_days: int
 
 
+class StudyStatsBulkResponse(BaseModel):
+    """Schema for statistics of several studies (researcher view)."""
+    studies: List[StudyStatsResponse]
+    not_found: List[str] = Field(default_factory=list, description="Requested studies with no consents or metadata")
+
+
 class ParticipantDataExport(BaseModel):
     """Schema for participant data export (for participant's own access)."""
     participant_id: str
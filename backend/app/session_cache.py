@@ -0,0 +1,170 @@
+"""
+In-process cache of known metric/play sessions.
+
+Ingest endpoints only need to know that the parent session exists (and
+whether it is closed), so the answer is cached with TTL and LRU eviction
+instead of running a SELECT on every request. Entries are written through
+when sessions are created or closed and invalidated when withdrawal deletes
+them. With several workers, another worker's changes become visible here
+within the TTL.
+
+Until then this worker still accepts events for a play session another
+worker has deleted. On PostgreSQL the insert fails on the foreign key and
+the ingest paths answer 404 (app.main.play_session_write; the write-behind
+flusher drops those events). SQLite does not enforce foreign keys, so such
+events would be stored orphaned: run a single worker on SQLite.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+SESSION_CACHE_SIZE = int(os.getenv("WEBTICS_SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL_SEC = float(os.getenv("WEBTICS_SESSION_CACHE_TTL", "60"))
+# Reject events for play sessions that have been closed
+REJECT_CLOSED_PLAY_SESSIONS = os.getenv(
+    "WEBTICS_REJECT_CLOSED_PLAY_SESSIONS", "false"
+).lower() == "true"
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed TTL."""
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_sec": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class PlaySessionInfo(NamedTuple):
+    """What the ingest path needs to know about a play session."""
+    metric_session_id: int
+    closed: bool
+
+
+class MetricSessionInfo(NamedTuple):
+    """What play session creation needs to know about a metric session."""
+    closed: bool
+
+
+play_session_cache = TTLCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SEC)
+metric_session_cache = TTLCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SEC)
+
+
+async def lookup_play_session(db: AsyncSession, play_session_id: int) -> Optional[PlaySessionInfo]:
+    """Return play session info from cache, falling back to the database."""
+    info = play_session_cache.get(play_session_id)
+    if info is None:
+        result = await db.execute(
+            select(models.PlaySession.metric_session_id, models.PlaySession.ended_at)
+            .where(models.PlaySession.id == play_session_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        info = PlaySessionInfo(row.metric_session_id, row.ended_at is not None)
+        play_session_cache.set(play_session_id, info)
+    return info
+
+
+async def lookup_metric_session(db: AsyncSession, metric_session_id: int) -> Optional[MetricSessionInfo]:
+    """Return metric session info from cache, falling back to the database."""
+    info = metric_session_cache.get(metric_session_id)
+    if info is None:
+        result = await db.execute(
+            select(models.MetricSession.closed_at)
+            .where(models.MetricSession.id == metric_session_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        info = MetricSessionInfo(row.closed_at is not None)
+        metric_session_cache.set(metric_session_id, info)
+    return info
+
+
+def remember_play_session(play_session_id: int, metric_session_id: int, closed: bool = False) -> None:
+    play_session_cache.set(play_session_id, PlaySessionInfo(metric_session_id, closed))
+
+
+def remember_metric_session(metric_session_id: int, closed: bool = False) -> None:
+    metric_session_cache.set(metric_session_id, MetricSessionInfo(closed))
+
+
+def forget_play_session(play_session_id: int) -> None:
+    play_session_cache.invalidate(play_session_id)
+
+
+def forget_metric_session(metric_session_id: int) -> None:
+    metric_session_cache.invalidate(metric_session_id)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "reject_closed_play_sessions": REJECT_CLOSED_PLAY_SESSIONS,
+        "play_sessions": play_session_cache.stats(),
+        "metric_sessions": metric_session_cache.stats(),
+    }
@@ -0,0 +1,365 @@
+"""
+Mergeable magnitude distributions (reaction-time percentiles).
+
+Each play session keeps, per event type in WEBTICS_SKETCH_EVENT_TYPES
+(CORRECT_RESPONSE and INCORRECT_RESPONSE by default, whose magnitude is the
+reaction time), a log-bucketed histogram: the bucketing HDR histograms and
+DDSketch use. A value v with |v| >= MIN_VALUE lands in bucket
+
+    k = floor(log_gamma(|v| / MIN_VALUE)) + 1,   gamma = (1 + a) / (1 - a)
+
+(negated for negative values; smaller magnitudes share bucket 0), and is
+reported as the bucket's harmonic midpoint, which is within a relative
+error a = RELATIVE_ACCURACY of every value in the bucket. So any quantile
+read from a sketch is within 1% of the exact (lower) quantile, however many
+events went in, and a sketch of a few hundred milliseconds to seconds of
+reaction times is around a hundred buckets.
+
+Merging adds counts per bucket, so per play session sketches combine
+exactly (no extra error) into the distribution of a study, a condition,
+an age range or a build. Sketches are updated with the rollups, in the
+ingest transaction (app.rollups), and rebuilt with them.
+"""
+
+import math
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Select, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models, models_research
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Magnitudes closer to zero than this are counted as zero
+MIN_VALUE = 1e-6
+
+SKETCH_EVENT_TYPES = frozenset(
+    int(event_type) for event_type in os.getenv("WEBTICS_SKETCH_EVENT_TYPES", "102,103").split(",")
+    if event_type.strip()
+)
+
+DEFAULT_QUANTILES = (0.5, 0.75, 0.9, 0.95, 0.99)
+
+Sketch = models.PlaySessionSketch
+Consent = models_research.ResearchConsent
+
+SketchKey = Tuple[int, int]
+
+_KEY_DTYPE = np.dtype("<i4")
+_COUNT_DTYPE = np.dtype("<i8")
+
+
+def bucket_keys(values: np.ndarray) -> np.ndarray:
+    """Bucket key of each value."""
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    keys = np.zeros(values.shape, dtype=np.int32)
+    indexable = magnitude >= MIN_VALUE
+    keys[indexable] = (np.floor(np.log(magnitude[indexable] / MIN_VALUE) / LOG_GAMMA) + 1).astype(np.int32)
+    return np.where(values < 0, -keys, keys)
+
+
+def bucket_values(keys: np.ndarray) -> np.ndarray:
+    """The value each bucket reports: within RELATIVE_ACCURACY of its members."""
+    keys = np.asarray(keys)
+    magnitude = MIN_VALUE * 2 * np.power(GAMMA, np.abs(keys).astype(np.float64)) / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * magnitude)
+
+
+class LogHistogram:
+    """A relative-accuracy histogram of magnitudes: sorted bucket keys and counts."""
+
+    __slots__ = ("keys", "counts", "total", "minimum", "maximum")
+
+    def __init__(
+        self,
+        keys: Optional[np.ndarray] = None,
+        counts: Optional[np.ndarray] = None,
+        total: float = 0.0,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+    ):
+        self.keys = np.zeros(0, dtype=np.int32) if keys is None else keys
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def mean(self) -> Optional[float]:
+        count = self.count
+        return self.total / count if count else None
+
+    @classmethod
+    def from_values(cls, values) -> "LogHistogram":
+        """Build a sketch from an array of magnitudes (NaN and inf are skipped)."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return cls()
+        keys, counts = np.unique(bucket_keys(values), return_counts=True)
+        return cls(
+            keys.astype(np.int32), counts.astype(np.int64),
+            float(values.sum()), float(values.min()), float(values.max())
+        )
+
+    @classmethod
+    def merge(cls, sketches: Iterable["LogHistogram"]) -> "LogHistogram":
+        """Combine sketches into one, exactly."""
+        sketches = [s for s in sketches if s.keys.size]
+        if not sketches:
+            return cls()
+        if len(sketches) == 1:
+            return sketches[0]
+        keys, inverse = np.unique(np.concatenate([s.keys for s in sketches]), return_inverse=True)
+        counts = np.zeros(keys.size, dtype=np.int64)
+        np.add.at(counts, inverse, np.concatenate([s.counts for s in sketches]))
+        return cls(
+            keys.astype(np.int32), counts,
+            sum(s.total for s in sketches),
+            min(s.minimum for s in sketches),
+            max(s.maximum for s in sketches),
+        )
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """
+        Approximate lower quantiles (numpy's method="lower").
+
+        Each is within RELATIVE_ACCURACY of the exact value, and clamped to the
+        exact minimum and maximum.
+        """
+        if not self.keys.size:
+            return [None] * len(qs)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.floor(np.asarray(qs, dtype=np.float64) * (cumulative[-1] - 1))
+        index = np.searchsorted(cumulative, ranks, side="right")
+        values = np.clip(bucket_values(self.keys[index]), self.minimum, self.maximum)
+        return values.tolist()
+
+    def histogram(self, bins: int) -> List[Dict[str, float]]:
+        """Counts in `bins` equal-width bins from the minimum to the maximum."""
+        if not self.keys.size or bins <= 0:
+            return []
+        if self.minimum == self.maximum:
+            return [{"lower": self.minimum, "upper": self.maximum, "count": self.count}]
+        values = np.clip(bucket_values(self.keys), self.minimum, self.maximum)
+        counts, edges = np.histogram(values, bins=bins, range=(self.minimum, self.maximum), weights=self.counts)
+        return [
+            {"lower": lower, "upper": upper, "count": int(count)}
+            for lower, upper, count in zip(edges[:-1].tolist(), edges[1:].tolist(), counts.tolist())
+        ]
+
+    def to_bytes(self) -> bytes:
+        return self.keys.astype(_KEY_DTYPE).tobytes() + self.counts.astype(_COUNT_DTYPE).tobytes()
+
+    @classmethod
+    def from_row(cls, row) -> "LogHistogram":
+        """Sketch from a play_session_sketches row (or a row with the same columns)."""
+        size = len(row.bins) // (_KEY_DTYPE.itemsize + _COUNT_DTYPE.itemsize)
+        keys = np.frombuffer(row.bins, dtype=_KEY_DTYPE, count=size)
+        counts = np.frombuffer(row.bins, dtype=_COUNT_DTYPE, offset=size * _KEY_DTYPE.itemsize)
+        return cls(keys, counts, row.total, row.minimum, row.maximum)
+
+    def values(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "bins": self.to_bytes(),
+        }
+
+
+def group_sketches(
+    play_session_ids: np.ndarray,
+    event_types: np.ndarray,
+    magnitudes: np.ndarray,
+) -> Iterator[Tuple[SketchKey, LogHistogram]]:
+    """One sketch per (play session, event type) from parallel column arrays."""
+    finite = np.isfinite(magnitudes)
+    play_session_ids, event_types, magnitudes = play_session_ids[finite], event_types[finite], magnitudes[finite]
+    if not magnitudes.size:
+        return
+    order = np.lexsort((event_types, play_session_ids))
+    play_session_ids, event_types, magnitudes = play_session_ids[order], event_types[order], magnitudes[order]
+    starts = np.flatnonzero(np.r_[
+        True, (np.diff(play_session_ids) != 0) | (np.diff(event_types) != 0)
+    ])
+    ends = np.r_[starts[1:], magnitudes.size]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        yield (int(play_session_ids[start]), int(event_types[start])), LogHistogram.from_values(magnitudes[start:end])
+
+
+# Ingest
+
+def _insert_missing(dialect_name: str, keys: Sequence[SketchKey]):
+    empty = LogHistogram().values()
+    rows = [{"play_session_id": ps, "event_type": event_type, **empty} for ps, event_type in keys]
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(Sketch).values(rows)
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(Sketch).values(rows)
+    else:
+        raise NotImplementedError(f"Sketches are not supported on {dialect_name}")
+    return stmt.on_conflict_do_nothing(index_elements=["play_session_id", "event_type"])
+
+
+def _locked_query(keys: Sequence[SketchKey]) -> Select:
+    return (
+        select(Sketch.play_session_id, Sketch.event_type, Sketch.total, Sketch.minimum, Sketch.maximum, Sketch.bins)
+        .where(
+            Sketch.play_session_id.in_({ps for ps, _ in keys}),
+            Sketch.event_type.in_({event_type for _, event_type in keys})
+        )
+        .order_by(Sketch.play_session_id, Sketch.event_type)
+        .with_for_update()
+    )
+
+
+def _merged_updates(samples: Dict[SketchKey, List[float]], rows) -> List[dict]:
+    current = {(row.play_session_id, row.event_type): row for row in rows}
+    updates = []
+    for key, values in sorted(samples.items()):
+        sketch = LogHistogram.from_values(values)
+        if key in current:
+            sketch = LogHistogram.merge([LogHistogram.from_row(current[key]), sketch])
+        updates.append({"play_session_id": key[0], "event_type": key[1], **sketch.values()})
+    return updates
+
+
+async def apply_async(db: AsyncSession, samples: Dict[SketchKey, List[float]]) -> None:
+    """
+    Merge new magnitudes into their play session sketches, in the caller's transaction.
+
+    Rows are locked (FOR UPDATE on PostgreSQL) so concurrent batches of one
+    play session merge in turn rather than overwrite each other.
+    """
+    if not samples:
+        return
+    keys = sorted(samples)
+    rows = (await db.execute(_locked_query(keys))).all()
+    if not set(keys) <= {(r.play_session_id, r.event_type) for r in rows}:
+        await db.execute(_insert_missing(db.bind.dialect.name, keys))
+        rows = (await db.execute(_locked_query(keys))).all()
+    await db.execute(update(Sketch), _merged_updates(samples, rows))
+
+
+def apply(db: Session, samples: Dict[SketchKey, List[float]]) -> None:
+    """Sync counterpart of apply_async() for the write-behind flusher."""
+    if not samples:
+        return
+    keys = sorted(samples)
+    rows = db.execute(_locked_query(keys)).all()
+    if not set(keys) <= {(r.play_session_id, r.event_type) for r in rows}:
+        db.execute(_insert_missing(db.get_bind().dialect.name, keys))
+        rows = db.execute(_locked_query(keys)).all()
+    db.execute(update(Sketch), _merged_updates(samples, rows))
+
+
+def delete_statement(play_session_ids: Sequence[int]):
+    return delete(Sketch).where(Sketch.play_session_id.in_(play_session_ids))
+
+
+def rebuild_chunk(conn: Connection, first_id: int, last_id: int) -> int:
+    """Recompute the sketches of a range of play sessions from their events."""
+    rows = conn.execute(
+        select(models.Event.play_session_id, models.Event.event_type, models.Event.magnitude).where(
+            models.Event.play_session_id.between(first_id, last_id),
+            models.Event.event_type.in_(SKETCH_EVENT_TYPES),
+            models.Event.magnitude.isnot(None)
+        )
+    ).all()
+    if not rows:
+        return 0
+    columns = np.array([tuple(row) for row in rows], dtype=np.float64).T
+    sketches = [
+        {"play_session_id": ps, "event_type": event_type, **sketch.values()}
+        for (ps, event_type), sketch in group_sketches(
+            columns[0].astype(np.int64), columns[1].astype(np.int64), columns[2]
+        )
+    ]
+    if sketches:
+        conn.execute(Sketch.__table__.insert(), sketches)
+    return len(sketches)
+
+
+# Queries
+
+GROUP_COLUMNS = {
+    "condition": Consent.condition,
+    "age_range": Consent.age_range,
+    "build": models.MetricSession.build_number,
+}
+
+
+def study_sketches_query(
+    study_id: str,
+    event_type: int,
+    condition: Optional[str] = None,
+    age_range: Optional[str] = None,
+    build: Optional[str] = None,
+    group_by: Sequence[str] = (),
+) -> Select:
+    """A study's play session sketches, with the columns to group them by."""
+    filters = {"condition": condition, "age_range": age_range, "build": build}
+    return (
+        select(
+            Sketch.total, Sketch.minimum, Sketch.maximum, Sketch.bins,
+            *(GROUP_COLUMNS[name].label(name) for name in group_by)
+        )
+        .join(models.PlaySession, models.PlaySession.id == Sketch.play_session_id)
+        .join(models.MetricSession, models.MetricSession.id == models.PlaySession.metric_session_id)
+        .join(Consent, Consent.participant_id == models.MetricSession.unique_id)
+        .where(
+            Consent.study_id == study_id,
+            Sketch.event_type == event_type,
+            Sketch.count > 0,
+            *(GROUP_COLUMNS[name] == value for name, value in filters.items() if value is not None)
+        )
+    )
+
+
+def play_session_sketches_query(play_session_ids: Sequence[int], event_type: int) -> Select:
+    return select(Sketch.total, Sketch.minimum, Sketch.maximum, Sketch.bins).where(
+        Sketch.play_session_id.in_(play_session_ids),
+        Sketch.event_type == event_type,
+        Sketch.count > 0
+    )
+
+
+def merge_groups(rows, group_by: Sequence[str] = ()) -> List[Tuple[Dict[str, Optional[str]], LogHistogram]]:
+    """Merge sketch rows per distinct value of the group_by columns."""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(getattr(row, name) for name in group_by)].append(LogHistogram.from_row(row))
+    return [
+        (dict(zip(group_by, values)), LogHistogram.merge(sketches))
+        for values, sketches in sorted(groups.items(), key=lambda item: tuple(v or "" for v in item[0]))
+    ]
+
+
+def quantile_label(q: float) -> str:
+    return f"p{q * 100:g}"
+
+
+def describe(sketch: LogHistogram, quantiles: Sequence[float] = DEFAULT_QUANTILES, bins: int = 20) -> dict:
+    return {
+        "count": sketch.count,
+        "mean": sketch.mean,
+        "min": sketch.minimum,
+        "max": sketch.maximum,
+        "quantiles": dict(zip(map(quantile_label, quantiles), sketch.quantiles(quantiles))),
+        "histogram": sketch.histogram(bins),
+    }
@@ -0,0 +1,119 @@
+"""
+Cached per-study consent statistics for the researcher stats endpoints.
+
+All requested studies are counted in one grouped statement over the
+(study_id, is_active) consent index, joined to the study's first consent
+and its StudyMetadata row. Results are cached per study with TTL and LRU
+eviction; create_consent and withdrawal jobs invalidate the study they
+change, so this worker never serves counts older than its own writes.
+With several workers, another worker's changes become visible here within
+the TTL.
+"""
+
+import os
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import Select, case, func, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models_research, schemas_research
+from .session_cache import TTLCache
+
+STUDY_STATS_CACHE_SIZE = int(os.getenv("WEBTICS_STUDY_STATS_CACHE_SIZE", "1000"))
+STUDY_STATS_CACHE_TTL_SEC = float(os.getenv("WEBTICS_STUDY_STATS_CACHE_TTL", "30"))
+# Most studies accepted by one bulk request
+MAX_BULK_STUDIES = int(os.getenv("WEBTICS_STUDY_STATS_MAX_BULK", "200"))
+
+# Used when a study has no StudyMetadata row
+DEFAULT_RETENTION_DAYS = 365
+
+Consent = models_research.ResearchConsent
+Study = models_research.StudyMetadata
+
+stats_cache = TTLCache(STUDY_STATS_CACHE_SIZE, STUDY_STATS_CACHE_TTL_SEC)
+
+
+def stats_query(study_ids: List[str]) -> Select:
+    """One row per requested study that has consents or metadata."""
+    studies = union(
+        select(Consent.study_id).where(Consent.study_id.in_(study_ids)),
+        select(Study.study_id).where(Study.study_id.in_(study_ids)),
+    ).subquery("studies")
+    counts = (
+        select(
+            Consent.study_id,
+            func.count().label("total"),
+            func.sum(case((Consent.is_active == True, 1), else_=0)).label("active"),
+            func.min(Consent.id).label("first_id"),
+        )
+        .where(Consent.study_id.in_(study_ids))
+        .group_by(Consent.study_id)
+        .subquery("counts")
+    )
+    return (
+        select(
+            studies.c.study_id,
+            counts.c.total,
+            counts.c.active,
+            Consent.privacy_level,
+            Consent.irb_protocol,
+            Study.irb_protocol.label("study_irb_protocol"),
+            Study.data_retention_days,
+        )
+        .select_from(studies)
+        .outerjoin(counts, counts.c.study_id == studies.c.study_id)
+        .outerjoin(Consent, Consent.id == counts.c.first_id)
+        .outerjoin(Study, Study.study_id == studies.c.study_id)
+    )
+
+
+def _response(row) -> schemas_research.StudyStatsResponse:
+    total = row.total or 0
+    active = row.active or 0
+    return schemas_research.StudyStatsResponse(
+        study_id=row.study_id,
+        total_consented=total,
+        active_participants=active,
+        withdrawn_participants=total - active,
+        privacy_level=row.privacy_level or "unknown",
+        irb_protocol=row.study_irb_protocol if row.study_irb_protocol is not None else row.irb_protocol,
+        data_retention_days=(
+            row.data_retention_days if row.data_retention_days is not None else DEFAULT_RETENTION_DAYS
+        ),
+    )
+
+
+async def get_stats(
+    db: AsyncSession,
+    study_ids: Iterable[str]
+) -> Dict[str, schemas_research.StudyStatsResponse]:
+    """
+    Stats for each known study, from cache or one query for the misses.
+
+    Unknown studies are left out of the result (and not cached, so a study
+    appears as soon as its first consent exists).
+    """
+    found = {}
+    missing = []
+    for study_id in dict.fromkeys(study_ids):
+        stats = stats_cache.get(study_id)
+        if stats is None:
+            missing.append(study_id)
+        else:
+            found[study_id] = stats
+
+    if missing:
+        for row in (await db.execute(stats_query(missing))).all():
+            stats = _response(row)
+            stats_cache.set(row.study_id, stats)
+            found[row.study_id] = stats
+    return found
+
+
+def forget(study_id: str) -> None:
+    """Drop a study's cached stats after its consents change."""
+    stats_cache.invalidate(study_id)
+
+
+def stats() -> Dict[str, Any]:
+    return {"max_bulk_studies": MAX_BULK_STUDIES, "cache": stats_cache.stats()}
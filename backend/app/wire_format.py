@@ -0,0 +1,227 @@
+"""
+Compact binary wire format for event batches.
+
+All integers are little-endian and records are packed (no padding).
+
+Header (16 bytes):
+    magic          4s   b"WTEV"
+    version        u8   format version (currently 1)
+    flags          u8   reserved, must be 0
+    record_size    u16  size of one record in bytes (29 for version 1)
+    count          u32  number of records
+    data_size      u32  size of the trailing data blob section in bytes
+
+Record (version 1, 29 bytes):
+    event_type     u16
+    event_subtype  u16
+    present        u8   bit 0 = x, bit 1 = y, bit 2 = z, bit 3 = magnitude
+    x, y, z        i32
+    magnitude      f64
+    data_len       u32  length of this record's JSON object in the blob section
+
+Blob section: the UTF-8 JSON "data" objects of records with data_len > 0,
+concatenated in record order.
+
+Records are decoded with a single NumPy structured dtype view over the
+request body and validated column-wise; only the optional data blobs become
+per-event Python objects.
+"""
+
+import json
+import struct
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from . import schemas
+from .middleware.data_validation import ValidationError, validate_event_columns
+
+MEDIA_TYPE = "application/vnd.webtics.events"
+MAGIC = b"WTEV"
+VERSION = 1
+
+HEADER = struct.Struct("<4sBBHII")
+
+PRESENT_X = 1
+PRESENT_Y = 2
+PRESENT_Z = 4
+PRESENT_MAGNITUDE = 8
+
+RECORD_DTYPE_V1 = np.dtype([
+    ("event_type", "<u2"),
+    ("event_subtype", "<u2"),
+    ("present", "u1"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("z", "<i4"),
+    ("magnitude", "<f8"),
+    ("data_len", "<u4"),
+])
+
+RECORD_DTYPES = {1: RECORD_DTYPE_V1}
+
+MAX_DATA_BYTES = 10000  # Same 10KB limit as the JSON path
+
+
+def encode_events(
+    events: Iterable[Union[schemas.EventCreate, dict]],
+    version: int = VERSION
+) -> bytes:
+    """
+    Reference encoder: pack events into the binary wire format.
+
+    Args:
+        events: EventCreate models or dicts with the same fields
+
+    Returns:
+        bytes: Encoded batch (header + records + data blobs)
+    """
+    dtype = RECORD_DTYPES[version]
+    events = [
+        e.model_dump() if isinstance(e, schemas.EventCreate) else e
+        for e in events
+    ]
+    records = np.zeros(len(events), dtype=dtype)
+    blobs: List[bytes] = []
+
+    for i, event in enumerate(events):
+        present = 0
+        records["event_type"][i] = event["event_type"]
+        records["event_subtype"][i] = event.get("event_subtype") or 0
+        for field, bit in (("x", PRESENT_X), ("y", PRESENT_Y), ("z", PRESENT_Z)):
+            if event.get(field) is not None:
+                records[field][i] = event[field]
+                present |= bit
+        if event.get("magnitude") is not None:
+            records["magnitude"][i] = event["magnitude"]
+            present |= PRESENT_MAGNITUDE
+        records["present"][i] = present
+        if event.get("data"):
+            blob = json.dumps(event["data"], separators=(",", ":")).encode("utf-8")
+            records["data_len"][i] = len(blob)
+            blobs.append(blob)
+
+    data = b"".join(blobs)
+    header = HEADER.pack(MAGIC, version, 0, dtype.itemsize, len(events), len(data))
+    return header + records.tobytes() + data
+
+
+def decode_events(body: bytes) -> Tuple[np.ndarray, bytes]:
+    """
+    Decode a binary batch into a structured record array and blob section.
+
+    The record array is a zero-copy view over the request body.
+
+    Raises:
+        ValidationError: If the header or sizes are malformed
+    """
+    if len(body) < HEADER.size:
+        raise ValidationError("Binary batch is shorter than its header")
+
+    magic, version, flags, record_size, count, data_size = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise ValidationError("Not a WebTics binary event batch")
+    if version not in RECORD_DTYPES:
+        raise ValidationError(f"Unsupported binary format version {version}")
+    if flags != 0:
+        raise ValidationError(f"Unsupported binary format flags {flags:#x}")
+    dtype = RECORD_DTYPES[version]
+    if record_size != dtype.itemsize:
+        raise ValidationError(
+            f"Record size {record_size} does not match version {version} ({dtype.itemsize})"
+        )
+
+    records_end = HEADER.size + count * record_size
+    if len(body) != records_end + data_size:
+        raise ValidationError(
+            f"Binary batch size {len(body)} does not match header "
+            f"({count} records, {data_size} data bytes)"
+        )
+
+    records = np.frombuffer(body, dtype=dtype, count=count, offset=HEADER.size)
+    return records, body[records_end:]
+
+
+def validate_records(records: np.ndarray, data: bytes) -> None:
+    """
+    Validate decoded records with column-wise vectorized checks.
+
+    Applies the same rules as the JSON batch path to whole columns at once.
+
+    Raises:
+        ValidationError: Naming the first offending record
+    """
+    present = records["present"]
+    columns = {
+        "event_type": records["event_type"].astype(np.float64),
+        "event_subtype": records["event_subtype"].astype(np.float64),
+    }
+    for field, bit in (
+        ("x", PRESENT_X), ("y", PRESENT_Y), ("z", PRESENT_Z), ("magnitude", PRESENT_MAGNITUDE)
+    ):
+        # Absent fields are zero-filled on the wire; mark them missing (NaN)
+        columns[field] = np.where((present & bit) != 0, records[field], np.nan)
+
+    nan_magnitude = ((present & PRESENT_MAGNITUDE) != 0) & np.isnan(records["magnitude"])
+    if nan_magnitude.any():
+        index = int(np.flatnonzero(nan_magnitude)[0])
+        raise ValidationError(f"Record {index}: magnitude must be a finite number")
+
+    validate_event_columns(columns, label="Record")
+
+    data_len = records["data_len"]
+    oversized = data_len > MAX_DATA_BYTES
+    if oversized.any():
+        index = int(np.flatnonzero(oversized)[0])
+        raise ValidationError(f"Record {index}: 'data' JSON exceeds 10KB limit")
+    if int(data_len.sum(dtype=np.uint64)) != len(data):
+        raise ValidationError("Record data lengths do not match the data section size")
+
+
+def decode_data(records: np.ndarray, data: bytes) -> List[Optional[dict]]:
+    """Parse the per-record JSON data blobs (None where absent)."""
+    result: List[Optional[dict]] = [None] * len(records)
+    offsets = np.concatenate(([0], np.cumsum(records["data_len"], dtype=np.int64))).tolist()
+    for index in np.flatnonzero(records["data_len"]).tolist():
+        try:
+            value = json.loads(data[offsets[index]:offsets[index + 1]])
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError(f"Record {index}: 'data' is not valid JSON")
+        if not isinstance(value, dict):
+            raise ValidationError(f"Record {index}: 'data' field must be a JSON object")
+        result[index] = value
+    return result
+
+
+def record_rows(
+    play_session_id: int,
+    records: np.ndarray,
+    data: List[Optional[dict]],
+    timestamp: Optional[datetime] = None
+) -> Iterator[dict]:
+    """Feed decoded columns into bulk_insert.insert_events as row dicts."""
+    timestamp = timestamp or datetime.utcnow()
+    present = records["present"].tolist()
+    columns = zip(
+        records["event_type"].tolist(),
+        records["event_subtype"].tolist(),
+        records["x"].tolist(),
+        records["y"].tolist(),
+        records["z"].tolist(),
+        records["magnitude"].tolist(),
+        present,
+        data,
+    )
+    for event_type, event_subtype, x, y, z, magnitude, bits, event_data in columns:
+        yield {
+            "play_session_id": play_session_id,
+            "event_type": event_type,
+            "event_subtype": event_subtype,
+            "x": x if bits & PRESENT_X else None,
+            "y": y if bits & PRESENT_Y else None,
+            "z": z if bits & PRESENT_Z else None,
+            "magnitude": magnitude if bits & PRESENT_MAGNITUDE else None,
+            "data": event_data,
+            "timestamp": timestamp,
+        }
@@ -0,0 +1 @@
+# WebTics Benchmarks
@@ -0,0 +1,197 @@
+"""
+Benchmark: request latency under many concurrent clients.
+
+Runs against a live server, so it measures the whole stack (uvicorn, event
+loop, driver, pool). Each simulated game client holds one keep-alive
+connection and sends requests back to back; latencies are reported as
+percentiles over all clients.
+
+The clients speak minimal HTTP/1.1 over asyncio streams: httpx's pool costs
+more CPU than the server under test at hundreds of connections, which would
+make the load generator the bottleneck when both share a machine.
+
+Usage (from backend/):
+    uvicorn app.main:app --port 8013 &
+    python -m benchmarks.bench_concurrency --url http://localhost:8013
+    python -m benchmarks.bench_concurrency --clients 500 --mode batch --batch-size 50
+
+Modes:
+    event  POST /api/v1/events (one event per request)
+    batch  POST /api/v1/events/batch
+    read   GET /api/v1/sessions/{id}/events
+    mixed  alternate event writes and reads
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+MODES = ("event", "batch", "read", "mixed")
+
+
+class BenchError(Exception):
+    pass
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection (a simulated game client)."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, payload=None):
+        reused = self.writer is not None
+        try:
+            return await asyncio.wait_for(self._request(method, path, payload), self.timeout)
+        except (BenchError, ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            # The server closed the idle keep-alive connection; retry once
+            self.close()
+            return await asyncio.wait_for(self._request(method, path, payload), self.timeout)
+
+    async def _request(self, method: str, path: str, payload):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        )
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            self.close()
+            raise BenchError("connection closed")
+        status = int(status_line.split()[1])
+        length = 0
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                keep_alive = False
+        data = await self.reader.readexactly(length)
+        if not keep_alive:
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def create_play_session(conn: Connection):
+    status, data = await conn.request(
+        "POST", "/api/v1/sessions",
+        {"unique_id": f"bench_{uuid4().hex}", "build_number": "bench"}
+    )
+    if status != 200:
+        raise BenchError(f"session setup failed: {status} {data[:200]!r}")
+    session_id = json.loads(data)["id"]
+    status, data = await conn.request(
+        "POST", "/api/v1/play-sessions", {"metric_session_id": session_id}
+    )
+    if status != 200:
+        raise BenchError(f"play session setup failed: {status} {data[:200]!r}")
+    return session_id, json.loads(data)["id"]
+
+
+async def run_client(conn, mode, batch_size, requests, ids, latencies, errors):
+    session_id, play_session_id = ids
+    event = {"event_type": 102, "x": 10, "y": 20, "magnitude": 350.0}
+    batch = [event] * batch_size
+    for i in range(requests):
+        kind = mode if mode != "mixed" else ("event" if i % 2 == 0 else "read")
+        started = time.perf_counter()
+        try:
+            if kind == "event":
+                status, _ = await conn.request(
+                    "POST", f"/api/v1/events?play_session_id={play_session_id}", event
+                )
+            elif kind == "batch":
+                status, _ = await conn.request(
+                    "POST", f"/api/v1/events/batch?play_session_id={play_session_id}", batch
+                )
+            else:
+                status, _ = await conn.request(
+                    "GET", f"/api/v1/sessions/{session_id}/events?limit=50"
+                )
+            if status >= 300:
+                errors.append(status)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, BenchError) as e:
+            conn.close()
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(url: str, clients: int, requests: int, mode: str, batch_size: int, timeout: float) -> None:
+    parts = urlsplit(url)
+    conns = [Connection(parts.hostname, parts.port or 80, timeout) for _ in range(clients)]
+
+    # Set up sessions with concurrency below the default pool size, so a
+    # server that blocks its event loop on the database still gets through
+    setup = asyncio.Semaphore(10)
+
+    async def setup_one(conn):
+        async with setup:
+            return await create_play_session(conn)
+
+    ids = await asyncio.gather(*(setup_one(conn) for conn in conns))
+
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(conn, mode, batch_size, requests, client_ids, latencies, errors)
+        for conn, client_ids in zip(conns, ids)
+    ))
+    elapsed = time.perf_counter() - started
+    for conn in conns:
+        conn.close()
+
+    latencies.sort()
+    print(f"mode={mode} clients={clients} requests/client={requests}"
+          + (f" batch_size={batch_size}" if mode == "batch" else ""))
+    print(f"{'requests':>9} {'errors':>7} {'req/sec':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    print(
+        f"{len(latencies):>9} {len(errors):>7} {len(latencies) / elapsed:>9,.0f} "
+        f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+        f"{percentile(latencies, 99) * 1000:>8.1f} {latencies[-1] * 1000:>8.1f}"
+    )
+    if errors:
+        print(f"first errors: {errors[:5]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8013", help="API base URL")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--mode", choices=MODES, default="mixed")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout (seconds)")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.clients, args.requests, args.mode, args.batch_size, args.timeout))
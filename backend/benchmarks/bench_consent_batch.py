@@ -0,0 +1,73 @@
+"""
+Benchmark: enrolling a cohort, one POST /consent per participant vs
+POST /consent/batch.
+
+Runs against a live server, as a lab's enrollment tool would: the single
+endpoint pays a request, a transaction and a commit per participant, the
+batch endpoint one of each per request.
+
+Usage (from backend/):
+    uvicorn app.main:app --port 8013 &
+    python -m benchmarks.bench_consent_batch --url http://localhost:8013
+    python -m benchmarks.bench_consent_batch --cohort 500 --batch-sizes 50,100,500
+
+The batch sizes must not exceed the server's WEBTICS_CONSENT_BATCH_MAX.
+Consents are created under a fresh bench_* study id on every run.
+"""
+
+import argparse
+import time
+from uuid import uuid4
+
+import httpx
+
+
+def enrol_single(client: httpx.Client, study_id: str, cohort: int) -> None:
+    for _ in range(cohort):
+        response = client.post("/api/v1/research/consent", json={"study_id": study_id})
+        response.raise_for_status()
+
+
+def enrol_batch(client: httpx.Client, study_id: str, cohort: int, batch_size: int) -> None:
+    for start in range(0, cohort, batch_size):
+        participants = [{}] * min(batch_size, cohort - start)
+        response = client.post(
+            "/api/v1/research/consent/batch",
+            json={"study_id": study_id, "participants": participants}
+        )
+        response.raise_for_status()
+
+
+def best_sec(enrol, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        study_id = f"bench_{uuid4().hex[:12]}"
+        started = time.perf_counter()
+        enrol(study_id)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(url: str, cohort: int, batch_sizes, repeats: int) -> None:
+    with httpx.Client(base_url=url, timeout=60) as client:
+        # Warm up the connection and the server's code paths
+        enrol_single(client, f"bench_{uuid4().hex[:12]}", 5)
+        enrol_batch(client, f"bench_{uuid4().hex[:12]}", 5, 5)
+
+        print(f"{'cohort':>7} {'method':>12} {'total ms':>10} {'consents/s':>11} {'speedup':>8}")
+        single = best_sec(lambda s: enrol_single(client, s, cohort), repeats)
+        print(f"{cohort:>7} {'single':>12} {single * 1000:>10.1f} {cohort / single:>11.0f} {1:>8.1f}")
+        for batch_size in batch_sizes:
+            elapsed = best_sec(lambda s: enrol_batch(client, s, cohort, batch_size), repeats)
+            print(f"{cohort:>7} {f'batch {batch_size}':>12} {elapsed * 1000:>10.1f} "
+                  f"{cohort / elapsed:>11.0f} {single / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8013")
+    parser.add_argument("--cohort", type=int, default=200, help="Participants enrolled per run")
+    parser.add_argument("--batch-sizes", default="10,50,200", help="Comma-separated participants per request")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.url, args.cohort, [int(s) for s in args.batch_sizes.split(",")], args.repeats)
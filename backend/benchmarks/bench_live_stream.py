@@ -0,0 +1,146 @@
+"""
+Benchmark: live event streams with many concurrent dashboard subscribers.
+
+Opens --subscribers Server-Sent Events connections spread over --sessions
+metric sessions, posts event batches to those sessions and measures how
+long each batch takes to reach every subscriber (send to receive, same
+machine clock). Subscribers that fall behind are dropped by the server with
+an "overflow" message; those are counted, not retried.
+
+Usage (from backend/):
+    uvicorn app.main:app --port 8013 &
+    python -m benchmarks.bench_live_stream --url http://localhost:8013
+    python -m benchmarks.bench_live_stream --subscribers 1000 --sessions 10 --batches 100
+
+The server needs WEBTICS_LIVE_MAX_SUBSCRIBERS of at least --subscribers,
+and the worker must be the one receiving the posts (a single worker).
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from .bench_concurrency import BenchError, Connection, create_play_session, percentile
+
+
+class Subscriber:
+    """One SSE connection, recording the delivery latency of each batch."""
+
+    def __init__(self, host: str, port: int, path: str):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.latencies = []
+        self.events = 0
+        self.overflowed = False
+        self.connected = asyncio.Event()
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f"GET {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Accept: text/event-stream\r\n\r\n".encode()
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            if b" 200 " not in status_line:
+                raise BenchError(f"stream refused: {status_line!r}")
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            self.connected.set()
+
+            event = None
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                # Chunked transfer encoding: skip the chunk size lines
+                line = line.rstrip(b"\r\n")
+                if line.startswith(b"event: "):
+                    event = line[7:]
+                elif line.startswith(b"data: ") and event == b"events":
+                    received = time.time()
+                    batch = json.loads(line[6:])
+                    self.events += len(batch)
+                    self.latencies.append(received - batch[0]["data"]["sent"])
+                elif event == b"overflow" and line.startswith(b"data: "):
+                    self.overflowed = True
+                    return
+        finally:
+            writer.close()
+
+
+async def publish(conn: Connection, play_session_id: int, batch_size: int):
+    batch = [{"event_type": 102, "x": i, "data": {"sent": time.time()}} for i in range(batch_size)]
+    status, data = await conn.request(
+        "POST", f"/api/v1/events/batch?play_session_id={play_session_id}", batch
+    )
+    if status != 200:
+        raise BenchError(f"publish failed: {status} {data[:200]!r}")
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+
+    setup = Connection(host, port, timeout=30)
+    ids = [await create_play_session(setup) for _ in range(args.sessions)]
+
+    subscribers = [
+        Subscriber(host, port, f"/api/v1/sessions/{ids[i % args.sessions][0]}/events/stream")
+        for i in range(args.subscribers)
+    ]
+    tasks = [asyncio.create_task(s.run()) for s in subscribers]
+    started = time.perf_counter()
+    await asyncio.wait_for(asyncio.gather(*(s.connected.wait() for s in subscribers)), 60)
+    print(f"{args.subscribers} subscribers connected in {time.perf_counter() - started:.2f}s")
+
+    publishers = [Connection(host, port, timeout=30) for _ in ids]
+    started = time.perf_counter()
+    for _ in range(args.batches):
+        await asyncio.gather(*(
+            publish(conn, play_session_id, args.batch_size)
+            for conn, (_, play_session_id) in zip(publishers, ids)
+        ))
+        await asyncio.sleep(args.interval)
+    # Let the last batches arrive
+    await asyncio.sleep(max(1.0, args.interval * 5))
+    elapsed = time.perf_counter() - started
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for conn in [setup, *publishers]:
+        conn.close()
+
+    latencies = sorted(latency * 1000 for s in subscribers for latency in s.latencies)
+    expected = args.batches * args.batch_size
+    complete = sum(1 for s in subscribers if s.events == expected)
+    overflowed = sum(1 for s in subscribers if s.overflowed)
+    print(
+        f"{args.batches} batches x {args.batch_size} events to each of {args.sessions} sessions "
+        f"in {elapsed:.2f}s"
+    )
+    print(f"subscribers with every event: {complete}/{args.subscribers}, overflowed: {overflowed}")
+    print(
+        f"delivery latency ms: p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  "
+        f"p99 {percentile(latencies, 99):.1f}  max {percentile(latencies, 100):.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8013")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between publish rounds")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
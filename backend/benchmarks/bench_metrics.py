@@ -0,0 +1,107 @@
+"""
+Benchmark: cost of the Prometheus instrumentation on the request path.
+
+- record: one Histogram.observe / Counter.inc / record_ingest call
+- request: CPU per request through a no-op route, with and without
+  MetricsMiddleware (route template lookup, status capture, histogram)
+- statement: a trivial SQLite statement with and without the cursor
+  event listeners that charge database time to the request (most of the
+  difference is SQLAlchemy dispatching cursor events at all; it is fixed
+  per statement, small next to a PostgreSQL round trip)
+
+Usage (from backend/):
+    python -m benchmarks.bench_metrics
+"""
+
+import argparse
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app import metrics
+
+
+def per_call(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def bench_record(calls: int) -> None:
+    registry = metrics.Registry()
+    histogram = registry.histogram("bench_seconds", "bench", ("method", "route", "status"))
+    counter = registry.counter("bench_total", "bench", ("format",))
+    labels = ("POST", "/api/v1/events/batch", "200")
+
+    print(f"{'record':>28} {'ns/call':>10}")
+    for name, fn in (
+        ("Histogram.observe", lambda: histogram.observe(0.0042, labels)),
+        ("Counter.inc", lambda: counter.inc(("batch",), 100)),
+        ("record_ingest", lambda: metrics.record_ingest("batch", 100)),
+    ):
+        print(f"{name:>28} {per_call(fn, calls) * 1e9:>10.0f}")
+
+
+def noop_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/v1/play-sessions/{play_session_id}/close")
+    async def close(play_session_id: int):
+        return {"ok": play_session_id}
+
+    if instrumented:
+        app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+def bench_request(requests: int) -> None:
+    print(f"{'request':>28} {'us/request':>10}")
+    results = {}
+    for instrumented in (False, True):
+        client = TestClient(noop_app(instrumented))
+        client.post("/api/v1/play-sessions/1/close")
+        started = time.process_time()
+        for i in range(requests):
+            response = client.post(f"/api/v1/play-sessions/{i}/close")
+            assert response.status_code == 200, response.text
+        results[instrumented] = (time.process_time() - started) / requests
+    print(f"{'plain':>28} {results[False] * 1e6:>10.1f}")
+    print(f"{'MetricsMiddleware':>28} {results[True] * 1e6:>10.1f}")
+    print(f"{'overhead':>28} {(results[True] - results[False]) * 1e6:>10.1f}")
+
+
+def bench_statement(statements: int) -> None:
+    print(f"{'statement (SQLite SELECT 1)':>28} {'us/stmt':>10}")
+    results = {}
+    for instrumented in (False, True):
+        engine = create_engine("sqlite://")
+        if instrumented:
+            metrics.instrument_engine(engine)
+        # As inside a request, so the listeners do their full work
+        token = metrics._db_timer.set([0.0, 0])
+        try:
+            with engine.connect() as conn:
+                query = text("SELECT 1")
+                results[instrumented] = per_call(lambda: conn.execute(query).scalar(), statements)
+        finally:
+            metrics._db_timer.reset(token)
+        engine.dispose()
+    print(f"{'plain':>28} {results[False] * 1e6:>10.2f}")
+    print(f"{'cursor events':>28} {results[True] * 1e6:>10.2f}")
+    print(f"{'overhead':>28} {(results[True] - results[False]) * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000, help="Calls per record benchmark")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--statements", type=int, default=50000)
+    args = parser.parse_args()
+    bench_record(args.calls)
+    print()
+    bench_request(args.requests)
+    print()
+    bench_statement(args.statements)
@@ -0,0 +1,105 @@
+"""
+Benchmark: CPU per ingest request, old double-parse vs single-parse pipeline.
+
+"legacy" reproduces the previous pipeline: validation_middleware decoded the
+body with json.loads and validated it, then FastAPI decoded the same body
+again for the List[EventCreate] parameter. "single" decodes once (orjson)
+in the parse_event_batch dependency and validates the batch as columns.
+
+Both apps use a no-op endpoint so only request handling CPU is measured.
+
+Usage (from backend/):
+    python -m benchmarks.bench_validation
+"""
+
+import argparse
+import json
+import time
+from typing import List
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app.middleware.data_validation import (
+    ValidationError,
+    parse_event,
+    parse_event_batch,
+    validate_event_data,
+)
+from app.schemas import EventCreate, EventCreateDict
+
+
+def make_events(count: int):
+    return [
+        {"event_type": 102, "x": i % 100, "y": i % 50, "magnitude": 250.0 + i % 300}
+        for i in range(count)
+    ]
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def legacy_validation(request: Request, call_next):
+        body = await request.json()
+        try:
+            for item in body if isinstance(body, list) else [body]:
+                validate_event_data(item)
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return await call_next(request)
+
+    @app.post("/event")
+    async def event(event: EventCreate):
+        return {"ok": 1}
+
+    @app.post("/batch")
+    async def batch(events: List[EventCreate]):
+        return {"ok": len(events)}
+
+    return app
+
+
+def single_parse_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/event")
+    async def event(event: EventCreate = Depends(parse_event)):
+        return {"ok": 1}
+
+    @app.post("/batch")
+    async def batch(events: List[EventCreateDict] = Depends(parse_event_batch)):
+        return {"ok": len(events)}
+
+    return app
+
+
+def time_requests(client: TestClient, path: str, body: bytes, requests: int) -> float:
+    headers = {"Content-Type": "application/json"}
+    started = time.process_time()
+    for _ in range(requests):
+        response = client.post(path, content=body, headers=headers)
+        assert response.status_code == 200, response.text
+    return (time.process_time() - started) / requests
+
+
+def run(batch_sizes, requests: int) -> None:
+    clients = {"legacy": TestClient(legacy_app()), "single": TestClient(single_parse_app())}
+    cases = [("/event", 1, json.dumps(make_events(1)[0]).encode())]
+    cases += [("/batch", n, json.dumps(make_events(n)).encode()) for n in batch_sizes]
+
+    print(f"{'request':>14} {'legacy ms':>10} {'single ms':>10} {'saving':>7}")
+    for path, size, body in cases:
+        count = max(5, requests // max(1, size // 100))
+        legacy = time_requests(clients["legacy"], path, body, count)
+        single = time_requests(clients["single"], path, body, count)
+        label = f"{path[1:]}[{size}]"
+        print(f"{label:>14} {legacy * 1000:>10.3f} {single * 1000:>10.3f} {1 - single / legacy:>7.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", default="100,1000,10000")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per case (scaled down for big batches)")
+    args = parser.parse_args()
+    run([int(s) for s in args.batch_sizes.split(",")], args.requests)
@@ -0,0 +1,98 @@
+"""
+Benchmark: binary wire format vs the JSON batch path.
+
+Measures server-side decode + validate + row building throughput (the part
+that runs before the bulk insert) and payload size for both formats.
+
+Usage (from backend/):
+    python -m benchmarks.bench_wire_format
+    python -m benchmarks.bench_wire_format --sizes 1000,20000 --url sqlite://
+"""
+
+import argparse
+import json
+import time
+from collections import deque
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, wire_format
+from app.bulk_insert import event_rows, insert_events
+from app.middleware.data_validation import validate_event_data
+from app.schemas import EventCreate
+
+
+def make_events(count: int):
+    return [
+        {
+            "event_type": 102 if i % 2 else 103,
+            "event_subtype": i % 4,
+            "x": i % 1000,
+            "y": -(i % 500),
+            "z": 0,
+            "magnitude": 250.0 + (i % 300),
+            "data": {"trial": i} if i % 10 == 0 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def json_path(body: bytes):
+    payload = json.loads(body)
+    for item in payload:
+        validate_event_data(item)
+    events = [EventCreate.model_validate(item) for item in payload]
+    return event_rows(1, events)
+
+
+def binary_path(body: bytes):
+    records, data = wire_format.decode_events(body)
+    wire_format.validate_records(records, data)
+    return wire_format.record_rows(1, records, wire_format.decode_data(records, data))
+
+
+def best_of(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(sizes, repeats: int, url: str = None) -> None:
+    SessionLocal = None
+    if url:
+        engine = create_engine(url)
+        models.Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(bind=engine)
+
+    def consume(rows):
+        if SessionLocal is None:
+            deque(rows, maxlen=0)
+            return
+        db = SessionLocal()
+        insert_events(db, rows)
+        db.rollback()
+        db.close()
+
+    print(f"{'events':>8} {'format':>7} {'bytes':>10} {'events/sec':>12} {'best ms':>9}")
+    for size in sizes:
+        events = make_events(size)
+        bodies = {
+            "json": (json.dumps(events).encode("utf-8"), json_path),
+            "binary": (wire_format.encode_events(events), binary_path),
+        }
+        for name, (body, path) in bodies.items():
+            elapsed = best_of(lambda: consume(path(body)), repeats)
+            print(f"{size:>8} {name:>7} {len(body):>10,} {size / elapsed:>12,.0f} {elapsed * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,20000", help="Comma-separated batch sizes")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--url", default=None, help="Also insert into this database (rolled back)")
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.repeats, args.url)
@@ -0,0 +1,65 @@
+"""
+Shared test fixtures and helpers.
+"""
+
+import os
+from typing import Callable, Optional, Sequence
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Before the app is imported, so the internal router and heatmaps are enabled
+os.environ.setdefault("WEBTICS_OPERATOR_TOKEN", "test-operator-token")
+os.environ.setdefault("WEBTICS_HEATMAPS_ENABLED", "true")
+
+from app import rate_limit  # noqa: E402
+from app.main import app  # noqa: E402
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """Every TestClient request comes from one address; give each test a fresh attempt budget."""
+    rate_limit.code_attempt_limiter.backend.reset()
+
+
+def default_event(index: int) -> dict:
+    return {"event_type": 102}
+
+
+def create_participant(
+    study_id: str,
+    play_sessions: Sequence[int] = (0,),
+    build: Optional[str] = None,
+    participant_info: Optional[dict] = None,
+    make_event: Callable[[int], dict] = default_event
+) -> dict:
+    """
+    Consent in a study plus one metric session with play sessions, through the API.
+
+    play_sessions gives the number of events logged to each play session,
+    make_event builds the i-th of them. Returns the consent response with
+    session_id and play_session_ids added.
+    """
+    consent = client.post("/api/v1/research/consent", json={
+        "study_id": study_id,
+        **({"participant_info": participant_info} if participant_info else {})
+    }).json()
+    session_id = client.post("/api/v1/sessions", json={
+        "unique_id": consent["participant_id"],
+        **({"build_number": build} if build else {})
+    }).json()["id"]
+    play_session_ids = []
+    for events in play_sessions:
+        play_session_id = client.post(
+            "/api/v1/play-sessions", json={"metric_session_id": session_id}
+        ).json()["id"]
+        if events:
+            response = client.post(
+                f"/api/v1/events/batch?play_session_id={play_session_id}",
+                json=[make_event(i) for i in range(events)]
+            )
+            assert response.status_code == 200
+        play_session_ids.append(play_session_id)
+    return {**consent, "session_id": session_id, "play_session_ids": play_session_ids}
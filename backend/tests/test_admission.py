@@ -0,0 +1,121 @@
+"""
+Tests for ingest admission control.
+"""
+
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db_pool
+from app.main import app
+from app.middleware.admission import AdmissionController, admission_controller
+from app.routers.internal import OPERATOR_TOKEN
+
+client = TestClient(app)
+OPERATOR = {"Authorization": f"Bearer {OPERATOR_TOKEN}"}
+
+
+def fake_queue(depth: int, max_size: int = 1000, events_flushed: int = 0, total_flush_ms: float = 0.0):
+    return SimpleNamespace(
+        is_running=True, depth=depth, max_size=max_size, flush_interval=0.5,
+        events_flushed=events_flushed, total_flush_ms=total_flush_ms
+    )
+
+
+def controller(**kwargs) -> AdmissionController:
+    options = dict(
+        max_in_flight=2, max_pool_wait=0.5, max_queue_fill=0.9, max_retry_after=30,
+        pool_wait=lambda: 0.0, queue=None, enabled=True
+    )
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+class TestAdmissionController:
+    """Test each overload signal and the Retry-After it computes."""
+
+    def test_in_flight_limit(self):
+        admission = controller()
+        assert admission.admit() is None and admission.admit() is None
+        admission.latency_sec = 3.2
+        assert admission.admit() == (429, 4, "in_flight")
+        admission.release(3.2)
+        assert admission.admit() is None
+        assert admission.refused["in_flight"] == 1
+        assert admission.peak_in_flight == 2
+
+    def test_pool_wait(self):
+        wait = [0.4]
+        admission = controller(pool_wait=lambda: wait[0])
+        assert admission.admit() is None
+        wait[0] = 2.5
+        assert admission.admit() == (503, 3, "pool_wait")
+        wait[0] = 600.0
+        assert admission.admit() == (503, 30, "pool_wait")
+
+    def test_queue_fill(self):
+        assert controller(queue=fake_queue(900)).check() is None
+        # 950 queued, flushed at 1000 events/s: 0.95 s plus one flush interval
+        admission = controller(queue=fake_queue(950, events_flushed=10000, total_flush_ms=10000))
+        assert admission.check() == (503, 2, "queue")
+        assert controller(queue=SimpleNamespace(is_running=False, depth=10**6, max_size=1)).check() is None
+
+    def test_disabled(self):
+        admission = controller(max_in_flight=0, enabled=False)
+        assert admission.admit() is None
+
+
+class TestRecentPoolWait:
+    """Test the moving average of checkout waits decays while idle."""
+
+    def test_average_and_decay(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(db_pool.time, "monotonic", lambda: now[0])
+        stats = db_pool.PoolStats("test")
+        for _ in range(20):
+            stats.record_wait(1.0)
+        assert stats.recent_wait_sec() == pytest.approx(1 - 0.8 ** 20)
+        now[0] += db_pool.RECENT_WAIT_DECAY_SEC * 3
+        assert stats.recent_wait_sec() < 0.05
+
+
+class TestAdmissionMiddleware:
+    """Test refusals reach clients and only ingest is controlled."""
+
+    @pytest.fixture
+    def play_session_id(self):
+        session_id = client.post("/api/v1/sessions", json={"unique_id": f"adm_{uuid4().hex}"}).json()["id"]
+        return client.post("/api/v1/play-sessions", json={"metric_session_id": session_id}).json()["id"]
+
+    def test_refuses_ingest_only(self, play_session_id, monkeypatch):
+        monkeypatch.setattr(admission_controller, "max_in_flight", 0)
+        response = client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 1})
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+        assert response.json()["reason"] == "in_flight"
+        response = client.post(f"/api/v1/events/batch?play_session_id={play_session_id}", json=[{"event_type": 1}])
+        assert response.status_code == 429
+
+        assert client.get(f"/api/v1/sessions/{play_session_id}/events").status_code != 429
+        assert client.post("/api/v1/sessions", json={"unique_id": f"adm_{uuid4().hex}"}).status_code == 200
+
+    def test_pool_wait_refusal(self, play_session_id, monkeypatch):
+        monkeypatch.setattr(admission_controller, "_pool_wait", lambda: 7.2)
+        response = client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 1})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "8"
+
+        state = client.get("/api/v1/internal/admission", headers=OPERATOR).json()
+        assert (state["admitting"], state["reason"]) == (False, "pool_wait")
+        assert state["last_refusal"]["retry_after"] == 8
+
+    def test_in_flight_released(self, play_session_id):
+        before = admission_controller.admitted
+        client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 1})
+        # Failed requests are released too
+        client.post("/api/v1/events?play_session_id=999999999", json={"event_type": 1})
+        assert admission_controller.admitted == before + 2
+        assert admission_controller.in_flight == 0
+        assert client.get("/api/v1/internal/admission", headers=OPERATOR).json()["admitting"] is True
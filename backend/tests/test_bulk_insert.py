@@ -0,0 +1,128 @@
+"""
+Tests for the bulk event insert engine.
+"""
+
+import asyncio
+import csv
+import io
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.bulk_insert import (
+    event_rows,
+    insert_events,
+    insert_events_async,
+    resolve_strategy,
+    _CopyStream,
+)
+from app.schemas import EventCreate
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    metric_session = models.MetricSession(unique_id="bulk_test")
+    session.add(metric_session)
+    session.flush()
+    session.add(models.PlaySession(id=1, metric_session_id=metric_session.id))
+    session.commit()
+    yield session
+    session.close()
+
+
+def sample_events(count: int):
+    return [
+        EventCreate(event_type=102, x=i, y=-i, magnitude=200.0 + i, data={"i": i})
+        for i in range(count)
+    ]
+
+
+class TestStrategySelection:
+    """Test COPY fallback on non-PostgreSQL databases."""
+
+    def test_auto_falls_back_to_core_on_sqlite(self, db):
+        assert resolve_strategy(db, "auto") == "core"
+
+    def test_copy_falls_back_to_core_on_sqlite(self, db):
+        assert resolve_strategy(db, "copy") == "core"
+
+    def test_unknown_strategy_rejected(self, db):
+        with pytest.raises(ValueError):
+            resolve_strategy(db, "bogus")
+
+
+class TestBulkInsert:
+    """Test each strategy writes identical rows."""
+
+    @pytest.mark.parametrize("strategy", ["core", "orm"])
+    def test_strategy_writes_all_rows(self, db, strategy):
+        written = insert_events(db, event_rows(1, sample_events(2500)), strategy=strategy)
+        db.commit()
+
+        assert written == 2500
+        events = db.query(models.Event).order_by(models.Event.x).all()
+        assert len(events) == 2500
+        assert events[10].magnitude == 210.0
+        assert events[10].data == {"i": 10}
+        assert all(e.timestamp is not None for e in events)
+
+    def test_rows_consumed_lazily(self, db):
+        """Core insert accepts a generator without materializing it first."""
+        generator = event_rows(1, iter(sample_events(10)))
+        assert insert_events(db, generator, strategy="core") == 10
+
+
+class TestAsyncBulkInsert:
+    """Test the AsyncSession write path used by request handlers."""
+
+    @pytest.mark.parametrize("strategy", ["auto", "core", "orm"])
+    def test_async_strategy_writes_all_rows(self, tmp_path, strategy):
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            async with async_sessionmaker(engine)() as db:
+                db.add(models.MetricSession(id=1, unique_id="async_bulk"))
+                db.add(models.PlaySession(id=1, metric_session_id=1))
+                await db.flush()
+                written = await insert_events_async(
+                    db, event_rows(1, sample_events(1500)), strategy=strategy
+                )
+                await db.commit()
+                stored = await db.scalar(select(func.count()).select_from(models.Event))
+            await engine.dispose()
+            return written, stored
+
+        assert asyncio.run(run()) == (1500, 1500)
+
+
+class TestCopyStream:
+    """Test CSV rendering for COPY FROM STDIN."""
+
+    def test_renders_csv_rows(self):
+        rows = list(event_rows(1, [
+            EventCreate(event_type=100, data={"comment": "a,b \"quoted\""}),
+            EventCreate(event_type=101, x=5, magnitude=1.5),
+        ]))
+        stream = _CopyStream(rows)
+        text = stream.read(1 << 20)
+
+        assert stream.count == 2
+        assert stream.read(1 << 20) == ""
+        parsed = list(csv.reader(io.StringIO(text)))
+        assert parsed[0][1] == "100"
+        assert parsed[0][7] == '{"comment": "a,b \\"quoted\\""}'
+        assert parsed[1][3] == "5"
+        # NULL columns render as unquoted empty fields
+        assert parsed[1][4] == ""
+
+    def test_reads_in_bounded_chunks(self):
+        stream = _CopyStream(event_rows(1, sample_events(1000)))
+        first = stream.read(256)
+        assert 0 < len(first) < 1024
+        assert stream.count < 1000
@@ -0,0 +1,86 @@
+"""
+Tests for batch cohort enrollment.
+"""
+
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app import models_research
+from app.crypto_utils import generate_consent_record
+from app.database import SessionLocal
+from app.main import app
+from app.routers import research
+
+client = TestClient(app)
+
+Consent = models_research.ResearchConsent
+
+
+def new_study() -> str:
+    return f"cohort_{uuid4().hex}"
+
+
+def enrol(study_id: str, participants, **fields):
+    return client.post("/api/v1/research/consent/batch", json={
+        "study_id": study_id, "participants": participants, **fields
+    })
+
+
+def consent_count(study_id: str) -> int:
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(Consent).where(Consent.study_id == study_id))
+
+
+class TestConsentBatch:
+    """Test /research/consent/batch."""
+
+    def test_enrols_cohort_in_order(self):
+        study_id = new_study()
+        participants = [{"condition": "ADHD", "age_range": "18-25"}, {}, {"condition": "control"}]
+        response = enrol(study_id, participants, irb_protocol="IRB-9", consent_version="2.1")
+        assert response.status_code == 200
+        body = response.json()
+        consents = body["consents"]
+        assert len(consents) == 3
+        assert len({c["withdrawal_code"] for c in consents}) == 3
+
+        with SessionLocal() as db:
+            rows = {r.participant_id: r for r in db.scalars(select(Consent).where(Consent.study_id == study_id))}
+        for item, info in zip(consents, participants):
+            row = rows[item["participant_id"]]
+            assert row.id == item["consent_id"]
+            assert (row.condition, row.age_range) == (info.get("condition"), info.get("age_range"))
+            assert (row.irb_protocol, row.consent_version, row.is_active) == ("IRB-9", "2.1", True)
+
+        stats = client.get(f"/api/v1/research/study/{study_id}/stats").json()
+        assert stats["total_consented"] == 3
+
+    def test_codes_work_like_single_consents(self):
+        study_id = new_study()
+        consents = enrol(study_id, [{}, {}]).json()["consents"]
+        response = client.post("/api/v1/research/withdraw", json={"withdrawal_code": consents[1]["withdrawal_code"]})
+        assert response.status_code == 200
+        stats = client.get(f"/api/v1/research/study/{study_id}/stats").json()
+        assert (stats["active_participants"], stats["withdrawn_participants"]) == (1, 1)
+
+    def test_limits(self):
+        study_id = new_study()
+        assert enrol(study_id, []).status_code == 400
+        assert enrol(study_id, [{}] * (research.CONSENT_BATCH_MAX + 1)).status_code == 400
+        assert enrol(study_id, [{}], privacy_level="public").status_code == 400
+        assert consent_count(study_id) == 0
+
+    def test_all_or_nothing(self, monkeypatch):
+        records = [generate_consent_record() for _ in range(3)]
+        # The third participant collides with the first, so the insert fails
+        records[2] = (records[2][0], records[0][1], records[2][2], records[2][3])
+        monkeypatch.setattr(research, "generate_consent_record", iter(records).__next__)
+
+        study_id = new_study()
+        response = TestClient(app, raise_server_exceptions=False).post(
+            "/api/v1/research/consent/batch", json={"study_id": study_id, "participants": [{}, {}, {}]}
+        )
+        assert response.status_code == 500
+        assert consent_count(study_id) == 0
@@ -0,0 +1,32 @@
+"""
+Tests for deriving sync and async engine URLs from DATABASE_URL.
+"""
+
+import pytest
+
+from app.database import async_database_url, sync_database_url
+
+
+class TestDatabaseUrls:
+    """Test one DATABASE_URL selects both drivers."""
+
+    @pytest.mark.parametrize("url, expected", [
+        ("postgresql://u:p@db:5432/webtics", "postgresql+asyncpg://u:p@db:5432/webtics"),
+        ("postgresql+psycopg2://u:p@db/webtics", "postgresql+asyncpg://u:p@db/webtics"),
+        ("postgresql+asyncpg://u:p@db/webtics", "postgresql+asyncpg://u:p@db/webtics"),
+        ("sqlite:///./test.db", "sqlite+aiosqlite:///./test.db"),
+    ])
+    def test_async_url(self, url, expected):
+        assert async_database_url(url).render_as_string(hide_password=False) == expected
+
+    @pytest.mark.parametrize("url, expected", [
+        ("postgresql+asyncpg://u:p@db/webtics", "postgresql+psycopg2://u:p@db/webtics"),
+        ("sqlite+aiosqlite:///./test.db", "sqlite:///./test.db"),
+        ("postgresql://u:p@db/webtics", "postgresql://u:p@db/webtics"),
+    ])
+    def test_sync_url(self, url, expected):
+        assert sync_database_url(url).render_as_string(hide_password=False) == expected
+
+    def test_unsupported_backend(self):
+        with pytest.raises(ValueError, match="No async driver"):
+            async_database_url("mssql+pyodbc://u:p@dsn")
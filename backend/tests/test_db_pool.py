@@ -0,0 +1,112 @@
+"""
+Tests for connection pool configuration and instrumentation.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.engine import make_url
+
+from app import db_pool
+from app.db_pool import TimedQueuePool, TimedAsyncAdaptedQueuePool, engine_options, instrument
+from app.main import app
+from app.routers.internal import OPERATOR_TOKEN
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05
+    )
+    instrument(engine, "test", max_overflow=1)
+    yield engine
+    engine.dispose()
+    db_pool._pool_stats.pop("test", None)
+    db_pool._engines.pop("test", None)
+
+
+class TestPoolStats:
+    """Test checkout waits, occupancy and overflow are recorded."""
+
+    def test_checkouts_counted(self, engine):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            assert db_pool.pool_state(engine)["checked_out"] == 1
+        stats = engine.pool.stats.stats()
+        assert stats["checkouts"] == 1
+        assert stats["checkins"] == 1
+        assert stats["connects"] == 1
+        assert stats["wait_ms"]["samples"] == 1
+
+    def test_overflow_and_timeout(self, engine):
+        first = engine.connect()
+        second = engine.connect()
+        try:
+            assert db_pool.pool_state(engine)["overflow"] == 1
+            assert db_pool.pool_state(engine)["max_overflow"] == 1
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        finally:
+            first.close()
+            second.close()
+
+        stats = engine.pool.stats.stats()
+        assert stats["timeouts"] == 1
+        assert stats["peak_checked_out"] == 2
+        assert stats["peak_overflow"] == 1
+        assert stats["wait_ms"]["max"] >= 50
+
+    def test_stats_survive_dispose(self, engine):
+        stats = engine.pool.stats
+        engine.dispose()
+        with engine.connect():
+            pass
+        assert engine.pool.stats is stats
+        assert stats.checkouts == 1
+
+    def test_counters_from_many_threads(self, engine):
+        stats = engine.pool.stats
+
+        def bump(_):
+            for _ in range(1000):
+                stats.record_connect()
+                stats.record_checkin()
+                stats.record_invalidation()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(bump, range(8)))
+        counters = stats.stats()
+        assert counters["connects"] == counters["checkins"] == counters["invalidations"] == 8000
+
+
+class TestEngineOptions:
+    """Test pool settings are only applied where SQLAlchemy supports them."""
+
+    def test_postgres_uses_timed_pools(self):
+        sync = engine_options(make_url("postgresql+psycopg2://u@db/webtics"))
+        assert sync["poolclass"] is TimedQueuePool
+        assert sync["pool_size"] == db_pool.POOL_SIZE
+        async_ = engine_options(make_url("postgresql+asyncpg://u@db/webtics"))
+        assert async_["poolclass"] is TimedAsyncAdaptedQueuePool
+
+    def test_sqlite_keeps_default_pool(self):
+        assert engine_options(make_url("sqlite:///./test.db")) == {}
+
+
+class TestPoolEndpoint:
+    """Test the internal pool stats endpoint."""
+
+    def test_reports_both_engines(self):
+        response = client.get("/api/v1/internal/pool", headers={"Authorization": f"Bearer {OPERATOR_TOKEN}"})
+        assert response.status_code == 200
+        body = response.json()
+        assert set(body["engines"]) == {"sync", "async"}
+        assert body["config"]["pool_size"] == db_pool.POOL_SIZE
@@ -0,0 +1,191 @@
+"""
+Tests for the per-event-type validation rule registry.
+"""
+
+import asyncio
+import json
+import os
+import numpy as np
+import pytest
+
+from app.middleware.data_validation import VALIDATION_RULES
+from app.middleware.event_rules import EventRuleRegistry
+
+
+def write_rules(path, event_types, study_id=None):
+    config = {"event_types": event_types}
+    if study_id:
+        config["study_id"] = study_id
+    path.write_text(json.dumps(config))
+    # Make sure the change is visible to mtime-based reload checks
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def columns(**values):
+    n = len(values["event_type"])
+    result = {f: np.full(n, np.nan) for f in ("event_subtype", "x", "y", "z", "magnitude")}
+    for field, column in values.items():
+        result[field] = np.array(column, dtype=np.float64)
+    return result
+
+
+@pytest.fixture
+def base_file(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, {"102": {"fields": {"magnitude": {"rule": "reaction_time_ms"}}}})
+    return path
+
+
+@pytest.fixture
+def registry(base_file, tmp_path):
+    study_dir = tmp_path / "studies"
+    study_dir.mkdir()
+    return EventRuleRegistry(
+        VALIDATION_RULES, 999,
+        path=str(base_file), rules_dir=str(study_dir), reload_interval=0
+    )
+
+
+class TestCompiledRules:
+    """Test vectorized dispatch by event type."""
+
+    def test_rule_applies_only_to_its_type(self, registry):
+        errors = registry.compiled.validate_columns(columns(
+            event_type=[102, 100, 102],
+            magnitude=[500, 50000, 50000],
+        ))
+        assert [e["loc"] for e in errors] == [["body", 2, "magnitude"]]
+        assert errors[0]["type"] == "reaction_time_ms"
+        assert errors[0]["input"] == 50000
+
+    def test_missing_value_passes_unless_required(self, registry):
+        assert registry.compiled.validate_columns(columns(event_type=[102])) == []
+
+    def test_error_limit(self, registry):
+        errors = registry.compiled.validate_columns(
+            columns(event_type=[102] * 500, magnitude=[-1] * 500), limit=10
+        )
+        assert len(errors) == 10
+
+
+class TestStudyRules:
+    """Test studies registering their own types without code changes."""
+
+    def test_study_file_registers_types(self, registry, tmp_path):
+        write_rules(tmp_path / "studies" / "adhd.json", {
+            "200": {"fields": {
+                "magnitude": {"rule": "reaction_time_ms", "required": True},
+                "event_subtype": {"min": 0, "max": 3, "description": "Subtask"},
+            }},
+        }, study_id="ADHD_2026_001")
+        registry.reload()
+
+        errors = registry.compiled.validate_columns(columns(
+            event_type=[200, 200],
+            event_subtype=[1, 7],
+            magnitude=[np.nan, 300],
+        ))
+        assert {(e["loc"][1], e["loc"][2]) for e in errors} == {(0, "magnitude"), (1, "event_subtype")}
+        assert "required" in errors[0]["msg"] or "required" in errors[1]["msg"]
+        assert registry.describe()["event_types"]["200"]["study_id"] == "ADHD_2026_001"
+
+    def test_conflicting_definitions_rejected(self, registry, tmp_path):
+        reaction_time = {"200": {"fields": {"magnitude": {"rule": "reaction_time_ms"}}}}
+        write_rules(tmp_path / "studies" / "a.json", reaction_time, study_id="A")
+        write_rules(tmp_path / "studies" / "b.json", reaction_time, study_id="B")
+        assert registry.reload()["last_error"] is None
+
+        write_rules(tmp_path / "studies" / "b.json", {"200": {"fields": {"magnitude": {"min": 0, "max": 1}}}}, study_id="B")
+        summary = registry.reload()
+        assert "conflicts" in summary["last_error"]
+        # The previous rules stay in place
+        assert summary["event_types"]["200"]["fields"]["magnitude"]["rule"] == "reaction_time_ms"
+
+
+class TestReload:
+    """Test hot reload behaviour."""
+
+    def test_changed_file_picked_up(self, registry, base_file):
+        assert not registry.check_for_changes()
+        write_rules(base_file, {"102": {"fields": {"magnitude": {"min": 0, "max": 100}}}})
+        # Reading the rules does not look at the files
+        assert registry.compiled.validate_columns(columns(event_type=[102], magnitude=[500])) == []
+        assert registry.check_for_changes()
+        errors = registry.compiled.validate_columns(columns(event_type=[102], magnitude=[500]))
+        assert len(errors) == 1
+
+    def test_background_polling(self, registry, base_file):
+        registry.reload_interval = 0.01
+
+        async def scenario():
+            await registry.start()
+            write_rules(base_file, {})
+            await asyncio.sleep(0.2)
+            await registry.stop()
+
+        asyncio.run(scenario())
+        assert registry.compiled.validate_columns(columns(event_type=[102], magnitude=[50000])) == []
+
+    def test_broken_file_keeps_previous_rules(self, registry, base_file):
+        base_file.write_text("{not json")
+        summary = registry.reload()
+        assert summary["last_error"]
+        errors = registry.compiled.validate_columns(columns(event_type=[102], magnitude=[50000]))
+        assert len(errors) == 1
+
+    @pytest.mark.parametrize("config", [
+        [{"event_types": {}}],
+        {"event_types": [102]},
+        {"event_types": {"102": ["magnitude"]}},
+        {"event_types": {"102": {"fields": ["magnitude"]}}},
+        {"event_types": {"102": {"fields": {"magnitude": "reaction_time_ms"}}}},
+        {"event_types": {"102": {"fields": {"magnitude": {"min": "5"}}}}},
+        {"event_types": {"102": {"fields": {"magnitude": {"max": True}}}}},
+        {"event_types": {"102": {"fields": {"magnitude": {"required": "false"}}}}},
+    ])
+    def test_malformed_shape_keeps_previous_rules(self, registry, base_file, config):
+        base_file.write_text(json.dumps(config))
+        stat = base_file.stat()
+        os.utime(base_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        assert registry.check_for_changes() is True
+        assert registry.describe()["last_error"]
+        errors = registry.compiled.validate_columns(columns(event_type=[102], magnitude=[50000]))
+        assert len(errors) == 1
+        # Not retried until the file changes again
+        assert registry.check_for_changes() is False
+
+    def test_malformed_file_at_startup(self, base_file):
+        base_file.write_text(json.dumps({"event_types": [102]}))
+        registry = EventRuleRegistry(VALIDATION_RULES, 999, path=str(base_file), reload_interval=0)
+        assert registry.last_error
+        assert registry.compiled.types == {}
+
+    def test_invalid_rule_reference_rejected(self, registry, base_file):
+        write_rules(base_file, {"102": {"fields": {"magnitude": {"rule": "no_such_rule"}}}})
+        assert "unknown rule" in registry.reload()["last_error"]
+
+    def test_polling_disabled(self, registry, base_file):
+        async def scenario():
+            await registry.start()
+            return registry._task
+
+        assert asyncio.run(scenario()) is None
+        write_rules(base_file, {})
+        errors = registry.compiled.validate_columns(columns(event_type=[102], magnitude=[50000]))
+        assert len(errors) == 1
+
+
+class TestBundledRules:
+    """Test the shipped app/event_rules.json keeps the built-in behaviour."""
+
+    def test_bundled_types(self):
+        registry = EventRuleRegistry(VALIDATION_RULES, 999, rules_dir="", reload_interval=0)
+        assert registry.last_error is None
+        assert set(registry.describe()["event_types"]) == {"102", "103", "104", "105"}
+        errors = registry.compiled.validate_columns(columns(
+            event_type=[102, 104], magnitude=[10001, 101]
+        ))
+        assert [e["type"] for e in errors] == ["reaction_time_ms", "accuracy_percent"]
+
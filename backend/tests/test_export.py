@@ -0,0 +1,134 @@
+"""
+Tests for the streaming participant data export.
+"""
+
+import asyncio
+import gzip
+import json
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+
+from app import models
+from app.database import SessionLocal
+from app.export import gzip_stream
+from app.main import app
+
+from .conftest import create_participant
+
+client = TestClient(app)
+
+
+def export_event(index: int) -> dict:
+    return {"event_type": 100 + index, "x": index, "data": {"i": index}}
+
+
+def export(code: str, **params):
+    return client.get(
+        "/api/v1/research/participant/data",
+        params={"withdrawal_code": code, **params},
+        headers={"Accept-Encoding": "identity"}
+    )
+
+
+class TestExportJson:
+    """Test the nested JSON document keeps its shape."""
+
+    def test_document_shape(self):
+        consent = create_participant("export_study", (3, 0, 2), build="b1", make_event=export_event)
+        response = export(consent["withdrawal_code"])
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+
+        body = response.json()
+        assert body["participant_id"] == consent["participant_id"]
+        assert body["study_id"] == "export_study"
+        assert body["total_sessions"] == 1
+        assert body["total_events"] == 5
+
+        session = body["sessions"][0]
+        assert session["build_number"] == "b1"
+        assert set(session) == {"id", "unique_id", "build_number", "created_at", "closed_at", "play_sessions"}
+        assert [len(ps["events"]) for ps in session["play_sessions"]] == [3, 0, 2]
+        event = session["play_sessions"][0]["events"][0]
+        assert event["event_type"] == 100
+        assert event["data"] == {"i": 0}
+        assert set(event) == {
+            "id", "event_type", "event_subtype", "x", "y", "z", "magnitude", "data", "timestamp"
+        }
+
+    def test_event_before_play_session_start(self):
+        """Events stamped before their play session started (skewed clocks) are exported too."""
+        consent = create_participant("export_study", play_sessions=(1,))
+        play_session_id = consent["play_session_ids"][0]
+        with SessionLocal() as db:
+            started_at = db.get(models.PlaySession, play_session_id).started_at
+            db.add(models.Event(
+                play_session_id=play_session_id, event_type=103, event_subtype=0,
+                timestamp=started_at - timedelta(minutes=10)
+            ))
+            db.commit()
+
+        body = export(consent["withdrawal_code"]).json()
+        assert body["total_events"] == 2
+        events = body["sessions"][0]["play_sessions"][0]["events"]
+        assert sorted(e["event_type"] for e in events) == [102, 103]
+
+    def test_participant_without_sessions(self):
+        consent = client.post("/api/v1/research/consent", json={"study_id": "export_study"}).json()
+        body = export(consent["withdrawal_code"]).json()
+        assert body["sessions"] == []
+        assert body["total_sessions"] == 0
+        assert body["total_events"] == 0
+
+    def test_session_without_play_sessions(self):
+        consent = create_participant("export_study", play_sessions=())
+        body = export(consent["withdrawal_code"]).json()
+        assert body["sessions"][0]["play_sessions"] == []
+
+    def test_invalid_format(self):
+        consent = create_participant("export_study", play_sessions=())
+        assert export(consent["withdrawal_code"], format="xml").status_code == 400
+
+
+class TestExportNdjson:
+    """Test the line-per-record format."""
+
+    def test_records(self):
+        consent = create_participant("export_study", (3, 0, 2), build="b1", make_event=export_event)
+        response = export(consent["withdrawal_code"], format="ndjson")
+        assert response.headers["content-type"] == "application/x-ndjson"
+
+        records = [json.loads(line) for line in response.text.splitlines()]
+        types = [r["type"] for r in records]
+        assert types[0] == "participant"
+        assert types.count("session") == 1
+        assert types.count("play_session") == 3
+        assert types.count("event") == 5
+        assert records[-1] == {"type": "summary", "total_sessions": 1, "total_events": 5}
+
+
+class TestExportGzip:
+    """Test gzip is applied when the client accepts it."""
+
+    def test_gzip_body(self):
+        consent = create_participant("export_study", (3, 0, 2), build="b1", make_event=export_event)
+        response = client.get(
+            "/api/v1/research/participant/data",
+            params={"withdrawal_code": consent["withdrawal_code"]},
+            headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["content-encoding"] == "gzip"
+        # httpx decodes the body transparently
+        assert response.json()["total_events"] == 5
+
+    def test_gzip_stream_roundtrip(self):
+        async def chunks():
+            for i in range(100):
+                yield f"chunk {i}\n".encode()
+
+        async def collect():
+            return b"".join([c async for c in gzip_stream(chunks())])
+
+        data = gzip.decompress(asyncio.run(collect()))
+        assert data == b"".join(f"chunk {i}\n".encode() for i in range(100))
@@ -0,0 +1,259 @@
+"""
+Tests for the heatmap tile pyramid.
+"""
+
+from collections import Counter
+from uuid import uuid4
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select
+
+from app import heatmaps, models, rollups
+from app.database import SessionLocal, engine
+from app.main import app
+
+from .conftest import create_participant
+
+client = TestClient(app)
+
+CELLS = heatmaps.TILE_SIZE * heatmaps.TILE_SIZE
+
+
+def expected_tile(points, zoom: int, tile_x: int, tile_y: int) -> np.ndarray:
+    """Brute-force binning of (x, y) points into one tile."""
+    size = heatmaps.cell_size(zoom)
+    counts = np.zeros(CELLS, dtype=np.int64)
+    for x, y in points:
+        cx, cy = (x - heatmaps.ORIGIN) // size, (y - heatmaps.ORIGIN) // size
+        if (cx // heatmaps.TILE_SIZE, cy // heatmaps.TILE_SIZE) == (tile_x, tile_y):
+            counts[(cy % heatmaps.TILE_SIZE) * heatmaps.TILE_SIZE + cx % heatmaps.TILE_SIZE] += 1
+    return counts
+
+
+def random_points(seed: int, size: int, spread: int = 3000):
+    rng = np.random.default_rng(seed)
+    xy = np.clip(rng.normal(0, spread, (size, 2)).round(), -10000, 10000).astype(int)
+    return [tuple(p) for p in xy.tolist()]
+
+
+def tile_from_rows(rows, zoom: int, tile_x: int, tile_y: int) -> np.ndarray:
+    counts = np.zeros(CELLS, dtype=np.int64)
+    for row in rows:
+        if (row["zoom"], row["tile_x"], row["tile_y"]) == (zoom, tile_x, tile_y):
+            counts[row["cell"]] += row["count"]
+    return counts
+
+
+class TestTally:
+    """Test vectorized binning against brute force."""
+
+    def test_matches_brute_force(self):
+        points = random_points(1, 2000) + [(-10000, -10000), (10000, 10000), (0, 0)]
+        n = len(points)
+        xy = np.array(points)
+        rows = heatmaps.tally(np.arange(n) % 5 + 1, np.full(n, 200), xy[:, 0], xy[:, 1],
+                              {i: ("study", "1.0") for i in range(1, 6)})
+
+        for zoom in range(heatmaps.HEATMAP_MAX_ZOOM + 1):
+            assert sum(r["count"] for r in rows if r["zoom"] == zoom) == n
+        for zoom, tile_x, tile_y in [(0, 0, 0), (1, 1, 1), (1, 0, 0), (heatmaps.HEATMAP_MAX_ZOOM, 20, 20)]:
+            assert np.array_equal(tile_from_rows(rows, zoom, tile_x, tile_y), expected_tile(points, zoom, tile_x, tile_y))
+
+    def test_levels_nest(self):
+        points = random_points(2, 3000)
+        xy = np.array(points)
+        rows = heatmaps.tally(np.ones(len(points), dtype=int), np.full(len(points), 200), xy[:, 0], xy[:, 1],
+                              {1: ("", "")})
+        parent = tile_from_rows(rows, 0, 0, 0).reshape(64, 64)
+        child = np.zeros((128, 128), dtype=np.int64)
+        for tile_x in range(2):
+            for tile_y in range(2):
+                child[tile_y * 64:(tile_y + 1) * 64, tile_x * 64:(tile_x + 1) * 64] = \
+                    tile_from_rows(rows, 1, tile_x, tile_y).reshape(64, 64)
+        # Each zoom 0 cell is the sum of its 2x2 zoom 1 cells
+        assert np.array_equal(parent, child.reshape(64, 2, 64, 2).sum(axis=(1, 3)))
+
+    def test_rows_are_sharded_and_sorted(self):
+        rows = heatmaps.tally(np.array([1, 2, 9]), np.array([200, 200, 200]),
+                              np.array([0, 0, 0]), np.array([0, 0, 0]), {1: ("s", ""), 2: ("s", ""), 9: ("s", "")})
+        shards = Counter(ps % heatmaps.HEATMAP_SHARDS for ps in (1, 2, 9))
+        assert [(r["shard"], r["count"]) for r in rows if r["zoom"] == 0] == sorted(shards.items())
+        keys = [tuple(r[c] for c in ("study_id", "zoom", "tile_x", "tile_y", "event_type", "build", "cell", "shard"))
+                for r in rows]
+        assert keys == sorted(keys)
+
+    def test_weighted_matches_repeated_points(self):
+        points = random_points(3, 500, spread=50)
+        grouped = Counter(points)
+        unique = list(grouped)
+        labels = {1: ("study", "")}
+        repeated = heatmaps.tally_points([(1, 200, x, y) for x, y in points], labels)
+        weighted = heatmaps.tally_points([(1, 200, x, y, grouped[(x, y)]) for x, y in unique], labels, weighted=True)
+        assert weighted == repeated
+
+
+def log_points(play_session_id: int, points, event_type: int = 200) -> None:
+    events = [{"event_type": event_type, "x": x, "y": y} for x, y in points]
+    response = client.post(f"/api/v1/events/batch?play_session_id={play_session_id}", json=events)
+    assert response.status_code == 200
+
+
+def get_tile(study_id: str, zoom=0, tile_x=0, tile_y=0, **params) -> dict:
+    response = client.get(f"/api/v1/heatmaps/tiles/{zoom}/{tile_x}/{tile_y}", params={"study_id": study_id, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def cell_rows(study_id: str) -> list:
+    with SessionLocal() as db:
+        return db.execute(
+            select(models.HeatmapCell.zoom, models.HeatmapCell.tile_x, models.HeatmapCell.tile_y,
+                   models.HeatmapCell.event_type, models.HeatmapCell.build, models.HeatmapCell.cell,
+                   models.HeatmapCell.shard, models.HeatmapCell.count)
+            .where(models.HeatmapCell.study_id == study_id)
+            .order_by(*models.HeatmapCell.__table__.primary_key.columns)
+        ).all()
+
+
+class TestHeatmapEndpoints:
+    """Test tiles maintained at ingest."""
+
+    def test_tiles_and_filters(self):
+        study_id = f"heat_{uuid4().hex}"
+        first = create_participant(study_id, build="1.0")["play_session_ids"][0]
+        second = create_participant(study_id, build="2.0")["play_session_ids"][0]
+        a, b = random_points(3, 400), random_points(4, 300)
+        log_points(first, a[:200])
+        log_points(first, a[200:])
+        log_points(second, b, event_type=201)
+
+        tile = get_tile(study_id)
+        assert tile["total"] == 700
+        assert tile["bounds"] == [-10000, -10000, -10000 + 32768, -10000 + 32768]
+        assert np.array_equal(tile["counts"], expected_tile(a + b, 0, 0, 0))
+        assert tile["max"] == max(tile["counts"])
+
+        assert np.array_equal(get_tile(study_id, event_type=200)["counts"], expected_tile(a, 0, 0, 0))
+        assert np.array_equal(get_tile(study_id, build="2.0")["counts"], expected_tile(b, 0, 0, 0))
+        assert get_tile(study_id, event_type=200, build="2.0")["total"] == 0
+
+        zoom = heatmaps.HEATMAP_MAX_ZOOM
+        tile_x = (0 - heatmaps.ORIGIN) // heatmaps.cell_size(zoom) // heatmaps.TILE_SIZE
+        deep = get_tile(study_id, zoom, tile_x, tile_x)
+        assert np.array_equal(deep["counts"], expected_tile(a + b, zoom, tile_x, tile_x))
+
+        info = client.get("/api/v1/heatmaps", params={"study_id": study_id}).json()
+        assert info["max_zoom"] == heatmaps.HEATMAP_MAX_ZOOM
+        assert [(layer["event_type"], layer["build"], layer["count"]) for layer in info["layers"]] == [(200, "1.0", 400), (201, "2.0", 300)]
+
+    def test_binary_format(self):
+        study_id = f"heat_{uuid4().hex}"
+        play_session_id = create_participant(study_id, build="1.0")["play_session_ids"][0]
+        log_points(play_session_id, random_points(5, 100))
+        response = client.get("/api/v1/heatmaps/tiles/0/0/0", params={"study_id": study_id, "format": "binary"})
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert len(response.content) == CELLS * 4
+        counts = np.frombuffer(response.content, dtype="<u4")
+        assert counts.tolist() == get_tile(study_id)["counts"]
+        assert response.headers["x-heatmap-total"] == "100"
+
+    def test_invalid_tiles(self):
+        assert client.get("/api/v1/heatmaps/tiles/1/2/0").status_code == 404
+        assert client.get(f"/api/v1/heatmaps/tiles/{heatmaps.HEATMAP_MAX_ZOOM + 1}/0/0").status_code == 422
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(heatmaps, "HEATMAPS_ENABLED", False)
+        assert client.get("/api/v1/heatmaps/tiles/0/0/0").status_code == 404
+
+    def test_cache_invalidated_by_ingest(self):
+        study_id = f"heat_{uuid4().hex}"
+        play_session_id = create_participant(study_id, build="1.0")["play_session_ids"][0]
+        log_points(play_session_id, [(0, 0)])
+        assert get_tile(study_id)["total"] == 1
+        hits = heatmaps.tile_cache.hits
+        assert get_tile(study_id)["total"] == 1
+        assert heatmaps.tile_cache.hits == hits + 1
+
+        log_points(play_session_id, [(5, 5), (-9000, 9000)])
+        assert get_tile(study_id)["total"] == 3
+        client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 200, "x": 1, "y": 1})
+        assert get_tile(study_id)["total"] == 4
+
+    def test_sessions_without_consent(self):
+        build = f"nostudy_{uuid4().hex[:8]}"
+        session_id = client.post("/api/v1/sessions", json={"unique_id": f"heat_{uuid4().hex}", "build_number": build}).json()["id"]
+        play_session_id = client.post("/api/v1/play-sessions", json={"metric_session_id": session_id}).json()["id"]
+        log_points(play_session_id, [(10, 10), (20, 20)])
+        assert get_tile("", build=build)["total"] == 2
+
+
+class TestHeatmapMaintenance:
+    """Test deletion and rebuild keep the pyramid consistent with events."""
+
+    def test_withdrawal_subtracts_events(self):
+        study_id = f"heat_{uuid4().hex}"
+        consent = create_participant(study_id, build="1.0")
+        withdrawn = consent["play_session_ids"][0]
+        kept = create_participant(study_id, build="1.0")["play_session_ids"][0]
+        log_points(withdrawn, random_points(6, 300))
+        kept_points = random_points(7, 200)
+        log_points(kept, kept_points)
+        assert get_tile(study_id)["total"] == 500
+
+        response = client.post("/api/v1/research/withdraw", json={"withdrawal_code": consent["withdrawal_code"]})
+        assert response.status_code == 200
+        tile = get_tile(study_id)
+        assert np.array_equal(tile["counts"], expected_tile(kept_points, 0, 0, 0))
+        # Cells only the withdrawn participant had are gone, not left at zero
+        assert all(row.count > 0 for row in cell_rows(study_id))
+
+    def test_retention_style_chunked_delete(self):
+        study_id = f"heat_{uuid4().hex}"
+        play_session_id = create_participant(study_id, build="1.0")["play_session_ids"][0]
+        log_points(play_session_id, random_points(8, 50))
+        assert get_tile(study_id)["total"] == 50
+
+        with engine.begin() as conn:
+            batch = select(models.Event.id).where(models.Event.play_session_id == play_session_id).limit(30)
+            points = conn.execute(
+                delete(models.Event).where(models.Event.id.in_(batch)).returning(*heatmaps.POINT_COLUMNS)
+            ).all()
+            rollups.forget_heatmap_points(conn, points)
+        assert get_tile(study_id)["total"] == 20
+
+    def test_dropped_partition_subtracted(self):
+        study_id = f"heat_{uuid4().hex}"
+        dropped = create_participant(study_id, build="1.0")["play_session_ids"][0]
+        kept = create_participant(study_id, build="1.0")["play_session_ids"][0]
+        log_points(dropped, random_points(9, 200, spread=5))
+        kept_points = random_points(10, 100)
+        log_points(kept, kept_points)
+
+        # Stand-in for a detached partition holding only the dropped session's events
+        scratch = f"events_drop_{uuid4().hex[:8]}"
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"CREATE TABLE {scratch} AS SELECT * FROM events WHERE play_session_id = {dropped}")
+            conn.execute(delete(models.Event).where(models.Event.play_session_id == dropped))
+            points = conn.execute(heatmaps.partition_points_query(scratch)).all()
+            assert len(points) < 200
+            rollups.forget_heatmap_points(conn, points, weighted=True)
+            conn.exec_driver_sql(f"DROP TABLE {scratch}")
+
+        assert np.array_equal(get_tile(study_id)["counts"], expected_tile(kept_points, 0, 0, 0))
+        assert all(row.count > 0 for row in cell_rows(study_id))
+
+    def test_rebuild_matches_incremental(self):
+        study_id = f"heat_{uuid4().hex}"
+        ids = [create_participant(study_id, build=build)["play_session_ids"][0] for build in ("1.0", "1.0", "2.0")]
+        for seed, play_session_id in enumerate(ids):
+            log_points(play_session_id, random_points(seed, 150))
+            log_points(play_session_id, random_points(seed + 10, 50), event_type=201)
+        incremental = cell_rows(study_id)
+
+        rollups.rebuild(engine, chunk=2)
+        assert cell_rows(study_id) == incremental
+        with SessionLocal() as db:
+            assert db.execute(select(func.count()).select_from(models.HeatmapCell).where(
+                models.HeatmapCell.count <= 0
+            )).scalar() == 0
@@ -0,0 +1,147 @@
+"""
+Tests for the write-behind ingestion queue.
+"""
+
+import asyncio
+import json
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.schemas import EventCreate
+from app.ingest_queue import WriteBehindQueue, QueueFullError
+from app.live_hub import LiveHub
+
+
+@pytest.fixture
+def session_factory():
+    """In-memory database shared across the flusher thread."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+
+    db = factory()
+    metric_session = models.MetricSession(unique_id="queue_test")
+    db.add(metric_session)
+    db.flush()
+    db.add(models.PlaySession(id=1, metric_session_id=metric_session.id))
+    db.commit()
+    db.close()
+    return factory
+
+
+def count_events(factory) -> int:
+    db = factory()
+    try:
+        return db.query(models.Event).count()
+    finally:
+        db.close()
+
+
+class TestWriteBehindQueue:
+    """Test batching, bounding and shutdown behaviour."""
+
+    def test_flush_on_batch_size(self, session_factory):
+        """Reaching the batch size triggers a flush before the interval."""
+        queue = WriteBehindQueue(session_factory, max_size=100, batch_size=5, flush_interval=60)
+
+        async def scenario():
+            await queue.start()
+            for i in range(5):
+                queue.enqueue(1, EventCreate(event_type=100, magnitude=float(i)))
+            for _ in range(100):
+                if queue.events_flushed == 5:
+                    break
+                await asyncio.sleep(0.01)
+            flushed = queue.events_flushed
+            await queue.stop()
+            return flushed
+
+        assert asyncio.run(scenario()) == 5
+        assert count_events(session_factory) == 5
+        assert queue.stats()["last_batch_size"] == 5
+
+    def test_flush_on_interval(self, session_factory):
+        """A partial batch is flushed once the interval elapses."""
+        queue = WriteBehindQueue(session_factory, max_size=100, batch_size=50, flush_interval=0.05)
+
+        async def scenario():
+            await queue.start()
+            queue.enqueue(1, EventCreate(event_type=100))
+            await asyncio.sleep(0.3)
+            flushed = queue.events_flushed
+            await queue.stop()
+            return flushed
+
+        assert asyncio.run(scenario()) == 1
+
+    def test_stop_drains_queue(self, session_factory):
+        """Shutdown flushes everything still queued."""
+        queue = WriteBehindQueue(session_factory, max_size=100, batch_size=4, flush_interval=60)
+
+        async def scenario():
+            await queue.start()
+            for _ in range(10):
+                queue.enqueue(1, EventCreate(event_type=101))
+            await queue.stop()
+
+        asyncio.run(scenario())
+        assert count_events(session_factory) == 10
+        assert queue.depth == 0
+        assert queue.stats()["max_batch_size"] <= 4
+
+    def test_queue_is_bounded(self, session_factory):
+        """Events beyond max_size are rejected, not buffered."""
+        queue = WriteBehindQueue(session_factory, max_size=3, batch_size=100, flush_interval=60)
+
+        async def scenario():
+            await queue.start()
+            for _ in range(3):
+                queue.enqueue(1, EventCreate(event_type=100))
+            with pytest.raises(QueueFullError):
+                queue.enqueue(1, EventCreate(event_type=100))
+            await queue.stop()
+
+        asyncio.run(scenario())
+        assert queue.events_rejected == 1
+        assert count_events(session_factory) == 3
+
+    def test_events_of_deleted_play_sessions_dropped(self, session_factory):
+        """A deleted play session's events fail the foreign key; the rest of the batch is written."""
+        with session_factory.kw["bind"].connect() as conn:
+            conn.exec_driver_sql("PRAGMA foreign_keys = ON")
+        queue = WriteBehindQueue(session_factory, max_size=100, batch_size=10, flush_interval=60)
+
+        async def scenario():
+            await queue.start()
+            for play_session_id in (1, 999, 1):
+                queue.enqueue(play_session_id, EventCreate(event_type=100))
+            await queue.stop()
+
+        asyncio.run(scenario())
+        assert count_events(session_factory) == 2
+        assert queue.events_flushed == 2
+        assert queue.events_failed == 1
+
+    def test_live_events_published_after_commit(self, session_factory):
+        """Subscribers see queued events only once their flush has committed."""
+        hub = LiveHub()
+        queue = WriteBehindQueue(session_factory, max_size=100, batch_size=10, flush_interval=60, hub=hub)
+
+        async def scenario():
+            subscription = hub.subscribe(metric_session_id=7)
+            await queue.start()
+            queue.enqueue(1, EventCreate(event_type=100, x=1.0), metric_session_id=7)
+            queued = await subscription.get(timeout=0.05)
+            await queue.stop()
+            return queued, await subscription.get(timeout=1)
+
+        queued, flushed = asyncio.run(scenario())
+        assert queued is None
+        assert [e["x"] for e in json.loads(flushed)] == [1.0]
@@ -0,0 +1,192 @@
+"""
+Tests for the live event hub and its SSE streams.
+"""
+
+import asyncio
+import json
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.live_hub import LiveHub, TooManySubscribersError, live_hub, sse_stream
+from app.main import app
+
+client = TestClient(app)
+
+
+def rows(count: int, start: int = 0) -> list:
+    return [
+        {"play_session_id": 1, "event_type": 100, "x": float(start + i), "timestamp": datetime(2024, 1, 1)}
+        for i in range(count)
+    ]
+
+
+class TestLiveHub:
+    """Test fan-out, buffering and slow-consumer dropping."""
+
+    def test_routes_by_topic(self):
+        async def scenario():
+            hub = LiveHub()
+            by_session = hub.subscribe(metric_session_id=10)
+            by_play_session = hub.subscribe(play_session_id=1)
+            other = hub.subscribe(metric_session_id=11)
+
+            assert hub.publish(1, 10, rows(2)) == 2
+            assert hub.has_subscribers(1, 99)
+            assert not hub.has_subscribers(2, 12)
+
+            events = json.loads(await by_session.get(timeout=1))
+            assert [e["x"] for e in events] == [0.0, 1.0]
+            assert events[0]["id"] is None
+            assert events[0]["timestamp"] == "2024-01-01T00:00:00"
+            assert json.loads(await by_play_session.get(timeout=1)) == events
+            assert await other.get(timeout=0.01) is None
+
+        asyncio.run(scenario())
+
+    def test_slow_subscriber_is_dropped(self):
+        async def scenario():
+            hub = LiveHub(buffer_events=5)
+            slow = hub.subscribe(metric_session_id=1)
+            fast = hub.subscribe(metric_session_id=1)
+
+            hub.publish(1, 1, rows(3))
+            await fast.get(timeout=1)
+            # The second batch no longer fits the slow subscriber's buffer
+            assert hub.publish(1, 1, rows(3)) == 1
+            assert slow.dropped and not fast.dropped
+            assert hub.stats()["subscribers_dropped"] == 1
+            with pytest.raises(OverflowError):
+                await slow.get(timeout=1)
+            assert len(json.loads(await fast.get(timeout=1))) == 3
+
+        asyncio.run(scenario())
+
+    def test_subscriber_limit(self):
+        async def scenario():
+            hub = LiveHub(max_subscribers=1)
+            subscription = hub.subscribe(metric_session_id=1)
+            with pytest.raises(TooManySubscribersError):
+                hub.subscribe(metric_session_id=2)
+            hub.unsubscribe(subscription)
+            hub.unsubscribe(subscription)
+            assert hub.subscriber_count == 0
+            hub.subscribe(metric_session_id=2)
+
+        asyncio.run(scenario())
+
+    def test_publish_from_another_thread(self):
+        async def scenario():
+            hub = LiveHub()
+            subscription = hub.subscribe(play_session_id=3)
+            await asyncio.to_thread(hub.publish, 3, 1, rows(1))
+            return await subscription.get(timeout=1)
+
+        assert json.loads(asyncio.run(scenario()))[0]["event_type"] == 100
+
+    def test_sse_stream(self):
+        async def scenario():
+            hub = LiveHub(buffer_events=2)
+            subscription = hub.subscribe(metric_session_id=1)
+            stream = sse_stream(hub, subscription, keepalive=0.01)
+            messages = [await stream.__anext__()]
+            messages.append(await stream.__anext__())
+            hub.publish(1, 1, rows(1))
+            messages.append(await stream.__anext__())
+            hub.publish(1, 1, rows(3))
+            messages.extend([message async for message in stream])
+            return messages, hub.subscriber_count
+
+        messages, remaining = asyncio.run(scenario())
+        assert messages[0].startswith(b"retry:")
+        assert messages[1] == b": keepalive\n\n"
+        assert messages[2].startswith(b"event: events\ndata: [")
+        assert messages[3] == b"event: overflow\ndata: {}\n\n"
+        assert remaining == 0
+
+
+class TestThousandSubscribers:
+    """Fan-out to 1,000 simulated dashboard subscribers."""
+
+    SUBSCRIBERS = 1000
+    BATCHES = 50
+    BATCH_SIZE = 20
+
+    def test_fan_out(self):
+        async def scenario():
+            hub = LiveHub(max_subscribers=self.SUBSCRIBERS + 1, buffer_events=self.BATCHES * self.BATCH_SIZE)
+            # Spread over ten sessions, half following single play sessions
+            subscriptions = [
+                hub.subscribe(metric_session_id=i % 10) if i % 2 else hub.subscribe(play_session_id=i % 10)
+                for i in range(self.SUBSCRIBERS)
+            ]
+            # Never reads, and only has room for a few batches
+            stalled = hub.subscribe(metric_session_id=0)
+            stalled.max_events = 5 * self.BATCH_SIZE
+
+            async def consume(subscription):
+                received = []
+                while len(received) < self.BATCHES * self.BATCH_SIZE:
+                    received.extend(json.loads(await subscription.get(timeout=5)))
+                return received
+
+            consumers = [asyncio.create_task(consume(s)) for s in subscriptions]
+            for batch in range(self.BATCHES):
+                for play_session_id in range(10):
+                    hub.publish(play_session_id, play_session_id, rows(self.BATCH_SIZE, batch * self.BATCH_SIZE))
+                await asyncio.sleep(0)
+            return await asyncio.gather(*consumers), stalled, hub
+
+        results, stalled, hub = asyncio.run(scenario())
+        expected = [float(i) for i in range(self.BATCHES * self.BATCH_SIZE)]
+        assert all([e["x"] for e in received] == expected for received in results)
+        assert stalled.dropped
+        assert hub.stats()["subscribers_dropped"] == 1
+
+
+class TestLiveEndpoints:
+    """Test ingest publishes to subscribers and the stream endpoints."""
+
+    @pytest.fixture
+    def play_session(self):
+        session_id = client.post("/api/v1/sessions", json={"unique_id": f"live_{uuid4().hex}"}).json()["id"]
+        play_session_id = client.post(
+            "/api/v1/play-sessions", json={"metric_session_id": session_id}
+        ).json()["id"]
+        return session_id, play_session_id
+
+    def test_ingest_publishes(self, play_session):
+        session_id, play_session_id = play_session
+
+        async def scenario():
+            subscription = live_hub.subscribe(metric_session_id=session_id)
+            try:
+                await asyncio.to_thread(
+                    client.post, f"/api/v1/events/batch?play_session_id={play_session_id}",
+                    json=[{"event_type": 100, "x": 1}, {"event_type": 101}]
+                )
+                await asyncio.to_thread(
+                    client.post, f"/api/v1/events?play_session_id={play_session_id}",
+                    json={"event_type": 102}
+                )
+                return [json.loads(await subscription.get(timeout=2)) for _ in range(2)]
+            finally:
+                live_hub.unsubscribe(subscription)
+
+        batch, single = asyncio.run(scenario())
+        assert [e["event_type"] for e in batch] == [100, 101]
+        assert batch[0]["play_session_id"] == play_session_id
+        assert single[0]["event_type"] == 102
+        assert single[0]["id"] is not None
+
+    def test_unknown_session(self):
+        assert client.get("/api/v1/sessions/999999/events/stream").status_code == 404
+        assert client.get("/api/v1/play-sessions/999999/events/stream").status_code == 404
+
+    def test_full_hub(self, play_session, monkeypatch):
+        monkeypatch.setattr(live_hub, "max_subscribers", 0)
+        response = client.get(f"/api/v1/sessions/{play_session[0]}/events/stream")
+        assert response.status_code == 503
+        assert "retry-after" in response.headers
@@ -0,0 +1,135 @@
+"""
+Tests for the Prometheus metrics registry, middleware and /metrics endpoint.
+"""
+
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.main import app
+from app.middleware.admission import admission_controller
+
+client = TestClient(app)
+
+UNKNOWN_CODE = "WC-00000000-0000-0000-0000-000000000000"
+
+
+def samples(text: str) -> dict:
+    """Sample lines of a text exposition, keyed by name and labels."""
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            key, value = line.rsplit(" ", 1)
+            result[key] = float(value)
+    return result
+
+
+class TestRegistry:
+    """Test the text exposition format."""
+
+    def test_counter_and_histogram(self):
+        registry = metrics.Registry()
+        counter = registry.counter("requests_total", "Requests.", ("path",))
+        counter.inc(('say "hi"\\',))
+        counter.inc(('say "hi"\\',), 2)
+        histogram = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, ("/a",))
+
+        text = registry.render()
+        assert "# TYPE requests_total counter" in text
+        assert "# TYPE latency_seconds histogram" in text
+        assert samples(text) == {
+            'requests_total{path="say \\"hi\\"\\\\"}': 3,
+            'latency_seconds_bucket{route="/a",le="0.1"}': 2,
+            'latency_seconds_bucket{route="/a",le="1"}': 3,
+            'latency_seconds_bucket{route="/a",le="+Inf"}': 4,
+            'latency_seconds_sum{route="/a"}': 3.65,
+            'latency_seconds_count{route="/a"}': 4,
+        }
+        with pytest.raises(ValueError):
+            registry.counter("requests_total", "Again.")
+
+    def test_callbacks(self):
+        registry = metrics.Registry()
+        registry.gauge_function("depth", "Depth.", lambda: 7)
+        registry.counter_function("refused_total", "Refused.", lambda: {("queue",): 2}, ("reason",))
+        registry.gauge_function("broken", "Broken.", lambda: 1 / 0)
+
+        text = registry.render()
+        assert samples(text) == {"depth": 7, 'refused_total{reason="queue"}': 2}
+        assert "# TYPE refused_total counter" in text
+        # A failing callback is left out rather than failing the scrape
+        assert "broken" not in text
+
+
+class TestMiddleware:
+    """Test requests are recorded by route template, status and DB time."""
+
+    @pytest.fixture
+    def play_session_id(self):
+        session_id = client.post("/api/v1/sessions", json={"unique_id": f"met_{uuid4().hex}"}).json()["id"]
+        return client.post("/api/v1/play-sessions", json={"metric_session_id": session_id}).json()["id"]
+
+    def test_route_templates_and_db_time(self, play_session_id):
+        route = ("GET", "/api/v1/sessions/{session_id}/events")
+        before = metrics.request_duration.count(route + ("200",))
+        db_before = metrics.request_db_time.count(route)
+        queries_before = metrics.request_db_queries.value(route)
+
+        for session_id in (play_session_id, play_session_id + 1):
+            assert client.get(f"/api/v1/sessions/{session_id}/events").status_code == 200
+        assert metrics.request_duration.count(route + ("200",)) == before + 2
+        assert metrics.request_db_time.count(route) == db_before + 2
+        assert metrics.request_db_queries.value(route) >= queries_before + 4
+
+        unmatched = ("GET", metrics.UNMATCHED_ROUTE, "404")
+        before = metrics.request_duration.count(unmatched)
+        client.get(f"/no/such/{uuid4().hex}")
+        assert metrics.request_duration.count(unmatched) == before + 1
+
+    def test_admission_refusals_keep_their_route(self, play_session_id, monkeypatch):
+        monkeypatch.setattr(admission_controller, "max_in_flight", 0)
+        labels = ("POST", "/api/v1/events", "429")
+        before = metrics.request_duration.count(labels)
+        client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 1})
+        assert metrics.request_duration.count(labels) == before + 1
+
+    def test_ingest_and_validation(self, play_session_id):
+        ingested = metrics.events_ingested.value(("batch",))
+        batches = metrics.ingest_batch_events.count(("batch",))
+        coordinates = metrics.validation_failures.value(("coordinates",))
+        schema = metrics.validation_failures.value(("schema",))
+
+        url = f"/api/v1/events/batch?play_session_id={play_session_id}"
+        assert client.post(url, json=[{"event_type": 1}] * 3).status_code == 200
+        assert client.post(url, json=[{"event_type": 1, "x": 99999, "y": -99999}]).status_code == 400
+        assert client.post(url, json=[{"event_type": "not a number"}]).status_code == 422
+
+        assert metrics.events_ingested.value(("batch",)) == ingested + 3
+        assert metrics.ingest_batch_events.count(("batch",)) == batches + 1
+        assert metrics.validation_failures.value(("coordinates",)) == coordinates + 2
+        assert metrics.validation_failures.value(("schema",)) == schema + 1
+
+    def test_withdrawal_lookup(self):
+        before = metrics.withdrawal_lookup_duration.count(("indexed",))
+        client.post("/api/v1/research/withdraw", json={"withdrawal_code": UNKNOWN_CODE})
+        assert metrics.withdrawal_lookup_duration.count(("indexed",)) == before + 1
+
+
+class TestEndpoint:
+    """Test /metrics serves the registry in Prometheus text format."""
+
+    def test_metrics(self):
+        client.get("/")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+        assert samples(response.text)[
+            'webtics_http_request_duration_seconds_count{method="GET",route="/",status="200"}'
+        ] >= 1
+        assert "# TYPE webtics_ingest_queue_depth gauge" in response.text
+        assert "webtics_db_pool_checked_out{pool=\"async\"}" in response.text
+        assert "webtics_code_attempt_global_alerts_total" in samples(response.text)
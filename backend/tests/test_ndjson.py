@@ -0,0 +1,114 @@
+"""
+Tests for streaming NDJSON event ingestion.
+"""
+
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.ndjson import iter_ndjson_lines
+from uuid import uuid4
+
+client = TestClient(app)
+
+NDJSON_HEADERS = {"Content-Type": "application/x-ndjson"}
+
+
+def collect_lines(chunks, max_line_bytes=1024):
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [item async for item in iter_ndjson_lines(source(), max_line_bytes)]
+
+    return asyncio.run(collect())
+
+
+@pytest.fixture
+def play_session_id():
+    session = client.post(
+        "/api/v1/sessions",
+        json={"unique_id": f"ndjson_{uuid4().hex}", "build_number": "1.0"}
+    ).json()
+    play_session = client.post(
+        "/api/v1/play-sessions",
+        json={"metric_session_id": session["id"]}
+    ).json()
+    return play_session["id"]
+
+
+class TestLineSplitting:
+    """Test incremental line splitting across chunk boundaries."""
+
+    def test_lines_split_across_chunks(self):
+        lines = collect_lines([b'{"a":', b' 1}\n{"b"', b': 2}\n'])
+        assert lines == [(1, b'{"a": 1}'), (2, b'{"b": 2}')]
+
+    def test_final_line_without_newline(self):
+        assert collect_lines([b'{"a": 1}\n{"b": 2}']) == [(1, b'{"a": 1}'), (2, b'{"b": 2}')]
+
+    def test_blank_lines_skipped_but_counted(self):
+        assert collect_lines([b'\n\n{"a": 1}\n']) == [(3, b'{"a": 1}')]
+
+    def test_oversized_line_reported_as_none(self):
+        lines = collect_lines([b'{"a": "' + b"x" * 50, b'"}\n{"b": 2}\n'], max_line_bytes=20)
+        assert lines == [(1, None), (2, b'{"b": 2}')]
+
+
+class TestNdjsonEndpoint:
+    """Test the /api/v1/events/ndjson endpoint."""
+
+    def test_valid_stream(self, play_session_id):
+        body = "\n".join(
+            json.dumps({"event_type": 102, "magnitude": 300.0 + i}) for i in range(25)
+        )
+        response = client.post(
+            f"/api/v1/events/ndjson?play_session_id={play_session_id}",
+            content=body,
+            headers=NDJSON_HEADERS
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert result["status"] == "success"
+        assert result["events_logged"] == 25
+        assert result["lines_rejected"] == 0
+
+    def test_invalid_lines_reported_individually(self, play_session_id):
+        body = "\n".join([
+            json.dumps({"event_type": 100}),
+            "not-json",
+            json.dumps({"event_type": 102, "magnitude": 999999}),
+            json.dumps({"event_type": "abc"}),
+            json.dumps([1, 2, 3]),
+            json.dumps({"event_type": 101}),
+        ])
+        response = client.post(
+            f"/api/v1/events/ndjson?play_session_id={play_session_id}",
+            content=body,
+            headers=NDJSON_HEADERS
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert result["status"] == "partial"
+        assert result["events_logged"] == 2
+        assert result["lines_rejected"] == 4
+        assert [e["line"] for e in result["errors"]] == [2, 3, 4, 5]
+        assert "outside valid range" in result["errors"][1]["error"]
+
+    def test_wrong_content_type_rejected(self, play_session_id):
+        response = client.post(
+            f"/api/v1/events/ndjson?play_session_id={play_session_id}",
+            content=b'{"event_type": 100}',
+            headers={"Content-Type": "text/plain"}
+        )
+        assert response.status_code == 415
+
+    def test_unknown_play_session(self):
+        response = client.post(
+            "/api/v1/events/ndjson?play_session_id=999999",
+            content=b'{"event_type": 100}\n',
+            headers=NDJSON_HEADERS
+        )
+        assert response.status_code == 404
@@ -0,0 +1,176 @@
+"""
+Tests for keyset-paginated session event reads.
+"""
+
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+
+from app import models
+from app.database import SessionLocal
+from app.main import app
+from app.pagination import decode_cursor, encode_cursor, session_events_query, session_version_query
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def session_with_events():
+    """A metric session with two play sessions; batches share timestamps."""
+    session_id = client.post("/api/v1/sessions", json={"unique_id": f"pages_{uuid4().hex}"}).json()["id"]
+    for _ in range(2):
+        play_session_id = client.post(
+            "/api/v1/play-sessions", json={"metric_session_id": session_id}
+        ).json()["id"]
+        client.post(
+            f"/api/v1/events/batch?play_session_id={play_session_id}",
+            json=[{"event_type": 100, "x": i} for i in range(12)]
+        )
+    return session_id
+
+
+class TestCursor:
+    """Test cursor encoding."""
+
+    def test_roundtrip(self):
+        ts = datetime(2024, 5, 1, 12, 30, 45, 123456)
+        assert decode_cursor(encode_cursor(ts, 42)) == (ts, 42)
+
+    @pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(datetime(2024, 1, 1), 1)[:-3]])
+    def test_malformed(self, cursor):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+class TestSessionEventPages:
+    """Test paging through a session's events."""
+
+    def test_pages_cover_all_events_once(self, session_with_events):
+        url = f"/api/v1/sessions/{session_with_events}/events"
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 5, **({"cursor": cursor} if cursor else {})}
+            response = client.get(url, params=params)
+            assert response.status_code == 200
+            seen.extend((e["timestamp"], e["id"]) for e in response.json())
+            pages += 1
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+            assert 'rel="next"' in response.headers["link"]
+
+        assert len(seen) == 24
+        assert len(set(seen)) == 24
+        # Newest first, ties on timestamp broken by id
+        assert seen == sorted(seen, reverse=True)
+        assert pages == 5
+
+    def test_no_cursor_on_last_page(self, session_with_events):
+        response = client.get(f"/api/v1/sessions/{session_with_events}/events", params={"limit": 100})
+        assert len(response.json()) == 24
+        assert "x-next-cursor" not in response.headers
+
+    def test_invalid_cursor(self, session_with_events):
+        response = client.get(f"/api/v1/sessions/{session_with_events}/events", params={"cursor": "bogus"})
+        assert response.status_code == 400
+
+    def test_limit_bounds(self, session_with_events):
+        url = f"/api/v1/sessions/{session_with_events}/events"
+        assert client.get(url, params={"limit": 0}).status_code == 422
+        assert client.get(url, params={"limit": 100000}).status_code == 422
+
+    def test_unknown_session(self):
+        assert client.get("/api/v1/sessions/999999/events").json() == []
+
+
+class TestPostgresQuery:
+    """Test the PostgreSQL query shape."""
+
+    def test_lateral_per_play_session(self):
+        query = session_events_query(1, 50, "postgresql", before=(datetime(2024, 1, 1), 10))
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        assert "LATERAL" in sql
+        assert "(events.timestamp, events.id) <" in sql
+
+    def test_version_includes_highest_id(self):
+        query = session_version_query(1, "postgresql")
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        assert sql.count("LATERAL") == 2
+        assert "max(events.id)" in sql
+
+
+class TestIncrementalReads:
+    """Test since_id / since_timestamp and ETag revalidation."""
+
+    def test_since_id_returns_only_newer(self, session_with_events):
+        url = f"/api/v1/sessions/{session_with_events}/events"
+        events = client.get(url, params={"limit": 100}).json()
+        newest = max(e["id"] for e in events)
+
+        assert client.get(url, params={"since_id": newest}).json() == []
+        newer = client.get(url, params={"since_id": newest - 3}).json()
+        assert sorted(e["id"] for e in newer) == [newest - 2, newest - 1, newest]
+
+    def test_since_timestamp_is_exclusive(self, session_with_events):
+        url = f"/api/v1/sessions/{session_with_events}/events"
+        newest = client.get(url, params={"limit": 1}).json()[0]
+        assert client.get(url, params={"since_timestamp": newest["timestamp"]}).json() == []
+
+    def test_not_modified_until_new_event(self, session_with_events):
+        url = f"/api/v1/sessions/{session_with_events}/events"
+        first = client.get(url, params={"limit": 10})
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+
+        again = client.get(url, params={"limit": 10}, headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+
+        # Another query on the same session has its own tag
+        other = client.get(url, params={"limit": 5}, headers={"If-None-Match": etag})
+        assert other.status_code == 200
+
+        play_session_id = client.post(
+            "/api/v1/play-sessions", json={"metric_session_id": session_with_events}
+        ).json()["id"]
+        assert client.get(url, params={"limit": 10}, headers={"If-None-Match": etag}).status_code == 200
+        etag = client.get(url, params={"limit": 10}).headers["etag"]
+
+        client.post(f"/api/v1/events/batch?play_session_id={play_session_id}", json=[{"event_type": 101}])
+        changed = client.get(url, params={"limit": 10}, headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.json()[0]["event_type"] == 101
+
+    def test_poll_with_etag(self, session_with_events):
+        """The dashboard loop: since_id plus If-None-Match."""
+        url = f"/api/v1/sessions/{session_with_events}/events"
+        newest = client.get(url).json()[0]["id"]
+        poll = client.get(url, params={"since_id": newest})
+        assert poll.json() == []
+        assert client.get(
+            url, params={"since_id": newest}, headers={"If-None-Match": poll.headers["etag"]}
+        ).status_code == 304
+
+    def test_late_commit_with_older_timestamp_changes_etag(self, session_with_events):
+        """An event stamped before the newest one but committed after it still changes the tag."""
+        url = f"/api/v1/sessions/{session_with_events}/events"
+        newest = client.get(url).json()[0]
+        poll = client.get(url, params={"since_id": newest["id"]})
+        assert poll.json() == []
+
+        with SessionLocal() as db:
+            db.add(models.Event(
+                play_session_id=db.get(models.Event, newest["id"]).play_session_id,
+                event_type=102,
+                event_subtype=0,
+                timestamp=datetime.fromisoformat(newest["timestamp"]) - timedelta(seconds=1)
+            ))
+            db.commit()
+
+        changed = client.get(url, params={"since_id": newest["id"]}, headers={"If-None-Match": poll.headers["etag"]})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != poll.headers["etag"]
+        assert [e["event_type"] for e in changed.json()] == [102]
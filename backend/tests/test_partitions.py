@@ -0,0 +1,99 @@
+"""
+Tests for events table range partitioning helpers and pruning bounds.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from app import partitions
+from app.main import app
+from app.routers.internal import OPERATOR_TOKEN
+from app.partitions import (
+    PartitionManager, earliest_event_time, interval_start, next_start,
+    partition_name, partitioned_events_table
+)
+
+client = TestClient(app)
+
+
+class TestIntervals:
+    """Test partition interval boundaries."""
+
+    def test_month(self):
+        ts = datetime(2024, 1, 31, 23, 59, 59)
+        start = interval_start(ts, "month")
+        assert start == datetime(2024, 1, 1)
+        assert next_start(start, "month") == datetime(2024, 2, 1)
+        assert next_start(datetime(2024, 12, 1), "month") == datetime(2025, 1, 1)
+
+    def test_week_starts_monday(self):
+        start = interval_start(datetime(2024, 3, 10, 12), "week")  # a Sunday
+        assert start == datetime(2024, 3, 4)
+        assert next_start(start, "week") == datetime(2024, 3, 11)
+
+    def test_day(self):
+        start = interval_start(datetime(2024, 2, 28, 8, 30), "day")
+        assert start == datetime(2024, 2, 28)
+        assert next_start(start, "day") == datetime(2024, 2, 29)
+
+    def test_unknown_interval(self):
+        with pytest.raises(ValueError):
+            interval_start(datetime(2024, 1, 1), "year")
+        with pytest.raises(ValueError):
+            PartitionManager(None, interval="year")
+
+    def test_partition_name(self):
+        assert partition_name(datetime(2024, 5, 1)) == "events_p20240501"
+
+
+class TestPartitionedTable:
+    """Test the DDL for the partitioned parent table."""
+
+    def test_partition_key_in_primary_key(self):
+        events = partitioned_events_table()
+        assert {c.name for c in events.primary_key.columns} == {"id", "timestamp"}
+        ddl = str(CreateTable(events).compile(dialect=postgresql.dialect()))
+        assert "PARTITION BY RANGE (timestamp)" in ddl
+        assert "PRIMARY KEY (id, timestamp)" in ddl
+        assert "SERIAL" in ddl
+
+    def test_model_table_unchanged(self):
+        partitioned_events_table()
+        assert partitions.models.Event.__table__.c.timestamp.primary_key is False
+
+    def test_unsupported_on_sqlite(self):
+        assert partitions.partition_manager.supported is False
+        response = client.get("/api/v1/internal/partitions", headers={"Authorization": f"Bearer {OPERATOR_TOKEN}"})
+        assert response.status_code == 200
+        assert response.json() == {"partitioned": False}
+
+
+class TestPruningBounds:
+    """Test event queries carry timestamp bounds."""
+
+    def test_earliest_event_time(self):
+        started = datetime(2024, 1, 1, 12)
+        assert earliest_event_time(started) == started - partitions.EVENT_CLOCK_SKEW
+        assert earliest_event_time(None) is None
+
+    def test_session_events_since_until(self):
+        session_id = client.post(
+            "/api/v1/sessions", json={"unique_id": "partition_bounds_user"}
+        ).json()["id"]
+        play_session_id = client.post(
+            "/api/v1/play-sessions", json={"metric_session_id": session_id}
+        ).json()["id"]
+        client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 102})
+
+        url = f"/api/v1/sessions/{session_id}/events"
+        assert len(client.get(url).json()) == 1
+
+        future = (datetime.utcnow() + timedelta(days=1)).isoformat()
+        assert client.get(url, params={"since": future}).json() == []
+        past = (datetime.utcnow() - timedelta(days=1)).isoformat()
+        assert client.get(url, params={"until": past}).json() == []
+        assert len(client.get(url, params={"since": past, "until": future}).json()) == 1
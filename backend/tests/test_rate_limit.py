@@ -0,0 +1,215 @@
+"""
+Tests for withdrawal-code rate limiting and aggregated invalid-attempt audits.
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models_research, rate_limit
+from app.database import Base, SessionLocal
+from app.main import app
+from app.rate_limit import CodeAttemptLimiter, DatabaseBackend, InvalidAttemptLog, MemoryBackend
+
+client = TestClient(app)
+
+Audit = models_research.WithdrawalAudit
+UNKNOWN_CODE = "WC-00000000-0000-0000-0000-000000000000"
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def async_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'limits.db'}")
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[
+                models_research.RateLimitWindow.__table__,
+                models_research.ResearchConsent.__table__,
+                Audit.__table__,
+            ])
+
+    asyncio.run(create())
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+class TestMemoryBackend:
+    """Test the per-worker token bucket."""
+
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        backend = MemoryBackend(clock=clock)
+        assert [backend.take("a", 3, 60) for _ in range(3)] == [0, 0, 0]
+        assert backend.take("a", 3, 60) == pytest.approx(20)
+        # Other keys have their own bucket
+        assert backend.take("b", 3, 60) == 0
+
+        clock.now += 20
+        assert backend.take("a", 3, 60) == 0
+        assert backend.take("a", 3, 60) == pytest.approx(20)
+
+    def test_prune_and_size_cap(self):
+        clock = FakeClock()
+        backend = MemoryBackend(max_keys=2, clock=clock)
+        for key in ("a", "b", "c"):
+            backend.take(key, 3, 60)
+        assert len(backend) == 2
+
+        clock.now += 19
+        asyncio.run(backend.prune())
+        assert len(backend) == 2
+        clock.now += 1
+        asyncio.run(backend.prune())
+        assert len(backend) == 0
+
+
+class TestDatabaseBackend:
+    """Test fixed-window counters shared through the database."""
+
+    def test_shared_between_workers(self, async_engine):
+        clock = FakeClock(600.0)
+        workers = [DatabaseBackend(async_engine, clock=clock), DatabaseBackend(async_engine, clock=clock)]
+
+        async def scenario():
+            waits = [await workers[i % 2].hit("code:ip", 3, 60) for i in range(4)]
+            clock.now = 615.0
+            waits.append(await workers[0].hit("code:ip", 3, 60))
+            clock.now = 660.0
+            waits.append(await workers[1].hit("code:ip", 3, 60))
+            clock.now = 800.0
+            await workers[1].prune()
+            async with async_engine.connect() as conn:
+                rows = (await conn.execute(select(func.count()).select_from(rate_limit.Window))).scalar()
+            return waits, rows
+
+        waits, rows = asyncio.run(scenario())
+        assert waits[:3] == [0, 0, 0]
+        assert waits[3] == pytest.approx(60)
+        assert waits[4] == pytest.approx(45)
+        # A new window starts from zero
+        assert waits[5] == 0
+        assert rows == 0
+
+
+class TestLimiter:
+    """Test per-IP and global limits."""
+
+    def test_global_failures_alert_without_refusing(self):
+        limiter = CodeAttemptLimiter(MemoryBackend(clock=FakeClock()), limit=2, window=60, global_limit=5, enabled=True)
+
+        async def scenario():
+            waits = []
+            for i in range(8):
+                waits.append(await limiter.check(f"ip{i}"))
+                await limiter.record_failure()
+            return waits, await limiter.check("participant")
+
+        waits, participant = asyncio.run(scenario())
+        # Failures spread over many IPs are flagged once, but nobody is locked out
+        assert waits == [0] * 8
+        assert participant == 0
+        assert limiter.failures == 8
+        assert limiter.global_alerts == 1
+
+    def test_per_ip_limit(self):
+        limiter = CodeAttemptLimiter(MemoryBackend(clock=FakeClock()), limit=2, window=60, global_limit=3, enabled=True)
+
+        async def scenario():
+            attacker = [await limiter.check("attacker") for _ in range(10)]
+            return attacker, await limiter.check("participant")
+
+        attacker, participant = asyncio.run(scenario())
+        assert attacker.count(0) == 2
+        assert participant == 0
+
+    def test_backend_failure_allows(self):
+        class Broken(rate_limit.RateLimitBackend):
+            async def hit(self, key, limit, window):
+                raise ConnectionError("down")
+
+        limiter = CodeAttemptLimiter(Broken(), limit=1, window=60, global_limit=0, enabled=True)
+        assert asyncio.run(limiter.check("ip")) == 0
+        assert limiter.backend_errors == 1
+
+
+class TestInvalidAttemptLog:
+    """Test invalid attempts are written as one row per IP and reason."""
+
+    def test_aggregates(self, async_engine):
+        log = InvalidAttemptLog(async_sessionmaker(async_engine), max_pending=2)
+        for ip in ("a", "a", "a", "b", "c", "d"):
+            log.record(ip, "Invalid withdrawal code")
+        log.record("a", "Rate limited")
+
+        async def rows():
+            async with async_engine.connect() as conn:
+                return (await conn.execute(
+                    select(Audit.request_ip_hash, Audit.error_message, Audit.attempt_count, Audit.success)
+                    .order_by(Audit.id)
+                )).all()
+
+        assert asyncio.run(log.flush()) == 4
+        assert asyncio.run(rows()) == [
+            ("a", "Invalid withdrawal code", 3, False),
+            ("b", "Invalid withdrawal code", 1, False),
+            # Beyond max_pending, attempts are pooled per reason without an IP
+            (None, "Invalid withdrawal code", 2, False),
+            (None, "Rate limited", 1, False),
+        ]
+        assert asyncio.run(log.flush()) == 0
+
+
+class TestEndpoints:
+    """Test the limit on /withdraw and /participant/data."""
+
+    def test_429_with_retry_after(self, async_engine, monkeypatch):
+        log = InvalidAttemptLog(async_sessionmaker(async_engine))
+        monkeypatch.setattr(rate_limit, "invalid_attempts", log)
+        with SessionLocal() as db:
+            audits_before = db.scalar(select(func.count()).select_from(Audit))
+
+        limit = rate_limit.code_attempt_limiter.limit
+        statuses = [
+            client.post("/api/v1/research/withdraw", json={"withdrawal_code": UNKNOWN_CODE}).status_code
+            for _ in range(limit - 1)
+        ]
+        statuses.append(client.get(
+            "/api/v1/research/participant/data", params={"withdrawal_code": UNKNOWN_CODE}
+        ).status_code)
+        assert statuses == [400] * limit
+
+        response = client.post("/api/v1/research/withdraw", json={"withdrawal_code": UNKNOWN_CODE})
+        assert response.status_code == 429
+        assert 1 <= int(response.headers["retry-after"]) <= rate_limit.code_attempt_limiter.window
+        assert client.get(
+            "/api/v1/research/participant/data", params={"withdrawal_code": UNKNOWN_CODE}
+        ).status_code == 429
+
+        # Nothing is written per attempt; the log holds them until flushed
+        with SessionLocal() as db:
+            assert db.scalar(select(func.count()).select_from(Audit)) == audits_before
+        asyncio.run(log.flush())
+
+        async def rows():
+            async with async_engine.connect() as conn:
+                return dict((await conn.execute(
+                    select(Audit.error_message, Audit.attempt_count)
+                )).all())
+
+        assert asyncio.run(rows()) == {
+            "Invalid withdrawal code": limit - 1,
+            "Invalid withdrawal code (data export)": 1,
+            "Rate limited": 2,
+        }
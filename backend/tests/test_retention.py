@@ -0,0 +1,170 @@
+"""
+Tests for the data retention sweeper.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models, models_research, session_cache
+from app.retention import RetentionSweeper
+
+NOW = datetime(2024, 6, 1)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    db.add(models_research.StudyMetadata(
+        study_id="short", title="Short", principal_investigator="PI",
+        institution="Uni", irb_protocol="IRB-1", data_retention_days=30
+    ))
+    db.add(models_research.StudyMetadata(
+        study_id="long", title="Long", principal_investigator="PI",
+        institution="Uni", irb_protocol="IRB-2", data_retention_days=3650
+    ))
+
+    # (participant, study, days since last activity, events)
+    participants = [
+        ("expired_a", "short", 40, 7),
+        ("expired_b", "short", 31, 3),
+        ("fresh", "short", 5, 2),
+        ("long_study", "long", 40, 2),
+        ("no_consent", None, 400, 2),
+    ]
+    for participant, study, age, events in participants:
+        if study:
+            db.add(models_research.ResearchConsent(
+                study_id=study, participant_id=participant,
+                withdrawal_code_hash=f"hash_{participant}", withdrawal_salt="salt"
+            ))
+        metric_session = models.MetricSession(
+            unique_id=participant, created_at=NOW - timedelta(days=age + 1),
+            closed_at=NOW - timedelta(days=age)
+        )
+        db.add(metric_session)
+        db.flush()
+        for _ in range(2):
+            play_session = models.PlaySession(
+                metric_session_id=metric_session.id,
+                started_at=NOW - timedelta(days=age + 1), ended_at=NOW - timedelta(days=age)
+            )
+            db.add(play_session)
+            db.flush()
+            db.add_all(
+                models.Event(
+                    play_session_id=play_session.id, event_type=1, event_subtype=0,
+                    timestamp=NOW - timedelta(days=age + 1)
+                )
+                for _ in range(events)
+            )
+    db.commit()
+    db.close()
+    yield engine
+    engine.dispose()
+
+
+def remaining(engine, model) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model)).scalar()
+
+
+class TestRetentionSweeper:
+    """Test expiry selection, chunking and reporting."""
+
+    def test_purges_only_expired_sessions(self, engine):
+        sweeper = RetentionSweeper(engine, session_batch=1, event_batch=4, throttle=0)
+        result = sweeper.sweep(now=NOW)
+
+        assert result["sessions_deleted"] == 2
+        assert result["play_sessions_deleted"] == 4
+        assert result["events_deleted"] == 2 * 7 + 2 * 3
+        assert remaining(engine, models.MetricSession) == 3
+        assert remaining(engine, models.Event) == 2 * (2 + 2 + 2)
+
+        with engine.connect() as conn:
+            left = set(conn.execute(select(models.MetricSession.unique_id)).scalars())
+            deleted_at = dict(conn.execute(select(
+                models_research.ResearchConsent.participant_id,
+                models_research.ResearchConsent.data_deleted_at
+            )).all())
+        assert left == {"fresh", "long_study", "no_consent"}
+        assert deleted_at["expired_a"] == NOW
+        assert deleted_at["fresh"] is None
+
+    def test_second_run_is_noop(self, engine):
+        sweeper = RetentionSweeper(engine, throttle=0)
+        sweeper.sweep(now=NOW)
+        result = sweeper.sweep(now=NOW)
+        assert result["sessions_deleted"] == 0
+        assert sweeper.stats()["runs"] == 2
+        assert sweeper.stats()["sessions_deleted"] == 2
+
+    def test_dry_run_deletes_nothing(self, engine):
+        sweeper = RetentionSweeper(engine, throttle=0)
+        result = sweeper.sweep(now=NOW, dry_run=True)
+        assert result["sessions_deleted"] == 2
+        assert remaining(engine, models.MetricSession) == 5
+        assert sweeper.stats()["runs"] == 0
+
+    def test_no_retention_configured(self, engine):
+        with engine.begin() as conn:
+            conn.execute(models_research.StudyMetadata.__table__.update().values(data_retention_days=None))
+        result = RetentionSweeper(engine, throttle=0).sweep(now=NOW)
+        assert result["sessions_deleted"] == 0
+        assert remaining(engine, models.MetricSession) == 5
+
+    def test_purged_sessions_leave_cache(self, engine):
+        with engine.connect() as conn:
+            play_session_id = conn.execute(
+                select(models.PlaySession.id).join(models.MetricSession)
+                .where(models.MetricSession.unique_id == "expired_a")
+            ).scalars().first()
+        session_cache.remember_play_session(play_session_id, 1)
+        RetentionSweeper(engine, throttle=0).sweep(now=NOW)
+        assert session_cache.play_session_cache.get(play_session_id) is None
+
+    @pytest.mark.parametrize("started, ended, event", [
+        (2, None, None),  # play session started recently
+        (40, 1, None),  # long play session ended recently
+        (40, None, 1),  # still open, logging events
+    ])
+    def test_unclosed_session_with_recent_play_kept(self, engine, started, ended, event):
+        """A session that never closed is judged by its play sessions, not its creation date."""
+        db = sessionmaker(bind=engine)()
+        db.add(models_research.ResearchConsent(
+            study_id="short", participant_id="still_playing",
+            withdrawal_code_hash="hash_still_playing", withdrawal_salt="salt"
+        ))
+        metric_session = models.MetricSession(unique_id="still_playing", created_at=NOW - timedelta(days=60))
+        db.add(metric_session)
+        db.flush()
+        play_session = models.PlaySession(
+            metric_session_id=metric_session.id,
+            started_at=NOW - timedelta(days=started),
+            ended_at=NOW - timedelta(days=ended) if ended is not None else None
+        )
+        db.add(play_session)
+        db.flush()
+        db.add(models.Event(
+            play_session_id=play_session.id, event_type=1, event_subtype=0,
+            timestamp=NOW - timedelta(days=event if event is not None else started)
+        ))
+        db.commit()
+        db.close()
+
+        result = RetentionSweeper(engine, throttle=0).sweep(now=NOW)
+        assert result["sessions_deleted"] == 2
+        with engine.connect() as conn:
+            left = set(conn.execute(select(models.MetricSession.unique_id)).scalars())
+        assert "still_playing" in left
@@ -0,0 +1,183 @@
+"""
+Tests for incrementally maintained event rollups.
+"""
+
+import statistics
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+
+from app import heatmaps, models, rollups
+from app.database import SessionLocal, engine
+from app.main import app
+
+from .conftest import create_participant
+
+client = TestClient(app)
+
+
+def log(play_session_id: int, magnitudes, event_type: int = 102) -> None:
+    events = [{"event_type": event_type, "magnitude": m} for m in magnitudes]
+    response = client.post(f"/api/v1/events/batch?play_session_id={play_session_id}", json=events)
+    assert response.status_code == 200
+
+
+def assert_stats(stats: dict, magnitudes, count=None):
+    values = [m for m in magnitudes if m is not None]
+    assert stats["count"] == (count if count is not None else len(magnitudes))
+    assert stats["magnitude"]["count"] == len(values)
+    assert stats["magnitude"]["mean"] == pytest.approx(statistics.mean(values))
+    assert stats["magnitude"]["stddev"] == pytest.approx(statistics.stdev(values))
+    assert stats["magnitude"]["min"] == min(values)
+    assert stats["magnitude"]["max"] == max(values)
+
+
+def play_session_rows(play_session_ids):
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(models.PlaySessionEventRollup).where(
+                models.PlaySessionEventRollup.play_session_id.in_(play_session_ids)
+            ).order_by(
+                models.PlaySessionEventRollup.play_session_id,
+                models.PlaySessionEventRollup.event_type,
+                models.PlaySessionEventRollup.bucket_start,
+            )
+        ).scalars().all()
+        return [
+            (r.play_session_id, r.event_type, r.bucket_start, r.study_id,
+             *(getattr(r, c) for c in rollups.STAT_COLUMNS))
+            for r in rows
+        ]
+
+
+class TestIngestRollups:
+    """Test rollups match the ingested events."""
+
+    def test_play_session_summary(self):
+        play_session_id = create_participant(f"rollup_{uuid4().hex}")["play_session_ids"][0]
+        first, second = [250.0, 310.5, None, 190.25], [402.0, 275.0]
+        log(play_session_id, first)
+        log(play_session_id, second)
+        client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 103, "magnitude": 5.0})
+
+        body = client.get(f"/api/v1/analytics/play-sessions/{play_session_id}/summary").json()
+        by_type = {e["event_type"]: e for e in body["event_types"]}
+        assert_stats(by_type[102], first + second)
+        assert by_type[103]["count"] == 1
+        assert by_type[103]["magnitude"]["stddev"] is None
+
+        only = client.get(
+            f"/api/v1/analytics/play-sessions/{play_session_id}/summary", params={"event_type": 103}
+        ).json()
+        assert [e["event_type"] for e in only["event_types"]] == [103]
+
+    def test_study_summary_and_timeseries(self):
+        study_id = f"rollup_{uuid4().hex}"
+        a, b = (create_participant(study_id)["play_session_ids"][0] for _ in range(2))
+        log(a, [100.0, 200.0])
+        log(b, [300.0, 450.0, 500.0])
+
+        summary = client.get(f"/api/v1/analytics/studies/{study_id}/summary").json()
+        assert len(summary["event_types"]) == 1
+        assert_stats(summary["event_types"][0], [100.0, 200.0, 300.0, 450.0, 500.0])
+
+        for interval in ("hour", "day"):
+            series = client.get(
+                f"/api/v1/analytics/studies/{study_id}/timeseries", params={"interval": interval}
+            ).json()
+            assert series["interval"] == interval
+            assert sum(bucket["count"] for bucket in series["buckets"]) == 5
+
+        assert client.get(f"/api/v1/analytics/studies/{study_id}/summary", params={
+            "start": "2000-01-01T00:00:00", "end": "2000-01-02T00:00:00"
+        }).json() == {"event_types": []}
+
+    def test_sessions_without_consent(self):
+        session_id = client.post("/api/v1/sessions", json={"unique_id": f"noconsent_{uuid4().hex}"}).json()["id"]
+        play_session_id = client.post("/api/v1/play-sessions", json={"metric_session_id": session_id}).json()["id"]
+        log(play_session_id, [1.0, 2.0])
+        summary = client.get(f"/api/v1/analytics/sessions/{session_id}/summary").json()
+        assert_stats(summary["event_types"][0], [1.0, 2.0])
+        assert play_session_rows([play_session_id])[0][3] is None
+
+    def test_heatmaps_and_sketches_without_rollups(self, monkeypatch):
+        monkeypatch.setattr(rollups, "ROLLUPS_ENABLED", False)
+        monkeypatch.setattr(heatmaps, "HEATMAPS_ENABLED", True)
+        study_id = f"rollup_{uuid4().hex}"
+        play_session_id = create_participant(study_id)["play_session_ids"][0]
+        events = [{"event_type": 102, "magnitude": 250.0 + i, "x": i, "y": -i} for i in range(4)]
+        assert client.post(f"/api/v1/events/batch?play_session_id={play_session_id}", json=events).status_code == 200
+        assert client.post(f"/api/v1/events?play_session_id={play_session_id}", json=events[0]).status_code == 200
+
+        assert play_session_rows([play_session_id]) == []
+        with SessionLocal() as db:
+            points = db.execute(
+                select(func.sum(models.HeatmapCell.count))
+                .where(models.HeatmapCell.study_id == study_id, models.HeatmapCell.zoom == 0)
+            ).scalar()
+            sketches = db.execute(
+                select(func.count()).select_from(models.PlaySessionSketch)
+                .where(models.PlaySessionSketch.play_session_id == play_session_id)
+            ).scalar()
+        assert points == 5
+        assert sketches == 1
+
+
+class TestRollupMaintenance:
+    """Test rebuild and deletion keep rollups consistent with events."""
+
+    def test_rebuild_matches_incremental(self):
+        study_id = f"rollup_{uuid4().hex}"
+        ids = [create_participant(study_id)["play_session_ids"][0] for _ in range(3)]
+        for i, play_session_id in enumerate(ids):
+            log(play_session_id, [10.0 * i, 20.5, None])
+            log(play_session_id, [3.0], event_type=104)
+
+        incremental = play_session_rows(ids)
+        study_before = client.get(f"/api/v1/analytics/studies/{study_id}/summary").json()
+
+        rollups.rebuild(engine, chunk=2)
+
+        rebuilt = play_session_rows(ids)
+        assert len(rebuilt) == len(incremental)
+        for before, after in zip(incremental, rebuilt):
+            assert before[:4] == after[:4]
+            assert before[4:] == pytest.approx(after[4:])
+        assert client.get(f"/api/v1/analytics/studies/{study_id}/summary").json() == pytest.approx(study_before)
+
+    def test_withdrawal_removes_contribution(self):
+        study_id = f"rollup_{uuid4().hex}"
+        consent = create_participant(study_id)
+        withdrawn = consent["play_session_ids"][0]
+        kept = create_participant(study_id)["play_session_ids"][0]
+        log(withdrawn, [1000.0, 2000.0])
+        log(kept, [10.0, 30.0])
+
+        response = client.post(
+            "/api/v1/research/withdraw", json={"withdrawal_code": consent["withdrawal_code"]}
+        )
+        assert response.status_code == 200
+
+        assert play_session_rows([withdrawn]) == []
+        summary = client.get(f"/api/v1/analytics/studies/{study_id}/summary").json()
+        assert_stats(summary["event_types"][0], [10.0, 30.0])
+
+
+class TestUpsertStatement:
+    """Test the PostgreSQL upsert shape."""
+
+    def test_postgres_upsert(self):
+        from datetime import datetime
+
+        accumulator = rollups.RollupAccumulator()
+        for magnitude in (1.0, None):
+            accumulator.add({"play_session_id": 9, "event_type": 1, "magnitude": magnitude,
+                             "timestamp": datetime(2024, 1, 1, 10, 30)})
+        statements = rollups._upsert_statements("postgresql", accumulator, {9: rollups.PlaySessionLabels("s", "")})
+        sql = [str(s.compile(dialect=postgresql.dialect())) for s in statements]
+        assert len(sql) == 2
+        assert all("ON CONFLICT" in s for s in sql)
+        assert "least(" in sql[0] and "greatest(" in sql[0]
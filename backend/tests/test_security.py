@@ -6,6 +6,7 @@ Tests for SQL injection, XSS, path traversal, and other vulnerabilities.
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.routers import internal
 from datetime import datetime
 
 client = TestClient(app)
@@ -167,6 +168,28 @@ class TestInputValidation:
         )
         assert response.status_code in [400, 422]
 
+    def test_invalid_event_in_batch(self):
+        """A single out-of-range event should reject the batch."""
+        response = client.post(
+            "/api/v1/events/batch?play_session_id=1",
+            json=[
+                {"event_type": 100},
+                {"event_type": 102, "magnitude": 999999}
+            ]
+        )
+        assert response.status_code == 400
+        error = response.json()["detail"][0]
+        assert error["loc"] == ["body", 1, "magnitude"]
+        assert error["type"] == "reaction_time_ms"
+
+    def test_batch_must_be_array(self):
+        """A batch body that is not an array should be rejected."""
+        response = client.post(
+            "/api/v1/events/batch?play_session_id=1",
+            json={"event_type": 100}
+        )
+        assert response.status_code in [400, 422]
+
 
 class TestSecurityHeaders:
     """Test security headers are present."""
@@ -209,6 +232,32 @@ class TestCORS:
         assert "access-control-allow-origin" in response.headers
 
 
+class TestOperatorEndpoints:
+    """Test /api/v1/internal/* requires the operator token."""
+
+    def test_token_required(self):
+        assert client.get("/api/v1/internal/pool").status_code == 401
+        response = client.get("/api/v1/internal/ingest-queue", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+        assert response.headers["www-authenticate"] == "Bearer"
+
+        headers = {"Authorization": f"Bearer {internal.OPERATOR_TOKEN}"}
+        assert client.get("/api/v1/internal/pool", headers=headers).status_code == 200
+
+    def test_rule_reload_requires_token(self):
+        assert client.post("/api/v1/internal/event-rules/reload").status_code == 401
+        response = client.post("/api/v1/internal/event-rules/reload", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+
+        headers = {"Authorization": f"Bearer {internal.OPERATOR_TOKEN}"}
+        assert client.post("/api/v1/internal/event-rules/reload", headers=headers).status_code == 200
+
+    def test_disabled_without_token(self, monkeypatch):
+        monkeypatch.setattr(internal, "OPERATOR_TOKEN", "")
+        response = client.get("/api/v1/internal/pool", headers={"Authorization": "Bearer "})
+        assert response.status_code == 404
+
+
 class TestErrorHandling:
     """Test error handling doesn't leak information."""
 
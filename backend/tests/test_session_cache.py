@@ -0,0 +1,122 @@
+"""
+Tests for the play/metric session existence cache.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from uuid import uuid4
+
+from app import bulk_insert, models, session_cache
+from app.database import SessionLocal
+from app.main import app
+from app.session_cache import TTLCache
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Test TTL expiry, LRU eviction and counters."""
+
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(max_size=10, ttl_seconds=60)
+        assert cache.get(1) is None
+        cache.set(1, "a")
+        assert cache.get(1) == "a"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(max_size=10, ttl_seconds=5, clock=clock)
+        cache.set(1, "a")
+        clock.now = 4.9
+        assert cache.get(1) == "a"
+        clock.now = 5.1
+        assert cache.get(1) is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_evicted(self):
+        cache = TTLCache(max_size=2, ttl_seconds=60)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)  # 2 is now least recently used
+        cache.set(3, "c")
+        assert cache.get(2) is None
+        assert cache.get(1) == "a"
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidate(self):
+        cache = TTLCache(max_size=10, ttl_seconds=60)
+        cache.set(1, "a")
+        cache.invalidate(1)
+        assert cache.get(1) is None
+
+
+class TestIngestUsesCache:
+    """Test the cache is written through by the session endpoints."""
+
+    @pytest.fixture
+    def play_session(self):
+        session = client.post(
+            "/api/v1/sessions",
+            json={"unique_id": f"cache_{uuid4().hex}", "build_number": "1.0"}
+        ).json()
+        return client.post(
+            "/api/v1/play-sessions",
+            json={"metric_session_id": session["id"]}
+        ).json()
+
+    def test_created_play_session_is_cached(self, play_session):
+        hits_before = session_cache.play_session_cache.hits
+        response = client.post(
+            f"/api/v1/events?play_session_id={play_session['id']}",
+            json={"event_type": 100}
+        )
+        assert response.status_code == 200
+        assert session_cache.play_session_cache.hits == hits_before + 1
+
+    def test_closed_play_session_rejected_when_enabled(self, play_session, monkeypatch):
+        client.post(f"/api/v1/play-sessions/{play_session['id']}/close")
+        url = f"/api/v1/events?play_session_id={play_session['id']}"
+
+        monkeypatch.setattr(session_cache, "REJECT_CLOSED_PLAY_SESSIONS", False)
+        assert client.post(url, json={"event_type": 100}).status_code == 200
+
+        monkeypatch.setattr(session_cache, "REJECT_CLOSED_PLAY_SESSIONS", True)
+        response = client.post(url, json={"event_type": 100})
+        assert response.status_code == 409
+
+    def test_unknown_play_session_not_cached(self):
+        response = client.post(
+            "/api/v1/events?play_session_id=987654",
+            json={"event_type": 100}
+        )
+        assert response.status_code == 404
+        assert session_cache.play_session_cache.get(987654) is None
+
+    def test_play_session_deleted_by_another_worker(self, play_session, monkeypatch):
+        url = f"/api/v1/events/batch?play_session_id={play_session['id']}"
+        assert client.post(url, json=[{"event_type": 100}]).status_code == 200
+        # Still cached here; deleted elsewhere, so the insert hits the foreign key
+        with SessionLocal() as db:
+            db.execute(delete(models.Event).where(models.Event.play_session_id == play_session["id"]))
+            db.execute(delete(models.PlaySession).where(models.PlaySession.id == play_session["id"]))
+            db.commit()
+
+        async def insert_violating_fk(db, rows, strategy=None):
+            raise IntegrityError("INSERT INTO events", None, Exception("foreign key violation"))
+
+        monkeypatch.setattr(bulk_insert, "insert_events_async", insert_violating_fk)
+        response = client.post(url, json=[{"event_type": 100}])
+        assert response.status_code == 404
+        assert session_cache.play_session_cache.get(play_session["id"]) is None
@@ -0,0 +1,229 @@
+"""
+Tests for the mergeable magnitude distribution sketches.
+"""
+
+from types import SimpleNamespace
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app import models, rollups, sketches
+from app.database import SessionLocal, engine
+from app.main import app
+from app.sketches import LogHistogram
+
+from .conftest import create_participant
+
+client = TestClient(app)
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999, 1.0]
+
+
+def reaction_times(seed: int, size: int) -> np.ndarray:
+    """Right-skewed reaction times in milliseconds."""
+    rng = np.random.default_rng(seed)
+    return rng.lognormal(mean=np.log(350), sigma=0.4, size=size) + rng.exponential(40, size)
+
+
+def assert_accurate(sketch: LogHistogram, values: np.ndarray, quantiles=QUANTILES):
+    exact = np.quantile(values, quantiles, method="lower")
+    approx = np.array(sketch.quantiles(quantiles))
+    assert np.all(np.abs(approx - exact) <= sketches.RELATIVE_ACCURACY * np.abs(exact) + 1e-9)
+
+
+class TestLogHistogram:
+    """Test sketch accuracy against exact computation."""
+
+    @pytest.mark.parametrize("seed", [1, 2, 3])
+    def test_quantiles_within_relative_accuracy(self, seed):
+        values = reaction_times(seed, 50_000)
+        sketch = LogHistogram.from_values(values)
+        assert sketch.count == values.size
+        assert sketch.minimum == values.min() and sketch.maximum == values.max()
+        assert sketch.mean == pytest.approx(values.mean())
+        assert sketch.keys.size < 200
+        assert_accurate(sketch, values)
+
+    def test_wide_range_negative_and_zero(self):
+        rng = np.random.default_rng(7)
+        values = np.concatenate([
+            -rng.lognormal(0, 3, 1000), np.zeros(50), rng.lognormal(0, 5, 5000), [np.nan, np.inf]
+        ])
+        sketch = LogHistogram.from_values(values)
+        assert sketch.count == values.size - 2
+        assert_accurate(sketch, values[np.isfinite(values)])
+
+    def test_merge_is_exact(self):
+        values = reaction_times(4, 20_000)
+        parts = [LogHistogram.from_values(chunk) for chunk in np.array_split(values, 37)]
+        merged = LogHistogram.merge(parts + [LogHistogram()])
+        whole = LogHistogram.from_values(values)
+        assert np.array_equal(merged.keys, whole.keys)
+        assert np.array_equal(merged.counts, whole.counts)
+        assert merged.total == pytest.approx(whole.total)
+        assert (merged.minimum, merged.maximum) == (whole.minimum, whole.maximum)
+        assert_accurate(merged, values)
+
+    def test_serialization_round_trip(self):
+        sketch = LogHistogram.from_values(reaction_times(5, 1000))
+        row = SimpleNamespace(**sketch.values())
+        restored = LogHistogram.from_row(row)
+        assert np.array_equal(restored.keys, sketch.keys)
+        assert np.array_equal(restored.counts, sketch.counts)
+        assert restored.quantiles(QUANTILES) == sketch.quantiles(QUANTILES)
+
+    def test_histogram(self):
+        values = reaction_times(6, 10_000)
+        sketch = LogHistogram.from_values(values)
+        bins = sketch.histogram(10)
+        assert len(bins) == 10
+        assert sum(b["count"] for b in bins) == values.size
+        assert bins[0]["lower"] == values.min() and bins[-1]["upper"] == values.max()
+        exact, _ = np.histogram(values, bins=10, range=(values.min(), values.max()))
+        # Only values within 1% of a bin edge can land in the neighbouring bin
+        assert np.abs(np.array([b["count"] for b in bins]) - exact).sum() < 0.05 * values.size
+        assert LogHistogram.from_values([5.0, 5.0]).histogram(10) == [{"lower": 5.0, "upper": 5.0, "count": 2}]
+        assert LogHistogram().histogram(10) == []
+        assert LogHistogram().quantiles([0.5]) == [None]
+
+    def test_group_sketches(self):
+        rng = np.random.default_rng(8)
+        play_session_ids = rng.integers(1, 20, 5000)
+        event_types = rng.choice([102, 103], 5000)
+        values = reaction_times(8, 5000)
+        grouped = dict(sketches.group_sketches(play_session_ids, event_types, values))
+        assert sum(s.count for s in grouped.values()) == 5000
+        for (play_session_id, event_type), sketch in grouped.items():
+            mask = (play_session_ids == play_session_id) & (event_types == event_type)
+            assert np.array_equal(sketch.counts, LogHistogram.from_values(values[mask]).counts)
+
+
+def log(play_session_id: int, values, event_type: int = 102, batch_size: int = 250) -> None:
+    for start in range(0, len(values), batch_size):
+        events = [{"event_type": event_type, "magnitude": float(v)} for v in values[start:start + batch_size]]
+        response = client.post(f"/api/v1/events/batch?play_session_id={play_session_id}", json=events)
+        assert response.status_code == 200
+
+
+@pytest.fixture(scope="module")
+def study():
+    """Four participants across two conditions, age ranges and builds."""
+    study_id = f"sketch_{uuid4().hex}"
+    participants = [
+        ("control", "18-25", "1.0"), ("control", "26-35", "1.1"),
+        ("ADHD", "18-25", "1.0"), ("ADHD", "26-35", "1.1"),
+    ]
+    values = {}
+    for seed, labels in enumerate(participants):
+        condition, age_range, build = labels
+        play_session_id = create_participant(
+            study_id, build=build, participant_info={"condition": condition, "age_range": age_range}
+        )["play_session_ids"][0]
+        values[labels] = reaction_times(seed + 10, 1000)
+        log(play_session_id, values[labels])
+        log(play_session_id, [1.0, 2.0], event_type=103)
+        # Other event types are not sketched
+        log(play_session_id, [50.0], event_type=104)
+    return study_id, values
+
+
+class TestDistributionEndpoints:
+    """Test sketches maintained at ingest against the exact values."""
+
+    def get(self, study_id: str, **params):
+        response = client.get(f"/api/v1/analytics/studies/{study_id}/distribution", params=params)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_whole_study(self, study):
+        study_id, values = study
+        everything = np.concatenate(list(values.values()))
+        body = self.get(study_id, q=QUANTILES)
+        assert body["relative_accuracy"] == sketches.RELATIVE_ACCURACY
+        [group] = body["groups"]
+        assert group["count"] == everything.size
+        assert group["mean"] == pytest.approx(everything.mean())
+        exact = np.quantile(everything, QUANTILES, method="lower")
+        for q, expected in zip(QUANTILES, exact):
+            assert group["quantiles"][sketches.quantile_label(q)] == pytest.approx(expected, rel=0.01)
+        assert sum(b["count"] for b in group["histogram"]) == everything.size
+
+    def test_group_by_condition(self, study):
+        study_id, values = study
+        body = self.get(study_id, group_by="condition", q=[0.5, 0.9])
+        assert [g["condition"] for g in body["groups"]] == ["ADHD", "control"]
+        for group in body["groups"]:
+            exact = np.concatenate([v for labels, v in values.items() if labels[0] == group["condition"]])
+            assert group["count"] == exact.size
+            assert group["quantiles"]["p50"] == pytest.approx(np.quantile(exact, 0.5, method="lower"), rel=0.01)
+            assert group["quantiles"]["p90"] == pytest.approx(np.quantile(exact, 0.9, method="lower"), rel=0.01)
+
+    def test_filters_and_multiple_groups(self, study):
+        study_id, values = study
+        body = self.get(study_id, build="1.1", group_by=["condition", "age_range"], bins=0)
+        assert [(g["condition"], g["age_range"], g["build"]) for g in body["groups"]] == [
+            ("ADHD", "26-35", None), ("control", "26-35", None)
+        ]
+        assert all(g["histogram"] == [] for g in body["groups"])
+        incorrect = self.get(study_id, event_type=103, condition="ADHD")
+        assert incorrect["groups"][0]["count"] == 4
+        assert self.get(study_id, event_type=104)["groups"] == []
+        assert self.get(study_id, condition="nobody")["groups"] == []
+
+    def test_play_session_and_validation(self, study):
+        study_id, _ = study
+        play_session_id = create_participant(
+            study_id, build="2.0", participant_info={"condition": "control", "age_range": "18-25"}
+        )["play_session_ids"][0]
+        client.post(f"/api/v1/events?play_session_id={play_session_id}", json={"event_type": 102, "magnitude": 420.0})
+        log(play_session_id, [300.0, 500.0])
+        body = client.get(f"/api/v1/analytics/play-sessions/{play_session_id}/distribution").json()
+        assert body["groups"][0]["count"] == 3
+        assert body["groups"][0]["quantiles"]["p50"] == pytest.approx(420.0, rel=0.01)
+        assert body["groups"][0]["min"] == 300.0
+
+        response = client.get(f"/api/v1/analytics/studies/{study_id}/distribution", params={"q": 1.5})
+        assert response.status_code == 400
+        response = client.get(f"/api/v1/analytics/studies/{study_id}/distribution", params={"group_by": "site"})
+        assert response.status_code == 422
+
+
+class TestSketchMaintenance:
+    """Test rebuild and deletion of sketches."""
+
+    def sketch_rows(self, play_session_ids):
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(models.PlaySessionSketch).where(models.PlaySessionSketch.play_session_id.in_(play_session_ids))
+                .order_by(models.PlaySessionSketch.play_session_id, models.PlaySessionSketch.event_type)
+            ).scalars().all()
+            return [(r.play_session_id, r.event_type, r.count, bytes(r.bins), r.minimum, r.maximum) for r in rows]
+
+    def test_rebuild_matches_incremental(self):
+        study_id = f"sketch_{uuid4().hex}"
+        ids = [
+            create_participant(
+                study_id, build="1.0", participant_info={"condition": "control", "age_range": "18-25"}
+            )["play_session_ids"][0]
+            for _ in range(3)
+        ]
+        for seed, play_session_id in enumerate(ids):
+            log(play_session_id, reaction_times(seed, 300), batch_size=70)
+        incremental = self.sketch_rows(ids)
+        assert len(incremental) == 3
+
+        rollups.rebuild(engine, chunk=2)
+        assert self.sketch_rows(ids) == incremental
+
+    def test_withdrawal_removes_sketches(self):
+        study_id = f"sketch_{uuid4().hex}"
+        consent = create_participant(study_id)
+        play_session_id = consent["play_session_ids"][0]
+        log(play_session_id, [100.0, 200.0])
+        assert len(self.sketch_rows([play_session_id])) == 1
+
+        client.post("/api/v1/research/withdraw", json={"withdrawal_code": consent["withdrawal_code"]})
+        assert self.sketch_rows([play_session_id]) == []
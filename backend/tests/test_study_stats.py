@@ -0,0 +1,133 @@
+"""
+Tests for cached, single-query study statistics.
+"""
+
+from contextlib import contextmanager
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import models_research, study_stats
+from app.database import SessionLocal, async_engine
+from app.main import app
+
+client = TestClient(app)
+
+
+def new_study() -> str:
+    return f"stats_{uuid4().hex}"
+
+
+def consent(study_id: str, **fields) -> dict:
+    response = client.post("/api/v1/research/consent", json={"study_id": study_id, **fields})
+    assert response.status_code == 200
+    return response.json()
+
+
+def get_stats(study_id: str) -> dict:
+    response = client.get(f"/api/v1/research/study/{study_id}/stats")
+    assert response.status_code == 200
+    return response.json()
+
+
+@contextmanager
+def count_statements():
+    """Collect the SQL run by request handlers."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+class TestStudyStats:
+    """Test counts, fallbacks and caching of /study/{id}/stats."""
+
+    def test_counts_in_one_query(self):
+        study_id = new_study()
+        first = consent(study_id, privacy_level="anonymous", irb_protocol="IRB-1")
+        consent(study_id)
+        consent(study_id)
+        client.post("/api/v1/research/withdraw", json={"withdrawal_code": first["withdrawal_code"]})
+
+        with count_statements() as statements:
+            stats = get_stats(study_id)
+        assert len(statements) == 1
+        assert stats == {
+            "study_id": study_id,
+            "total_consented": 3,
+            "active_participants": 2,
+            "withdrawn_participants": 1,
+            "privacy_level": "anonymous",
+            "irb_protocol": "IRB-1",
+            "data_retention_days": 365,
+        }
+
+    def test_metadata_only_and_unknown(self):
+        study_id = new_study()
+        with SessionLocal() as db:
+            db.add(models_research.StudyMetadata(
+                study_id=study_id, title="t", principal_investigator="p", institution="i",
+                irb_protocol="IRB-META", data_retention_days=30
+            ))
+            db.commit()
+        stats = get_stats(study_id)
+        assert (stats["total_consented"], stats["privacy_level"]) == (0, "unknown")
+        assert (stats["irb_protocol"], stats["data_retention_days"]) == ("IRB-META", 30)
+
+        # Metadata takes precedence over the first consent's protocol
+        consent(study_id, irb_protocol="IRB-CONSENT")
+        assert get_stats(study_id)["irb_protocol"] == "IRB-META"
+
+        assert client.get(f"/api/v1/research/study/{new_study()}/stats").status_code == 404
+
+    def test_cache_invalidated_by_consent_and_withdrawal(self):
+        study_id = new_study()
+        code = consent(study_id)["withdrawal_code"]
+        assert get_stats(study_id)["total_consented"] == 1
+
+        with count_statements() as statements:
+            assert get_stats(study_id)["total_consented"] == 1
+        assert statements == []
+
+        consent(study_id)
+        assert get_stats(study_id)["total_consented"] == 2
+        client.post("/api/v1/research/withdraw", json={"withdrawal_code": code})
+        stats = get_stats(study_id)
+        assert (stats["active_participants"], stats["withdrawn_participants"]) == (1, 1)
+
+
+class TestBulkStudyStats:
+    """Test /studies/stats."""
+
+    def test_many_studies_in_order(self):
+        studies = [new_study() for _ in range(3)]
+        for count, study_id in enumerate(studies, start=1):
+            for _ in range(count):
+                consent(study_id)
+        get_stats(studies[1])  # cached; the others are fetched together
+        unknown = new_study()
+
+        with count_statements() as statements:
+            response = client.get("/api/v1/research/studies/stats", params={
+                "study_id": [studies[2], unknown, studies[0], studies[1], studies[2]]
+            })
+        assert response.status_code == 200
+        assert len(statements) == 1
+        body = response.json()
+        assert [(s["study_id"], s["total_consented"]) for s in body["studies"]] == [
+            (studies[2], 3), (studies[0], 1), (studies[1], 2)
+        ]
+        assert body["not_found"] == [unknown]
+
+    def test_limits(self):
+        assert client.get("/api/v1/research/studies/stats").status_code == 400
+        too_many = [new_study() for _ in range(study_stats.MAX_BULK_STUDIES + 1)]
+        response = client.get("/api/v1/research/studies/stats", params={"study_id": too_many})
+        assert response.status_code == 400
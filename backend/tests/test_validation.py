@@ -7,12 +7,14 @@ import pytest
 from datetime import datetime, timedelta
 from app.middleware.data_validation import (
     validate_event_data,
+    validate_event_batch,
     validate_session_data,
     validate_numeric_range,
     validate_string_safe,
     validate_timestamp,
     ValidationError
 )
+from app.schemas import EventCreate
 
 
 class TestNumericValidation:
@@ -248,5 +250,53 @@ class TestEdgeCases:
         validate_event_data(event)  # Should not raise
 
 
+class TestBatchValidation:
+    """Test column-wise validation of event batches."""
+
+    @staticmethod
+    def validate(items):
+        validate_event_batch(items, [EventCreate.model_validate(item).__dict__ for item in items])
+
+    def test_valid_batch(self):
+        """Batch of valid events should pass."""
+        self.validate([
+            {"event_type": 102, "magnitude": 250.0, "x": 1, "y": 2},
+            {"event_type": 104, "magnitude": 85.0},
+            {"event_type": 100, "data": {"level": "1"}},
+        ])
+
+    def test_error_names_offending_event(self):
+        """The first invalid event is reported by index."""
+        with pytest.raises(ValidationError, match="Event 2: magnitude value"):
+            self.validate([
+                {"event_type": 102, "magnitude": 250.0},
+                {"event_type": 100, "magnitude": 99999},  # No magnitude rule for 100
+                {"event_type": 103, "magnitude": 15000},
+            ])
+
+    def test_coordinates_checked_per_column(self):
+        """Out-of-range coordinates anywhere in the batch should fail."""
+        with pytest.raises(ValidationError, match="Event 1: y value"):
+            self.validate([{"event_type": 100, "y": 5}, {"event_type": 100, "y": -20000}])
+
+    def test_missing_values_skipped(self):
+        """None values are treated as missing, not out of range."""
+        self.validate([{"event_type": 102, "magnitude": None, "x": None}])
+
+    def test_future_timestamp_in_batch(self):
+        """Timestamps are validated per event."""
+        future = (datetime.utcnow() + timedelta(hours=1)).isoformat() + "Z"
+        with pytest.raises(ValidationError, match="Event 1: .*in the future") as raised:
+            self.validate([{"event_type": 100}, {"event_type": 100, "timestamp": future}])
+        assert raised.value.field == "timestamp"
+        assert raised.value.errors[0]["loc"] == ["body", 1, "timestamp"]
+
+    def test_oversized_data_in_batch(self):
+        """Data over 10KB is rejected per event."""
+        with pytest.raises(ValidationError, match="Event 0: 'data' JSON exceeds") as raised:
+            self.validate([{"event_type": 100, "data": {"note": "timestamp " * 2000}}])
+        assert raised.value.errors[0]["loc"] == ["body", 0, "data"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
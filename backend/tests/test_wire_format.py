@@ -0,0 +1,169 @@
+"""
+Tests for the binary event wire format.
+"""
+
+import struct
+import pytest
+from fastapi.testclient import TestClient
+from uuid import uuid4
+
+from app.main import app
+from app.middleware.data_validation import ValidationError
+from app.wire_format import (
+    MEDIA_TYPE,
+    HEADER,
+    encode_events,
+    decode_events,
+    decode_data,
+    validate_records,
+    record_rows,
+)
+
+client = TestClient(app)
+
+BINARY_HEADERS = {"Content-Type": MEDIA_TYPE}
+
+
+def round_trip(events):
+    records, data = decode_events(encode_events(events))
+    validate_records(records, data)
+    return list(record_rows(1, records, decode_data(records, data)))
+
+
+class TestRoundTrip:
+    """Test the reference encoder against the decoder."""
+
+    def test_fields_round_trip(self):
+        rows = round_trip([
+            {"event_type": 102, "event_subtype": 3, "x": -5, "y": 7, "z": 0,
+             "magnitude": 312.5, "data": {"trial": 4}},
+        ])
+        row = rows[0]
+        assert (row["event_type"], row["event_subtype"]) == (102, 3)
+        assert (row["x"], row["y"], row["z"]) == (-5, 7, 0)
+        assert row["magnitude"] == 312.5
+        assert row["data"] == {"trial": 4}
+
+    def test_missing_fields_decode_as_none(self):
+        row = round_trip([{"event_type": 100}])[0]
+        assert row["x"] is None and row["y"] is None and row["z"] is None
+        assert row["magnitude"] is None
+        assert row["data"] is None
+        assert row["event_subtype"] == 0
+
+    def test_record_size_is_packed(self):
+        body = encode_events([{"event_type": 100}] * 10)
+        assert len(body) == HEADER.size + 10 * 29
+
+    def test_empty_batch(self):
+        assert round_trip([]) == []
+
+
+class TestDecodeErrors:
+    """Test malformed batches are rejected."""
+
+    def test_bad_magic(self):
+        body = b"XXXX" + encode_events([{"event_type": 100}])[4:]
+        with pytest.raises(ValidationError, match="Not a WebTics"):
+            decode_events(body)
+
+    def test_unsupported_version(self):
+        body = bytearray(encode_events([{"event_type": 100}]))
+        body[4] = 99
+        with pytest.raises(ValidationError, match="version"):
+            decode_events(bytes(body))
+
+    def test_truncated_body(self):
+        body = encode_events([{"event_type": 100}] * 3)
+        with pytest.raises(ValidationError, match="does not match header"):
+            decode_events(body[:-5])
+
+    def test_short_header(self):
+        with pytest.raises(ValidationError):
+            decode_events(b"WTEV")
+
+
+class TestColumnValidation:
+    """Test vectorized range checks name the offending record."""
+
+    def test_reaction_time_out_of_range(self):
+        body = encode_events([
+            {"event_type": 102, "magnitude": 300},
+            {"event_type": 102, "magnitude": 15000},
+        ])
+        records, data = decode_events(body)
+        with pytest.raises(ValidationError, match="Record 1: magnitude value"):
+            validate_records(records, data)
+
+    def test_coordinates_out_of_range(self):
+        records, data = decode_events(encode_events([{"event_type": 100, "z": 20000}]))
+        with pytest.raises(ValidationError, match="Record 0: z value"):
+            validate_records(records, data)
+
+    def test_event_type_out_of_range(self):
+        records, data = decode_events(encode_events([{"event_type": 5000}]))
+        with pytest.raises(ValidationError, match="event_type"):
+            validate_records(records, data)
+
+    def test_absent_coordinates_not_checked(self):
+        """Zero-filled absent fields must not be range checked."""
+        records, data = decode_events(encode_events([{"event_type": 104}]))
+        validate_records(records, data)
+
+    def test_non_object_data_rejected(self):
+        body = bytearray(encode_events([{"event_type": 100, "data": {"a": 1}}]))
+        blob = b'[1,2,3]'
+        # Rewrite the blob and its length so sizes stay consistent
+        header = list(HEADER.unpack_from(body))
+        header[5] = len(blob)
+        record = bytearray(body[HEADER.size:HEADER.size + 29])
+        struct.pack_into("<I", record, 25, len(blob))
+        body = HEADER.pack(*header) + bytes(record) + blob
+        records, data = decode_events(body)
+        with pytest.raises(ValidationError, match="JSON object"):
+            decode_data(records, data)
+
+
+class TestBinaryEndpoint:
+    """Test the /api/v1/events/binary endpoint."""
+
+    @pytest.fixture
+    def play_session_id(self):
+        session = client.post(
+            "/api/v1/sessions",
+            json={"unique_id": f"binary_{uuid4().hex}", "build_number": "1.0"}
+        ).json()
+        return client.post(
+            "/api/v1/play-sessions",
+            json={"metric_session_id": session["id"]}
+        ).json()["id"]
+
+    def test_binary_batch_logged(self, play_session_id):
+        body = encode_events([
+            {"event_type": 102, "x": i, "y": -i, "magnitude": 250.0 + i}
+            for i in range(50)
+        ])
+        response = client.post(
+            f"/api/v1/events/binary?play_session_id={play_session_id}",
+            content=body,
+            headers=BINARY_HEADERS
+        )
+        assert response.status_code == 200
+        assert response.json()["events_logged"] == 50
+
+    def test_invalid_batch_rejected(self, play_session_id):
+        body = encode_events([{"event_type": 102, "magnitude": 999999}])
+        response = client.post(
+            f"/api/v1/events/binary?play_session_id={play_session_id}",
+            content=body,
+            headers=BINARY_HEADERS
+        )
+        assert response.status_code == 400
+
+    def test_wrong_content_type(self, play_session_id):
+        response = client.post(
+            f"/api/v1/events/binary?play_session_id={play_session_id}",
+            content=encode_events([{"event_type": 100}]),
+            headers={"Content-Type": "application/octet-stream"}
+        )
+        assert response.status_code == 415
@@ -0,0 +1,181 @@
+"""
+Tests for set-based withdrawal deletion jobs.
+"""
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import jobs, models, models_research
+from app.database import SessionLocal
+from app.main import app
+
+from .conftest import create_participant
+
+client = TestClient(app)
+
+
+def count(model, *where) -> int:
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(model).where(*where))
+
+
+class TestWithdrawalJobs:
+    """Test withdrawal deletes everything, audits it and reports the job."""
+
+    def test_withdraw_deletes_and_audits(self):
+        consent = create_participant("jobs_study", play_sessions=(4, 4, 4))
+
+        response = client.post(
+            "/api/v1/research/withdraw", json={"withdrawal_code": consent["withdrawal_code"]}
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert body["sessions_deleted"] == 1
+        assert body["events_deleted"] == 12
+
+        assert count(models.MetricSession, models.MetricSession.id == consent["session_id"]) == 0
+        assert count(models.PlaySession, models.PlaySession.metric_session_id == consent["session_id"]) == 0
+
+        with SessionLocal() as db:
+            audit = db.scalar(select(models_research.WithdrawalAudit).where(
+                models_research.WithdrawalAudit.participant_id == consent["participant_id"]
+            ))
+            job = db.scalar(select(models_research.DeletionJob).where(
+                models_research.DeletionJob.consent_id == consent["consent_id"]
+            ))
+        assert audit.success is True
+        assert audit.events_deleted == 12
+        assert audit.requested_at == job.requested_at
+
+        status = client.get(f"/api/v1/research/withdraw/jobs/{job.id}").json()
+        assert status["status"] == "completed"
+        assert status["events_deleted"] == 12
+
+    def test_withdraw_deletes_events_before_play_session_start(self):
+        """Events stamped well before their play session started (skewed clocks) are erased too."""
+        consent = create_participant("jobs_study", play_sessions=(2,))
+        play_session_id = consent["play_session_ids"][0]
+        with SessionLocal() as db:
+            started_at = db.get(models.PlaySession, play_session_id).started_at
+            db.add(models.Event(
+                play_session_id=play_session_id, event_type=102, event_subtype=0,
+                timestamp=started_at - timedelta(minutes=10)
+            ))
+            db.commit()
+
+        response = client.post(
+            "/api/v1/research/withdraw", json={"withdrawal_code": consent["withdrawal_code"]}
+        )
+        assert response.status_code == 200
+        assert response.json()["events_deleted"] == 3
+        assert count(models.Event, models.Event.play_session_id == play_session_id) == 0
+
+    def test_unknown_job(self):
+        assert client.get("/api/v1/research/withdraw/jobs/missing").status_code == 404
+
+    def test_retry_reuses_active_job(self):
+        """A second request while a job is in progress returns that job."""
+        consent = create_participant("jobs_study", play_sessions=(5,))
+        with SessionLocal() as db:
+            db.add(models_research.DeletionJob(
+                id="inprogressjob", consent_id=consent["consent_id"], status="running"
+            ))
+            db.commit()
+
+        response = client.post(
+            "/api/v1/research/withdraw", json={"withdrawal_code": consent["withdrawal_code"]}
+        )
+        assert response.status_code == 202
+        body = response.json()
+        assert body["job_id"] == "inprogressjob"
+        assert body["status"] == "running"
+        assert body["events_deleted"] is None
+        assert body["status_url"].endswith("/api/v1/research/withdraw/jobs/inprogressjob")
+        # Nothing deleted by the duplicate request
+        assert count(models.MetricSession, models.MetricSession.id == consent["session_id"]) == 1
+
+
+class TestWithdrawalAtomicity:
+    """Test a failed deletion leaves data untouched and is audited."""
+
+    @pytest.fixture
+    def session_factory(self, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+
+        async def setup():
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            factory = async_sessionmaker(engine, expire_on_commit=False)
+            async with factory() as db:
+                consent = models_research.ResearchConsent(
+                    study_id="s", participant_id="P-atomic",
+                    withdrawal_code_hash="h", withdrawal_salt="s"
+                )
+                metric_session = models.MetricSession(unique_id="P-atomic")
+                db.add_all([consent, metric_session])
+                await db.flush()
+                play_session = models.PlaySession(metric_session_id=metric_session.id)
+                db.add(play_session)
+                await db.flush()
+                db.add_all(
+                    models.Event(play_session_id=play_session.id, event_type=1, event_subtype=0)
+                    for _ in range(3)
+                )
+                db.add(models_research.DeletionJob(id="atomic", consent_id=consent.id))
+                await db.commit()
+            return factory
+
+        yield asyncio.run(setup())
+        asyncio.run(engine.dispose())
+
+    def test_failure_rolls_back(self, session_factory, monkeypatch):
+        real_delete = jobs.delete_participant_data
+
+        async def delete_then_fail(db, participant_id):
+            await real_delete(db, participant_id)
+            raise RuntimeError("disk full")
+
+        monkeypatch.setattr(jobs, "delete_participant_data", delete_then_fail)
+
+        async def scenario():
+            await jobs.run_withdrawal("atomic", None, session_factory=session_factory)
+            async with session_factory() as db:
+                events = await db.scalar(select(func.count()).select_from(models.Event))
+                consent = await db.scalar(select(models_research.ResearchConsent))
+                job = await db.get(models_research.DeletionJob, "atomic")
+                audit = await db.scalar(select(models_research.WithdrawalAudit))
+            return events, consent, job, audit
+
+        events, consent, job, audit = asyncio.run(scenario())
+        assert events == 3
+        assert consent.is_active is True
+        assert job.status == "failed"
+        assert audit.success is False
+        assert audit.error_message == "disk full"
+
+    def test_concurrent_withdrawal_completes(self, session_factory):
+        async def scenario():
+            async with session_factory() as db:
+                consent = await db.scalar(select(models_research.ResearchConsent))
+                db.add(models_research.DeletionJob(id="duplicate", consent_id=consent.id))
+                await db.commit()
+            # Both jobs were started; on PostgreSQL the second waits on the
+            # consent row lock until the first has committed
+            await jobs.run_withdrawal("atomic", None, session_factory=session_factory)
+            await jobs.run_withdrawal("duplicate", None, session_factory=session_factory)
+            async with session_factory() as db:
+                first = await db.get(models_research.DeletionJob, "atomic")
+                second = await db.get(models_research.DeletionJob, "duplicate")
+                audits = (await db.scalars(select(models_research.WithdrawalAudit.success))).all()
+            return first, second, audits
+
+        first, second, audits = asyncio.run(scenario())
+        assert first.status == second.status == "completed"
+        assert (second.events_deleted, second.sessions_deleted) == (3, 1)
+        assert second.completed_at == first.completed_at
+        assert audits == [True]
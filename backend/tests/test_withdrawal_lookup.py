@@ -0,0 +1,145 @@
+"""
+Tests for indexed withdrawal-code lookup and additive schema migrations.
+"""
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, select, text
+
+from app import migrations, models_research
+from app.crypto_utils import (
+    generate_consent_record,
+    hash_withdrawal_code,
+    withdrawal_lookup_digest
+)
+from app.database import SessionLocal, engine
+from app.main import app
+from app.routers import research
+
+client = TestClient(app)
+
+
+def create_consent(study_id: str = "lookup_study") -> dict:
+    response = client.post("/api/v1/research/consent", json={"study_id": study_id})
+    assert response.status_code == 200
+    return response.json()
+
+
+def stored_lookup(participant_id: str):
+    with SessionLocal() as db:
+        return db.scalar(
+            select(models_research.ResearchConsent.withdrawal_lookup).where(
+                models_research.ResearchConsent.participant_id == participant_id
+            )
+        )
+
+
+class TestLookupDigest:
+    """Test the keyed lookup digest."""
+
+    def test_deterministic_and_unsalted(self):
+        code = "WC-7f3a9b2e-4d1c-8a5f-9e2b-3c7d1a8f4e6b"
+        assert withdrawal_lookup_digest(code) == withdrawal_lookup_digest(code)
+        assert len(withdrawal_lookup_digest(code)) == 64
+        assert withdrawal_lookup_digest(code) != withdrawal_lookup_digest(code + "0")
+        assert withdrawal_lookup_digest(code) != hash_withdrawal_code(code, "")
+
+
+class TestWithdrawalLookup:
+    """Test codes resolve through the lookup column."""
+
+    def test_consent_stores_lookup(self):
+        consent = create_consent()
+        assert stored_lookup(consent["participant_id"]) == withdrawal_lookup_digest(consent["withdrawal_code"])
+
+    def test_export_and_withdraw(self):
+        consent = create_consent()
+        code = consent["withdrawal_code"]
+
+        response = client.get("/api/v1/research/participant/data", params={"withdrawal_code": code})
+        assert response.status_code == 200
+
+        response = client.post("/api/v1/research/withdraw", json={"withdrawal_code": code})
+        assert response.status_code == 200
+        assert response.json()["success"] is True
+
+        # Withdrawn consents no longer resolve
+        response = client.post("/api/v1/research/withdraw", json={"withdrawal_code": code})
+        assert response.status_code == 400
+
+    def test_unknown_code_rejected(self):
+        create_consent()
+        response = client.post(
+            "/api/v1/research/withdraw",
+            json={"withdrawal_code": "WC-00000000-0000-0000-0000-000000000000"}
+        )
+        assert response.status_code == 400
+
+    def test_legacy_consent_backfilled(self, monkeypatch):
+        """While legacy consents remain, ones without a lookup digest still resolve, and gain one."""
+        code, participant_id, salt, code_hash = generate_consent_record()
+        with SessionLocal() as db:
+            db.add(models_research.ResearchConsent(
+                study_id="lookup_study",
+                participant_id=participant_id,
+                withdrawal_code_hash=code_hash,
+                withdrawal_salt=salt
+            ))
+            db.commit()
+        assert stored_lookup(participant_id) is None
+        assert migrations.legacy_consents(engine) >= 1
+        monkeypatch.setattr(research, "legacy_consents_remaining", True)
+
+        # Forced off
+        monkeypatch.setattr(research, "WITHDRAWAL_LEGACY_SCAN", False)
+        response = client.get("/api/v1/research/participant/data", params={"withdrawal_code": code})
+        assert response.status_code == 400
+
+        # On by default while legacy consents remain
+        monkeypatch.setattr(research, "WITHDRAWAL_LEGACY_SCAN", True)
+        response = client.get("/api/v1/research/participant/data", params={"withdrawal_code": code})
+        assert response.status_code == 200
+        assert response.json()["participant_id"] == participant_id
+        assert stored_lookup(participant_id) == withdrawal_lookup_digest(code)
+
+    def test_legacy_scan_stops_when_none_remain(self, monkeypatch):
+        monkeypatch.setattr(research, "WITHDRAWAL_LEGACY_SCAN", True)
+        monkeypatch.setattr(research, "legacy_consents_remaining", True)
+        with SessionLocal() as db:
+            db.query(models_research.ResearchConsent).filter(
+                models_research.ResearchConsent.withdrawal_lookup.is_(None)
+            ).update({"is_active": False})
+            db.commit()
+
+        response = client.post(
+            "/api/v1/research/withdraw",
+            json={"withdrawal_code": "WC-00000000-0000-0000-0000-000000000000"}
+        )
+        assert response.status_code == 400
+        assert research.legacy_consents_remaining is False
+
+
+class TestMigrations:
+    """Test missing columns and indexes are added to existing tables."""
+
+    def test_adds_lookup_column_and_index(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE research_consents (id INTEGER PRIMARY KEY, "
+                "study_id VARCHAR(100) NOT NULL, participant_id VARCHAR(50) NOT NULL, "
+                "withdrawal_code_hash VARCHAR(64) NOT NULL, withdrawal_salt VARCHAR(32) NOT NULL, "
+                "privacy_level VARCHAR(20) NOT NULL, age_range VARCHAR(20), condition VARCHAR(100), "
+                "recruitment_site VARCHAR(100), consented_at DATETIME NOT NULL, withdrawn_at DATETIME, "
+                "data_deleted_at DATETIME, irb_protocol VARCHAR(100), consent_version VARCHAR(20), "
+                "is_active BOOLEAN NOT NULL)"
+            ))
+
+        applied = migrations.upgrade(engine)
+        assert "column research_consents.withdrawal_lookup" in applied
+        assert "index ix_research_consents_withdrawal_lookup" in applied
+
+        inspector = inspect(engine)
+        assert "withdrawal_lookup" in {c["name"] for c in inspector.get_columns("research_consents")}
+        # Idempotent
+        assert migrations.upgrade(engine) == []
+        engine.dispose()
@@ -17,6 +17,7 @@ signal session_created(session_id: int)
 signal play_session_created(play_session_id: int)
 signal event_logged(success: bool)
 signal error_occurred(error_message: String)
+signal backoff_started(delay_seconds: float)
 
 ## Configuration
 var base_url: String = "http://localhost:8013"
@@ -31,9 +32,20 @@ var is_play_session_active: bool = false
 ## HTTP client
 var http_client: HTTPRequest
 
-## Event queue for offline support (future enhancement)
+## Backoff when the server is overloaded (429/503): events are held in
+## event_queue and resent after max(Retry-After, exponential backoff)
+var retry_base_delay: float = 1.0
+var retry_max_delay: float = 60.0
+var max_queued_events: int = 1000
+
+## Event requests waiting to be sent, in order
 var event_queue: Array = []
 
+var _retry_attempt: int = 0
+var _backing_off: bool = false
+var _retry_timer: Timer
+var _in_flight: Dictionary = {}
+
 
 func _ready():
 	# Create HTTP client
@@ -41,6 +53,11 @@ func _ready():
 	add_child(http_client)
 	http_client.request_completed.connect(_on_request_completed)
 
+	_retry_timer = Timer.new()
+	_retry_timer.one_shot = true
+	add_child(_retry_timer)
+	_retry_timer.timeout.connect(_on_retry_timeout)
+
 
 ## Configure the WebTics backend URL
 func configure(url: String) -> void:
@@ -137,7 +154,6 @@ func log_event(
 		return
 
 	var url = "%s/api/%s/events?play_session_id=%d" % [base_url, api_version, play_session_id]
-	var headers = ["Content-Type: application/json"]
 	var body = JSON.stringify({
 		"event_type": event_type,
 		"event_subtype": event_subtype,
@@ -148,7 +164,7 @@ func log_event(
 		"data": data if data.size() > 0 else null
 	})
 
-	http_client.request(url, headers, HTTPClient.METHOD_POST, body)
+	_send_event(url, body)
 
 
 ## Log multiple events in a batch
@@ -158,14 +174,89 @@ func log_events_batch(events: Array) -> void:
 		return
 
 	var url = "%s/api/%s/events/batch?play_session_id=%d" % [base_url, api_version, play_session_id]
-	var headers = ["Content-Type: application/json"]
 	var body = JSON.stringify(events)
 
-	http_client.request(url, headers, HTTPClient.METHOD_POST, body)
+	_send_event(url, body)
+
+
+## Send an event request now, or queue it behind earlier ones and any backoff
+func _send_event(url: String, body: String) -> void:
+	var request = {"url": url, "body": body}
+	if _backing_off or not event_queue.is_empty() or _send(request) == ERR_BUSY:
+		_queue_event(request)
+
+
+func _send(request: Dictionary) -> int:
+	var headers = ["Content-Type: application/json"]
+	var err = http_client.request(request["url"], headers, HTTPClient.METHOD_POST, request["body"])
+	if err == OK:
+		_in_flight = request
+	elif err != ERR_BUSY:
+		error_occurred.emit("Failed to send events: " + str(err))
+	return err
+
+
+func _queue_event(request: Dictionary) -> void:
+	if event_queue.size() >= max_queued_events:
+		event_queue.pop_front()
+		error_occurred.emit("Event queue full, dropped the oldest queued events")
+	event_queue.append(request)
+
+
+func _send_next_event() -> void:
+	if _backing_off or event_queue.is_empty() or not _in_flight.is_empty():
+		return
+	var request = event_queue.pop_front()
+	if _send(request) == ERR_BUSY:
+		event_queue.push_front(request)
+
+
+## Server refused an event request (429/503): wait, then resend it first
+func _back_off(request: Dictionary, headers: PackedStringArray) -> void:
+	var delay = min(retry_max_delay, retry_base_delay * pow(2.0, _retry_attempt))
+	# Jitter spreads out the clients that were refused together
+	delay = randf_range(delay / 2.0, delay)
+	# Never sooner than the server asked
+	delay = max(delay, _retry_after(headers))
+	_retry_attempt += 1
+
+	event_queue.push_front(request)
+	_backing_off = true
+	_retry_timer.start(delay)
+	backoff_started.emit(delay)
+	print("[WebTics] Server busy, retrying in %.1f s" % delay)
+
+
+func _retry_after(headers: PackedStringArray) -> float:
+	for header in headers:
+		if header.to_lower().begins_with("retry-after:"):
+			var value = header.substr(header.find(":") + 1).strip_edges()
+			if value.is_valid_int():
+				return float(value.to_int())
+	return 0.0
+
+
+func _on_retry_timeout() -> void:
+	_backing_off = false
+	_send_next_event()
 
 
 ## HTTP request completion handler
 func _on_request_completed(result: int, response_code: int, headers: PackedStringArray, body: PackedByteArray) -> void:
+	var request = _in_flight
+	_in_flight = {}
+	if not request.is_empty() and result == HTTPRequest.RESULT_SUCCESS:
+		if response_code == 429 or response_code == 503:
+			_back_off(request, headers)
+			return
+		_retry_attempt = 0
+
+	_handle_response(result, response_code, body)
+	# The client is free again; send what was queued meanwhile
+	_send_next_event.call_deferred()
+
+
+func _handle_response(result: int, response_code: int, body: PackedByteArray) -> void:
 	if result != HTTPRequest.RESULT_SUCCESS:
 		error_occurred.emit("HTTP request failed: " + str(result))
 		return